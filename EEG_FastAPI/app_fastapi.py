@@ -7,14 +7,23 @@ app_fastapi.py
 - ✅ 모델/파라미터 동적 오버라이드 지원
 - ✅ /chatbot.do alias 유지 (스프링 호환)
 - ✅ 동기 LLM 파이프라인을 스레드로 오프로드하여 이벤트 루프 블로킹 방지
+- ✅ 엔드포인트별 마감(DEADLINE_CHATBOT_SEC / DEADLINE_VOICE_SEC)을 파이프라인 전체 호출에 전파(request_deadline)
+  · 클라이언트 연결이 끊기면 취소 → 작업 스레드는 다음 LLM/검색 호출 전에 중단
+  · 마감 초과 시 선택 단계는 생략한 저하 응답(degraded), 필수 단계(요약 등)까지 넘기면 504 / 취소는 499
+- GET /llm/hedge : 요약/구조화 헤지 실행 경로별 지연 분위수·승리 횟수
+- GET /llm/usage : 엔드포인트·단계·모델별 누적 토큰/비용, 라우팅 횟수, 정책 설정 (?session_id= 세션 누적)
+- GET /deadlines : 진행 중/완료/마감 초과/취소 요청 수, 단계별 저하 응답 수
+- GET /llm/structured : 구조화 출력 모드, 캐시된 체인 수, 스키마별 파싱 실패 횟수
+- GET /session-analysis : 세션 증분 분석 저장소 현황, DELETE /session-analysis/{session_id} : 세션 분석 초기화
 """
 
 import os
 import time
+import asyncio
 from functools import partial
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
@@ -26,6 +35,11 @@ from chabot_model import (
     mark_guide_question_shown,
     analyze_voice_response,  # 새로 추가할 함수
 )
+import llm_hedge
+import llm_usage
+import llm_structured
+import session_analysis
+import request_deadline
 
 app = FastAPI(title="Dementia Chatbot API (FastAPI)")
 
@@ -72,10 +86,60 @@ class VoiceChatbotRequest(BaseModel):
 async def healthz():
     return {"status": "ok", "time": time.time()}
 
+@app.get("/llm/hedge")
+async def llm_hedge_stats():
+    return llm_hedge.stats()
+
+@app.get("/llm/usage")
+async def llm_usage_stats(session_id: Optional[str] = None):
+    return llm_usage.stats(session_id)
+
+@app.get("/deadlines")
+async def deadline_stats():
+    return request_deadline.stats()
+
+@app.get("/llm/structured")
+async def llm_structured_stats():
+    return llm_structured.stats()
+
+@app.get("/session-analysis")
+async def session_analysis_stats():
+    return session_analysis.stats()
+
+@app.delete("/session-analysis/{session_id}")
+async def session_analysis_drop(session_id: str):
+    session_analysis.drop(session_id)
+    return {"status": "ok", "session_id": session_id}
+
+# -------------------------------
+# 마감/취소를 건 스레드 실행
+# -------------------------------
+async def _run_with_deadline(endpoint: str, request: Optional[Request], fn: Callable[[], Any]) -> Any:
+    """fn 을 워커 스레드에서 실행(contextvars 복사 → 마감이 모든 호출에 전파), 연결 끊김 감시"""
+    deadline = request_deadline.start(endpoint)
+    outcome, result = "completed", None
+    with request_deadline.scope(deadline):
+        watcher = asyncio.ensure_future(request_deadline.watch_disconnect(request, deadline)) if request else None
+        try:
+            result = await to_thread.run_sync(fn)
+            return result
+        except request_deadline.DeadlineExceeded as e:
+            outcome = "expired"
+            print(f"⏰ [{endpoint}] 마감 초과({e}) {deadline.elapsed():.1f}s")
+            raise HTTPException(status_code=504, detail=f"처리 시간 제한을 초과했습니다 ({e})")
+        except request_deadline.RequestCancelled:
+            outcome = "cancelled"
+            raise HTTPException(status_code=499, detail="클라이언트 연결이 끊겨 요청을 취소했습니다.")
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            degraded = result.get("degraded") if isinstance(result, dict) else None
+            request_deadline.finish(deadline, outcome, degraded)
+
 # -------------------------------
 # 음성 챗봇 전용 처리 루틴
 # -------------------------------
-async def _handle_voice_chatbot(payload: VoiceChatbotRequest):
+async def _handle_voice_chatbot(payload: VoiceChatbotRequest, request: Optional[Request] = None):
     """음성 챗봇 전용 처리 - 사용자 답변 분석 및 상담 제공"""
     try:
         # 오버라이드 수집
@@ -95,9 +159,11 @@ async def _handle_voice_chatbot(payload: VoiceChatbotRequest):
             **overrides,
         )
         
-        result = await to_thread.run_sync(fn)
+        result = await _run_with_deadline("voice", request, fn)
         return result
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"음성 챗봇 처리 오류: {e}")
         raise HTTPException(status_code=500, detail=f"음성 챗봇 처리 중 오류가 발생했습니다: {str(e)}")
@@ -105,7 +171,7 @@ async def _handle_voice_chatbot(payload: VoiceChatbotRequest):
 # -------------------------------
 # 핵심 처리 루틴
 # -------------------------------
-async def _handle_chatbot(payload: ChatbotRequest):
+async def _handle_chatbot(payload: ChatbotRequest, request: Optional[Request] = None):
     # 오버라이드 수집
     overrides: Dict[str, Any] = {
         "chat_model": payload.chat_model,
@@ -136,7 +202,7 @@ async def _handle_chatbot(payload: ChatbotRequest):
                 session_id=payload.session_id,
                 **overrides,
             )
-            result = await to_thread.run_sync(fn)
+            result = await _run_with_deadline("chatbot", request, fn)
         except FileNotFoundError as e:
             raise HTTPException(status_code=404, detail=str(e))
     else:
@@ -152,7 +218,7 @@ async def _handle_chatbot(payload: ChatbotRequest):
                 session_id=payload.session_id,
                 **overrides,
             )
-            result = await to_thread.run_sync(fn)
+            result = await _run_with_deadline("chatbot", request, fn)
         except FileNotFoundError as e:
             raise HTTPException(status_code=404, detail=str(e))
 
@@ -162,10 +228,10 @@ async def _handle_chatbot(payload: ChatbotRequest):
 # 엔드포인트
 # -------------------------------
 @app.post("/voice-chatbot")
-async def voice_chatbot(payload: VoiceChatbotRequest):
+async def voice_chatbot(payload: VoiceChatbotRequest, request: Request):
     """음성 챗봇 전용 엔드포인트 - 사용자 답변 분석 및 상담 제공"""
     try:
-        result = await _handle_voice_chatbot(payload)
+        result = await _handle_voice_chatbot(payload, request)
         return JSONResponse(content=result, status_code=200)
     except HTTPException:
         raise
@@ -175,9 +241,9 @@ async def voice_chatbot(payload: VoiceChatbotRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/chatbot")
-async def chatbot(payload: ChatbotRequest):
+async def chatbot(payload: ChatbotRequest, request: Request):
     try:
-        result = await _handle_chatbot(payload)
+        result = await _handle_chatbot(payload, request)
         return JSONResponse(content=result, status_code=200)
     except HTTPException:
         raise
@@ -190,8 +256,8 @@ async def chatbot(payload: ChatbotRequest):
 
 # 스프링 호환 alias
 @app.post("/chatbot.do")
-async def chatbot_do(payload: ChatbotRequest):
-    return await chatbot(payload)
+async def chatbot_do(payload: ChatbotRequest, request: Request):
+    return await chatbot(payload, request)
 
 # -------------------------------
 # 로컬 실행
@@ -6,50 +6,46 @@ chabot_model.py
 - ✅ 허용 모델을 'gpt-4o'와 'gpt-4o-mini'로 **엄격 제한**
 - ✅ 기본은 gpt-4o, 사용자가 원하면 gpt-4o-mini 선택 가능
 - ✅ 알 수 없는 모델명 입력 시 ValueError (서버에서 400으로 내려주길 권장)
+- ✅ 요약/구조화 폴백(메인 → 강건 프롬프트 → mini)은 llm_hedge 로 헤지 실행: 느리면 겹쳐 시작, 첫 유효 결과 채택
+  · 구조화 JSON 은 호출/전송 오류일 때만 mini 로 넘어감 — 파싱/스키마 실패는 재호출 없이 요약 텍스트에서 재구성
+- ✅ LLM_BACKEND=stub 이면 ChatOpenAI/OpenAIEmbeddings/DDGS 대신 llm_stub(오프라인, 지연 분포 설정) 사용
+- 응답의 timings: 단계별 소요 시간(초) — load_test.py 가 단계별 분위수 집계에 사용
+- ✅ 응답의 usage: 단계별/모델별 토큰·비용 + 세션 누적(llm_usage), 단계 시작 전 라우팅 정책으로 gpt-4o-mini 전환 가능
+  · 프롬프트 크기 / 세션 예산 / 지연 SLO 기준 — 실제 사용 모델은 used_models, 결정 내역은 usage.routing
+- ✅ 긴 STT(추정 LLM_CHUNK_TRIGGER_TOKENS 이상)는 청크 map-reduce (transcript_chunks)
+  · map: 청크별 세그먼트 판별/비치매 과업, 온토픽·감정·발췌요약을 병렬 실행
+  · reduce: 판별/감정 병합, 발췌요약을 상한(LLM_CHUNK_REDUCE_TOKENS) 이하로 접어 검색어·RAG·요약·JSON 입력으로 사용
+- ✅ 세션 증분 분석(session_analysis): 같은 session_id 의 이전 턴에서 처리한 문장은 판별/감정/임베딩 재사용,
+  새 문장(델타)만 분석하고 세션 요약은 '기존 요약 + 델타' 로 갱신, 새 내용이 없으면 마지막 결과 재사용
+- ✅ JSON 단계는 구조화 출력(llm_structured 스키마, response_format) + 단일 검증 파서 — 파싱 실패 시 재호출 없이 기본값
+  · 클라이언트는 설정별 캐시, 체인은 (프롬프트, 클라이언트) 당 한 번만 조립
+- ✅ 요청 마감(request_deadline): 모든 LLM/임베딩/검색 호출에 남은 시간을 timeout 으로 전달, 취소/마감이면 다음 호출 중단
+  · 선택 단계(검색어·RAG, 감정, 구조화 JSON)는 요약 몫을 남긴 하위 마감 안에서만 실행 — 넘기면 생략하고 degraded 에 기록
+    (예: RAG 없는 요약, 요약 텍스트에서 재구성한 구조화 JSON), 요약 자체가 마감을 넘기면 DeadlineExceeded
 """
 
-import os, json, re, time
+import os, json, re, time, copy
+from contextlib import contextmanager
 from dataclasses import dataclass
+from functools import partial, lru_cache
 from typing import List, Dict, Any, Optional, Tuple
 
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
+from langchain_core.exceptions import OutputParserException
 from langchain_core.documents import Document
 
+import llm_hedge
+import llm_usage
+import transcript_chunks
+import session_analysis
+import llm_structured
+import request_deadline
 
-# --- PATCH: loose JSON parser & helpers ---
-import re as _re
-
-def _json_loose_loads(text: str) -> dict:
-    """
-    모델이 JSON을 코드펜스로 감싸거나 스마트따옴표/트레일링 콤마가 섞여도 최대한 파싱.
-    실패 시 ValueError를 그대로 던짐.
-    """
-    if not text:
-        raise ValueError("empty")
-    # 코드펜스 제거
-    t = text.strip()
-    t = _re.sub(r"^```(?:json)?\s*", "", t)
-    t = _re.sub(r"\s*```$", "", t)
-
-    # 첫 번째 { ... } 블록만 추출
-    m = _re.search(r"\{.*\}", t, flags=_re.DOTALL)
-    if not m:
-        raise ValueError("no-json-object")
-    s = m.group(0)
-
-    # 스마트 따옴표 정규화
-    s = s.replace("“", "\"").replace("”", "\"").replace("’", "'").replace("‘", "'")
-
-    # }나 ] 앞의 트레일링 콤마 제거
-    s = _re.sub(r",(\s*[}\]])", r"\1", s)
-
-    return json.loads(s)
 
 def _first_sentence_containing(text: str, keyword: str) -> str:
-    for sent in _re.split(r"[.!?\n]+", text):
+    for sent in re.split(r"[.!?\n]+", text):
         if keyword in sent:
             st = sent.strip()
             if 6 <= len(st) <= 120:
@@ -64,6 +60,7 @@ load_dotenv()
 API_TOKEN_PATH = os.getenv("API_TOKEN", "./api_token.txt")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 DEV_USE_TOKEN_FILE = os.getenv("DEV_USE_TOKEN_FILE", "1") == "1"
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai").strip().lower()   # openai | stub
 
 if not OPENAI_API_KEY and DEV_USE_TOKEN_FILE and os.path.exists(API_TOKEN_PATH):
     try:
@@ -76,7 +73,12 @@ if not OPENAI_API_KEY and DEV_USE_TOKEN_FILE and os.path.exists(API_TOKEN_PATH):
     except Exception as e:
         print(f"⚠️ API 토큰 로드 실패: {e}")
 
-if not OPENAI_API_KEY:
+if LLM_BACKEND == "stub":
+    # 오프라인 대체: 아래 코드의 ChatOpenAI(...)/OpenAIEmbeddings(...) 생성이 모두 stub 으로 바뀜
+    import llm_stub
+    from llm_stub import StubChatModel as ChatOpenAI, StubEmbeddings as OpenAIEmbeddings
+    print("🧪 LLM_BACKEND=stub — OpenAI/DDGS 호출 없이 고정 응답 사용")
+elif not OPENAI_API_KEY:
     raise RuntimeError("OPENAI_API_KEY 가 설정되어 있지 않습니다. .env 또는 환경변수를 확인하세요.")
 
 # -------------------------------
@@ -111,6 +113,10 @@ class ClientBundle:
     max_tokens:  int
     model_ids:   Dict[str, str]
 
+    def llm(self, component: str) -> ChatOpenAI:
+        return {"summary": self.llm_summary, "judge": self.llm_judge,
+                "query": self.llm_query, "emotion": self.llm_emo}[component]
+
 # ✅ 허용 모델 화이트리스트 (챗/임베딩)
 ALLOWED_CHAT = {"gpt-4o", "gpt-4o-mini"}
 ALLOWED_EMBED = {"text-embedding-3-small", "text-embedding-3-large"}
@@ -171,7 +177,12 @@ def _build_clients(
         if "emotion" in models: m_emo     = _normalise_model_id(models["emotion"], "chat")
         if "embed"   in models: m_embed   = _normalise_model_id(models["embed"],   "embed")
 
-    # 인스턴스
+    return _client_bundle(m_summary, m_judge, m_query, m_emo, m_embed, tmp, mx)
+
+@lru_cache(maxsize=32)
+def _client_bundle(m_summary: str, m_judge: str, m_query: str, m_emo: str, m_embed: str,
+                   tmp: float, mx: int) -> ClientBundle:
+    """설정 조합별 클라이언트 1벌 (요청 간 공유 → HTTP 연결·체인 캐시 재사용, 읽기 전용으로만 사용)"""
     llm_summary = ChatOpenAI(model=m_summary, temperature=tmp, max_tokens=mx, api_key=OPENAI_API_KEY)
     llm_judge   = ChatOpenAI(model=m_judge,   temperature=0.0, max_tokens=min(mx, 220), api_key=OPENAI_API_KEY)
     llm_query   = ChatOpenAI(model=m_query,   temperature=0.1, max_tokens=min(mx, 120), api_key=OPENAI_API_KEY)
@@ -236,34 +247,16 @@ TAU_ON = 0.60
 BAND   = (0.48, 0.60)
 
 def detect_topic(text: str, judge_llm: ChatOpenAI, session_id: Optional[str] = None) -> Dict[str, Any]:
-    parser = StrOutputParser()
-    judge_chain = CLASSIFY_PROMPT | judge_llm | parser
+    judge_chain = llm_structured.structured_chain(CLASSIFY_PROMPT, judge_llm, llm_structured.TopicJudgement)
     t = (text or "").strip()
     if not t:
         return {"label": "off_topic", "prob": 0.0, "evidence": []}
     
     try:
-        raw = judge_chain.invoke({"user_text": t})
-        print(f"🔍 LLM 원본 응답: {raw}")  # 디버깅용
-        
-        # 코드펜스 제거 (```json, ``` 등)
-        cleaned_raw = raw.strip()
-        if cleaned_raw.startswith("```"):
-            # 첫 번째 ``` 제거
-            cleaned_raw = cleaned_raw[3:]
-            # 마지막 ``` 제거
-            if cleaned_raw.endswith("```"):
-                cleaned_raw = cleaned_raw[:-3]
-            # json, python 등 언어 표시 제거
-            cleaned_raw = cleaned_raw.lstrip("json\n").lstrip("python\n").lstrip("```\n")
-        
-        cleaned_raw = cleaned_raw.strip()
-        print(f"🧹 정리된 응답: {cleaned_raw}")  # 디버깅용
-        
-        data = json.loads(cleaned_raw)
-        on_topic = bool(data.get("on_topic", False))
-        score = float(data.get("score", 0.0))
-        reason = str(data.get("reason", ""))
+        data = judge_chain.invoke({"user_text": t})
+        on_topic = data["on_topic"]
+        score = data["score"]
+        reason = data["reason"]
         
         # on_topic이 false면 확실히 off_topic
         if not on_topic:
@@ -290,18 +283,17 @@ SEGMENT_CLASSIFY_PROMPT = ChatPromptTemplate.from_messages([
      "적어도 하나의 **구체적 경험/우려**가 나타나면 on_topic. 일상 추천/메뉴 선택/광고/가격/일반 수다는 off_topic.\n"
      "오직 JSON: {{\"on_topic\": true|false, \"score\": 0.0~1.0}}"),
     ("human", "문장:\n\"\"\"\n요즘 약속 장소 이름이 자꾸 생각이 안 나요. 멋쩍어서 웃고 넘어가요.\n\"\"\"\n오직 JSON:"),
-    ("assistant", "{\"on_topic\": true, \"score\": 0.86}"),
+    ("assistant", "{{\"on_topic\": true, \"score\": 0.86}}"),
     ("human", "문장:\n\"\"\"\n오늘 와퍼 먹을까 통새우 와퍼 먹을까 골라줘.\n\"\"\"\n오직 JSON:"),
-    ("assistant", "{\"on_topic\": false, \"score\": 0.05}"),
+    ("assistant", "{{\"on_topic\": false, \"score\": 0.05}}"),
     ("human", "문장:\n\"\"\"\n대화하다가 단어가 자꾸 막혀요. 그게 떠오르지 않아서 대화 흐름이 끊겨요.\n\"\"\"\n오직 JSON:"),
-    ("assistant", "{\"on_topic\": true, \"score\": 0.88}"),
+    ("assistant", "{{\"on_topic\": true, \"score\": 0.88}}"),
     ("human", "문장:\n\"\"\"\n기억이 잘 안 나서 무섭고 당황스러워요.\n\"\"\"\n오직 JSON:"),
-    ("assistant", "{\"on_topic\": true, \"score\": 0.9}"),
+    ("assistant", "{{\"on_topic\": true, \"score\": 0.9}}"),
     ("human", "문장:\n\"\"\"\n근데 치킨이랑 피자 중에 뭐가 더 좋아?\n\"\"\"\n오직 JSON:"),
-    ("assistant", "{\"on_topic\": false, \"score\": 0.07}"),
+    ("assistant", "{{\"on_topic\": false, \"score\": 0.07}}"),
     ("human", "문장:\n\"\"\"\n{sent}\n\"\"\"\n오직 JSON:")
 ])
-_segment_judge_parser = StrOutputParser()
 
 OFFDOMAIN_TASK_PROMPT = ChatPromptTemplate.from_messages([
     ("system",
@@ -309,49 +301,56 @@ OFFDOMAIN_TASK_PROMPT = ChatPromptTemplate.from_messages([
      "오직 JSON: {{\"non_dementia_task\": true|false, \"spans\": [\"...\", \"...\"]}}"),
     ("human", "입력:\n\"\"\"\n{whole}\n\"\"\"\n오직 JSON:")
 ])
-_offdomain_parser = StrOutputParser()
 
 def _split_into_segments(text: str) -> List[str]:
     raw = re.split(r"(?:\n+|[.!?]+|\r+|^\s*\d+[.)]\s*)", text)
     segs = [s.strip() for s in raw if s and s.strip()]
     return [s for s in segs if len(s) >= 2]
 
-def classify_segments(text: str, judge_llm: ChatOpenAI) -> List[Dict[str, Any]]:
+_SEGMENT_DEFAULT = {"on_topic": False, "score": 0.5}
+
+def _judge_segments(chain, segments: List[str]) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+    """문장별 판별 → (검증 통과한 결과, 호출 자체가 실패한 문장). 파싱 실패는 재호출 없이 기본값(결과에서 제외)"""
+    res: Dict[str, Dict[str, Any]] = {}
+    errored: List[str] = []
+    if not segments:
+        return res, errored
+    # 문장별 호출은 서로 독립 → batch 로 동시 실행(최대 LLM_CHUNK_WORKERS, 실제 호출은 요청당 LLM_MAX_CONCURRENCY 슬롯 공유)
+    outs = chain.batch([{"sent": s} for s in segments],
+                       config={"max_concurrency": transcript_chunks.CHUNK_WORKERS}, return_exceptions=True)
+    for s, js in zip(segments, outs):
+        if isinstance(js, OutputParserException):
+            continue
+        if isinstance(js, Exception):
+            errored.append(s)
+            continue
+        res[s] = {"on_topic": js["on_topic"], "score": js["score"]}
+    return res, errored
+
+def classify_segments(text: str, judge_llm: ChatOpenAI,
+                      known: Optional[Dict[str, Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """known: 세션 캐시(문장 → 판별, SessionAnalysis.segment_cache()). 있으면 새 문장만 판별하고 성공한 결과를 채워 넣음(턴 스테이징)"""
     segments = _split_into_segments(text)
-    chain = SEGMENT_CLASSIFY_PROMPT | judge_llm | _segment_judge_parser
-    out: List[Dict[str, Any]] = []
-    for s in segments:
-        try:
-            js = json.loads(chain.invoke({"sent": s}))
-            out.append({"text": s, "on_topic": bool(js.get("on_topic", False)), "score": float(js.get("score", 0.5))})
-        except Exception:
-            out.append({"text": s, "on_topic": False, "score": 0.5})
-    # 폴백(동일 모델에서 모두 0.5 default 느낌일 때, mini로 재시도)
-    if out and all((not x["on_topic"] and abs(x["score"] - 0.5) < 1e-9) for x in out):
-        try:
-            fb_judge = ChatOpenAI(model="gpt-4o-mini", temperature=0.0, max_tokens=220, api_key=OPENAI_API_KEY)
-            fb_chain = SEGMENT_CLASSIFY_PROMPT | fb_judge | _segment_judge_parser
-            out_fb: List[Dict[str, Any]] = []
-            for s in segments:
-                try:
-                    js = json.loads(fb_chain.invoke({"sent": s}))
-                    out_fb.append({"text": s, "on_topic": bool(js.get("on_topic", False)), "score": float(js.get("score", 0.5))})
-                except Exception:
-                    out_fb.append({"text": s, "on_topic": False, "score": 0.5})
-            if any(x["on_topic"] or abs(x["score"] - 0.5) > 0.0 for x in out_fb):
-                out = out_fb
-        except Exception:
-            pass
-    return out
+    chain = llm_structured.structured_chain(SEGMENT_CLASSIFY_PROMPT, judge_llm, llm_structured.SegmentJudgement)
+    cached = {s: known[s] for s in segments if known is not None and s in known}
+    todo = [s for s in dict.fromkeys(segments) if s not in cached]
+    fresh, errored = _judge_segments(chain, todo)
+    # 폴백: 호출이 실패한 문장만 gpt-4o-mini 로 한 번 더 (파싱 실패는 재호출하지 않음)
+    if errored:
+        fb_judge = _build_clients(chat_model="gpt-4o-mini").llm_judge
+        if fb_judge is not judge_llm:
+            fb_chain = llm_structured.structured_chain(SEGMENT_CLASSIFY_PROMPT, fb_judge, llm_structured.SegmentJudgement)
+            fresh.update(_judge_segments(fb_chain, errored)[0])
+    if known is not None:
+        known.update(fresh)
+    labels = {**cached, **fresh}
+    return [dict(labels.get(s, _SEGMENT_DEFAULT), text=s) for s in segments]
 
 def detect_offdomain_task(text: str, judge_llm: ChatOpenAI) -> Dict[str, Any]:
-    chain = OFFDOMAIN_TASK_PROMPT | judge_llm | _offdomain_parser
+    chain = llm_structured.structured_chain(OFFDOMAIN_TASK_PROMPT, judge_llm, llm_structured.OffdomainTask)
     try:
-        js = json.loads(chain.invoke({"whole": text}))
-        return {
-            "non_dementia_task": bool(js.get("non_dementia_task", False)),
-            "spans": [str(x) for x in (js.get("spans") or [])][:2]
-        }
+        js = chain.invoke({"whole": text})
+        return {"non_dementia_task": js["non_dementia_task"], "spans": js["spans"][:2]}
     except Exception:
         return {"non_dementia_task": False, "spans": []}
 
@@ -360,14 +359,46 @@ RESCUE_TRIGGERS = re.compile(
     re.IGNORECASE
 )
 
-def apply_topic_policy(text: str, judge_llm: ChatOpenAI) -> Dict[str, Any]:
-    segs = classify_segments(text, judge_llm)
+def apply_topic_policy(text: str, judge_llm: ChatOpenAI,
+                       sess: Optional[session_analysis.SessionAnalysis] = None) -> Dict[str, Any]:
+    segs = classify_segments(text, judge_llm, known=sess.segment_cache() if sess is not None else None)
+    if not segs:
+        return {"label": "off_topic", "coverage": 0.0, "filtered_text": "", "dropped_segments": [], "offdomain": {}, "segments": []}
+    if sess is not None:
+        offd = sess.offdomain([s["text"] for s in segs], lambda t: detect_offdomain_task(t, judge_llm))
+    else:
+        offd = detect_offdomain_task(text, judge_llm)
+    return _policy_from_segments(text, segs, offd)
+
+def _merge_offdomain(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"non_dementia_task": any(o["non_dementia_task"] for o in results),
+            "spans": [sp for o in results for sp in o["spans"]][:2]}
+
+def _offdomain_chunked(text: str, judge_llm: ChatOpenAI) -> Dict[str, Any]:
+    chunks = transcript_chunks.split_chunks(text) if transcript_chunks.should_chunk(text) else [text]
+    return _merge_offdomain(transcript_chunks.map_parallel(partial(detect_offdomain_task, judge_llm=judge_llm), chunks))
+
+def apply_topic_policy_chunked(text: str, chunks: List[str], judge_llm: ChatOpenAI,
+                               sess: Optional[session_analysis.SessionAnalysis] = None) -> Dict[str, Any]:
+    """긴 입력: 청크별 세그먼트 판별 + 비치매 과업 감지를 병렬 실행 후 합쳐서 같은 정책 적용"""
+    n = len(chunks)
+    known = sess.segment_cache() if sess is not None else None
+    parts = transcript_chunks.run_parallel(
+        [(None, partial(classify_segments, c, judge_llm, known)) for c in chunks]
+        + ([] if sess is not None else [(None, partial(detect_offdomain_task, c, judge_llm)) for c in chunks]))
+    segs = [sg for part in parts[:n] for sg in part]
     if not segs:
         return {"label": "off_topic", "coverage": 0.0, "filtered_text": "", "dropped_segments": [], "offdomain": {}, "segments": []}
+    if sess is not None:
+        # 증분: 이전 턴에서 판정한 블록은 재사용, 새 문장만 (길면 청크 병렬로) 판정
+        offd = sess.offdomain([s["text"] for s in segs], lambda t: _offdomain_chunked(t, judge_llm))
+    else:
+        offd = _merge_offdomain(parts[n:])
+    return _policy_from_segments(text, segs, offd)
 
+def _policy_from_segments(text: str, segs: List[Dict[str, Any]], offd: Dict[str, Any]) -> Dict[str, Any]:
     on = [s for s in segs if s["on_topic"]]
     coverage = len(on) / max(1, len(segs))
-    offd = detect_offdomain_task(text, judge_llm)
 
     if len(on) == 0 and RESCUE_TRIGGERS.search(text):
         on = segs
@@ -399,29 +430,37 @@ def apply_topic_policy(text: str, judge_llm: ChatOpenAI) -> Dict[str, Any]:
 QUERY_PROMPT = ChatPromptTemplate.from_messages([
     ("system",
      "의료 상담 보조 검색어 생성기이다. 입력 STT에서 핵심 증상/키워드를 뽑아 "
-     "치매/경도인지장애와 관련된 한국어 검색질의 2~4개를 JSON 배열로만 출력하라."),
+     "치매/경도인지장애와 관련된 한국어 검색질의 2~4개를 JSON 객체로만 출력하라: {{\"queries\": [\"...\"]}}"),
     ("human", "{transcript}")
 ])
 
 def make_search_queries(transcript: str, query_llm: ChatOpenAI) -> List[str]:
-    parser = StrOutputParser()
-    chain = QUERY_PROMPT | query_llm | parser
+    chain = llm_structured.structured_chain(QUERY_PROMPT, query_llm, llm_structured.SearchQueries)
     base = ["치매 초기 증상", "경도인지장애 언어 유창성", "일상 안전 가족 교육", "단기 기억력 저하 원인"]
     try:
-        raw = chain.invoke({"transcript": transcript})
-        qs = [q for q in json.loads(raw) if isinstance(q, str)]
+        qs = [q for q in chain.invoke({"transcript": transcript})["queries"] if q.strip()]
         return (qs + base)[:4]
     except Exception:
         return base[:4]
 
 def ddgs_search(query: str, k: int = 5) -> List[Document]:
+    request_deadline.check()
+    timeout = request_deadline.call_timeout()
+    if LLM_BACKEND == "stub":
+        try:
+            return llm_stub.search(query, k, timeout=timeout)
+        except Exception as e:
+            print(f"⚠️ stub 검색 실패: {e}")
+            return []
     try:
         from ddgs import DDGS
     except Exception:
         return []
     docs: List[Document] = []
+    # DDGS 기본 timeout 5초 → 요청 마감이 더 짧으면 그에 맞춤
+    ddgs_kw = {} if timeout is None else {"timeout": max(1, int(min(timeout, 5)))}
     try:
-        with DDGS() as d:
+        with DDGS(**ddgs_kw) as d:
             for i, item in enumerate(d.text(query, max_results=k)):
                 title = item.get("title") or ""
                 link  = item.get("href") or ""
@@ -438,11 +477,30 @@ def ddgs_search(query: str, k: int = 5) -> List[Document]:
 def multi_engine_search(query: str, k: int = 5) -> List[Document]:
     return ddgs_search(query, k)
 
-def _embed_texts(texts: List[str], embeddings: OpenAIEmbeddings) -> List[List[float]]:
-    return embeddings.embed_documents(texts)
-
-def _embed_query(text: str, embeddings: OpenAIEmbeddings) -> List[float]:
-    return embeddings.embed_query(text)
+def _timeout_kw() -> Dict[str, Any]:
+    t = request_deadline.call_timeout()
+    return {} if t is None else {"timeout": t}
+
+def _embed_texts(texts: List[str], embeddings: OpenAIEmbeddings,
+                 sess: Optional[session_analysis.SessionAnalysis] = None) -> List[List[float]]:
+    def _embed(ts: List[str]) -> List[List[float]]:
+        request_deadline.check()
+        llm_usage.record_embedding(embeddings.model, ts)
+        return embeddings.embed_documents(ts, **_timeout_kw())
+    if sess is None:
+        return _embed(texts)
+    # 세션 캐시: 이전 턴에서 임베딩한 문서/질의는 재사용
+    return sess.cached_embeddings(embeddings.model, texts, _embed)
+
+def _embed_query(text: str, embeddings: OpenAIEmbeddings,
+                 sess: Optional[session_analysis.SessionAnalysis] = None) -> List[float]:
+    def _embed(ts: List[str]) -> List[List[float]]:
+        request_deadline.check()
+        llm_usage.record_embedding(embeddings.model, ts)
+        return [embeddings.embed_query(ts[0], **_timeout_kw())]
+    if sess is None:
+        return _embed([text])[0]
+    return sess.cached_embeddings(embeddings.model, [text], _embed)[0]
 
 def _cosine(a: List[float], b: List[float]) -> float:
     import numpy as np
@@ -456,18 +514,20 @@ def build_rag_context_rerank(
     embeddings: OpenAIEmbeddings,
     k_search: int = 8,
     k_rerank: int = 8,
-    k_final: int  = 4
+    k_final: int  = 4,
+    sess: Optional[session_analysis.SessionAnalysis] = None,
 ) -> Tuple[str, List[Dict[str, str]]]:
-    all_docs: List[Document] = []
-    for q in queries:
-        all_docs.extend(multi_engine_search(q, k=max(3, k_search // max(1, len(queries)) + 1)))
+    # 질의별 검색은 서로 독립 → 병렬(같은 요청 마감 안에서)
+    k_each = max(3, k_search // max(1, len(queries)) + 1)
+    all_docs: List[Document] = [d for docs in transcript_chunks.map_parallel(
+        partial(multi_engine_search, k=k_each), queries) for d in docs]
     if not all_docs:
         return "", []
     combined_query = ((" ".join(queries)) + " " + transcript[:600]).strip()
-    q_emb = _embed_query(combined_query, embeddings)
+    q_emb = _embed_query(combined_query, embeddings, sess)
     cand = all_docs[:k_rerank]
     cand_texts = [d.page_content for d in cand]
-    cand_embs  = _embed_texts(cand_texts, embeddings)
+    cand_embs  = _embed_texts(cand_texts, embeddings, sess)
     scored = [(_cosine(q_emb, e), i) for i, e in enumerate(cand_embs)]
     scored.sort(key=lambda x: x[0], reverse=True)
     top_docs = [cand[i] for (_, i) in scored[:k_final]]
@@ -485,98 +545,70 @@ EMO_PROMPT = ChatPromptTemplate.from_messages([
      " - evidence_sentences: 원문 그대로 발췌 1~2개(각 6~100자)\n"
      " - keywords: 원문/근거문장에 실제로 등장하거나 대표하는 단어/구 3~8개\n"
      "유사 감정 통합, 중복 문장 제거, 총 1~4개. "
-     "오직 JSON 배열만 출력: "
-     "[{{\"emotion\":\"...\", \"evidence_sentences\":[\"...\"], \"keywords\":[\"...\"]}}, ...]"),
+     "오직 JSON 객체만 출력: "
+     "{{\"items\": [{{\"emotion\":\"...\", \"evidence_sentences\":[\"...\"], \"keywords\":[\"...\"]}}, ...]}}"),
     ("human", "텍스트:\n{transcript}\n오직 JSON:")
 ])
 
 FORCE_PROMPT = ChatPromptTemplate.from_messages([
     ("system", "최소 1개 감정 항목을 반드시 생성한다. 포맷/제약 동일. 오직 JSON. "
                "예시 형식: "
-               "[{{\"emotion\":\"...\", \"evidence_sentences\":[\"...\"], \"keywords\":[\"...\"]}}]"),
+               "{{\"items\": [{{\"emotion\":\"...\", \"evidence_sentences\":[\"...\"], \"keywords\":[\"...\"]}}]}}"),
     ("human", "텍스트:\n{transcript}\n오직 JSON:")
 ])
 
 def extract_emotions_with_keywords(transcript: str, emo_llm: ChatOpenAI) -> List[Dict]:
-    parser = StrOutputParser()
-    emo_chain   = EMO_PROMPT   | emo_llm | parser
-    force_chain = FORCE_PROMPT | emo_llm | parser
-
-    def _top_keywords_from_text(text: str, k: int=6) -> List[str]:
-        toks = re.findall(r"[가-힣]{2,}", text)
-        out, seen = [], set()
-        for t in toks:
-            if t not in seen:
-                seen.add(t); out.append(t)
-            if len(out) >= k:
-                break
-        return out
-
-    def _parse_emo_json(raw: str) -> List[Dict]:
-        def _to_json(r: str) -> Any:
+    """
+    감정 항목 추출(구조화 출력). 재호출은 두 경우만:
+    - 검증 통과했지만 항목이 비면 FORCE_PROMPT 1회(최소 1개 요구)
+    - 호출 자체가 실패(네트워크/API)하면 gpt-4o-mini 로 같은 순서 1회
+    파싱/검증 실패는 재호출 없이 [] (파이프라인에서 휴리스틱 보강)
+    """
+    def _clean(data: Dict[str, Any]) -> List[Dict]:
+        items = []
+        for it in data["items"]:
+            emo = it["emotion"].strip()
+            evs = [e.strip() for e in it["evidence_sentences"]]
+            kws = [k.strip() for k in it["keywords"]]
+            evs = [e for e in evs if 6 <= len(e) <= 120][:2]
+            if not emo or not evs:
+                continue
+            if len(kws) < 3:
+                for e in evs:
+                    # 간단 키워드 보강
+                    toks = re.findall(r"[가-힣]{2,}", e)
+                    for t in toks[:4]:
+                        if t not in kws:
+                            kws.append(t)
+            kws = list(dict.fromkeys([k for k in kws if 1 <= len(k) <= 20]))[:8]
+            if not kws:
+                toks = re.findall(r"[가-힣]{2,}", " ".join(evs))
+                kws = list(dict.fromkeys(toks))[:5]
+            items.append({"emotion": emo, "evidence_sentences": evs, "keywords": kws})
+        return items[:4]
+
+    def _run(llm: ChatOpenAI) -> List[Dict]:
+        for prompt in (EMO_PROMPT, FORCE_PROMPT):
+            chain = llm_structured.structured_chain(prompt, llm, llm_structured.EmotionItems)
             try:
-                return json.loads(r)
-            except Exception:
-                # 코드펜스/스마트따옴표/트레일링 콤마 등 보정
-                return _json_loose_loads(r)
-    
-        try:
-            data = _to_json(raw)
-            if not isinstance(data, list):
+                items = _clean(chain.invoke({"transcript": transcript}))
+            except OutputParserException:
                 return []
-            items = []
-            for it in data:
-                emo = (it.get("emotion") or "").strip()
-                evs = [e.strip() for e in (it.get("evidence_sentences") or []) if isinstance(e, str)]
-                kws = [k.strip() for k in (it.get("keywords") or []) if isinstance(k, str)]
-                evs = [e for e in evs if 6 <= len(e) <= 120][:2]
-                if not emo or not evs:
-                    continue
-                if len(kws) < 3:
-                    for e in evs:
-                        # 간단 키워드 보강
-                        toks = _re.findall(r"[가-힣]{2,}", e)
-                        for t in toks[:4]:
-                            if t not in kws:
-                                kws.append(t)
-                kws = list(dict.fromkeys([k for k in kws if 1 <= len(k) <= 20]))[:8]
-                if not kws:
-                    toks = _re.findall(r"[가-힣]{2,}", " ".join(evs))
-                    kws = list(dict.fromkeys(toks))[:5]
-                items.append({"emotion": emo, "evidence_sentences": evs, "keywords": kws})
-            return items[:4]
-        except Exception:
-            return []
-
+            if items:
+                return items
+        return []
 
-    # 1차
     try:
-        raw = emo_chain.invoke({"transcript": transcript})
+        return _run(emo_llm)
     except Exception:
-        raw = ""
-    items = _parse_emo_json(raw)
-    if not items:
-        try:
-            raw2 = force_chain.invoke({"transcript": transcript})
-        except Exception:
-            raw2 = "[]"
-        items = _parse_emo_json(raw2)
-    if items:
-        return items
-
-    # 2차 폴백(gpt-4o-mini)
+        pass
+
+    # 폴백(gpt-4o-mini) — 호출 실패 시에만
     try:
-        fb = ChatOpenAI(model="gpt-4o-mini", temperature=0.1, max_tokens=400, api_key=OPENAI_API_KEY)
-        fb_chain   = EMO_PROMPT   | fb | parser
-        fb_force   = FORCE_PROMPT | fb | parser
-        raw = fb_chain.invoke({"transcript": transcript})
-        items = _parse_emo_json(raw)
-        if not items:
-            raw = fb_force.invoke({"transcript": transcript})
-            items = _parse_emo_json(raw)
+        fb = _build_clients(chat_model="gpt-4o-mini").llm_emo
+        return _run(fb) if fb is not emo_llm else []
     except Exception:
-        items = []
-    return items
+        return []
 
 def build_psych_bullets_from_items(items: List[Dict]) -> str:
     if not items:
@@ -589,6 +621,70 @@ def build_psych_bullets_from_items(items: List[Dict]) -> str:
         lines.append(f"- {emo}\n  - 근거문장 : “{ev}”\n  - 키워드 : [{kws}]")
     return "\n".join(lines)
 
+# -------------------------------
+# 6-1) 긴 입력: 청크 map-reduce
+# -------------------------------
+DIGEST_PROMPT = ChatPromptTemplate.from_messages([
+    ("system",
+     "너는 치매 상담 기록 정리 보조다. 아래 STT 구간에서 기억/언어/방향감각/일상생활 관련 증상, 구체적 사례, "
+     "감정 표현을 원문 표현을 살려 '-' 불릿 3~6개로 발췌 요약하라. "
+     "해석/진단/추측 금지. 해당 내용이 없으면 '- (없음)'만 출력."),
+    ("human", "STT 구간:\n{chunk}\n\n불릿만 출력:")
+])
+
+def digest_chunk(chunk: str, digest_llm: ChatOpenAI) -> str:
+    try:
+        out = llm_structured.text_chain(DIGEST_PROMPT, digest_llm).invoke({"chunk": chunk}).strip()
+    except Exception as e:
+        print(f"⚠️ 청크 발췌요약 실패: {e}")
+        out = ""
+    # 실패/빈 출력이면 원문 청크 그대로(상한 이하라 reduce 에서 다시 접힘)
+    lines = [ln for ln in out.splitlines() if ln.strip() and "(없음)" not in ln]
+    return "\n".join(lines) if out else chunk
+
+def reduce_digests(digests: List[str], digest_llm: ChatOpenAI, max_rounds: int = 3) -> Tuple[str, int]:
+    """청크 발췌요약을 이어 붙이고, 상한을 넘으면 다시 청크로 나눠 발췌요약(재귀 reduce). 반환: (텍스트, 접은 횟수)"""
+    text = "\n".join(d for d in digests if d.strip())
+    rounds = 0
+    while llm_usage.estimate_tokens(text) > transcript_chunks.CHUNK_REDUCE_TOKENS and rounds < max_rounds:
+        parts = transcript_chunks.split_chunks(text)
+        text = "\n".join(d for d in transcript_chunks.map_parallel(
+            partial(digest_chunk, digest_llm=digest_llm), parts) if d.strip())
+        rounds += 1
+    return text, rounds
+
+def merge_topic_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """청크별 detect_topic → 하나라도 on_topic 이면 그중 최고 확률, 아니면 전체 최고 확률"""
+    if not results:
+        return {"label": "off_topic", "prob": 0.0, "evidence": []}
+    on = [r for r in results if r["label"] == "on_topic"]
+    best = max(on or results, key=lambda r: float(r["prob"]))
+    return {"label": best["label"], "prob": float(best["prob"]),
+            "evidence": [e for r in (on or [best]) for e in r.get("evidence", [])][:3]}
+
+def merge_emotion_items(lists: List[List[Dict]], limit: int = 4) -> List[Dict]:
+    """청크별 감정 항목 병합: 같은 감정 라벨끼리 근거/키워드 합침, 많은 청크에서 나온 감정 우선"""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for items in lists:
+        for it in items or []:
+            m = merged.setdefault(it["emotion"], {"emotion": it["emotion"], "evidence_sentences": [],
+                                                  "keywords": [], "_n": 0})
+            m["_n"] += 1
+            m["evidence_sentences"] = list(dict.fromkeys(m["evidence_sentences"] + it["evidence_sentences"]))[:2]
+            m["keywords"] = list(dict.fromkeys(m["keywords"] + it["keywords"]))[:8]
+    ranked = sorted(merged.values(), key=lambda m: -m["_n"])   # 안정 정렬 → 동률이면 먼저 나온 순
+    return [{k: v for k, v in m.items() if k != "_n"} for m in ranked[:limit]]
+
+def map_transcript_chunks(chunks: List[str], judge_llm: ChatOpenAI, emo_llm: ChatOpenAI,
+                          digest_llm: ChatOpenAI) -> Tuple[Dict[str, Any], List[Dict], List[str]]:
+    """청크 × (온토픽, 감정, 발췌요약)을 한 풀에서 병렬 실행 → (병합 온토픽, 병합 감정, 청크별 발췌요약)"""
+    n = len(chunks)
+    res = transcript_chunks.run_parallel(
+        [("topic",   partial(detect_topic, c, judge_llm)) for c in chunks]
+        + [("emotion", partial(extract_emotions_with_keywords, c, emo_llm)) for c in chunks]
+        + [("digest",  partial(digest_chunk, c, digest_llm)) for c in chunks])
+    return merge_topic_results(res[:n]), merge_emotion_items(res[n:2 * n]), res[2 * n:]
+
 # -------------------------------
 # 7) 요약 & 구조화 요약
 # -------------------------------
@@ -657,16 +753,33 @@ ROBUST_SUMMARY_PROMPT = ChatPromptTemplate.from_messages(
     ]
 )
 
+# 세션 증분: 기존 요약 + 새 발화(델타)만으로 갱신 (이전 원문은 다시 보내지 않음)
+UPDATE_SUMMARY_PROMPT = ChatPromptTemplate.from_messages(
+    [
+      ("system", SYSTEM_PERSONA + "\n\n"
+        "같은 상담 세션의 기존 요약에 새 발화 내용을 반영해 요약을 갱신하세요. "
+        "기존 항목은 유지하고 중복은 합치며, 새로 드러난 증상/사례/해석/주의사항만 해당 섹션에 추가하세요. "
+        "새 발화에 해당 내용이 없으면 기존 요약을 그대로 유지하세요."),
+      ("human",
+       "가이드 질문: {guide_question}\n\n"
+       "기존 세션 요약:\n{previous_summary}\n\n"
+       "참고 문서(요약):\n{rag_context}\n\n"
+       "새 발화 STT:\n{transcript}\n\n"
+       "심리상태 제공 불릿(세션 전체, 그대로 사용):\n{psych_bullets_fixed}\n\n"
+       "아래 형식으로 갱신된 <요약> 섹션만 출력하세요:\n{summary_template}")
+    ]
+)
+
 JSON_SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
     ("system",
      "입력에 기반하여 다음 필드를 갖는 JSON 객체만 출력하라:\n"
-     "{"
+     "{{"
      "\"primary_symptoms\": [\"...\"], "
      "\"counselling\": [\"...\"], "
-     "\"psych\": [{\"emotion\":\"...\",\"evidence\":\"...\",\"keywords\":[\"...\"]}], "
+     "\"psych\": [{{\"emotion\":\"...\",\"evidence\":\"...\",\"keywords\":[\"...\"]}}], "
      "\"ai_interpretation\": [\"...\"], "
      "\"cautions\": [\"...\"]"
-     "}\n"
+     "}}\n"
      "psych는 제공된 psych_items를 그대로 사용하고, 나머지는 STT와 참고 문서에서 요약하라."),
     ("human",
      "STT:\n{transcript}\n\n"
@@ -676,14 +789,52 @@ JSON_SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
 ])
 
 def _make_summary_chain(llm_summary: ChatOpenAI):
-    return SUMMARISE_PROMPT | llm_summary | StrOutputParser()
+    return llm_structured.text_chain(SUMMARISE_PROMPT, llm_summary)
 
 def _make_json_summary_chain(llm_summary: ChatOpenAI):
-    return JSON_SUMMARY_PROMPT | llm_summary | StrOutputParser()
+    return llm_structured.structured_chain(JSON_SUMMARY_PROMPT, llm_summary, llm_structured.StructuredSummary)
 
 # -------------------------------
 # 8) 파이프라인 함수
 # -------------------------------
+class _StageTimer:
+    """단계별 소요 시간(초) 누적 → 응답의 timings (ledger 가 있으면 토큰도 같은 단계명으로 집계)"""
+    def __init__(self, ledger: Optional[llm_usage.UsageLedger] = None):
+        self.t0 = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+        self.ledger = ledger
+
+    @contextmanager
+    def stage(self, name: str):
+        t = time.perf_counter()
+        prev = self.ledger.stage if self.ledger else None
+        if self.ledger:
+            self.ledger.stage = name
+        try:
+            yield
+        finally:
+            dt = time.perf_counter() - t
+            self.timings[name] = round(self.timings.get(name, 0.0) + dt, 4)
+            if self.ledger:
+                self.ledger.stage = prev
+                self.ledger.stage_done(name, dt)
+
+    def result(self) -> Dict[str, float]:
+        return dict(self.timings, total=round(time.perf_counter() - self.t0, 4))
+
+def _routed_llm(ledger: Optional[llm_usage.UsageLedger], clients: ClientBundle, mini: ClientBundle,
+                stage: str, component: str, prompt_text: str) -> Tuple[ChatOpenAI, str]:
+    """llm_usage 라우팅 정책 적용 → (사용할 클라이언트, 모델명)"""
+    model = clients.model_ids[component]
+    if ledger is not None:
+        model = ledger.route(stage, model, prompt_text)
+    bundle = clients if model == clients.model_ids[component] else mini
+    return bundle.llm(component), model
+
+@llm_usage.metered("chatbot")
+@llm_structured.bounded
+@session_analysis.incremental("chatbot", params=("guide_question_index", "chat_model", "embed_model",
+                                                 "temperature", "max_tokens", "models"))
 def run_summarisation_pipeline(
     transcript: str,
     guide_question_index: int = 3,
@@ -695,6 +846,8 @@ def run_summarisation_pipeline(
     models: Optional[Dict[str, str]] = None,
 ) -> Dict[str, Any]:
 
+    ledger = llm_usage.current()
+    timer = _StageTimer(ledger)
     clients = _build_clients(
         chat_model=chat_model,
         embed_model=embed_model,
@@ -702,9 +855,26 @@ def run_summarisation_pipeline(
         max_tokens=max_tokens,
         models=models,
     )
-
-    # ❶ 세그먼트 정책 적용
-    seg_policy = apply_topic_policy(transcript, judge_llm=clients.llm_judge)
+    # mini 번들: 라우팅 대상 + 요약 폴백(alt)
+    alt = _build_clients(chat_model="gpt-4o-mini",
+                         embed_model=clients.model_ids["embed"],
+                         temperature=clients.temperature,
+                         max_tokens=clients.max_tokens)
+    used_models = dict(clients.model_ids)
+    sess = session_analysis.current()   # 세션 증분 분석(없으면 매번 전체 분석)
+
+    def _llm(stage: str, component: str, prompt_text: str) -> ChatOpenAI:
+        llm, used_models[component] = _routed_llm(ledger, clients, alt, stage, component, prompt_text)
+        return llm
+
+    # ❶ 세그먼트 정책 적용 (긴 입력은 청크별 병렬, 세션에서 판별한 문장은 재사용)
+    policy_chunks = transcript_chunks.split_chunks(transcript) if transcript_chunks.should_chunk(transcript) else []
+    with timer.stage("policy"):
+        if policy_chunks:
+            seg_policy = apply_topic_policy_chunked(
+                transcript, policy_chunks, judge_llm=_llm("policy", "judge", max(policy_chunks, key=len)), sess=sess)
+        else:
+            seg_policy = apply_topic_policy(transcript, judge_llm=_llm("policy", "judge", transcript), sess=sess)
     if seg_policy["label"] == "off_topic":
         _update_session(session_id, "off_topic", 0.0)
         return {
@@ -718,7 +888,8 @@ def run_summarisation_pipeline(
                 "offdomain": seg_policy["offdomain"],
                 "segments": seg_policy.get("segments", [])
             },
-            "used_models": clients.model_ids
+            "used_models": used_models,
+            "timings": timer.result()
         }
 
     if seg_policy["label"] == "partial":
@@ -728,108 +899,116 @@ def run_summarisation_pipeline(
         working_transcript = transcript.strip()
         mix_msg = ""
 
-    # ❷ 로그용 prior 업데이트
-    det = detect_topic(working_transcript, judge_llm=clients.llm_judge, session_id=session_id)
+    # ❷-0 세션 증분: 이전 턴에서 처리한 문장은 제외(analysis_text = 델타), 새 내용이 없으면 마지막 결과 재사용
+    analysis_text, delta_keys = working_transcript, []
+    if sess is not None:
+        analysis_text, delta_keys = sess.delta(working_transcript)
+        if not analysis_text and sess.last_result is not None:
+            print(f"♻️ [{session_id}] 새 문장 없음 → 세션 마지막 결과 재사용")
+            reused = copy.deepcopy(sess.last_result)
+            reused["incremental"] = sess.info("reused", 0)
+            reused["timings"] = timer.result()
+            return reused
+        analysis_text = analysis_text or working_transcript
+
+    # ❷ 로그용 prior 업데이트 — 긴 입력은 청크 map(온토픽·감정·발췌요약 병렬) 후 reduce
+    #    이후 단계 입력(source_text): 짧으면 원문(델타), 길면 접은 발췌요약
+    work_chunks = transcript_chunks.split_chunks(analysis_text) if transcript_chunks.should_chunk(analysis_text) else []
+    reduce_rounds = 0
+    if work_chunks:
+        longest = max(work_chunks, key=len)
+        # 발췌요약은 감정 추출과 같은 설정(저온·500토큰) 클라이언트 사용
+        digest_llm, _ = _routed_llm(ledger, clients, alt, "digest", "emotion", longest)
+        with timer.stage("map"):
+            det, psych_items, digests = map_transcript_chunks(
+                work_chunks,
+                judge_llm=_llm("topic", "judge", longest),
+                emo_llm=_llm("emotion", "emotion", longest),
+                digest_llm=digest_llm)
+        with timer.stage("reduce"):
+            source_text, reduce_rounds = reduce_digests(digests, digest_llm)
+        source_text = source_text or analysis_text[:transcript_chunks.CHUNK_REDUCE_TOKENS * 2]
+    else:
+        with timer.stage("topic"):
+            det = detect_topic(analysis_text, judge_llm=_llm("topic", "judge", analysis_text), session_id=session_id)
+        source_text = analysis_text
+    det_new = det
+    if sess is not None:
+        det = merge_topic_results([b["topic"] for b in sess.blocks] + [det_new])
     _update_session(session_id, det["label"], float(det["prob"]))
 
-    # ❸ RAG
+    # ❸ RAG — 선택 단계: 요약 몫(DEADLINE_RESERVE_SEC)을 남긴 하위 마감 안에서만, 넘기면 RAG 없이 요약
     guide_question = GUIDE_QUESTIONS[max(0, min(3, int(guide_question_index)))]
-    queries = make_search_queries(working_transcript, clients.llm_query)
-    rag_context, rag_sources = build_rag_context_rerank(working_transcript, queries, clients.embeddings)
-
-    # ❹ 감정/근거/키워드
-    psych_items = extract_emotions_with_keywords(working_transcript, clients.llm_emo)
+    degraded: List[str] = []
+    queries, rag_context, rag_sources = [], "", []
+    try:
+        with request_deadline.within("rag") as rag_deadline:
+            with timer.stage("queries"):
+                queries = make_search_queries(source_text, _llm("queries", "query", source_text))
+            with timer.stage("rag"):
+                rag_context, rag_sources = build_rag_context_rerank(source_text, queries, clients.embeddings, sess=sess)
+        if not rag_context and rag_deadline is not None and rag_deadline.expired:
+            degraded.append("rag")   # 검색 timeout 으로 문서 없이 끝난 경우
+    except request_deadline.DeadlineExceeded:
+        request_deadline.check()   # 요청 전체 마감/취소면 그대로 전파
+        rag_context, rag_sources = "", []
+        degraded.append("rag")
+
+    # ❹ 감정/근거/키워드 (청크 모드는 map 에서 이미 추출) — 세션 증분이면 이전 턴 블록과 병합
+    #    선택 단계: 마감이 가까우면 생략(아래 구조화 단계에서 휴리스틱으로 최소 1개 보강)
+    if not work_chunks:
+        try:
+            with request_deadline.within("emotion"), timer.stage("emotion"):
+                psych_items = extract_emotions_with_keywords(analysis_text, _llm("emotion", "emotion", analysis_text))
+        except request_deadline.DeadlineExceeded:
+            request_deadline.check()
+            psych_items = []
+            degraded.append("emotion")
+    new_block = {"topic": det_new, "emotions": psych_items}
+    if sess is not None:
+        psych_items = merge_emotion_items([b["emotions"] for b in sess.blocks] + [new_block["emotions"]])
     psych_bullets_fixed = build_psych_bullets_from_items(psych_items)
 
-    # ❺ 요약 (빈 출력 방지: 강건 프롬프트 → mini 폴백)
-    summary_chain = _make_summary_chain(clients.llm_summary)
-    try:
-        _raw_summary = summary_chain.invoke({
-            "transcript": working_transcript,
-            "rag_context": rag_context.strip() if rag_context else "(문맥 없음)",
-            "guide_question": guide_question,
-            "summary_template": SUMMARY_TEMPLATE,
-            "psych_bullets_fixed": psych_bullets_fixed if psych_bullets_fixed else "(없음)",
-        })
-    except Exception:
-        _raw_summary = ""
+    # ❺ 요약 (빈 출력 방지: 강건 프롬프트 → mini 폴백) — 헤지 실행
+    summary_inputs = {
+        "transcript": source_text,
+        "rag_context": rag_context.strip() if rag_context else "(문맥 없음)",
+        "guide_question": guide_question,
+        "summary_template": SUMMARY_TEMPLATE,
+        "psych_bullets_fixed": psych_bullets_fixed if psych_bullets_fixed else "(없음)",
+    }
+    # 세션에 기존 요약이 있으면 '기존 요약 + 델타' 갱신(전체 재생성 대신)
+    previous_summary = sess.summary if sess is not None else ""
+    if previous_summary:
+        summary_inputs["previous_summary"] = previous_summary
+    summary_llm   = _llm("summary", "summary", "".join(str(v) for v in summary_inputs.values()))
+    summary_model = used_models["summary"]
+    if previous_summary:
+        update_chain     = llm_structured.text_chain(UPDATE_SUMMARY_PROMPT, summary_llm)
+        alt_update_chain = llm_structured.text_chain(UPDATE_SUMMARY_PROMPT, alt.llm_summary)
+        summary_candidates = [
+            llm_hedge.Candidate(f"update:{summary_model}", lambda: update_chain.ainvoke(summary_inputs)),
+            llm_hedge.Candidate(f"alt:{alt.model_ids['summary']}", lambda: alt_update_chain.ainvoke(summary_inputs)),
+        ]
+    else:
+        summary_chain = _make_summary_chain(summary_llm)
+        robust_chain  = llm_structured.text_chain(ROBUST_SUMMARY_PROMPT, summary_llm)
+        alt_chain     = llm_structured.text_chain(ROBUST_SUMMARY_PROMPT, alt.llm_summary)
+        summary_candidates = [
+            llm_hedge.Candidate(f"main:{summary_model}",   lambda: summary_chain.ainvoke(summary_inputs)),
+            llm_hedge.Candidate(f"robust:{summary_model}", lambda: robust_chain.ainvoke(summary_inputs)),
+            llm_hedge.Candidate(f"alt:{alt.model_ids['summary']}", lambda: alt_chain.ainvoke(summary_inputs)),
+        ]
+    with timer.stage("summary"):
+        summary_hedge = llm_hedge.run_hedged(summary_candidates, stage="summary")
 
-    def _ensure_summary_not_empty(summary_text: str) -> Tuple[str, str, bool]:
-        if summary_text and summary_text.strip():
-            return summary_text.strip(), clients.model_ids["summary"], False
-        # 같은 모델 + 강건 프롬프트
-        try:
-            robust_chain = ROBUST_SUMMARY_PROMPT | clients.llm_summary | StrOutputParser()
-            s2 = robust_chain.invoke({
-                "transcript": working_transcript,
-                "rag_context": rag_context.strip() if rag_context else "(문맥 없음)",
-                "guide_question": guide_question,
-                "summary_template": SUMMARY_TEMPLATE,
-                "psych_bullets_fixed": psych_bullets_fixed or "(없음)",
-            }).strip()
-        except Exception:
-            s2 = ""
-        if s2:
-            return s2, clients.model_ids["summary"], False
-        # 폴백: gpt-4o-mini
-        alt = _build_clients(chat_model="gpt-4o-mini",
-                             embed_model=clients.model_ids["embed"],
-                             temperature=clients.temperature,
-                             max_tokens=clients.max_tokens)
-        try:
-            alt_chain = ROBUST_SUMMARY_PROMPT | alt.llm_summary | StrOutputParser()
-            s3 = alt_chain.invoke({
-                "transcript": working_transcript,
-                "rag_context": rag_context.strip() if rag_context else "(문맥 없음)",
-                "guide_question": guide_question,
-                "summary_template": SUMMARY_TEMPLATE,
-                "psych_bullets_fixed": psych_bullets_fixed or "(없음)",
-            }).strip()
-        except Exception:
-            s3 = ""
-        return s3, alt.model_ids["summary"], True
-
-    summary_text, summary_model_used, did_fb = _ensure_summary_not_empty(_raw_summary)
+    if summary_hedge.winner and not summary_hedge.winner.startswith("alt:"):
+        summary_text, summary_model_used, did_fb = summary_hedge.value.strip(), summary_model, False
+    else:
+        # mini 가 이겼거나 전부 실패(빈 문자열) — 기존 직렬 폴백의 마지막 단계와 같은 표기
+        summary_text, summary_model_used, did_fb = (summary_hedge.value or "").strip(), alt.model_ids["summary"], True
 
     # ❻ 구조화 요약(JSON) — BEGIN REPLACE
-    def __loose_json_loads(text: str) -> dict:
-        """코드펜스/스마트따옴표/트레일링 콤마가 있어도 최대한 파싱"""
-        if not text:
-            raise ValueError("empty")
-        t = text.strip()
-        t = re.sub(r"^```(?:json)?\s*", "", t)
-        t = re.sub(r"\s*```$", "", t)
-        m = re.search(r"\{.*\}", t, flags=re.DOTALL)
-        if not m:
-            raise ValueError("no-json-object")
-        s = m.group(0)
-        s = s.replace("“", "\"").replace("”", "\"").replace("’", "'").replace("‘", "'")
-        s = re.sub(r",(\s*[}\]])", r"\1", s)
-        return json.loads(s)
-
-    def __json_mode_chat(model_id: str):
-        """JSON 전용 응답 강제 (langchain-openai 버전 호환)"""
-        try:
-            return ChatOpenAI(
-                model=model_id,
-                temperature=clients.temperature,
-                max_tokens=clients.max_tokens,
-                api_key=OPENAI_API_KEY,
-                model_kwargs={"response_format": {"type": "json_object"}}
-            )
-        except TypeError:
-            # 일부 버전은 extra_body 사용
-            return ChatOpenAI(
-                model=model_id,
-                temperature=clients.temperature,
-                max_tokens=clients.max_tokens,
-                api_key=OPENAI_API_KEY,
-                extra_body={"response_format": {"type": "json_object"}}
-            )
-
-    def _make_json_chain_with_model(model_id: str) -> Any:
-        return _make_json_summary_chain(__json_mode_chat(model_id))
-
     def __structured_from_summary_text(summary_text: str) -> Dict[str, Any]:
         """
         <요약> 텍스트를 다시 파싱해 구조화. 심리상태는
@@ -916,35 +1095,49 @@ def run_summarisation_pipeline(
                 added.append(emo)
                 break  # 최소 1개만 보장
 
-    # 1차: 실제 요약에 사용한 모델로 JSON 생성(엄격 JSON 모드)
+    # 1차: 실제 요약에 사용한 모델로 JSON 생성(엄격 JSON 모드), 2차: gpt-4o-mini — 헤지 실행
+    # 세션 갱신 모드: 누적 요약(압축된 세션 전체)을 STT 대신 사용
+    json_inputs = {
+        "transcript": summary_text if previous_summary and summary_text else source_text,
+        "rag_context": rag_context.strip() if rag_context else "",
+        "psych_items_json": json.dumps(psych_items, ensure_ascii=False),
+    }
+
+    def __json_candidate(model_id: str, role: str) -> llm_hedge.Candidate:
+        # 요약용 클라이언트(설정별 캐시)에 스키마 바인딩 — 체인도 캐시에서 재사용
+        bundle = clients if model_id == clients.model_ids["summary"] else alt
+        chain = _make_json_summary_chain(bundle.llm_summary)
+        return llm_hedge.Candidate(f"{role}:{model_id}", lambda: chain.ainvoke(json_inputs))
+
+    json_model = summary_model_used
+    if ledger is not None:
+        json_model = ledger.route("structured", json_model, "".join(json_inputs.values()))
+    # 선택 단계: 요약은 이미 있으므로 하위 마감(응답 조립 몫 DEADLINE_FINAL_RESERVE_SEC 남김)을 넘기면
+    # 요약 텍스트에서 재구성 — 요청 자체의 취소/마감 초과만 그대로 전파
     try:
-        json_summary_chain = _make_json_chain_with_model(summary_model_used)
-        structured_raw = json_summary_chain.invoke({
-            "transcript": working_transcript,
-            "rag_context": rag_context.strip() if rag_context else "",
-            "psych_items_json": json.dumps(psych_items, ensure_ascii=False),
-        })
-        structured = __loose_json_loads(structured_raw)
-    except Exception:
-        # 2차: 폴백(gpt-4o-mini)로 재시도
-        try:
-            json_summary_chain = _make_json_chain_with_model("gpt-4o-mini")
-            structured_raw = json_summary_chain.invoke({
-                "transcript": working_transcript,
-                "rag_context": rag_context.strip() if rag_context else "",
-                "psych_items_json": json.dumps(psych_items, ensure_ascii=False),
-            })
-            structured = __loose_json_loads(structured_raw)
-        except Exception:
-            # 최종 폴백: 요약 텍스트에서 재구성
-            structured = __structured_from_summary_text(summary_text)
+        with request_deadline.within("structured", reserve=request_deadline.FINAL_RESERVE_SEC), timer.stage("structured"):
+            json_hedge = llm_hedge.run_hedged([
+                __json_candidate(json_model, "main"),
+                __json_candidate("gpt-4o-mini", "alt"),
+            ], stage="structured", valid=lambda v: isinstance(v, dict),
+               # 파싱/스키마 실패는 alt 로 같은 JSON 요청을 다시 보내지 않고 요약 텍스트 재구성으로
+               terminal=lambda e: isinstance(e, OutputParserException))
+    except request_deadline.DeadlineExceeded:
+        request_deadline.check()
+        json_hedge = llm_hedge.HedgeResult(None, None)
+        degraded.append("structured")
+    if json_hedge.winner:
+        structured = json_hedge.value
+    else:
+        # 최종 폴백: 요약 텍스트에서 재구성
+        structured = __structured_from_summary_text(summary_text)
 
     # 심리상태 비었으면 최소 한 항목 보강
     __ensure_psych_if_empty(structured, working_transcript)
     # ❻ 구조화 요약(JSON) — END REPLACE
 
 
-    return {
+    result = {
         "status": "ok",
         "on_topic_prob": seg_policy.get("coverage", 1.0),
         "question_used": guide_question,
@@ -963,15 +1156,35 @@ def run_summarisation_pipeline(
         },
         "used_models": {
             "summary": summary_model_used,
-            "judge":   clients.model_ids["judge"],
-            "emotion": clients.model_ids["emotion"],
-            "query":   clients.model_ids["query"],
+            "judge":   used_models["judge"],
+            "emotion": used_models["emotion"],
+            "query":   used_models["query"],
             "embed":   clients.model_ids["embed"],
-            "fallback_applied": did_fb
+            "fallback_applied": did_fb,
+            "summary_path": summary_hedge.winner,
+            "structured_path": json_hedge.winner or "from_summary_text",
+        },
+        "hedge": {
+            "summary": summary_hedge.report(),
+            "structured": json_hedge.report(),
+        },
+        "chunking": {
+            "policy_chunks": len(policy_chunks),
+            "work_chunks": len(work_chunks),
+            "reduce_rounds": reduce_rounds,
+            "source_tokens": llm_usage.estimate_tokens(source_text),
         },
         "temperature": clients.temperature,
-        "max_tokens":  clients.max_tokens
+        "max_tokens":  clients.max_tokens,
+        "degraded": degraded,
+        "timings": timer.result()
     }
+    if sess is not None:
+        result["incremental"] = sess.info("update" if previous_summary else "new", len(delta_keys))
+        # 저하 응답(RAG/감정 생략 등)은 세션에 반영하지 않음 → 다음 턴에서 델타를 다시 온전히 분석
+        if summary_text and not degraded:
+            sess.commit(delta_keys, new_block, summary_text, result)
+    return result
 
 def summarise_from_file(
     file_path: str,
@@ -1032,6 +1245,59 @@ def analyze_voice_response(
         "summary": summary,
     }
     
+# 통합 분석 프롬프트 (원하는 형식에 맞게) — 사용자 답변은 변수로 넣어 모듈 로드 시 한 번만 생성
+INTEGRATED_ANALYSIS_PROMPT = ChatPromptTemplate.from_messages([
+    ("system",
+     "당신은 치매 관련 상담을 전문으로 하는 의료진입니다. "
+     "사용자의 답변을 분석하여 다음 형식으로 응답해주세요.\n\n"
+     "특히 심리상태 분석 시 주의사항:\n"
+     "- '부끄러웠어요', '걱정돼요', '무서워요', '당황스러워요' 등 감정 표현을 반드시 감지하세요\n"
+     "- 이런 감정이 있으면 구체적으로 분석하고, 전혀 없을 때만 '(정보없음)'으로 표시하세요\n\n"
+     "출력 형식 (정확히 이 형식을 따라주세요):\n"
+     "{{\n"
+     "  \"primary_symptoms\": [\"구체적인 증상 1\", \"구체적인 증상 2\"],\n"
+     "  \"counselling_content\": [\"구체적인 상담 사례 1\", \"구체적인 상담 사례 2\"],\n"
+     "  \"psychological_state\": \"(정보없음)\" 또는 \"구체적인 심리상태 분석\",\n"
+     "  \"ai_interpretation\": [\"가능성 시사 1\", \"가능성 시사 2\"],\n"
+     "  \"cautions\": [\"권장사항 1\", \"권장사항 2\", \"권장사항 3\"]\n"
+     "}}\n\n"
+     "주의사항:\n"
+     "- primary_symptoms: 사용자가 언급한 구체적인 증상들을 불릿 포인트로\n"
+     "- counselling_content: 사용자가 말한 구체적인 사례들을 불릿 포인트로\n"
+     "- psychological_state: 사용자가 표현한 감정(부끄러움, 걱정, 불안, 두려움, 당황 등)이 있으면 구체적으로 분석하고, 전혀 없으면 \"(정보없음)\"으로\n"
+     "- ai_interpretation: 의학적 가능성이나 시사점을 불릿 포인트로\n"
+     "- cautions: 실용적인 권장사항들을 불릿 포인트로"),
+    ("human",
+     "질문: {question_context}\n"
+     "사용자 답변: {user_response}\n\n"
+     "위 답변을 분석하여 정확히 지정된 JSON 형식으로 응답해주세요.")
+])
+
+# 세션 증분: 이전 분석 JSON + 새 답변(델타)으로 갱신
+VOICE_UPDATE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system",
+     "당신은 치매 관련 상담을 전문으로 하는 의료진입니다. "
+     "같은 세션의 이전 분석 결과에 사용자의 새 답변을 반영해 분석을 갱신하세요.\n"
+     "- 이전 항목은 유지하고 중복은 합치며, 새 답변에서 드러난 증상/사례/감정/해석/권장사항만 추가하세요\n"
+     "- 감정 표현('부끄러웠어요', '걱정돼요', '무서워요', '당황스러워요' 등)이 새로 있으면 psychological_state 에 반영하세요\n\n"
+     "출력 형식 (정확히 이 형식을 따라주세요):\n"
+     "{{\n"
+     "  \"primary_symptoms\": [\"...\"],\n"
+     "  \"counselling_content\": [\"...\"],\n"
+     "  \"psychological_state\": \"(정보없음)\" 또는 \"구체적인 심리상태 분석\",\n"
+     "  \"ai_interpretation\": [\"...\"],\n"
+     "  \"cautions\": [\"...\"]\n"
+     "}}"),
+    ("human",
+     "질문: {question_context}\n"
+     "이전 분석(JSON):\n{previous_analysis}\n\n"
+     "새 사용자 답변: {user_response}\n\n"
+     "갱신된 분석을 정확히 지정된 JSON 형식으로 응답해주세요.")
+])
+
+@llm_usage.metered("voice")
+@llm_structured.bounded
+@session_analysis.incremental("voice", params=("question_context", "chat_model", "temperature", "max_tokens"))
 def analyze_voice_response(
     user_response: str,
     question_context: str = "",
@@ -1058,14 +1324,34 @@ def analyze_voice_response(
     """
     
     # 클라이언트 설정
+    ledger = llm_usage.current()
+    timer = _StageTimer(ledger)
     clients = _build_clients(
         chat_model=chat_model,
         temperature=temperature,
         max_tokens=max_tokens,
     )
+    mini = _build_clients(chat_model="gpt-4o-mini", temperature=clients.temperature, max_tokens=clients.max_tokens)
+
+    # 세션 증분: 이미 분석한 문장은 제외, 새 문장이 없으면 마지막 결과 재사용
+    sess = session_analysis.current()
+    analysis_text, delta_keys = user_response, []
+    if sess is not None:
+        analysis_text, delta_keys = sess.delta(user_response)
+        if not analysis_text and sess.last_result is not None:
+            reused = copy.deepcopy(sess.last_result)
+            reused.update(timestamp=time.time(), timings=timer.result(),
+                          incremental=sess.info("reused", 0))
+            return reused
+        analysis_text = analysis_text or user_response
     
-    # 온토픽 감지
-    topic_result = detect_topic(user_response, clients.llm_judge, session_id)
+    # 온토픽 감지 (새 문장만 판별 → 세션 블록과 병합)
+    judge_llm, _ = _routed_llm(ledger, clients, mini, "topic", "judge", analysis_text)
+    with timer.stage("topic"):
+        topic_new = detect_topic(analysis_text, judge_llm, session_id)
+    topic_result = topic_new
+    if sess is not None and sess.blocks:
+        topic_result = merge_topic_results([b["topic"] for b in sess.blocks] + [topic_new])
     
     # 치매 관련이 아닌 경우
     if topic_result["label"] == "off_topic":
@@ -1076,49 +1362,30 @@ def analyze_voice_response(
                 "topic_detection": topic_result,
                 "user_response": user_response,
                 "question_context": question_context
-            }
+            },
+            "timings": timer.result()
         }
     
-    # 통합 분석 프롬프트 (원하는 형식에 맞게)
-    INTEGRATED_ANALYSIS_PROMPT = ChatPromptTemplate.from_messages([
-        ("system",
-         "당신은 치매 관련 상담을 전문으로 하는 의료진입니다. "
-         "사용자의 답변을 분석하여 다음 형식으로 응답해주세요.\n\n"
-         "특히 심리상태 분석 시 주의사항:\n"
-         "- '부끄러웠어요', '걱정돼요', '무서워요', '당황스러워요' 등 감정 표현을 반드시 감지하세요\n"
-         "- 이런 감정이 있으면 구체적으로 분석하고, 전혀 없을 때만 '(정보없음)'으로 표시하세요\n\n"
-         "출력 형식 (정확히 이 형식을 따라주세요):\n"
-         "{{\n"
-         "  \"primary_symptoms\": [\"구체적인 증상 1\", \"구체적인 증상 2\"],\n"
-         "  \"counselling_content\": [\"구체적인 상담 사례 1\", \"구체적인 상담 사례 2\"],\n"
-         "  \"psychological_state\": \"(정보없음)\" 또는 \"구체적인 심리상태 분석\",\n"
-         "  \"ai_interpretation\": [\"가능성 시사 1\", \"가능성 시사 2\"],\n"
-         "  \"cautions\": [\"권장사항 1\", \"권장사항 2\", \"권장사항 3\"]\n"
-         "}}\n\n"
-         "주의사항:\n"
-         "- primary_symptoms: 사용자가 언급한 구체적인 증상들을 불릿 포인트로\n"
-         "- counselling_content: 사용자가 말한 구체적인 사례들을 불릿 포인트로\n"
-         "- psychological_state: 사용자가 표현한 감정(부끄러움, 걱정, 불안, 두려움, 당황 등)이 있으면 구체적으로 분석하고, 전혀 없으면 \"(정보없음)\"으로\n"
-         "- ai_interpretation: 의학적 가능성이나 시사점을 불릿 포인트로\n"
-         "- cautions: 실용적인 권장사항들을 불릿 포인트로"),
-        ("human",
-         f"질문: {question_context}\n"
-         f"사용자 답변: {user_response}\n\n"
-         "위 답변을 분석하여 정확히 지정된 JSON 형식으로 응답해주세요.")
-    ])
-    
+    previous_analysis = sess.summary if sess is not None else ""
     try:
-        # 통합 분석 실행
-        analysis_chain = INTEGRATED_ANALYSIS_PROMPT | clients.llm_summary | StrOutputParser()
-        
-        # 분석 실행
-        analysis_result = analysis_chain.invoke({})
+        # 통합 분석 실행 (세션에 이전 분석이 있으면 '이전 분석 + 새 답변' 갱신)
+        analysis_llm, analysis_model = _routed_llm(ledger, clients, mini, "analysis", "summary",
+                                                   question_context + previous_analysis + analysis_text)
+        analysis_chain = llm_structured.structured_chain(
+            VOICE_UPDATE_PROMPT if previous_analysis else INTEGRATED_ANALYSIS_PROMPT,
+            analysis_llm, llm_structured.VoiceAnalysis)
+        analysis_inputs = {"question_context": question_context, "user_response": analysis_text}
+        if previous_analysis:
+            analysis_inputs["previous_analysis"] = previous_analysis
         
-        # JSON 파싱
+        # 분석 실행 (스키마 검증까지 한 번에, 실패 시 재호출 없음)
+        analysis_ok = True
         try:
-            analysis_data = _json_loose_loads(analysis_result)
-        except Exception as e:
+            with timer.stage("analysis"):
+                analysis_data = analysis_chain.invoke(analysis_inputs)
+        except OutputParserException as e:
             print(f"JSON 파싱 오류: {e}")
+            analysis_ok = False   # 실패 결과는 세션 분석으로 저장하지 않음
             analysis_data = {
                 "primary_symptoms": ["분석 실패"],
                 "counselling_content": ["분석 실패"],
@@ -1146,11 +1413,17 @@ def analyze_voice_response(
                 }
             },
             "model_info": {
-                "chat_model": clients.model_ids["summary"],
+                "chat_model": analysis_model,
                 "temperature": clients.temperature,
                 "max_tokens": clients.max_tokens
-            }
+            },
+            "timings": timer.result()
         }
+        if sess is not None:
+            result["incremental"] = sess.info("update" if previous_analysis else "new", len(delta_keys))
+        if sess is not None and analysis_ok:
+            sess.commit(delta_keys, {"topic": topic_new, "emotions": []},
+                        json.dumps(result["analysis"]["summary"], ensure_ascii=False), result)
         
         return result
         
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+llm_hedge.py
+- 요약/구조화(JSON) 폴백 체인을 '직렬 재시도' 대신 헤지(hedged) 요청으로 실행
+  · 1순위 호출 시작 → 경로별 지연 분위수(LLM_HEDGE_PERCENTILE, 기본 p90)를 넘기면 다음 후보를 동시에 시작
+  · 실패/빈 출력이면 기다리지 않고 바로 다음 후보 시작(다른 후보가 실행 중이어도, 기존 직렬 폴백과 같은 순서)
+  · terminal(e) 이 참인 오류(예: 구조화 출력 파싱/스키마 실패)는 다른 후보로 같은 요청을 다시 보내지 않고 즉시 종료(winner=None)
+  · 먼저 도착한 '유효한' 결과 채택 → 나머지는 asyncio 취소(ainvoke 라 HTTP 요청까지 끊김)
+- 분위수는 경로(stage/후보 이름)별 최근 LLM_HEDGE_WINDOW 개 성공 지연으로 계산,
+  표본이 LLM_HEDGE_MIN_SAMPLES 미만이면 LLM_HEDGE_DEFAULT_DELAY 사용, [MIN_DELAY, MAX_DELAY] 로 제한
+- ✅ LLM_HEDGE=0 이면 헤지 없이 기존처럼 실패 시에만 다음 후보(직렬)
+- 결과에는 어느 경로가 이겼는지(winner)와 시도별 상태/지연(report)을 함께 반환
+- 요청 마감(request_deadline)이 있으면 대기 중에도 DEADLINE_POLL_SEC 마다 취소/마감 확인 → 넘으면 모든 후보 취소 후 예외 전파
+"""
+
+import os, time, asyncio, threading, contextvars
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+import request_deadline
+
+# -------------------------------
+# 설정
+# -------------------------------
+HEDGE_ENABLED       = os.getenv("LLM_HEDGE", "1") == "1"
+HEDGE_PERCENTILE    = float(os.getenv("LLM_HEDGE_PERCENTILE", "90"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "8.0"))
+HEDGE_MIN_DELAY     = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1.0"))
+HEDGE_MAX_DELAY     = float(os.getenv("LLM_HEDGE_MAX_DELAY", "30.0"))
+HEDGE_MIN_SAMPLES   = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "5"))
+HEDGE_WINDOW        = int(os.getenv("LLM_HEDGE_WINDOW", "200"))
+
+# -------------------------------
+# 경로별 지연 기록
+# -------------------------------
+class LatencyTracker:
+    def __init__(self, window: int = HEDGE_WINDOW):
+        self.window = max(1, int(window))
+        self._lat: Dict[str, Deque[float]] = {}
+        self._wins: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key: str, sec: float):
+        with self._lock:
+            self._lat.setdefault(key, deque(maxlen=self.window)).append(float(sec))
+
+    def win(self, key: str):
+        with self._lock:
+            self._wins[key] = self._wins.get(key, 0) + 1
+
+    def percentile(self, key: str, p: float) -> Optional[float]:
+        with self._lock:
+            xs = sorted(self._lat.get(key, ()))
+        if len(xs) < HEDGE_MIN_SAMPLES:
+            return None
+        k = min(len(xs) - 1, max(0, int(round(p / 100.0 * (len(xs) - 1)))))
+        return xs[k]
+
+    def hedge_delay(self, key: str) -> float:
+        v = self.percentile(key, HEDGE_PERCENTILE)
+        if v is None:
+            v = HEDGE_DEFAULT_DELAY
+        return min(HEDGE_MAX_DELAY, max(HEDGE_MIN_DELAY, v))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            keys = sorted(set(self._lat) | set(self._wins))
+            snap = {k: (list(self._lat.get(k, ())), self._wins.get(k, 0)) for k in keys}
+        out = {}
+        for k, (xs, wins) in snap.items():
+            xs.sort()
+            pick = (lambda q: round(xs[min(len(xs) - 1, int(round(q * (len(xs) - 1))))], 3)) if xs else (lambda q: None)
+            out[k] = {"n": len(xs), "wins": wins, "p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99)}
+        return out
+
+TRACKER = LatencyTracker()
+
+# -------------------------------
+# 헤지 실행
+# -------------------------------
+@dataclass
+class Candidate:
+    name: str                                  # 예: "main:gpt-4o", "alt:gpt-4o-mini"
+    run: Callable[[], Awaitable[Any]]          # 호출마다 새 코루틴(예: lambda: chain.ainvoke(inputs))
+
+@dataclass
+class HedgeResult:
+    value: Any
+    winner: Optional[str]
+    attempts: List[Dict[str, Any]] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    def report(self) -> Dict[str, Any]:
+        return {"winner": self.winner, "elapsed": round(self.elapsed, 3), "attempts": self.attempts}
+
+def non_empty(v: Any) -> bool:
+    return bool(v and str(v).strip())
+
+async def race(candidates: List[Candidate], stage: str,
+               valid: Callable[[Any], bool] = non_empty,
+               tracker: LatencyTracker = TRACKER,
+               terminal: Optional[Callable[[Exception], bool]] = None) -> HedgeResult:
+    """후보를 순서대로(느리면 겹쳐서) 실행, 첫 유효 결과 반환. 전부 실패(또는 terminal 오류)면 value=None, winner=None."""
+    t_start = time.perf_counter()
+    deadline = request_deadline.current()
+    pending: Dict[asyncio.Task, Dict[str, Any]] = {}
+    attempts: List[Dict[str, Any]] = []
+    nxt = 0
+    last_launch = t_start
+
+    def _key(i: int) -> str:
+        return f"{stage}/{candidates[i].name}"
+
+    def _launch(reason: str):
+        nonlocal nxt, last_launch
+        i = nxt
+        nxt += 1
+        last_launch = time.perf_counter()
+        att = {"name": candidates[i].name, "reason": reason, "status": "running",
+               "start": round(last_launch - t_start, 3), "_i": i, "_t0": last_launch}
+        attempts.append(att)
+        pending[asyncio.ensure_future(candidates[i].run())] = att
+        if reason == "slow":
+            print(f"⏱️ [{stage}] {candidates[i - 1].name} 지연 → {candidates[i].name} 동시 시작")
+
+    def _finish(att: Dict[str, Any], status: str, err: Optional[str] = None):
+        att["status"] = status
+        att["latency"] = round(time.perf_counter() - att.pop("_t0"), 3)
+        att.pop("_i", None)
+        if err:
+            att["error"] = err
+
+    def _next_on_failure():
+        # 실패/빈 출력 → 다른 후보가 아직 실행 중이어도 다음 후보를 바로 시작(헤지 지연을 기다리지 않음)
+        if nxt < len(candidates):
+            _launch("failed")
+
+    try:
+        while pending or nxt < len(candidates):
+            if not pending:
+                _launch("primary" if nxt == 0 else "failed")
+                continue
+            timeout = hedge_wait = None
+            if HEDGE_ENABLED and nxt < len(candidates):
+                timeout = hedge_wait = max(0.0, tracker.hedge_delay(_key(nxt - 1)) - (time.perf_counter() - last_launch))
+            if deadline is not None:
+                timeout = request_deadline.POLL_SEC if timeout is None else min(timeout, request_deadline.POLL_SEC)
+            done, _ = await asyncio.wait(list(pending), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                if deadline is not None:
+                    deadline.check()
+                if hedge_wait is not None and hedge_wait <= timeout:
+                    _launch("slow")
+                continue
+            for task in done:
+                att = pending.pop(task)
+                i = att["_i"]
+                lat = time.perf_counter() - att["_t0"]
+                try:
+                    value = task.result()
+                except Exception as e:
+                    if terminal is not None and terminal(e):
+                        # 응답은 왔지만 재호출해도 소용없는 실패 → 실행 중인 후보까지 취소하고 종료
+                        tracker.observe(_key(i), lat)
+                        _finish(att, "terminal", f"{type(e).__name__}: {e}")
+                        print(f"🛑 [{stage}] {candidates[i].name} {type(e).__name__} → 다른 후보 재호출 없이 종료")
+                        return HedgeResult(None, None, attempts, time.perf_counter() - t_start)
+                    _finish(att, "error", f"{type(e).__name__}: {e}")
+                    _next_on_failure()
+                    continue
+                tracker.observe(_key(i), lat)   # 응답이 온 호출만 분위수에 반영(유효성과 무관)
+                if not valid(value):
+                    _finish(att, "invalid")
+                    _next_on_failure()
+                    continue
+                _finish(att, "won")
+                tracker.win(_key(i))
+                return HedgeResult(value, candidates[i].name, attempts, time.perf_counter() - t_start)
+        return HedgeResult(None, None, attempts, time.perf_counter() - t_start)
+    finally:
+        # 진 쪽(아직 실행 중) 취소 → 응답을 기다리지 않음
+        for task, att in pending.items():
+            task.cancel()
+            _finish(att, "cancelled")
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+def _run_coro(coro):
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    # 이벤트 루프 스레드에서 호출된 경우: 별도 스레드에서 실행(루프 블로킹/중첩 방지)
+    # contextvars(사용량 장부 등)는 호출 스레드의 것을 그대로 넘김
+    box: Dict[str, Any] = {}
+    ctx = contextvars.copy_context()
+    def _target():
+        try:
+            box["v"] = ctx.run(asyncio.run, coro)
+        except BaseException as e:
+            box["e"] = e
+    t = threading.Thread(target=_target, name="llm-hedge", daemon=True)
+    t.start(); t.join()
+    if "e" in box:
+        raise box["e"]
+    return box["v"]
+
+def run_hedged(candidates: List[Candidate], stage: str,
+               valid: Callable[[Any], bool] = non_empty,
+               terminal: Optional[Callable[[Exception], bool]] = None) -> HedgeResult:
+    """동기 파이프라인(to_thread 워커)에서 호출하는 진입점"""
+    res = _run_coro(race(candidates, stage, valid, terminal=terminal))
+    print(f"🏁 [{stage}] winner={res.winner} ({res.elapsed:.2f}s, 시도 {len(res.attempts)}회)")
+    return res
+
+def stats() -> Dict[str, Any]:
+    return {"enabled": HEDGE_ENABLED, "percentile": HEDGE_PERCENTILE,
+            "default_delay": HEDGE_DEFAULT_DELAY, "min_delay": HEDGE_MIN_DELAY,
+            "max_delay": HEDGE_MAX_DELAY, "paths": TRACKER.stats()}
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+llm_structured.py
+- JSON 응답 단계(온토픽/세그먼트/비치매 과업/검색어/감정/구조화 요약/음성 분석)의 구조화 출력 + 단일 검증 파서
+  · 스키마(pydantic) → OpenAI response_format(json_schema, strict) 로 바인딩 → 모델이 스키마에 맞는 JSON 만 생성
+  · SchemaParser: (있으면) 코드펜스 1회 제거 후 model_validate_json 한 번 → dict
+    파싱/검증 실패는 OutputParserException — 같은 요청을 다시 보내지 않음(호출 측은 기본값 사용)
+- ✅ 체인 캐시: (프롬프트, 클라이언트) 당 `prompt | llm | parser` 를 한 번만 조립해 재사용 (text_chain / structured_chain)
+  · 클라이언트는 chabot_model 에서 설정별로 캐시 → 요청마다 체인/클라이언트를 다시 만들지 않음
+  · 체인의 LLM 단계는 호출 직전 request_deadline.check() + timeout=남은 시간 전달(요청 마감 전파)
+- ✅ 요청당 동시 LLM 호출 상한(LLM_MAX_CONCURRENCY, 0=무제한): @bounded 파이프라인 안의 모든 체인 호출이 같은 슬롯 공유
+  · 청크 병렬(LLM_CHUNK_WORKERS) 안에서 다시 batch 가 도는 중첩 팬아웃도 합쳐서 상한 이하
+  · 슬롯 대기 중에도 취소/마감 확인(DEADLINE_POLL_SEC), 비동기(헤지) 호출은 이벤트 루프를 막지 않고 대기
+- ✅ LLM_STRUCTURED_OUTPUT=json_schema(기본) | json_object | off — 구형 모델/프록시 호환용, 파서는 동일
+- stats(): 스키마별 파싱 실패 횟수, 캐시된 체인 수, 동시 호출 상한/슬롯 대기 횟수
+"""
+
+import os, re, asyncio, threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from functools import lru_cache, wraps
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ConfigDict, ValidationError
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import BaseOutputParser, StrOutputParser
+from langchain_core.runnables import Runnable, RunnableLambda
+from langchain_core.utils.function_calling import convert_to_openai_function
+
+import request_deadline
+
+# -------------------------------
+# 설정
+# -------------------------------
+OUTPUT_MODE     = os.getenv("LLM_STRUCTURED_OUTPUT", "json_schema").strip().lower()
+CHAIN_CACHE_MAX = int(os.getenv("LLM_CHAIN_CACHE_MAX", "256"))
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))   # 요청당 동시 LLM 호출(0 = 무제한)
+
+# -------------------------------
+# 스키마 (strict: 모든 필드 필수, 추가 필드 금지)
+# -------------------------------
+class _Schema(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+class TopicJudgement(_Schema):
+    """치매/인지장애 상담 여부 판정"""
+    on_topic: bool
+    score: float
+    evidence_spans: List[str]
+    reason: str
+
+class SegmentJudgement(_Schema):
+    """문장 단위 온토픽 판정"""
+    on_topic: bool
+    score: float
+
+class OffdomainTask(_Schema):
+    """치매상담 이외 과업 요청 포함 여부"""
+    non_dementia_task: bool
+    spans: List[str]
+
+class SearchQueries(_Schema):
+    """한국어 검색질의 2~4개"""
+    queries: List[str]
+
+class EmotionItem(_Schema):
+    emotion: str
+    evidence_sentences: List[str]
+    keywords: List[str]
+
+class EmotionItems(_Schema):
+    """감정 항목 목록"""
+    items: List[EmotionItem]
+
+class PsychItem(_Schema):
+    emotion: str
+    evidence: str
+    keywords: List[str]
+
+class StructuredSummary(_Schema):
+    """구조화 요약"""
+    primary_symptoms: List[str]
+    counselling: List[str]
+    psych: List[PsychItem]
+    ai_interpretation: List[str]
+    cautions: List[str]
+
+class VoiceAnalysis(_Schema):
+    """음성 답변 분석"""
+    primary_symptoms: List[str]
+    counselling_content: List[str]
+    psychological_state: str
+    ai_interpretation: List[str]
+    cautions: List[str]
+
+# -------------------------------
+# 파서
+# -------------------------------
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+_fail_lock = threading.Lock()
+_PARSE_FAILURES: Dict[str, int] = {}
+
+class SchemaParser(BaseOutputParser[Dict[str, Any]]):
+    """JSON 문자열 → 스키마 검증 → dict. 실패는 OutputParserException(재호출 없음)"""
+    model_cls: Type[BaseModel]
+
+    def parse(self, text: str) -> Dict[str, Any]:
+        t = text.strip()
+        if t.startswith("```"):
+            t = _FENCE.sub("", t)
+        try:
+            return self.model_cls.model_validate_json(t).model_dump()
+        except ValidationError as e:
+            name = self.model_cls.__name__
+            with _fail_lock:
+                _PARSE_FAILURES[name] = _PARSE_FAILURES.get(name, 0) + 1
+            raise OutputParserException(f"{name}: {e.error_count()}개 검증 오류", llm_output=text) from e
+
+    @property
+    def _type(self) -> str:
+        return "schema_json"
+
+@lru_cache(maxsize=None)
+def response_format(schema: Type[BaseModel]) -> Optional[Dict[str, Any]]:
+    if OUTPUT_MODE == "json_schema":
+        fn = convert_to_openai_function(schema, strict=True)
+        fn["schema"] = fn.pop("parameters")
+        return {"type": "json_schema", "json_schema": fn}
+    if OUTPUT_MODE == "json_object":
+        return {"type": "json_object"}
+    return None
+
+# -------------------------------
+# 요청당 동시 호출 상한
+# -------------------------------
+_SLOTS: ContextVar[Optional[threading.BoundedSemaphore]] = ContextVar("llm_slots", default=None)
+_THROTTLED = 0
+
+def bounded(fn: Callable) -> Callable:
+    """파이프라인 1회(요청) 동안 LLM 호출 슬롯 MAX_CONCURRENCY 개 — to_thread/청크 병렬/batch 스레드에 contextvar 로 공유"""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if MAX_CONCURRENCY <= 0 or _SLOTS.get() is not None:
+            return fn(*args, **kwargs)
+        token = _SLOTS.set(threading.BoundedSemaphore(MAX_CONCURRENCY))
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _SLOTS.reset(token)
+    return wrapper
+
+def _note_throttled():
+    global _THROTTLED
+    with _fail_lock:
+        _THROTTLED += 1
+
+def _acquire(sem: threading.BoundedSemaphore):
+    if sem.acquire(blocking=False):
+        return
+    _note_throttled()
+    while not sem.acquire(timeout=request_deadline.POLL_SEC):
+        request_deadline.check()
+
+async def _aacquire(sem: threading.BoundedSemaphore):
+    # 헤지 후보들이 같은 루프에서 돌므로 blocking acquire 금지(슬롯을 쥔 후보가 진행 못 함)
+    if sem.acquire(blocking=False):
+        return
+    _note_throttled()
+    while not sem.acquire(blocking=False):
+        request_deadline.check()
+        await asyncio.sleep(0.02)
+
+# -------------------------------
+# 체인 캐시
+# -------------------------------
+def _deadline_llm(llm: Any) -> Runnable:
+    """요청 마감이 있으면 호출 전 확인 + 남은 시간을 호출 timeout 으로 (OpenAI SDK 요청 옵션), 요청당 동시 호출 상한"""
+    def _kw() -> Dict[str, Any]:
+        t = request_deadline.call_timeout()
+        return {} if t is None else {"timeout": t}
+
+    def call(messages: Any, config: Any) -> Any:
+        request_deadline.check()
+        sem = _SLOTS.get()
+        if sem is None:
+            return llm.invoke(messages, config, **_kw())
+        _acquire(sem)
+        try:
+            return llm.invoke(messages, config, **_kw())
+        finally:
+            sem.release()
+
+    async def acall(messages: Any, config: Any) -> Any:
+        request_deadline.check()
+        sem = _SLOTS.get()
+        if sem is None:
+            return await llm.ainvoke(messages, config, **_kw())
+        await _aacquire(sem)
+        try:
+            return await llm.ainvoke(messages, config, **_kw())
+        finally:
+            sem.release()
+
+    return RunnableLambda(call, afunc=acall, name="deadline_llm")
+
+_lock = threading.Lock()
+_CHAINS: "OrderedDict[Tuple[int, int, str], Tuple[Any, Any, Runnable]]" = OrderedDict()
+
+def _cached(prompt: Any, llm: Any, tag: str, build: Callable[[], Runnable]) -> Runnable:
+    key = (id(prompt), id(llm), tag)
+    with _lock:
+        hit = _CHAINS.get(key)
+        # id 재사용 대비: 같은 객체일 때만 적중
+        if hit is not None and hit[0] is prompt and hit[1] is llm:
+            _CHAINS.move_to_end(key)
+            return hit[2]
+    chain = build()
+    with _lock:
+        _CHAINS[key] = (prompt, llm, chain)
+        while len(_CHAINS) > CHAIN_CACHE_MAX:
+            _CHAINS.popitem(last=False)
+    return chain
+
+def text_chain(prompt: Any, llm: Any) -> Runnable:
+    """prompt | llm | StrOutputParser (캐시)"""
+    return _cached(prompt, llm, "text", lambda: prompt | _deadline_llm(llm) | StrOutputParser())
+
+def structured_chain(prompt: Any, llm: Any, schema: Type[BaseModel]) -> Runnable:
+    """prompt | llm(response_format=schema) | SchemaParser (캐시) → dict"""
+    def build() -> Runnable:
+        fmt = response_format(schema)
+        bound = llm.bind(response_format=fmt) if fmt else llm
+        return prompt | _deadline_llm(bound) | SchemaParser(model_cls=schema)
+    return _cached(prompt, llm, schema.__name__, build)
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        n = len(_CHAINS)
+    with _fail_lock:
+        failures = dict(_PARSE_FAILURES)
+        throttled = _THROTTLED
+    return {"mode": OUTPUT_MODE, "cached_chains": n, "parse_failures": failures,
+            "max_concurrency": MAX_CONCURRENCY, "throttled_calls": throttled}
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+llm_stub.py
+- 오프라인 LLM/임베딩/검색 대체 백엔드 (LLM_BACKEND=stub) — CI/용량 테스트에서 OpenAI·DDGS 호출 없이 파이프라인 실행
+- StubChatModel: langchain BaseChatModel 구현 → 기존 `PROMPT | llm | parser` 체인/ainvoke/취소 그대로 동작
+  · 프롬프트 종류(system 메시지 표식)별 고정 응답: judge / segment / offdomain / query / emotion / digest / summary / structured / voice
+  · 응답은 입력 텍스트에서 문장을 발췌해 채움 → 파서/검증 로직이 실제와 같은 경로를 탐
+  · LLM_STUB_OUTPUTS=<json 파일> 로 종류별 응답 문자열 덮어쓰기
+- 지연: 종류별 분포(기본 lognormal 중앙값/시그마) → LLM_STUB_LATENCY='{"summary": ["lognormal", 4.0, 0.4], ...}'
+  · 분포: ["lognormal", 중앙값, sigma] | ["uniform", lo, hi] | ["fixed", v]
+  · 입력 길이 비례 지연(prefill): 입력 1K 토큰당 LLM_STUB_SEC_PER_1K_INPUT 초 추가
+  · LLM_STUB_SPEED 배율(0.1 = 10배 빠르게), gpt-4o-mini 는 LLM_STUB_MINI_FACTOR 배
+  · LLM_STUB_FAIL_RATE: 해당 비율로 예외 발생(폴백 경로 테스트)
+  · 호출 timeout(요청 마감 전파)을 받으면 지연이 그보다 길 때 timeout 만큼 기다린 뒤 StubTimeout
+- StubEmbeddings: 텍스트 해시 기반 결정적 벡터, search(): 고정 문서 k 개
+"""
+
+import os, re, json, time, random, asyncio, hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from pydantic import Field
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+# -------------------------------
+# 설정
+# -------------------------------
+DEFAULT_LATENCY: Dict[str, List[Any]] = {
+    "judge":      ["lognormal", 0.6, 0.35],
+    "segment":    ["lognormal", 0.4, 0.30],
+    "offdomain":  ["lognormal", 0.5, 0.30],
+    "query":      ["lognormal", 0.7, 0.30],
+    "emotion":    ["lognormal", 1.8, 0.35],
+    "digest":     ["lognormal", 2.0, 0.35],
+    "summary":    ["lognormal", 4.5, 0.40],
+    "structured": ["lognormal", 3.5, 0.40],
+    "voice":      ["lognormal", 3.5, 0.40],
+    "other":      ["lognormal", 0.8, 0.30],
+    "embed":      ["lognormal", 0.25, 0.30],
+    "search":     ["lognormal", 0.9, 0.50],
+}
+
+def _load_json_env(name: str) -> Dict[str, Any]:
+    v = os.getenv(name, "").strip()
+    if not v:
+        return {}
+    if os.path.exists(v):
+        with open(v, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return json.loads(v)
+
+LATENCY      = dict(DEFAULT_LATENCY, **_load_json_env("LLM_STUB_LATENCY"))
+OUTPUTS      = _load_json_env("LLM_STUB_OUTPUTS")
+SPEED        = float(os.getenv("LLM_STUB_SPEED", "1.0"))
+MINI_FACTOR  = float(os.getenv("LLM_STUB_MINI_FACTOR", "0.5"))
+SEC_PER_1K_INPUT = float(os.getenv("LLM_STUB_SEC_PER_1K_INPUT", "0.25"))
+FAIL_RATE    = float(os.getenv("LLM_STUB_FAIL_RATE", "0.0"))
+EMBED_DIM    = 64
+
+_rng = random.Random(int(os.getenv("LLM_STUB_SEED", "0")) or None)
+
+class StubFailure(RuntimeError):
+    """LLM_STUB_FAIL_RATE 로 주입한 실패"""
+
+def sample_latency(kind: str, model: str = "", n_input: int = 0) -> float:
+    dist = LATENCY.get(kind) or LATENCY["other"]
+    name, a = dist[0], float(dist[1])
+    if name == "lognormal":
+        v = a * float(np.exp(_rng.gauss(0.0, float(dist[2]))))
+    elif name == "uniform":
+        v = _rng.uniform(a, float(dist[2]))
+    else:
+        v = a
+    v += n_input / 1000.0 * SEC_PER_1K_INPUT
+    if model.endswith("mini"):
+        v *= MINI_FACTOR
+    return max(0.0, v * SPEED)
+
+class StubTimeout(TimeoutError):
+    pass
+
+def _wait(lat: float, timeout: Optional[float], what: str):
+    if timeout is not None and lat > timeout:
+        time.sleep(max(0.0, timeout))
+        raise StubTimeout(f"stub timeout ({what}, {timeout:.1f}s)")
+    time.sleep(lat)
+
+def _maybe_fail(kind: str):
+    if FAIL_RATE > 0 and _rng.random() < FAIL_RATE:
+        raise StubFailure(f"stub failure ({kind})")
+
+# -------------------------------
+# 프롬프트 종류 판별 + 고정 응답
+# -------------------------------
+# system 메시지에 들어 있는 표식 → 종류 (위에서부터 먼저 일치하는 것)
+_KIND_MARKERS: List[Tuple[str, str]] = [
+    ("counselling_content", "voice"),
+    ("발췌 요약하라", "digest"),
+    ("psych_items", "structured"),
+    ("요약 템플릿", "summary"),
+    ("N/A로 채우고", "summary"),
+    ("non_dementia_task", "offdomain"),
+    ("검색어 생성기", "query"),
+    ("감정 항목", "emotion"),
+    ("감정 상태를 식별", "emotion"),
+    ("evidence_spans", "judge"),
+    ("문장이", "segment"),
+]
+
+_ON_TOPIC = re.compile(r"(기억|떠오르|떠올리|생각이\s*안|단어|말이\s*막히|까먹|잊|길을|헤맸|약속|이름|무섭|두렵|걱정|불안|당황|부끄|답답)")
+
+def prompt_kind(messages: List[BaseMessage]) -> str:
+    system = " ".join(str(m.content) for m in messages if m.type == "system")
+    for marker, kind in _KIND_MARKERS:
+        if marker in system:
+            return kind
+    return "other"
+
+def _last_human(messages: List[BaseMessage]) -> str:
+    for m in reversed(messages):
+        if m.type == "human":
+            return str(m.content)
+    return ""
+
+# 사람 메시지에서 사용자 원문 부분만(프롬프트 틀 제외) — 요약/구조화/음성 분석 응답 발췌용
+_USER_TEXT = re.compile(r"(?:사용자 STT 원문:|STT 구간:|STT:|사용자 답변:|텍스트:)\s*(.+?)(?:\n\n|\n오직|$)", re.DOTALL)
+
+def _user_text(text: str) -> str:
+    m = _USER_TEXT.search(text or "")
+    return m.group(1) if m else (text or "")
+
+def _sentences(text: str) -> List[str]:
+    out = [s.strip() for s in re.split(r"[.!?\n]+", text or "") if s.strip()]
+    return [s for s in out if 6 <= len(s) <= 100] or ["기억이 잘 나지 않아 걱정돼요"]
+
+def _words(text: str, k: int = 6) -> List[str]:
+    return list(dict.fromkeys(re.findall(r"[가-힣]{2,}", text or "")))[:k] or ["기억", "걱정"]
+
+def canned_output(kind: str, messages: List[BaseMessage]) -> str:
+    if kind in OUTPUTS:
+        return str(OUTPUTS[kind])
+    text = _last_human(messages)
+    sents = _sentences(_user_text(text))
+    hit = bool(_ON_TOPIC.search(text))
+    if kind == "judge":
+        return json.dumps({"on_topic": hit, "score": 0.82 if hit else 0.1,
+                           "evidence_spans": sents[:2], "reason": "stub"}, ensure_ascii=False)
+    if kind == "segment":
+        seg = text.split('"""')[1] if text.count('"""') >= 2 else text
+        on = bool(_ON_TOPIC.search(seg))
+        return json.dumps({"on_topic": on, "score": 0.86 if on else 0.08})
+    if kind == "offdomain":
+        return json.dumps({"non_dementia_task": False, "spans": []})
+    if kind == "query":
+        return json.dumps({"queries": ["치매 초기 증상", "단기 기억력 저하 원인", "경도인지장애 언어 유창성"]},
+                          ensure_ascii=False)
+    if kind == "emotion":
+        return json.dumps({"items": [{"emotion": "불안감", "evidence_sentences": sents[:1],
+                                      "keywords": _words(sents[0], 4)}]}, ensure_ascii=False)
+    if kind == "digest":
+        return "\n".join(f"- {s}" for s in sents[:5])
+    if kind == "summary":
+        b = "\n".join(f"- {s}" for s in sents[:3])
+        return (f"<요약>\n1. **주 증상**\n{b}\n\n2. **상담내용**\n{b}\n\n3. **심리상태**\n- 불안감\n\n"
+                "4. **AI 해석**\n- 기억력 저하 가능성 시사\n\n5. **주의사항**\n- 전문의 상담 권고\n")
+    if kind in ("structured", "voice"):
+        counsel = "counselling_content" if kind == "voice" else "counselling"
+        psych = "(정보없음)" if kind == "voice" else [{"emotion": "불안감", "evidence": sents[0], "keywords": _words(sents[0], 3)}]
+        key = "psychological_state" if kind == "voice" else "psych"
+        return json.dumps({"primary_symptoms": sents[:2], counsel: sents[:2], key: psych,
+                           "ai_interpretation": ["기억력 저하 가능성 시사"], "cautions": ["전문의 상담 권고"]},
+                          ensure_ascii=False)
+    return "OK"
+
+def _approx_tokens(text: str) -> int:
+    # 한국어 위주 대략치(문자 2개 ≈ 1토큰)
+    return max(1, len(text) // 2)
+
+# -------------------------------
+# LangChain 호환 모델
+# -------------------------------
+class StubChatModel(BaseChatModel):
+    """ChatOpenAI 대신 쓰는 가짜 챗 모델(같은 생성자 인자 허용)"""
+    model: str = "gpt-4o"
+    temperature: float = 0.2
+    max_tokens: Optional[int] = None
+    api_key: Optional[Any] = None
+    model_kwargs: Dict[str, Any] = Field(default_factory=dict)
+    extra_body: Optional[Dict[str, Any]] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-chat"
+
+    @staticmethod
+    def _n_input(messages: List[BaseMessage]) -> int:
+        return sum(_approx_tokens(str(m.content)) for m in messages)
+
+    def _result(self, messages: List[BaseMessage], kind: str) -> ChatResult:
+        text = canned_output(kind, messages)
+        n_in = self._n_input(messages)
+        n_out = _approx_tokens(text)
+        msg = AIMessage(content=text,
+                        usage_metadata={"input_tokens": n_in, "output_tokens": n_out, "total_tokens": n_in + n_out},
+                        response_metadata={"model_name": self.model, "stub_kind": kind})
+        return ChatResult(generations=[ChatGeneration(message=msg)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        kind = prompt_kind(messages)
+        _wait(sample_latency(kind, self.model, self._n_input(messages)), kwargs.get("timeout"), kind)
+        _maybe_fail(kind)
+        return self._result(messages, kind)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        kind = prompt_kind(messages)
+        lat, timeout = sample_latency(kind, self.model, self._n_input(messages)), kwargs.get("timeout")
+        if timeout is not None and lat > timeout:
+            await asyncio.sleep(max(0.0, timeout))
+            raise StubTimeout(f"stub timeout ({kind}, {timeout:.1f}s)")
+        await asyncio.sleep(lat)
+        _maybe_fail(kind)
+        return self._result(messages, kind)
+
+class StubEmbeddings(Embeddings):
+    def __init__(self, model: str = "text-embedding-3-small", **_):
+        self.model = model
+
+    @staticmethod
+    def _vec(text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "little")
+        v = np.random.default_rng(seed).standard_normal(EMBED_DIM)
+        return (v / (np.linalg.norm(v) + 1e-12)).tolist()
+
+    def embed_documents(self, texts: List[str], timeout: Optional[float] = None, **_) -> List[List[float]]:
+        _wait(sample_latency("embed"), timeout, "embed")
+        return [self._vec(t) for t in texts]
+
+    def embed_query(self, text: str, timeout: Optional[float] = None, **_) -> List[float]:
+        _wait(sample_latency("embed"), timeout, "embed")
+        return self._vec(text)
+
+def search(query: str, k: int = 5, timeout: Optional[float] = None) -> List[Document]:
+    """ddgs_search 대체: 질의별 고정 문서 k 개"""
+    _wait(sample_latency("search"), timeout, "search")
+    return [Document(page_content=f"{query} 참고 문서 {i + 1}\n{query} 관련 일반 정보입니다.\nURL: https://example.org/{i + 1}",
+                     metadata={"source": f"https://example.org/{i + 1}", "title": f"{query} {i + 1}", "engine": "stub"})
+            for i in range(k)]
@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""
+llm_usage.py
+- 요청 단위 토큰/비용 집계: 단계(stage)별 · 모델별 · 세션별
+  · UsageLedger(콜백 핸들러)를 contextvar 로 설정 → 파이프라인 안의 모든 LangChain 챗 모델 호출이 자동 집계
+    (폴백/헤지/함수 안에서 즉석 생성한 ChatOpenAI 포함, 체인 코드 수정 불필요)
+  · 토큰은 응답 usage_metadata(없으면 llm_output.token_usage), 임베딩은 문자 수 기반 추정
+  · 비용 = 토큰 × 모델 단가(USD/1M 토큰) — LLM_PRICES='{"gpt-4o": [2.5, 10.0], ...}' 로 덮어쓰기
+- ✅ @metered(endpoint): 응답 dict 에 usage(단계별/모델별/합계/세션 누적/라우팅 결정) 추가, 전역 누적 → GET /llm/usage
+- ✅ 라우팅 정책 route(stage, model, prompt_text): 단계 시작 전 gpt-4o → gpt-4o-mini 로 내릴지 결정
+  · 프롬프트 추정 토큰 > LLM_ROUTE_PROMPT_TOKENS (기본 0 = 끔 — 긴 상담 전사를 품질 낮은 모델로 내리지 않도록 옵트인)
+  · 세션 누적 비용 ≥ LLM_SESSION_BUDGET_USD
+  · 경과 시간 + 해당 단계 p{LLM_ROUTE_SLO_PERCENTILE} 소요 > LLM_LATENCY_SLO_SEC
+  · 0 이면 해당 조건 끔, LLM_ROUTING=0 이면 라우팅 전체 끔(집계는 유지)
+- 공용 기본 세션 ID(SESSION_SHARED_IDS: default, rest-session-1, voice-session-1)는 여러 사용자가 섞이므로
+  세션 누적 집계에서 제외 — 세션 예산 조건은 이번 요청 비용만으로 판단, 프롬프트 크기/지연 SLO 라우팅과
+  요청 단위 집계·전역 누적은 그대로
+"""
+
+import os, json, time, inspect, asyncio, threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+import llm_hedge
+
+# -------------------------------
+# 설정
+# -------------------------------
+DEFAULT_PRICES: Dict[str, List[float]] = {   # USD / 1M 토큰 [입력, 출력]
+    "gpt-4o":                 [2.50, 10.00],
+    "gpt-4o-mini":            [0.15, 0.60],
+    "text-embedding-3-small": [0.02, 0.0],
+    "text-embedding-3-large": [0.13, 0.0],
+}
+_prices_env = os.getenv("LLM_PRICES", "").strip()
+PRICES = dict(DEFAULT_PRICES, **(json.loads(_prices_env) if _prices_env else {}))
+
+ROUTING_ENABLED       = os.getenv("LLM_ROUTING", "1") == "1"
+ROUTE_MINI_MODEL      = "gpt-4o-mini"
+ROUTE_PROMPT_TOKENS   = int(os.getenv("LLM_ROUTE_PROMPT_TOKENS", "0"))
+SESSION_BUDGET_USD    = float(os.getenv("LLM_SESSION_BUDGET_USD", "0"))
+LATENCY_SLO_SEC       = float(os.getenv("LLM_LATENCY_SLO_SEC", "0"))
+ROUTE_SLO_PERCENTILE  = float(os.getenv("LLM_ROUTE_SLO_PERCENTILE", "90"))
+MAX_SESSIONS          = int(os.getenv("LLM_USAGE_MAX_SESSIONS", "5000"))
+# 클라이언트 기본값으로 쓰이는 공용 세션 ID(session_analysis 도 같은 목록 사용)
+SHARED_SESSION_IDS    = {s.strip() for s in os.getenv(
+    "SESSION_SHARED_IDS", "default,rest-session-1,voice-session-1").split(",") if s.strip()}
+
+def estimate_tokens(text: str) -> int:
+    # 라우팅/임베딩용 대략치(한국어 위주: 문자 2개 ≈ 1토큰)
+    return (len(text or "") + 1) // 2
+
+def price_of(model: str) -> Tuple[float, float]:
+    """모델명(날짜 접미사 포함 가능)에 가장 길게 일치하는 단가"""
+    best = ""
+    for k in PRICES:
+        if (model or "").startswith(k) and len(k) > len(best):
+            best = k
+    p = PRICES.get(best) or [0.0, 0.0]
+    return float(p[0]), float(p[1] if len(p) > 1 else 0.0)
+
+def _counter() -> Dict[str, Any]:
+    return {"calls": 0, "errors": 0, "cancelled": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0}
+
+def _add(dst: Dict[str, Any], src: Dict[str, Any]):
+    for k, v in src.items():
+        dst[k] = dst.get(k, 0) + v
+
+def _rounded(c: Dict[str, Any]) -> Dict[str, Any]:
+    return dict(c, cost_usd=round(c["cost_usd"], 6))
+
+# -------------------------------
+# 전역 누적 (세션/단계/모델)
+# -------------------------------
+_lock = threading.Lock()
+_TOTALS: Dict[Tuple[str, str, str], Dict[str, Any]] = {}          # (endpoint, stage, model) → 카운터
+_REQUESTS: Dict[str, int] = {}                                     # endpoint → 요청 수
+_ROUTES: Dict[Tuple[str, str], int] = {}                           # (stage, reason) → 횟수
+_SESSIONS: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()      # session_id → 누적(LRU)
+STAGE_LATENCY = llm_hedge.LatencyTracker()                          # "stage/model" → 단계 소요(초)
+
+def session_cost(session_id: Optional[str]) -> float:
+    if not session_id:
+        return 0.0
+    with _lock:
+        s = _SESSIONS.get(session_id)
+        return float(s["cost_usd"]) if s else 0.0
+
+def session_usage(session_id: Optional[str]) -> Dict[str, Any]:
+    with _lock:
+        s = dict(_SESSIONS.get(session_id) or dict(_counter(), requests=0))
+    out = _rounded(s)
+    out["session_id"] = session_id
+    if SESSION_BUDGET_USD > 0:
+        out["budget_usd"] = SESSION_BUDGET_USD
+        out["remaining_usd"] = round(max(0.0, SESSION_BUDGET_USD - s["cost_usd"]), 6)
+    return out
+
+# -------------------------------
+# 요청 단위 장부
+# -------------------------------
+class UsageLedger(BaseCallbackHandler):
+    """요청 1건의 LLM/임베딩 사용량. stage 는 _StageTimer 가 단계 진입 시 설정"""
+    run_inline = True       # 비동기(헤지) 호출에서도 같은 스레드/컨텍스트에서 즉시 기록
+    raise_error = False
+
+    def __init__(self, endpoint: str, session_id: Optional[str] = None):
+        super().__init__()
+        self.endpoint = endpoint
+        # 공용 세션 ID 는 세션 누적에서 제외(라우팅은 요청 단위 조건만)
+        self.shared = session_id in SHARED_SESSION_IDS
+        self.session_id = None if self.shared else session_id
+        self.requested_session_id = session_id
+        self.stage = "other"
+        self.t0 = time.perf_counter()
+        self.routes: List[Dict[str, Any]] = []
+        self._rows: Dict[Tuple[str, str], Dict[str, Any]] = {}      # (stage, model) → 카운터
+        self._runs: Dict[Any, Tuple[str, str, int]] = {}            # run_id → (stage, model, 추정 입력 토큰)
+        self._stage_model: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    # ---- 기록 ----
+    def _row(self, stage: str, model: str) -> Dict[str, Any]:
+        return self._rows.setdefault((stage, model), _counter())
+
+    def add(self, stage: str, model: str, n_in: int, n_out: int, status: str = "ok"):
+        p_in, p_out = price_of(model)
+        with self._lock:
+            row = self._row(stage, model)
+            row["calls"] += 1
+            if status == "error":
+                row["errors"] += 1
+            elif status == "cancelled":
+                row["cancelled"] += 1
+            row["input_tokens"] += int(n_in)
+            row["output_tokens"] += int(n_out)
+            row["cost_usd"] += (n_in * p_in + n_out * p_out) / 1e6
+
+    def current_stage(self) -> str:
+        # 병렬 작업(청크 map)은 stage_label 로 단계명을 따로 지정
+        return _STAGE_LABEL.get() or self.stage
+
+    def add_embedding(self, model: str, texts: List[str]):
+        self.add(self.current_stage(), model, sum(estimate_tokens(t) for t in texts), 0)
+
+    @property
+    def cost(self) -> float:
+        with self._lock:
+            return sum(r["cost_usd"] for r in self._rows.values())
+
+    # ---- LangChain 콜백 ----
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = ((metadata or {}).get("ls_model_name") or params.get("model")
+                 or params.get("model_name") or "unknown")
+        est = sum(estimate_tokens(str(m.content)) for batch in messages for m in batch)
+        with self._lock:
+            self._runs[run_id] = (self.current_stage(), str(model), est)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            stage, model, _ = self._runs.pop(run_id, (self.stage, "unknown", 0))
+        n_in = n_out = 0
+        gens = response.generations[0] if response.generations else []
+        usage = getattr(getattr(gens[0], "message", None), "usage_metadata", None) if gens else None
+        if usage:
+            n_in, n_out = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+        else:
+            tu = (response.llm_output or {}).get("token_usage") or {}
+            n_in, n_out = tu.get("prompt_tokens", 0), tu.get("completion_tokens", 0)
+        self.add(stage, model, n_in, n_out)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            stage, model, est = self._runs.pop(run_id, (self.stage, "unknown", 0))
+        if isinstance(error, asyncio.CancelledError):
+            self.add(stage, model, est, 0, "cancelled")
+        else:
+            self.add(stage, model, 0, 0, "error")
+
+    def _sweep_unfinished(self):
+        # 헤지에서 진 쪽은 취소 시 콜백 없이 끝남 → 요청 종료 시 '취소'로 기록(입력 토큰은 프롬프트 길이로 추정)
+        with self._lock:
+            runs, self._runs = list(self._runs.values()), {}
+        for stage, model, est in runs:
+            self.add(stage, model, est, 0, "cancelled")
+
+    # ---- 라우팅 ----
+    def route(self, stage: str, model: str, prompt_text: str = "") -> str:
+        """단계 시작 전 호출: 조건에 걸리면 gpt-4o-mini 반환, 아니면 model 그대로"""
+        chosen, kind, reason = model, None, None
+        if ROUTING_ENABLED and model != ROUTE_MINI_MODEL:
+            est = estimate_tokens(prompt_text)
+            # 공용 세션(session_id=None)은 세션 누적 없이 이번 요청 비용만
+            spent = session_cost(self.session_id) + self.cost
+            elapsed = time.perf_counter() - self.t0
+            expect = STAGE_LATENCY.percentile(f"{stage}/{model}", ROUTE_SLO_PERCENTILE) or 0.0
+            if ROUTE_PROMPT_TOKENS > 0 and est > ROUTE_PROMPT_TOKENS:
+                kind, reason = "prompt_tokens", f"≈{est}>{ROUTE_PROMPT_TOKENS}"
+            elif SESSION_BUDGET_USD > 0 and spent >= SESSION_BUDGET_USD:
+                kind, reason = "session_budget", f"${spent:.4f}≥${SESSION_BUDGET_USD:g}"
+            elif LATENCY_SLO_SEC > 0 and elapsed + expect > LATENCY_SLO_SEC:
+                kind, reason = "latency_slo", f"{elapsed:.1f}s+p{ROUTE_SLO_PERCENTILE:g} {expect:.1f}s>{LATENCY_SLO_SEC:g}s"
+            if kind:
+                chosen = ROUTE_MINI_MODEL
+                self.routes.append({"stage": stage, "from": model, "to": chosen, "reason": kind, "detail": reason})
+                with _lock:
+                    _ROUTES[(stage, kind)] = _ROUTES.get((stage, kind), 0) + 1
+                print(f"🔀 [{stage}] {model} → {chosen} ({kind} {reason})")
+        self._stage_model[stage] = chosen
+        return chosen
+
+    def stage_done(self, stage: str, sec: float):
+        # 라우팅된 단계만 모델별 소요 기록(SLO 예측용)
+        model = self._stage_model.get(stage)
+        if model:
+            STAGE_LATENCY.observe(f"{stage}/{model}", sec)
+
+    # ---- 결과 ----
+    def report(self) -> Dict[str, Any]:
+        by_stage: Dict[str, Dict[str, Any]] = {}
+        by_model: Dict[str, Dict[str, Any]] = {}
+        total = _counter()
+        with self._lock:
+            rows = {k: dict(v) for k, v in self._rows.items()}
+        for (stage, model), c in rows.items():
+            _add(by_stage.setdefault(stage, _counter()), c)
+            _add(by_model.setdefault(model, _counter()), c)
+            _add(total, c)
+        return {
+            "by_stage": {k: _rounded(v) for k, v in by_stage.items()},
+            "by_model": {k: _rounded(v) for k, v in by_model.items()},
+            "total": _rounded(total),
+            "session": (dict(_rounded(dict(_counter(), requests=0)), session_id=self.requested_session_id, shared=True)
+                        if self.shared else session_usage(self.session_id)),
+            "routing": list(self.routes),
+        }
+
+    def commit(self):
+        """요청 종료 시 전역/세션 누적에 반영"""
+        self._sweep_unfinished()
+        with self._lock:
+            rows = {k: dict(v) for k, v in self._rows.items()}
+        total = _counter()
+        with _lock:
+            _REQUESTS[self.endpoint] = _REQUESTS.get(self.endpoint, 0) + 1
+            for (stage, model), c in rows.items():
+                _add(_TOTALS.setdefault((self.endpoint, stage, model), _counter()), c)
+                _add(total, c)
+            if self.session_id:
+                s = _SESSIONS.pop(self.session_id, None) or dict(_counter(), requests=0)
+                _add(s, total)
+                s["requests"] += 1
+                _SESSIONS[self.session_id] = s
+                while len(_SESSIONS) > MAX_SESSIONS:
+                    _SESSIONS.popitem(last=False)
+
+# -------------------------------
+# 컨텍스트 연결
+# -------------------------------
+_CURRENT: ContextVar[Optional[UsageLedger]] = ContextVar("llm_usage_ledger", default=None)
+_STAGE_LABEL: ContextVar[Optional[str]] = ContextVar("llm_usage_stage", default=None)
+register_configure_hook(_CURRENT, True)   # 설정된 동안 모든 LangChain 실행에 핸들러 자동 추가
+
+def current() -> Optional[UsageLedger]:
+    return _CURRENT.get()
+
+def record_embedding(model: str, texts: List[str]):
+    ledger = _CURRENT.get()
+    if ledger is not None:
+        ledger.add_embedding(model, texts)
+
+@contextmanager
+def stage_label(name: Optional[str]):
+    """현재 컨텍스트(스레드/작업)에서만 단계명 덮어쓰기"""
+    token = _STAGE_LABEL.set(name)
+    try:
+        yield
+    finally:
+        _STAGE_LABEL.reset(token)
+
+@contextmanager
+def track(ledger: UsageLedger):
+    token = _CURRENT.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _CURRENT.reset(token)
+        ledger.commit()
+
+def metered(endpoint: str):
+    """응답 dict 에 usage 를 붙이는 데코레이터(session_id 인자를 세션 키로 사용)"""
+    def deco(fn):
+        sig = inspect.signature(fn)
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = sig.bind_partial(*args, **kwargs)
+            ledger = UsageLedger(endpoint, bound.arguments.get("session_id"))
+            with track(ledger):
+                result = fn(*args, **kwargs)
+            if isinstance(result, dict):
+                result["usage"] = ledger.report()
+                u = result["usage"]["total"]
+                print(f"💰 [{endpoint}] 토큰 in={u['input_tokens']} out={u['output_tokens']} "
+                      f"${u['cost_usd']:.5f} (세션 ${result['usage']['session']['cost_usd']:.5f})")
+            return result
+        return wrapper
+    return deco
+
+def stats(session_id: Optional[str] = None) -> Dict[str, Any]:
+    with _lock:
+        totals = {k: dict(v) for k, v in _TOTALS.items()}
+        requests = dict(_REQUESTS)
+        routes = dict(_ROUTES)
+        n_sessions = len(_SESSIONS)
+    by_stage: Dict[str, Dict[str, Any]] = {}
+    by_model: Dict[str, Dict[str, Any]] = {}
+    for (endpoint, stage, model), c in totals.items():
+        _add(by_stage.setdefault(f"{endpoint}/{stage}", _counter()), c)
+        _add(by_model.setdefault(model, _counter()), c)
+    out = {
+        "requests": requests,
+        "by_stage": {k: _rounded(v) for k, v in sorted(by_stage.items())},
+        "by_model": {k: _rounded(v) for k, v in sorted(by_model.items())},
+        "routing": {f"{s}/{r}": n for (s, r), n in sorted(routes.items())},
+        "sessions": n_sessions,
+        "stage_latency": STAGE_LATENCY.stats(),
+        "policy": {"enabled": ROUTING_ENABLED, "mini_model": ROUTE_MINI_MODEL,
+                   "prompt_tokens": ROUTE_PROMPT_TOKENS, "session_budget_usd": SESSION_BUDGET_USD,
+                   "shared_session_ids": sorted(SHARED_SESSION_IDS),
+                   "latency_slo_sec": LATENCY_SLO_SEC, "slo_percentile": ROUTE_SLO_PERCENTILE,
+                   "prices_per_1m": PRICES},
+    }
+    if session_id:
+        out["session"] = session_usage(session_id)
+    return out
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+load_test.py
+- /chatbot, /voice-chatbot 부하 생성기: 목표 RPS 로 요청을 '개방 루프'로 발사(응답을 기다리지 않고 일정 간격)
+  · 지연은 예정 발사 시각부터 측정 → 클라이언트 대기(coordinated omission)까지 포함
+- 리포트: 엔드포인트별 처리량/성공·실패 수/p50·p95·p99·max, 서버 응답의 timings 로 단계별 분위수
+  + Little 법칙 기반 동시 처리 필요량(처리량 × 평균 지연) → 워커 수 산정용
+- 오프라인 용량 테스트: 서버를 LLM_BACKEND=stub 으로 띄운 뒤 실행(llm_stub 지연 분포로 OpenAI/DDGS 대체)
+    LLM_BACKEND=stub LLM_STUB_SPEED=0.2 python app_fastapi.py
+    python load_test.py --rps 4 --duration 60 --mix chatbot=3,voice=1 --out report.json
+"""
+
+import os
+import json
+import time
+import random
+import argparse
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import requests
+
+BASE_URL = "http://localhost:8001"
+ENDPOINTS = {"chatbot": "/chatbot", "voice": "/voice-chatbot"}
+VOICE_QUESTION = "자주 쓰던 물건 이름이 갑자기 생각안 난적이 있나요?"
+
+_local = threading.local()
+
+def _session() -> requests.Session:
+    s = getattr(_local, "session", None)
+    if s is None:
+        s = _local.session = requests.Session()
+    return s
+
+def load_scripts(folder: str) -> List[str]:
+    texts = []
+    for p in sorted(Path(folder).glob("*.txt")):
+        try:
+            t = p.read_text(encoding="utf-8").strip()
+        except UnicodeDecodeError:
+            t = p.read_text(encoding="cp949", errors="ignore").strip()
+        if t:
+            texts.append(t)
+    return texts or ["요즘 약속 장소 이름이 자꾸 생각이 안 나요. 멋쩍어서 웃고 넘어가요."]
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, w = item.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise SystemExit(f"알 수 없는 엔드포인트: {name} (선택: {list(ENDPOINTS)})")
+        mix[name] = float(w or 1)
+    return mix
+
+def make_payload(kind: str, texts: List[str], i: int) -> Dict[str, Any]:
+    text = texts[i % len(texts)]
+    if kind == "chatbot":
+        return {"transcript": text, "guide_question_index": 3, "session_id": f"load-{i}"}
+    return {"user_response": text[:400], "question_context": VOICE_QUESTION,
+            "session_id": f"load-voice-{i}", "user_id": "load-test"}
+
+def percentiles(xs: List[float]) -> Dict[str, Optional[float]]:
+    if not xs:
+        return {"n": 0, "p50": None, "p95": None, "p99": None, "max": None, "mean": None}
+    s = sorted(xs)
+    pick = lambda q: round(s[min(len(s) - 1, int(round(q * (len(s) - 1))))], 3)
+    return {"n": len(s), "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99),
+            "max": round(s[-1], 3), "mean": round(sum(s) / len(s), 3)}
+
+def _fire(url: str, kind: str, payload: Dict[str, Any], t_sched: float, timeout: float) -> Dict[str, Any]:
+    rec: Dict[str, Any] = {"kind": kind, "t_sched": t_sched}
+    try:
+        r = _session().post(url + ENDPOINTS[kind], json=payload, timeout=timeout)
+        rec["status"] = r.status_code
+        if r.status_code == 200:
+            body = r.json()
+            rec["timings"] = body.get("timings") or {}
+            rec["result_status"] = body.get("status")
+    except requests.RequestException as e:
+        rec["status"] = type(e).__name__
+    rec["latency"] = time.perf_counter() - t_sched
+    return rec
+
+def run_load(url: str, rps: float, duration: float, mix: Dict[str, float], texts: List[str],
+             concurrency: int = 64, timeout: float = 120.0, seed: int = 0) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    kinds, weights = list(mix), list(mix.values())
+    n = max(1, int(rps * duration))
+    futures = []
+    print(f"🚀 {url} 에 {rps:g} RPS × {duration:g}s = {n} 요청 (mix={mix}, 동시 {concurrency})")
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        t0 = time.perf_counter()
+        for i in range(n):
+            t_sched = t0 + i / rps
+            delay = t_sched - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            kind = rng.choices(kinds, weights)[0]
+            futures.append(pool.submit(_fire, url, kind, make_payload(kind, texts, i), t_sched, timeout))
+        records = [f.result() for f in futures]
+        elapsed = time.perf_counter() - t0
+    return build_report(records, elapsed, rps, duration)
+
+def build_report(records: List[Dict[str, Any]], elapsed: float, rps: float, duration: float) -> Dict[str, Any]:
+    report: Dict[str, Any] = {"target_rps": rps, "duration": duration, "elapsed": round(elapsed, 2),
+                              "sent": len(records), "endpoints": {}}
+    for kind in sorted({r["kind"] for r in records}):
+        rs = [r for r in records if r["kind"] == kind]
+        ok = [r for r in rs if r["status"] == 200]
+        errors: Dict[str, int] = {}
+        for r in rs:
+            if r["status"] != 200:
+                errors[str(r["status"])] = errors.get(str(r["status"]), 0) + 1
+        lat = percentiles([r["latency"] for r in ok])
+        stages: Dict[str, List[float]] = {}
+        for r in ok:
+            for st, v in (r.get("timings") or {}).items():
+                stages.setdefault(st, []).append(float(v))
+        thr = len(ok) / elapsed if elapsed > 0 else 0.0
+        report["endpoints"][kind] = {
+            "sent": len(rs), "ok": len(ok), "errors": errors,
+            "throughput_rps": round(thr, 3),
+            "latency": lat,
+            "stages": {st: percentiles(v) for st, v in sorted(stages.items())},
+            # Little 법칙: 평균 동시 처리 중 요청 수 ≈ 필요한 워커(스레드) 수
+            "concurrency_needed": (round(thr * lat["mean"], 1) if lat["mean"] is not None else None),
+        }
+    done = sum(e["ok"] for e in report["endpoints"].values())
+    report["throughput_rps"] = round(done / elapsed, 3) if elapsed > 0 else 0.0
+    return report
+
+def print_report(report: Dict[str, Any]):
+    print(f"\n📊 전송 {report['sent']} / 경과 {report['elapsed']}s / 처리량 {report['throughput_rps']} rps "
+          f"(목표 {report['target_rps']})")
+    for kind, ep in report["endpoints"].items():
+        lat = ep["latency"]
+        print("-" * 80)
+        print(f"[{kind}] 성공 {ep['ok']}/{ep['sent']}  실패 {ep['errors'] or '-'}  처리량 {ep['throughput_rps']} rps  "
+              f"필요 동시성 ≈ {ep['concurrency_needed']}")
+        print(f"  지연  p50={lat['p50']}  p95={lat['p95']}  p99={lat['p99']}  max={lat['max']}")
+        for st, p in ep["stages"].items():
+            print(f"  · {st:<12} p50={p['p50']}  p95={p['p95']}  p99={p['p99']}")
+
+def main():
+    ap = argparse.ArgumentParser(description="챗봇 API 부하 테스트")
+    ap.add_argument("--url", default=os.getenv("CHATBOT_URL", BASE_URL))
+    ap.add_argument("--rps", type=float, default=2.0)
+    ap.add_argument("--duration", type=float, default=30.0)
+    ap.add_argument("--mix", default="chatbot=1,voice=1", help="엔드포인트 가중치, 예: chatbot=3,voice=1")
+    ap.add_argument("--scripts", default=str(Path(__file__).with_name("test_script")))
+    ap.add_argument("--concurrency", type=int, default=64, help="클라이언트 동시 연결 상한")
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None, help="리포트 JSON 저장 경로")
+    args = ap.parse_args()
+
+    report = run_load(args.url.rstrip("/"), args.rps, args.duration, parse_mix(args.mix),
+                      load_scripts(args.scripts), args.concurrency, args.timeout, args.seed)
+    print_report(report)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 리포트 저장: {args.out}")
+
+if __name__ == "__main__":
+    main()
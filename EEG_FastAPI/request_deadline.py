@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+request_deadline.py
+- 요청 단위 마감(deadline) + 취소 — 엔드포인트별 예산을 모든 LLM/임베딩/검색 호출까지 전파
+  · Deadline: 예산(초) + 취소 플래그(클라이언트 연결 끊김 시 cancel())
+  · contextvar 로 현재 요청의 Deadline 노출 → to_thread 워커/청크 병렬 작업/헤지 루프에도 그대로 복사됨
+- check(): 취소면 RequestCancelled, 마감 초과면 DeadlineExceeded → 다음 호출을 시작하지 않음(장애 시 버려진 요청이 쌓이지 않음)
+  · 두 예외는 asyncio.CancelledError 처럼 BaseException — 단계 함수의 `except Exception` 기본값 처리에 삼켜지지 않고
+    파이프라인까지 올라옴(파이프라인이 선택 단계면 생략, 필수 단계면 504)
+- call_timeout(): 개별 호출 timeout = 남은 시간 → OpenAI(chat/embeddings) timeout, DDGS timeout 으로 전달
+- within(reserve): 선택 단계(검색어/RAG/감정/구조화)용 하위 마감 = 상위 마감 - reserve(요약 몫 예약)
+  · 하위 마감이 끝나면 그 단계만 DeadlineExceeded → 파이프라인은 해당 단계 없이 저하 응답(degraded) 반환
+  · 요약 뒤 단계(구조화)는 FINAL_RESERVE_SEC(응답 조립 몫)만 남김 → 넘기면 이미 나온 요약으로 저하 응답
+- ✅ DEADLINE_CHATBOT_SEC / DEADLINE_VOICE_SEC (0 = 무제한), DEADLINE_RESERVE_SEC, DEADLINE_FINAL_RESERVE_SEC, DEADLINE_POLL_SEC
+- watch_disconnect(request, deadline): 처리 중 연결 끊김을 폴링해 cancel
+- stats(): 진행 중/완료/마감 초과/취소/저하 응답 수(단계별)
+"""
+
+import os, time, asyncio, threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+# -------------------------------
+# 설정
+# -------------------------------
+ENDPOINT_BUDGETS = {
+    "chatbot": float(os.getenv("DEADLINE_CHATBOT_SEC", "60")),
+    "voice":   float(os.getenv("DEADLINE_VOICE_SEC", "30")),
+}
+RESERVE_SEC = float(os.getenv("DEADLINE_RESERVE_SEC", "20"))    # 요약(필수 단계)에 남겨 둘 시간
+FINAL_RESERVE_SEC = float(os.getenv("DEADLINE_FINAL_RESERVE_SEC", "1"))   # 요약 뒤 단계 → 응답 조립에 남겨 둘 시간
+POLL_SEC    = float(os.getenv("DEADLINE_POLL_SEC", "0.5"))      # 연결 끊김/취소 확인 주기
+MIN_CALL_TIMEOUT = 0.5
+
+class RequestCancelled(BaseException):
+    """클라이언트 연결 끊김 등으로 요청 취소"""
+
+class DeadlineExceeded(BaseException):
+    """요청(또는 단계) 마감 초과"""
+
+# -------------------------------
+# 마감
+# -------------------------------
+class Deadline:
+    def __init__(self, budget_sec: Optional[float], endpoint: str = "",
+                 parent: Optional["Deadline"] = None, stage: str = ""):
+        self.endpoint = endpoint or (parent.endpoint if parent else "")
+        self.stage = stage
+        self.t0 = time.monotonic()
+        self.expires_at = self.t0 + budget_sec if budget_sec and budget_sec > 0 else None
+        if parent is not None and parent.expires_at is not None:
+            self.expires_at = parent.expires_at if self.expires_at is None else min(self.expires_at, parent.expires_at)
+        # 취소 플래그는 상위와 공유
+        self._cancel = parent._cancel if parent is not None else threading.Event()
+
+    def remaining(self) -> Optional[float]:
+        return None if self.expires_at is None else self.expires_at - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        r = self.remaining()
+        return r is not None and r <= 0
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def check(self):
+        if self.cancelled:
+            raise RequestCancelled(self.endpoint)
+        if self.expired:
+            raise DeadlineExceeded(self.stage or self.endpoint)
+
+    def call_timeout(self) -> Optional[float]:
+        r = self.remaining()
+        return None if r is None else max(MIN_CALL_TIMEOUT, r)
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.t0
+
+_CURRENT: ContextVar[Optional[Deadline]] = ContextVar("request_deadline", default=None)
+
+def current() -> Optional[Deadline]:
+    return _CURRENT.get()
+
+def check():
+    d = _CURRENT.get()
+    if d is not None:
+        d.check()
+
+def call_timeout() -> Optional[float]:
+    d = _CURRENT.get()
+    return None if d is None else d.call_timeout()
+
+def affordable(reserve: float = RESERVE_SEC) -> bool:
+    """마감이 없거나, 남은 시간이 reserve 보다 많으면 True"""
+    d = _CURRENT.get()
+    r = None if d is None else d.remaining()
+    return r is None or r > reserve
+
+@contextmanager
+def scope(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    token = _CURRENT.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _CURRENT.reset(token)
+
+@contextmanager
+def within(stage: str, reserve: float = RESERVE_SEC) -> Iterator[Optional[Deadline]]:
+    """선택 단계 하위 마감(상위 마감 - reserve). 상위 마감이 없으면 그대로 통과"""
+    parent = _CURRENT.get()
+    if parent is None or parent.expires_at is None:
+        yield parent
+        return
+    child = Deadline(None, parent=parent, stage=stage)
+    child.expires_at = parent.expires_at - reserve
+    with scope(child):
+        yield child
+
+# -------------------------------
+# 엔드포인트 측
+# -------------------------------
+_lock = threading.Lock()
+_STATS: Dict[str, Any] = {"in_flight": 0, "completed": 0, "expired": 0, "cancelled": 0, "degraded": {}}
+
+def start(endpoint: str) -> Deadline:
+    with _lock:
+        _STATS["in_flight"] += 1
+    return Deadline(ENDPOINT_BUDGETS.get(endpoint), endpoint=endpoint)
+
+def finish(deadline: Deadline, outcome: str, degraded: Optional[list] = None):
+    """outcome: completed | expired | cancelled"""
+    with _lock:
+        _STATS["in_flight"] -= 1
+        _STATS[outcome] = _STATS.get(outcome, 0) + 1
+        for stage in degraded or []:
+            _STATS["degraded"][stage] = _STATS["degraded"].get(stage, 0) + 1
+
+async def watch_disconnect(request: Any, deadline: Deadline):
+    """요청 처리 동안 연결 상태 폴링 → 끊기면 deadline.cancel() (작업 스레드는 다음 check 에서 중단)"""
+    while not deadline.cancelled:
+        if await request.is_disconnected():
+            print(f"🔌 [{deadline.endpoint}] 클라이언트 연결 끊김 → 요청 취소 ({deadline.elapsed():.1f}s)")
+            deadline.cancel()
+            return
+        await asyncio.sleep(POLL_SEC)
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        snap = dict(_STATS, degraded=dict(_STATS["degraded"]))
+    return dict(snap, budgets=ENDPOINT_BUDGETS, reserve_sec=RESERVE_SEC, final_reserve_sec=FINAL_RESERVE_SEC)
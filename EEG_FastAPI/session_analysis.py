@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+session_analysis.py
+- 세션별 증분 분석 저장소: 같은 세션에서 이미 처리한 텍스트는 다시 LLM 에 보내지 않음
+  · 세그먼트 판별 결과(문장 → on_topic/score), 비치매 과업 판정(델타 블록 단위)
+  · 분석 블록: 새로 들어온 온토픽 델타마다 {온토픽 판별, 감정 항목} 1개 → 세션 결과는 블록 병합
+  · 임베딩 캐시(모델+텍스트 해시 → 벡터, 세션당 LRU)
+  · 세션 요약/마지막 결과: 다음 턴은 '기존 요약 + 델타' 로 갱신, 델타가 없으면 마지막 결과 재사용
+- 델타 = 세션에서 아직 처리하지 않은 문장 — 누적 전사본을 매번 보내도, 턴마다 새 발화만 보내도 같은 방식
+- ✅ @incremental(kind, params): 세션 객체를 contextvar 로 설정 + 같은 세션 요청 직렬화 → 함수 안에서 current()
+  · kind 별로 분리("chatbot" / "voice") — 같은 session_id 라도 결과 형식이 달라 저장소를 공유하지 않음
+  · params(질문 번호/모델/온도 등 결과에 영향을 주는 인자)가 이전 턴과 다르면 세션 상태를 비우고 처음부터 분석
+  · 세션 잠금 대기 중에도 DEADLINE_POLL_SEC 마다 취소/마감 확인 → 연결 끊김/마감 초과 요청은 줄 서 있지 않고 빠짐
+- 턴 도중 판별 결과(세그먼트/비치매 과업)는 스테이징 → commit() 때만 세션에 반영(실패/저하/오프토픽 턴은 남기지 않음)
+- ✅ SESSION_INCREMENTAL=0 이면 끔, 세션 미지정 · 공용 기본 세션 ID(SESSION_SHARED_IDS)는 항상 제외(사용자 간 섞임 방지)
+- SESSION_ANALYSIS_TTL_SEC 동안 요청이 없으면 폐기, 최대 SESSION_ANALYSIS_MAX 개(LRU)
+"""
+
+import os, re, copy, time, hashlib, inspect, threading
+from collections import ChainMap, OrderedDict
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+import llm_usage
+import request_deadline
+import transcript_chunks
+
+# -------------------------------
+# 설정
+# -------------------------------
+INCREMENTAL_ENABLED = os.getenv("SESSION_INCREMENTAL", "1") == "1"
+SHARED_SESSION_IDS  = llm_usage.SHARED_SESSION_IDS   # SESSION_SHARED_IDS (사용량 집계와 같은 목록)
+TTL_SEC             = float(os.getenv("SESSION_ANALYSIS_TTL_SEC", "1800"))
+MAX_SESSIONS        = int(os.getenv("SESSION_ANALYSIS_MAX", "1000"))
+EMBED_CACHE_MAX     = int(os.getenv("SESSION_EMBED_CACHE_MAX", "512"))
+
+def sentence_key(s: str) -> str:
+    return re.sub(r"\s+", " ", s or "").strip()
+
+def embed_key(model: str, text: str) -> str:
+    return f"{model}:{hashlib.sha1((text or '').encode('utf-8')).hexdigest()}"
+
+# -------------------------------
+# 세션 1개
+# -------------------------------
+class SessionAnalysis:
+    def __init__(self, session_id: str, kind: str):
+        self.session_id = session_id
+        self.kind = kind
+        self.lock = threading.RLock()
+        self.last_ts = time.time()
+        self.turns = 0
+        self.segments: Dict[str, Dict[str, Any]] = {}                         # 세그먼트 → {"on_topic", "score"}
+        self.offdomain_blocks: List[Tuple[FrozenSet[str], Dict[str, Any]]] = []
+        self.blocks: List[Dict[str, Any]] = []                                # {"sentences", "topic", "emotions"}
+        self.processed: Dict[str, None] = {}                                  # 처리 끝난 문장(순서 유지)
+        self.embeddings: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.summary: str = ""
+        self.last_result: Optional[Dict[str, Any]] = None
+        self.params: Optional[str] = None                                     # 상태를 만든 요청 인자(repr)
+        self._staged_segments: Dict[str, Dict[str, Any]] = {}
+        self._staged_offdomain: List[Tuple[FrozenSet[str], Dict[str, Any]]] = []
+
+    # ---- 턴 시작 ----
+    def begin(self, params: str):
+        """요청 시작: 스테이징 비움, 결과에 영향을 주는 인자가 바뀌었으면 이전 턴 상태 폐기"""
+        self._staged_segments = {}
+        self._staged_offdomain = []
+        if self.params is not None and params != self.params:
+            print(f"🔄 [{self.session_id}/{self.kind}] 요청 설정 변경 → 세션 증분 상태 초기화")
+            self.segments, self.offdomain_blocks, self.blocks = {}, [], []
+            self.processed, self.summary, self.last_result = {}, "", None
+        self.params = params
+
+    def segment_cache(self) -> "ChainMap[str, Dict[str, Any]]":
+        """세그먼트 판별 캐시: 읽기는 세션+이번 턴, 쓰기(update)는 이번 턴 스테이징에만"""
+        return ChainMap(self._staged_segments, self.segments)
+
+    # ---- 델타 ----
+    def delta(self, text: str) -> Tuple[str, List[str]]:
+        """아직 처리하지 않은 문장만 원문 순서대로 → (델타 텍스트, 문장 키 목록)"""
+        sents, keys, seen = [], [], set()
+        for s in transcript_chunks.split_sentences(text):
+            k = sentence_key(s)
+            if k and k not in self.processed and k not in seen:
+                seen.add(k)
+                sents.append(s)
+                keys.append(k)
+        return "".join(sents).strip(), keys
+
+    # ---- 비치매 과업: 새 문장 블록만 판정, 현재 텍스트에 남아 있는 블록 결과와 OR ----
+    def offdomain(self, segments: List[str], run: Callable[[str], Dict[str, Any]]) -> Dict[str, Any]:
+        present = {sentence_key(s) for s in segments}
+        blocks = self.offdomain_blocks + self._staged_offdomain
+        known = set().union(*(b for b, _ in blocks)) if blocks else set()
+        new = [s for s in segments if sentence_key(s) not in known]
+        results = [r for b, r in blocks if b <= present]
+        if new:
+            r = run(" ".join(new))
+            self._staged_offdomain.append((frozenset(sentence_key(s) for s in new), r))
+            results.append(r)
+        return {"non_dementia_task": any(r["non_dementia_task"] for r in results),
+                "spans": [sp for r in results for sp in r.get("spans", [])][:2]}
+
+    # ---- 임베딩 ----
+    def cached_embeddings(self, model: str, texts: List[str],
+                          embed: Callable[[List[str]], List[List[float]]]) -> List[List[float]]:
+        keys = [embed_key(model, t) for t in texts]
+        missing = list(dict.fromkeys(k for k in keys if k not in self.embeddings))
+        if missing:
+            by_key = {k: t for k, t in zip(keys, texts)}
+            for k, v in zip(missing, embed([by_key[k] for k in missing])):
+                self.embeddings[k] = v
+        out = []
+        for k in keys:
+            self.embeddings.move_to_end(k)
+            out.append(self.embeddings[k])
+        while len(self.embeddings) > EMBED_CACHE_MAX:
+            self.embeddings.popitem(last=False)
+        return out
+
+    # ---- 턴 반영 ----
+    def commit(self, keys: List[str], block: Optional[Dict[str, Any]], summary: str,
+               result: Dict[str, Any]):
+        """파이프라인이 끝까지 성공했을 때만 호출 → 실패한 턴의 델타는 다음 요청에서 다시 처리"""
+        self.segments.update(self._staged_segments)
+        self.offdomain_blocks.extend(self._staged_offdomain)
+        self._staged_segments, self._staged_offdomain = {}, []
+        for k in keys:
+            self.processed[k] = None
+        if block is not None:
+            self.blocks.append(block)
+        self.summary = summary
+        self.last_result = copy.deepcopy(result)
+        self.turns += 1
+
+    def info(self, mode: str, delta_sentences: int) -> Dict[str, Any]:
+        return {"mode": mode, "turn": self.turns + (0 if mode == "reused" else 1),
+                "delta_sentences": delta_sentences, "processed_sentences": len(self.processed),
+                "cached_segments": len(self.segments), "blocks": len(self.blocks),
+                "cached_embeddings": len(self.embeddings)}
+
+# -------------------------------
+# 저장소
+# -------------------------------
+_lock = threading.Lock()
+_STORE: "OrderedDict[Tuple[str, str], SessionAnalysis]" = OrderedDict()
+
+def get(session_id: Optional[str], kind: str) -> Optional[SessionAnalysis]:
+    if not INCREMENTAL_ENABLED or not session_id or session_id in SHARED_SESSION_IDS:
+        return None
+    now = time.time()
+    with _lock:
+        for key in [k for k, s in _STORE.items() if now - s.last_ts > TTL_SEC]:
+            del _STORE[key]
+        sess = _STORE.pop((session_id, kind), None) or SessionAnalysis(session_id, kind)
+        sess.last_ts = now
+        _STORE[(session_id, kind)] = sess
+        while len(_STORE) > MAX_SESSIONS:
+            _STORE.popitem(last=False)
+    return sess
+
+def drop(session_id: str):
+    with _lock:
+        for key in [k for k in _STORE if k[0] == session_id]:
+            del _STORE[key]
+
+_CURRENT: ContextVar[Optional[SessionAnalysis]] = ContextVar("session_analysis", default=None)
+
+def current() -> Optional[SessionAnalysis]:
+    return _CURRENT.get()
+
+def _acquire(lock: threading.RLock):
+    # 앞선 같은 세션 요청이 끝날 때까지 대기 — 취소/마감이면 RequestCancelled/DeadlineExceeded
+    while not lock.acquire(timeout=request_deadline.POLL_SEC):
+        request_deadline.check()
+
+def incremental(kind: str, params: Tuple[str, ...] = ()):
+    """
+    session_id 인자로 세션 객체를 찾아 current() 로 노출, 같은 세션 요청은 순서대로 처리
+    params: 결과에 영향을 주는 인자 이름 — 값이 이전 턴과 다르면 세션 상태를 재사용하지 않음
+    """
+    def deco(fn):
+        sig = inspect.signature(fn)
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = sig.bind_partial(*args, **kwargs)
+            sess = get(bound.arguments.get("session_id"), kind)
+            if sess is None:
+                return fn(*args, **kwargs)
+            bound.apply_defaults()
+            key = repr([(name, bound.arguments.get(name)) for name in params])
+            _acquire(sess.lock)
+            try:
+                sess.begin(key)
+                token = _CURRENT.set(sess)
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    _CURRENT.reset(token)
+            finally:
+                sess.lock.release()
+        return wrapper
+    return deco
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        sessions = list(_STORE.values())
+    return {"enabled": INCREMENTAL_ENABLED, "ttl_sec": TTL_SEC, "sessions": len(sessions),
+            "by_kind": {k: sum(1 for s in sessions if s.kind == k) for k in sorted({s.kind for s in sessions})}}
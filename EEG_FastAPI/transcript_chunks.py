@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+transcript_chunks.py
+- 긴 STT 원문을 토큰 상한 청크로 분할 + 청크별 작업 병렬 실행(map) 유틸
+  · 문장 경계 기준으로 묶고, 한 문장이 상한을 넘으면 글자 단위로 자름
+  · 토큰 수는 llm_usage.estimate_tokens(대략치) 기준
+- ✅ 추정 토큰이 LLM_CHUNK_TRIGGER_TOKENS 이상일 때만 청크 모드(짧은 입력은 기존 단일 호출 경로 그대로)
+- run_parallel / map_parallel: 최대 LLM_CHUNK_WORKERS 개 동시 실행 → 입력이 길어져도 지연은 대략 일정
+  · 각 작업은 제출 시점 contextvars 복사본에서 실행(사용량 장부 유지) + 작업별 단계 라벨(llm_usage.stage_label)
+- ✅ LLM_CHUNKING=0 이면 청크 모드 끔
+"""
+
+import os, re, contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, List, Optional, Tuple
+
+import llm_usage
+
+# -------------------------------
+# 설정
+# -------------------------------
+CHUNK_ENABLED        = os.getenv("LLM_CHUNKING", "1") == "1"
+CHUNK_TOKENS         = int(os.getenv("LLM_CHUNK_TOKENS", "1000"))
+CHUNK_TRIGGER_TOKENS = int(os.getenv("LLM_CHUNK_TRIGGER_TOKENS", "2000"))
+CHUNK_REDUCE_TOKENS  = int(os.getenv("LLM_CHUNK_REDUCE_TOKENS", "2500"))
+CHUNK_WORKERS        = int(os.getenv("LLM_CHUNK_WORKERS", "16"))
+
+# 문장 = 종결부호/줄바꿈까지(부호·뒤 공백 포함 → 이어 붙이면 원문 그대로)
+_SENTENCE = re.compile(r"[^.!?\n]+(?:[.!?]+|\n+|$)\s*")
+
+def split_sentences(text: str) -> List[str]:
+    return [m.group(0) for m in _SENTENCE.finditer(text or "") if m.group(0).strip()]
+
+def should_chunk(text: str) -> bool:
+    return CHUNK_ENABLED and llm_usage.estimate_tokens(text) >= CHUNK_TRIGGER_TOKENS
+
+def split_chunks(text: str, max_tokens: int = CHUNK_TOKENS) -> List[str]:
+    """문장 경계를 지키며 청크당 추정 토큰 ≤ max_tokens (줄바꿈/공백은 원문 유지)"""
+    max_tokens = max(1, int(max_tokens))
+    width = max_tokens * 2           # estimate_tokens 기준 글자 수
+    chunks: List[str] = []
+    cur: List[str] = []
+    cur_tok = 0
+    for sent in split_sentences(text):
+        pieces = [sent[i:i + width] for i in range(0, len(sent), width)]
+        for p in pieces:
+            t = llm_usage.estimate_tokens(p)
+            if cur and cur_tok + t > max_tokens:
+                chunks.append("".join(cur).strip())
+                cur, cur_tok = [], 0
+            cur.append(p)
+            cur_tok += t
+    if cur:
+        chunks.append("".join(cur).strip())
+    return chunks
+
+# -------------------------------
+# 병렬 실행
+# -------------------------------
+def _labelled(label: Optional[str], fn: Callable[[], Any]) -> Any:
+    if label is None:
+        return fn()
+    with llm_usage.stage_label(label):
+        return fn()
+
+def run_parallel(jobs: List[Tuple[Optional[str], Callable[[], Any]]],
+                 workers: int = CHUNK_WORKERS) -> List[Any]:
+    """jobs = [(단계 라벨|None, 인자 없는 함수)] → 같은 순서의 결과. 예외는 그대로 전파"""
+    if not jobs:
+        return []
+    if len(jobs) == 1 or workers <= 1:
+        return [_labelled(label, fn) for label, fn in jobs]
+    with ThreadPoolExecutor(max_workers=min(workers, len(jobs)), thread_name_prefix="chunk") as pool:
+        # Context 는 스레드 간 동시 진입 불가 → 작업마다 복사본
+        futures = [pool.submit(contextvars.copy_context().run, _labelled, label, fn) for label, fn in jobs]
+        return [f.result() for f in futures]
+
+def map_parallel(fn: Callable[[Any], Any], items: List[Any], label: Optional[str] = None,
+                 workers: int = CHUNK_WORKERS) -> List[Any]:
+    return run_parallel([(label, partial(fn, it)) for it in items], workers)
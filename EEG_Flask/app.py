@@ -10,27 +10,56 @@ app.py
     "subject_id": "sub-089",     // 옵션
     "true_label": "CN",          // 옵션: "CN"|"AD"|"FTD"|("C"|"A"|"F")
     "enforce_two_minutes": true, // 기본 true
-    "csv_order": "TP9,AF7,AF8,TP10" // 옵션(생략 가능). 기본은 표준 MuseLab 순서
+    "csv_order": "TP9,AF7,AF8,TP10", // 옵션(생략 가능). 기본은 표준 MuseLab 순서
+    "profile": false,            // 옵션: true 면 result.timings 에 단계별 시간/크기 포함
+    "profile_capture": "cprofile" // 옵션: "cprofile" | "torch" → EEG_PROFILE_DIR 에 trace 파일 저장
   }
+- file_path 는 .csv / .set / .eegr(네이티브 녹화 컨테이너) 지원
+- /convert_recording: 기존 CSV/.set → .eegr 변환
+- /metrics: Prometheus 텍스트 포맷(요청 수/지연, 단계별 지연 히스토그램)
+- 엔진은 (device, ver, comment, csv_order) 별로 캐시, 추론은 eeg_executor 워커에서 실행
+  (EEG_INFER_WORKERS × EEG_TORCH_THREADS, 대기열 EEG_INFER_QUEUE 초과 시 503)
+- 같은 엔진의 동시 요청 forward 는 eeg_batching 으로 합쳐 실행(EEG_MICROBATCH=0 으로 끔)
+- EEG_WORKER_PROCESSES > 0 이면 추론은 eeg_worker_pool 워커 프로세스에서 실행(크래시 시 자동 재시작)
+- /workers: 워커 풀 상태, POST /workers/restart: 전체 워커 재시작
+- 기동: torch/mne/엔진/openai/pandas 는 지연 import, 기본 엔진은 eeg_startup 이 백그라운드 warm-up
+  (EEG_WARMUP=background|eager|off). /health 는 liveness + warm-up 진행, /ready 는 준비 전 503
+  · warm-up 은 부모 프로세스에서만 시작(spawn 자식이 app.py 를 다시 import 해도 중복 실행 안 함)
+- /start_eeg_collection: 전극 접촉 품질을 계속 샘플링(eeg_contact), 양호 상태가 유지될 때 녹화 시작
+  헤드밴드 세션은 eeg_acquisition 이 시리얼별로 관리 → 여러 대 동시 수집, /acquisitions 로 시작/상태/중지/정리
+  ("async": true 면 202 + session_id 즉시 반환) → GET /eeg_collection/<id>, /eeg_collection/<id>/events(SSE)
+- EEG_ACQ_PROCESSES > 0 이면 BrainFlow 는 eeg_acq_supervisor 상주 워커 프로세스에서 실행(멈춤/크래시 시 워커만 재시작)
+  /acquisitions/workers: 상태, POST /acquisitions/workers/restart: 전체 재시작
+  /force_cleanup, /restart_flask_server, /force_restart_server 도 웹 프로세스 대신 수집 워커만 재시작
 """
+import time
+_T_START = time.perf_counter()  # 기동 시간 측정 기준
+
 import os
 import sys
-import time
 import json
+import threading
 import traceback
-import pandas as pd
+import multiprocessing
 import numpy as np
 from datetime import datetime
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
 from werkzeug.exceptions import HTTPException
-import openai
 from dotenv import load_dotenv
 
-# --- 엔진/채널 ---
-from eeg_model3class import EEGInferenceEngine3Class as EEGEngine3, CHANNEL_GROUPS
-from eeg_model2class import EEGInferenceEngine2Class as EEGEngine2
-from eeg_model import EEGInferenceEngine
+# --- 엔진/채널 (엔진 모듈은 torch/mne 를 끌어오므로 _engine_cls() 에서 지연 import) ---
+from eeg_recording import CHANNEL_GROUPS
+import eeg_recording
+import eeg_profiling
+import eeg_executor
+import eeg_worker_pool
+import eeg_startup
+import eeg_result_cache
+import eeg_timeline
+import eeg_contact
+import eeg_acquisition
+import eeg_acq_supervisor
 
 # .env 파일 로드
 load_dotenv()
@@ -41,20 +70,27 @@ CORS(app)  # CORS 활성화
 
 # 동일 (device, ver, comment, csv_order) 조합 재사용
 VER = 'V1'
+_ENGINE_CACHE = {}
+_BATCHERS = {}  # 모델(가중치 파일+장치)당 MicroBatcher 1개 → csv_order/comment 만 다른 엔진도 같은 배치로 합침
+_ENGINE_LOCK = threading.Lock()
 
-# 전역 변수로 board_shim 관리 (세션 정리를 위해)
-_ACTIVE_BOARD = None
+# BrainFlow 보드 세션은 eeg_acquisition.AcquisitionManager 가 시리얼 넘버별로 관리(여러 헤드밴드 동시 수집)
 
 def reset_all_global_state():
     """모든 전역 상태를 초기화하는 함수"""
-    global _ACTIVE_BOARD
-    _ACTIVE_BOARD = None
+    eeg_acquisition.get_manager().stop_all()
 
 # OpenAI API 키 설정 (환경변수에서 가져오기)
-openai.api_key = os.getenv("OPENAI_API_KEY")
-if not openai.api_key:
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+if not OPENAI_API_KEY:
     raise ValueError("OPENAI_API_KEY 환경변수가 설정되지 않았습니다. .env 파일을 확인해주세요.")
 
+def _openai():
+    """openai 패키지는 import 비용이 커서 첫 사용 시 로드"""
+    import openai
+    openai.api_key = OPENAI_API_KEY
+    return openai
+
 
 def check_place(word):
     """OpenAI GPT-4를 사용하여 장소 판별"""
@@ -75,7 +111,7 @@ def check_place(word):
         """
         
         
-        response = openai.chat.completions.create(
+        response = _openai().chat.completions.create(
             model="gpt-4",
             messages=[
                 {"role": "system", "content": "당신은 실제 위치(주소, 건물, 시설 등)만 장소로 판별하는 전문가입니다. '집', '병원', '학교', '회사' 등은 모두 장소입니다. 장난감, 상상 속 공간, 물건 이름은 장소가 아닙니다."},
@@ -132,7 +168,31 @@ def _parse_common_params():
     subject_id = p.get("subject_id")
     true_label = p.get("true_label")
     enforce_two_minutes = _truthy(p.get("enforce_two_minutes"), True)
-        
+    profile = _truthy(p.get("profile"), False)
+    profile_capture = eeg_profiling.capture_mode(p.get("profile_capture"))
+        
+    # (옵션) 앙상블/TTA: 추가 가중치 버전(같은 장치), 시간 이동 격자 수, 평균 방식(prob|logit)
+    ens_vers = p.get("ensemble_vers")
+    if isinstance(ens_vers, str):
+        ens_vers = [v.strip() for v in ens_vers.split(",") if v.strip()]
+    elif isinstance(ens_vers, list):
+        ens_vers = [str(v).strip() for v in ens_vers if str(v).strip()]
+    else:
+        ens_vers = []
+    try:
+        tta = int(p.get("tta") or 1)
+    except (TypeError, ValueError):
+        return None, ("tta must be an integer", 400)
+    ensemble = None
+    if ens_vers or tta > 1:
+        ensemble = {"vers": ens_vers, "tta": tta, "average": p.get("ensemble_average")}
+
+    # (옵션) 세그먼트별 확률 타임라인: true/"f16"(float16 base64) | "json"
+    try:
+        timeline = eeg_timeline.parse_format(p.get("timeline"))
+    except ValueError as e:
+        return None, (str(e), 400)
+
     # Muse CSV 물리 채널 순서(옵션)
     csv_order_str = p.get("csv_order")
     csv_order = None
@@ -149,19 +209,45 @@ def _parse_common_params():
         "subject_id": subject_id,
         "true_label": true_label,
         "enforce_two_minutes": enforce_two_minutes,
-        "csv_order": csv_order
+        "csv_order": csv_order,
+        "ensemble": ensemble,
+        "timeline": timeline,
+        "profile": profile,
+        "profile_capture": profile_capture
     }
     return parsed, None
 
+def _engine_cls(kind):
+    if kind == "2c":
+        from eeg_model2class import EEGInferenceEngine2Class
+        return EEGInferenceEngine2Class
+    from eeg_model3class import EEGInferenceEngine3Class
+    return EEGInferenceEngine3Class
+
+def _cached_engine(kind, cache_key, factory):
+    # 모델 로드는 키당 1회. 추론은 읽기 전용(eval/no_grad)이라 워커 간 공유 가능
+    import eeg_batching
+    key = (kind,) + cache_key
+    with _ENGINE_LOCK:
+        eng = _ENGINE_CACHE.get(key)
+        if eng is None:
+            eng = factory()
+            if eeg_batching.MICROBATCH_ENABLED:
+                batcher = _BATCHERS.get(eng.model_key)
+                if batcher is None:
+                    batcher = _BATCHERS[eng.model_key] = eeg_batching.MicroBatcher(
+                        eng.model, eng.torch_device, name="/".join(map(str, key[:3])))
+                eng.batcher = batcher
+            _ENGINE_CACHE[key] = eng
+    return eng
+
 def _engine3(device, ver, comment, csv_order):
     cache_key = (device or "__auto__", ver or "__auto__", comment or "__auto__", csv_order)
-    eng = EEGEngine3(device_type=device, version=ver, comment=comment, csv_order=csv_order)
-    return eng
+    return _cached_engine("3c", cache_key, lambda: _engine_cls("3c")(device_type=device, version=ver, comment=comment, csv_order=csv_order))
 
 def _engine2(device, ver, comment, csv_order):
     cache_key = (device or "__auto__", ver or "__auto__", comment or "__auto__", csv_order)
-    eng = EEGEngine2(device_type=device, version=ver, comment=comment, csv_order=csv_order)
-    return eng
+    return _cached_engine("2c", cache_key, lambda: _engine_cls("2c")(device_type=device, version=ver, comment=comment, csv_order=csv_order))
 
 def _normalize_true_label_3(tl: str | None):
     if not tl: return None
@@ -179,11 +265,93 @@ def _normalize_true_label_2(tl: str | None):
     # FTD는 2진분류에서 제외
     return None
 
+def _save_muse_recording(df_final, serial_number, sampling_rate):
+    """수집 데이터를 uploads/eeg 에 .eegr 로 저장 → (rec_name, rec_path, (X, sfreq)) (eeg_acquisition 참고)"""
+    return eeg_acquisition.save_muse_recording(df_final, serial_number, sampling_rate)
+
 @app.get("/health")
 def health():
-    return jsonify({"status": "flask-ok", "routes": ["/infer(3-class)", "/infer2class(2-class)", "/infer3class(3-class)", "/check_place", "/check_moca_q3", "/check_moca_q4"]}), 200
+    # liveness: 항상 200. readiness/warm-up 진행은 별도 필드(준비 전 503 이 필요하면 /ready)
+    return jsonify({"status": "flask-ok", "live": True, "ready": _WARMUP.ready, "warmup": _WARMUP.status(),
+                    "routes": ["/infer(3-class)", "/infer2class(2-class)", "/infer3class(3-class)", "/convert_recording", "/metrics", "/ready", "/cache", "/check_place", "/check_moca_q3", "/check_moca_q4"],
+                    "executor": eeg_executor.get_executor().stats(),
+                    "worker_pool": (eeg_worker_pool.get_pool().stats() if eeg_worker_pool.enabled() else None)}), 200
+
+@app.get("/ready")
+def ready():
+    st = _WARMUP.status()
+    return jsonify({"status": ("ready" if st["ready"] else st["state"]), "warmup": st}), (200 if st["ready"] else 503)
+
+@app.get("/workers")
+def workers_status():
+    if not eeg_worker_pool.enabled():
+        return jsonify({"status": "disabled", "error": "EEG_WORKER_PROCESSES=0"}), 404
+    return jsonify({"status": "ok", "pool": eeg_worker_pool.get_pool().stats()}), 200
+
+@app.post("/workers/restart")
+def workers_restart():
+    if not eeg_worker_pool.enabled():
+        return jsonify({"status": "disabled", "error": "EEG_WORKER_PROCESSES=0"}), 404
+    pool = eeg_worker_pool.get_pool()
+    pool.restart_all(reason="manual")
+    return jsonify({"status": "ok", "pool": pool.stats()}), 200
+
+@app.get("/cache")
+def cache_status():
+    cache = eeg_result_cache.get_cache()
+    if cache is None:
+        return jsonify({"status": "disabled", "error": "EEG_RESULT_CACHE=0"}), 404
+    return jsonify({"status": "ok", "cache": cache.stats()}), 200
+
+@app.post("/cache/clear")
+def cache_clear():
+    cache = eeg_result_cache.get_cache()
+    if cache is None:
+        return jsonify({"status": "disabled", "error": "EEG_RESULT_CACHE=0"}), 404
+    removed = cache.clear()
+    return jsonify({"status": "ok", "removed": removed, "cache": cache.stats()}), 200
+
+@app.get("/metrics")
+def metrics():
+    return eeg_profiling.REGISTRY.render(), 200, {"Content-Type": eeg_profiling.CONTENT_TYPE}
 
 def _infer_common(engine_kind: str):
+    timer = eeg_profiling.StageTimer()
+    resp = _infer_common_impl(engine_kind, timer)
+    eeg_profiling.observe_timer(timer, engine=engine_kind, endpoint=request.path, status=str(resp[1]))
+    return resp
+
+def _infer_in_process(engine_kind: str, parsed: dict, timer: eeg_profiling.StageTimer):
+    """Flask 프로세스 안의 엔진 캐시 + 실행기 워커 스레드로 추론 → (result, trace)"""
+    with eeg_profiling.activate(timer):
+        with eeg_profiling.stage("engine_init"):
+            get = _engine2 if engine_kind == "2c" else _engine3
+            engine = get(parsed["device"], parsed["ver"], parsed["comment"], parsed["csv_order"])
+            ens = parsed["ensemble"]
+            if ens:
+                # 멤버 엔진도 캐시에서 재사용, 앙상블 객체 자체는 가벼워 요청마다 구성
+                import eeg_ensemble
+                members = [engine] + [get(parsed["device"], v, parsed["comment"], parsed["csv_order"])
+                                      for v in ens["vers"]]
+                engine = eeg_ensemble.EnsembleEngine(members, tta=ens["tta"], average=ens["average"])
+
+    # 추론은 실행기 워커에서 (profile_capture 지정 시 워커 스레드 기준 trace 기록)
+    def _job():
+        timer.add("queue_wait", time.perf_counter() - t_submit)
+        with eeg_profiling.capture(parsed["profile_capture"], tag=f"infer{engine_kind}") as trace:
+            res = engine.infer(
+                file_path=parsed["file_path"],
+                subject_id=parsed["subject_id"],
+                true_label=parsed["true_label"],
+                enforce_two_minutes=parsed["enforce_two_minutes"],
+                timer=timer,
+                timeline=parsed["timeline"]
+            )
+        return res, trace
+    t_submit = time.perf_counter()
+    return eeg_executor.get_executor().run(_job)
+
+def _infer_common_impl(engine_kind: str, timer: eeg_profiling.StageTimer):
     try:
         parsed, err = _parse_common_params()
         if err:
@@ -199,19 +367,24 @@ def _infer_common(engine_kind: str):
         enforce_2min    = parsed["enforce_two_minutes"]
         csv_order       = parsed["csv_order"]
 
-        if engine_kind == "2c":
-            engine = _engine2(device, ver, comment, csv_order)
+        if eeg_worker_pool.enabled():
+            # 워커 프로세스에서 엔진 로드/추론(워커별 엔진 캐시), 단계 시간은 워커에서 받아 합침
+            out = eeg_worker_pool.get_pool().run({
+                "kind": engine_kind, "device": device, "ver": ver, "comment": comment,
+                "csv_order": csv_order, "ensemble": parsed["ensemble"], "timeline": parsed["timeline"],
+                "file_path": file_path, "subject_id": subject_id,
+                "true_label": true_label_in, "enforce_two_minutes": enforce_2min,
+                "profile_capture": parsed["profile_capture"],
+            }, timer=timer)
+            result, trace = out["result"], {"trace_file": out["trace_file"]}
         else:
-            engine = _engine3(device, ver, comment, csv_order)
-
-        # 추론
-        result = engine.infer(
-            file_path=file_path,
-            subject_id=subject_id,
-            true_label=true_label_in,
-            enforce_two_minutes=enforce_2min
-        )
+            result, trace = _infer_in_process(engine_kind, parsed, timer)
+        timer.stop()
+        if "cached" in result:
+            eeg_result_cache.LOOKUPS.inc(engine=engine_kind, outcome=("hit" if result["cached"] else "miss"))
         result['class_mode'] = (2 if engine_kind == "2c" else 3)
+        if parsed["profile"] or trace["trace_file"]:
+            result['timings'] = dict(timer.as_dict(), trace_file=trace["trace_file"])
 
         # subject-level 예측 레이블
         prob_mean = result.get('prob_mean', {})
@@ -239,6 +412,10 @@ def _infer_common(engine_kind: str):
         
         return jsonify({"status": "ok", "result": result}), 200
         
+    except eeg_executor.ExecutorBusy as e:
+        return jsonify({"status":"error","error":str(e)}), 503, {"Retry-After": "1"}
+    except eeg_worker_pool.WorkerCrashed as e:
+        return jsonify({"status":"error","error":str(e)}), 500
     except FileNotFoundError as e:
         return jsonify({"status":"error","error":str(e)}), 404
     except (ValueError, AssertionError) as e:
@@ -264,6 +441,31 @@ def infer_3():
 def infer_2():
     return _infer_common("2c")
 
+# (3-1) 업로드된 CSV/.set → .eegr 변환 (이후 /infer* 에 .eegr 경로를 넘기면 파싱 비용 없이 분석)
+@app.post("/convert_recording")
+def convert_recording():
+    try:
+        p = request.get_json(force=True) or {}
+        src = p.get("file_path")
+        if not src:
+            return jsonify({"status":"error","error":"file_path is required"}), 400
+        if not os.path.exists(src):
+            return jsonify({"status":"error","error":f"EEG file not found: {src}"}), 404
+        kw = {}
+        if src.lower().endswith(".csv"):
+            csv_order_str = p.get("csv_order")
+            if isinstance(csv_order_str, str) and csv_order_str.strip():
+                items = [s.strip().upper() for s in csv_order_str.split(",") if s.strip()]
+                if len(items) == 4:
+                    kw["csv_order"] = tuple(items)
+            kw["device_serial"] = p.get("serial_number")
+        dst = eeg_recording.convert_any(src, p.get("out_path"), **kw)
+        return jsonify({"status":"ok","recording_path":dst,"header":eeg_recording.read_header(dst)}), 200
+    except ValueError as e:
+        return jsonify({"status":"error","error":str(e)}), 400
+    except Exception as e:
+        return jsonify({"status":"error","error":repr(e)}), 500
+
 # (4) Muse 2 뇌파 데이터 수집 및 분석
 @app.post("/start_eeg_collection")
 def start_eeg_collection():
@@ -281,28 +483,161 @@ def start_eeg_collection():
             print(f"[DEBUG] 시리얼 넘버 누락")
             return jsonify({"status":"error","error":"시리얼 넘버가 필요합니다"}), 400
         
+        # 수집 세션(접촉 품질/진행 상태 이벤트). session_id 를 직접 주면 그 값으로 조회 가능
+        session = eeg_contact.create_session(serial_number, data.get('session_id'))
+        if _truthy(data.get('async'), default=False):
+            # 요청 스레드를 3분 넘게 잡지 않음: 백그라운드 수집 후 결과는 세션 조회/SSE 로 전달
+            threading.Thread(target=_run_collection_session, args=(serial_number, session),
+                             name=f"collect-{session.id}", daemon=True).start()
+            return jsonify({"status": "accepted", "session_id": session.id,
+                            "status_url": f"/eeg_collection/{session.id}",
+                            "events_url": f"/eeg_collection/{session.id}/events"}), 202
+
         # 뇌파 데이터 수집 시작
         print(f"[DEBUG] 뇌파 데이터 수집 함수 호출...")
-        result = run_muse2_eeg_collection(serial_number)
-        print(f"[DEBUG] 뇌파 데이터 수집 완료: {result}")
+        try:
+            response_data = _run_collection_session(serial_number, session)
+        except eeg_contact.ContactTimeout as e:
+            return jsonify({"status":"error","error":str(e),"session_id":session.id,"contact":e.summary}), 409
+        except eeg_acquisition.AcquisitionBusy as e:
+            return jsonify({"status":"error","error":str(e),"session_id":session.id}), 503, {"Retry-After": "5"}
         
+        print(f"[DEBUG] 응답 데이터: {response_data}")
+        return jsonify(response_data)
+        
+    except Exception as e:
+        print(f"[DEBUG] 엔드포인트 오류: {str(e)}")
+        import traceback
+        print(f"[DEBUG] 상세 오류: {traceback.format_exc()}")
+        return jsonify({"status":"error","error":str(e)}), 500
+
+def _run_collection_session(serial_number, session):
+    """수집 + 분석 → 응답 dict. 세션 상태를 done/error 로 마감(비동기 수집 스레드에서도 사용)"""
+    try:
+        result = run_muse2_eeg_collection(serial_number, session=session)
+        print(f"[DEBUG] 뇌파 데이터 수집 완료: {result}")
         response_data = {
             "status": "ok",
             "message": "뇌파 데이터 수집이 시작되었습니다",
+            "session_id": session.id,
             "data_file": result.get('data_file'),
+            "recording_file": result.get('recording_file'),
             "duration": result.get('duration'),
             "data_points": result.get('data_points'),
+            "contact": result.get('contact'),
             "analysis_result": result.get('analysis_result')
         }
-        
-        print(f"[DEBUG] 응답 데이터: {response_data}")
-        return jsonify(response_data)
-        
+        if session.state not in eeg_contact.FINAL_STATES:
+            session.set_state("done", result=response_data)
+        return response_data
+    except eeg_contact.ContactTimeout as e:
+        if session.state not in eeg_contact.FINAL_STATES:
+            session.set_state("error", error=str(e), contact=e.summary)
+        raise
     except Exception as e:
-        print(f"[DEBUG] 엔드포인트 오류: {str(e)}")
-        import traceback
-        print(f"[DEBUG] 상세 오류: {traceback.format_exc()}")
-        return jsonify({"status":"error","error":str(e)}), 500
+        print(f"[DEBUG] 뇌파 데이터 수집 실패({session.id}): {e}")
+        if session.state not in eeg_contact.FINAL_STATES:
+            session.set_state("error", error=str(e))
+        raise
+
+@app.get("/eeg_collection")
+def eeg_collection_list():
+    return jsonify({"status": "ok", "sessions": eeg_contact.list_sessions()})
+
+@app.get("/eeg_collection/<session_id>")
+def eeg_collection_status(session_id):
+    """수집 세션 상태: 현재 단계, 최근 접촉 품질, 단계별 접촉 요약, (완료 시) 결과"""
+    session = eeg_contact.get_session(session_id)
+    if session is None:
+        return jsonify({"status":"error","error":f"Unknown session: {session_id}"}), 404
+    return jsonify(dict(session.snapshot(), status="ok"))
+
+@app.get("/eeg_collection/<session_id>/events")
+def eeg_collection_events(session_id):
+    """수집 세션 이벤트 스트림(text/event-stream): snapshot → state/contact … → done|error 에서 종료"""
+    session = eeg_contact.get_session(session_id)
+    if session is None:
+        return jsonify({"status":"error","error":f"Unknown session: {session_id}"}), 404
+    return Response(stream_with_context(eeg_contact.stream_events(session)), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# ===== 여러 헤드밴드 수집(eeg_acquisition) =====
+@app.post("/acquisitions")
+def acquisitions_start():
+    """
+    헤드밴드 1대 수집 시작(즉시 202). 다른 시리얼의 진행 중 수집과 병렬 실행
+    {"serialNumber": "1234", "seconds": 180, "board": "muse2"|"muse2_bled"|"synthetic", "analyze": true}
+    """
+    data = request.get_json(force=True) or {}
+    serial_number = data.get('serialNumber') or data.get('serial_number')
+    if not serial_number:
+        return jsonify({"status":"error","error":"serialNumber is required"}), 400
+    session = eeg_contact.create_session(serial_number, data.get('session_id'))
+    try:
+        acq = eeg_acquisition.get_manager().start(
+            serial_number, seconds=data.get('seconds'), board=data.get('board'),
+            analyze=(run_automatic_eeg_analysis if _truthy(data.get('analyze'), default=True) else None),
+            session=session, replace=_truthy(data.get('replace'), default=False))
+    except eeg_acquisition.AcquisitionConflict as e:
+        session.set_state("error", error=str(e))
+        return jsonify({"status":"error","error":str(e)}), 409
+    except eeg_acquisition.AcquisitionBusy as e:
+        session.set_state("error", error=str(e))
+        return jsonify({"status":"error","error":str(e)}), 503, {"Retry-After": "5"}
+    except (eeg_acquisition.AcquisitionError, ValueError, TypeError) as e:
+        session.set_state("error", error=str(e))
+        return jsonify({"status":"error","error":str(e)}), 400
+    return jsonify(dict(acq.status(), status="accepted",
+                        status_url=f"/acquisitions/{serial_number}",
+                        events_url=f"/eeg_collection/{session.id}/events")), 202
+
+@app.get("/acquisitions")
+def acquisitions_list():
+    mgr = eeg_acquisition.get_manager()
+    return jsonify({"status": "ok", "manager": mgr.stats(), "acquisitions": mgr.list()})
+
+@app.get("/acquisitions/<serial_number>")
+def acquisitions_status(serial_number):
+    st = eeg_acquisition.get_manager().status(serial_number)
+    if st is None:
+        return jsonify({"status":"error","error":f"No acquisition for serial {serial_number}"}), 404
+    return jsonify(dict(st, status="ok"))
+
+@app.post("/acquisitions/<serial_number>/stop")
+def acquisitions_stop(serial_number):
+    """녹화 중이면 지금까지의 데이터를 저장하고 분석 없이 종료(state=stopped)"""
+    mgr = eeg_acquisition.get_manager()
+    if not mgr.stop(serial_number, wait=10.0):
+        return jsonify({"status":"error","error":f"No acquisition for serial {serial_number}"}), 404
+    return jsonify(dict(mgr.status(serial_number), status="ok"))
+
+@app.get("/acquisitions/workers")
+def acquisitions_workers():
+    if not eeg_acq_supervisor.enabled():
+        return jsonify({"status": "disabled", "error": "EEG_ACQ_PROCESSES=0"}), 404
+    return jsonify({"status": "ok", "supervisor": eeg_acq_supervisor.get_supervisor().stats()}), 200
+
+@app.post("/acquisitions/workers/restart")
+def acquisitions_workers_restart():
+    """멈춘 장비 계층 복구: 진행 중 수집은 그때까지 데이터로 error 처리, 웹 프로세스는 그대로"""
+    if not eeg_acq_supervisor.enabled():
+        return jsonify({"status": "disabled", "error": "EEG_ACQ_PROCESSES=0"}), 404
+    sup = eeg_acq_supervisor.get_supervisor()
+    sup.restart_all(reason="manual")
+    return jsonify({"status": "ok", "supervisor": sup.stats()}), 200
+
+def _restart_acq_workers(tag: str) -> bool:
+    """수집 워커 모드면 워커 프로세스만 재시작(웹 프로세스 재시작 불필요)"""
+    if not eeg_acq_supervisor.enabled():
+        return False
+    eeg_acq_supervisor.get_supervisor().restart_all(reason="manual")
+    print(f"[{tag}] 수집 워커 프로세스 재시작 완료")
+    return True
+
+@app.post("/acquisitions/cleanup")
+def acquisitions_cleanup():
+    """끝난(done/error/stopped) 수집을 목록에서 제거"""
+    return jsonify({"status": "ok", "removed": eeg_acquisition.get_manager().cleanup()})
 
 @app.route('/check_place', methods=['POST'])
 def check_place_api():
@@ -349,7 +684,7 @@ def check_moca_q3(answer):
     
     print(f"[DEBUG] MoCA Q3 프롬프트: {prompt}")
     
-    response = openai.chat.completions.create(
+    response = _openai().chat.completions.create(
         model="gpt-4",
         messages=[
             {"role": "system", "content": "당신은 MoCA 검사 전문가입니다."},
@@ -385,7 +720,7 @@ def check_moca_q4(answer):
     
     print(f"[DEBUG] MoCA Q4 프롬프트: {prompt}")
     
-    response = openai.chat.completions.create(
+    response = _openai().chat.completions.create(
         model="gpt-4",
         messages=[
             {"role": "system", "content": "당신은 MoCA 검사 전문가입니다."},
@@ -456,13 +791,15 @@ def check_moca_q4_api():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
-def run_muse2_eeg_collection(serial_number, max_retries=3):
+def run_muse2_eeg_collection(serial_number, max_retries=None, session=None):
     """
     Muse 2 헤드밴드로 뇌파 데이터를 수집하는 함수 (재시도 로직 포함)
+    max_retries: 연결 재시도 횟수(None 이면 EEG_ACQ_RETRIES) → 수집 관리자에 그대로 전달
+    session: eeg_contact.CollectionSession (없으면 새로 만듦) — 진행 상태/접촉 품질 발행, 녹화 시작 게이트
     """
-    global _ACTIVE_BOARD  # 전역 변수 사용 선언
-    
-    print(f"[DEBUG] 뇌파 데이터 수집 시작: 시리얼 넘버 {serial_number}, 최대 재시도: {max_retries}")
+    print(f"[DEBUG] 뇌파 데이터 수집 시작: 시리얼 넘버 {serial_number}, 최대 재시도: {max_retries or eeg_acquisition.ACQ_RETRIES}")
+    if session is None:
+        session = eeg_contact.create_session(serial_number)
     
     # 시뮬레이션 모드 (실제 헤드밴드 없이 테스트)
     SIMULATION_MODE = False
@@ -500,17 +837,20 @@ def run_muse2_eeg_collection(serial_number, max_retries=3):
             os.makedirs(os.path.dirname(filepath), exist_ok=True)
             
             df_final.to_csv(filepath, index=False)
+            rec_name, rec_path, rec_array = _save_muse_recording(df_final, serial_number, 256)
             
             print(f"[DEBUG] 시뮬레이션 CSV 파일 저장 완료: {filepath}")
             print(f"[DEBUG] 데이터 포인트 수: {num_points}")
             
             # 자동으로 뇌파 분석 실행
             print(f"[DEBUG] 뇌파 분석 시작...")
-            analysis_result = run_automatic_eeg_analysis(filepath, serial_number)
+            session.set_state("analyzing")
+            analysis_result = run_automatic_eeg_analysis(rec_path, serial_number, array=rec_array)
             print(f"[DEBUG] 뇌파 분석 완료: {analysis_result}")
             
             result = {
                 'data_file': filename,
+                'recording_file': rec_name,
                 'duration': 150,
                 'data_points': num_points,
                 'analysis_result': analysis_result
@@ -522,189 +862,24 @@ def run_muse2_eeg_collection(serial_number, max_retries=3):
         except Exception as e:
             raise Exception(f"시뮬레이션 데이터 생성 실패: {str(e)}")
     
-    # 실제 헤드밴드 모드 (재시도 로직 포함)
-    last_error = None
-    
-    for attempt in range(max_retries):
-        try:
-            print(f"[DEBUG] 연결 시도 {attempt + 1}/{max_retries}")
-            
-            # 기존 연결이 있으면 정리
-            if _ACTIVE_BOARD is not None:
-                try:
-                    _ACTIVE_BOARD.stop_stream()
-                    _ACTIVE_BOARD.release_session()
-                    print("[DEBUG] 기존 연결 정리 완료")
-                except:
-                    pass
-                _ACTIVE_BOARD = None
-            
-            # 잠시 대기 (리소스 해제 시간)
-            if attempt > 0:
-                print(f"[DEBUG] {2 * attempt}초 대기 중...")
-                sleep(2 * attempt)
-            
-            import pandas as pd
-            from time import sleep
-            from brainflow.board_shim import BoardShim, BrainFlowInputParams, BoardIds
-            
-            # Jupyter Notebook 코드 그대로 복사 (input() 대신 serial_number 파라미터 사용)
-            params = BrainFlowInputParams()
-            params.serial_number = f"Muse-{serial_number}"  # Muse 2의 고유 시리얼 넘버
-            print("설정된 시리얼 넘버:", params.serial_number)
-            
-            MUSE_2_BLED_BOARD = 22  #:
-            MUSE_2_BOARD = 38  #:
-            
-            board_id = MUSE_2_BOARD
-            
-            board_shim = BoardShim(board_id, params)
-            
-            # 전역 변수에 저장 (세션 정리를 위해)
-            _ACTIVE_BOARD = board_shim
-            
-            use_data_seconds = 180  # 3분 동안 데이터 수집 (AI 모델이 47개 세그먼트를 얻을 수 있는 충분한 시간) 
-            sampling_rate = BoardShim.get_sampling_rate(board_id)
-            num_points = use_data_seconds * sampling_rate  # 몇 초 동안 몇개의 데이터를 가져올지
-            
-            # Muse 2 연결
-            try:
-                print(f"[DEBUG] prepare_session 시작...")
-                board_shim.prepare_session()
-                print(f"[DEBUG] prepare_session 완료")
-            except Exception as e:
-                print(f"[ERROR] prepare_session 실패: {e}")
-                # 전역 변수 정리
-                _ACTIVE_BOARD = None
-                last_error = f"장비 연결 실패: {str(e)}"
-                if attempt < max_retries - 1:
-                    print(f"[DEBUG] 재시도 예정...")
-                    continue
-                else:
-                    raise Exception(last_error)
-            
-            # Muse 2 데이터 수집 시작
-            try:
-                print(f"[DEBUG] start_stream 시작...")
-                board_shim.start_stream()
-                print(f"[DEBUG] start_stream 완료")
-            except Exception as e:
-                print(f"[ERROR] start_stream 실패: {e}")
-                # 전역 변수 정리
-                _ACTIVE_BOARD = None
-                last_error = f"데이터 수집 시작 실패: {str(e)}"
-                if attempt < max_retries - 1:
-                    print(f"[DEBUG] 재시도 예정...")
-                    continue
-                else:
-                    raise Exception(last_error)
-            
-            # 연결 성공 시 루프 종료
-            print(f"[DEBUG] 연결 성공! (시도 {attempt + 1}/{max_retries})")
-            break
-            
-        except Exception as e:
-            last_error = str(e)
-            print(f"[ERROR] 연결 시도 {attempt + 1} 실패: {e}")
-            if attempt < max_retries - 1:
-                print(f"[DEBUG] {2 * (attempt + 1)}초 후 재시도...")
-                sleep(2 * (attempt + 1))
-            else:
-                print(f"[ERROR] 모든 연결 시도 실패. 마지막 오류: {last_error}")
-                raise Exception(f"연결 실패 (최대 재시도 횟수 초과): {last_error}")
-    
-    # 연결 성공 후 데이터 수집 진행
-    try:
-        # 전극 접촉 상태 확인 (10초간)
-        print("전극 접촉 상태 확인 중...")
-        for i in range(10):
-            try:
-                contact_quality = board_shim.get_electrode_contact_quality()
-                print(f"{i+1}초 - 전극 접촉 품질: {contact_quality}")
-                if contact_quality:
-                    electrodes = ['TP9', 'AF7', 'AF8', 'TP10']
-                    for j, quality in enumerate(contact_quality):
-                        status = "✅ 좋음" if quality >= 50 else "❌ 나쁨"
-                        print(f"  {electrodes[j]}: {quality} ({status})")
-                    if all(q >= 50 for q in contact_quality):
-                        print("모든 전극 접촉 상태가 양호합니다!")
-                        break
-                    else:
-                        print("일부 전극 접촉 상태가 불량합니다. 헤드밴드 착용을 조정해주세요.")
-                else:
-                    print("전극 접촉 상태를 읽을 수 없습니다.")
-            except Exception as e:
-                print(f"전극 접촉 상태 확인 실패: {e}")
-            sleep(1)
-        
-        # +1초 동안 데이터 수집
-        sleep(use_data_seconds + 1)  # 1초 여유를 뒀음.
-        
-        # 수집한 데이터를 변수에 저장
-        data = board_shim.get_current_board_data(num_points)
-        
-        # 저장된 데이터를 알기 위한 출력 코드
-        print(board_shim.get_board_descr(board_id))
-        
-        # CSV로 저장
-        df = pd.DataFrame(data).T
-        df.to_csv(f"data.csv", index=False)
-        
-        # Jupyter Notebook의 전처리 코드 그대로 사용
-        # data.csv 파일 불러오기
-        data_df = pd.read_csv('data.csv')
-        
-        # 1, 2, 3, 4열 (채널 데이터)과 6열 (timestamps)을 선택합니다.
-        data_df_cleaned = data_df[['1', '2', '3', '4', '6']].copy()
-        
-        # 컬럼 명 변경
-        data_df_cleaned.rename(columns={'1': 'eeg_1', '2': 'eeg_2', '3': 'eeg_3', '4': 'eeg_4', '6': 'timestamps'}, inplace=True)
-        
-        # 컬럼 순서 변경 timestamps, eeg_1, eeg_2, eeg_3, eeg_4
-        df_final = data_df_cleaned[['timestamps', 'eeg_1', 'eeg_2', 'eeg_3', 'eeg_4']]
-        
-        # 최종 CSV 저장
-        filename = f"eeg_data_{serial_number}_{int(time.time())}.csv"
-        filepath = os.path.join("uploads", "eeg", filename)
-        
-        # uploads/eeg 디렉토리가 없으면 생성
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        
-        df_final.to_csv(filepath, index=False)
-        
-        # Muse 2 데이터 수집 정지
-        board_shim.stop_stream()
-        
-        # Muse 2 연결 해제
-        board_shim.release_session()
-        
-        # 전역 변수 정리
-        _ACTIVE_BOARD = None
-        
-        print(f"[DEBUG] CSV 파일 저장 완료: {filepath}")
-        print(f"[DEBUG] 데이터 포인트 수: {len(data[0])}")
-        
-        # 자동으로 뇌파 분석 실행
-        print(f"[DEBUG] 뇌파 분석 시작...")
-        analysis_result = run_automatic_eeg_analysis(filepath, serial_number)
-        print(f"[DEBUG] 뇌파 분석 완료: {analysis_result}")
-        
-        result = {
-            'data_file': filename,
-            'duration': use_data_seconds,
-            'data_points': len(data[0]),
-            'analysis_result': analysis_result
-        }
-        
-        print(f"[DEBUG] 최종 결과 반환: {result}")
-        return result
-        
-    except Exception as e:
-        raise Exception(f"뇌파 데이터 수집 실패: {str(e)}")
+    # 실제 헤드밴드 모드: 수집 관리자(보드별 스레드, 재시도/접촉 게이트/격리 저장 포함)
+    # 같은 시리얼의 진행 중 세션만 정리하고 다른 헤드밴드 세션은 유지
+    acq = eeg_acquisition.get_manager().start(serial_number, analyze=run_automatic_eeg_analysis,
+                                              session=session, replace=True, retries=max_retries)
+    acq.wait()
+    if isinstance(acq.exc, eeg_contact.ContactTimeout):
+        raise acq.exc
+    if acq.exc is not None:
+        raise Exception(f"뇌파 데이터 수집 실패: {str(acq.exc)}")
+    if acq.result is None:
+        raise Exception("뇌파 데이터 수집이 중지되었습니다")
+    print(f"[DEBUG] 최종 결과 반환: {acq.result}")
+    return acq.result
 
-def run_automatic_eeg_analysis(file_path, serial_number):
+def run_automatic_eeg_analysis(file_path, serial_number, array=None):
     """
     수집된 뇌파 데이터를 자동으로 분석하는 함수 (2-class 모델 사용)
+    array=(X, sfreq) 가 있고 워커 풀이 켜져 있으면 파일을 다시 읽지 않고 공유 메모리로 전달
     """
     print(f"[DEBUG] 뇌파 분석 시작: {file_path}")
     print(f"[DEBUG] 시리얼 넘버: {serial_number}")
@@ -716,12 +891,26 @@ def run_automatic_eeg_analysis(file_path, serial_number):
         ver = "53"
         csv_order = None
         
-        # 2-class 엔진 캐시 키
-        cache_key = (device, ver, csv_order)
-        engine = EEGEngine2(device_type=device, version=ver, csv_order=csv_order)
-        
-        # 2-class 분석 실행
-        result = engine.infer(file_path=file_path, subject_id=f"sub-{serial_number}", enforce_two_minutes=True)
+        timer = eeg_profiling.StageTimer()
+        if eeg_worker_pool.enabled():
+            # 2-class 분석 실행(워커 프로세스)
+            pool = eeg_worker_pool.get_pool()
+            job = {"kind": "2c", "device": device, "ver": ver, "csv_order": csv_order,
+                   "file_path": file_path, "subject_id": f"sub-{serial_number}", "enforce_two_minutes": True}
+            if array is not None:
+                X, sfreq = array
+                result = pool.run_array(job, X, sfreq, list(eeg_recording.MUSE_CSV_CHANNELS), timer=timer)["result"]
+            else:
+                result = pool.run(job, timer=timer)["result"]
+        else:
+            # 2-class 엔진(캐시)
+            engine = _engine2(device, ver, None, csv_order)
+            
+            # 2-class 분석 실행(추론 실행기 경유)
+            result = eeg_executor.get_executor().run(
+                engine.infer, file_path=file_path, subject_id=f"sub-{serial_number}", enforce_two_minutes=True, timer=timer)
+        eeg_profiling.observe_timer(timer, engine="2c", endpoint="auto_analysis")
+        print(f"[DEBUG] 단계별 시간(ms): {timer.as_dict()['stages_ms']}")
         
         # 2-class 결과 정리
         prob_mean = result['prob_mean']
@@ -794,9 +983,14 @@ def reset_eeg_session():
     뇌파 검사 세션을 정리하는 엔드포인트
     """
     try:
-        global _ACTIVE_BOARD
-        _ACTIVE_BOARD = None
-        return jsonify({"status": "ok", "message": "세션이 정리되었습니다."})
+        # serialNumber 가 있으면 그 헤드밴드 세션만 중지, 끝난 세션은 목록에서 정리(다른 헤드밴드 녹화는 유지)
+        data = request.get_json(silent=True) or {}
+        serial_number = data.get('serialNumber') or data.get('serial_number')
+        mgr = eeg_acquisition.get_manager()
+        if serial_number:
+            mgr.stop(serial_number, wait=10.0)
+        removed = mgr.cleanup(serial_number)
+        return jsonify({"status": "ok", "message": "세션이 정리되었습니다.", "removed": removed})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
@@ -807,18 +1001,10 @@ def restart_flask_server():
     CMD 창 없이 현재 프로세스 내에서 재시작
     """
     try:
-        global _ACTIVE_BOARD
-        
         # 기존 연결 강제 정리
-        if _ACTIVE_BOARD is not None:
-            try:
-                _ACTIVE_BOARD.stop_stream()
-                _ACTIVE_BOARD.release_session()
-                print("[RESTART] 기존 연결 정리 완료")
-            except Exception as e:
-                print(f"[RESTART] 기존 연결 정리 중 오류 (무시): {e}")
-            finally:
-                _ACTIVE_BOARD = None
+        n = eeg_acquisition.get_manager().stop_all()
+        print(f"[RESTART] 수집 세션 정리 완료: {n}개")
+        _restart_acq_workers("RESTART")
         
         # 가비지 컬렉션 강제 실행
         import gc
@@ -852,16 +1038,12 @@ def force_restart_server():
         print("[FORCE_RESTART] 서버 재시작 시작...")
         
         # 1. 모든 리소스 정리
-        global _ACTIVE_BOARD
-        if _ACTIVE_BOARD is not None:
-            try:
-                _ACTIVE_BOARD.stop_stream()
-                _ACTIVE_BOARD.release_session()
-                print("[FORCE_RESTART] 기존 연결 정리 완료")
-            except Exception as e:
-                print(f"[FORCE_RESTART] 기존 연결 정리 중 오류 (무시): {e}")
-            finally:
-                _ACTIVE_BOARD = None
+        n = eeg_acquisition.get_manager().stop_all()
+        print(f"[FORCE_RESTART] 수집 세션 정리 완료: {n}개")
+        if _restart_acq_workers("FORCE_RESTART"):
+            # 장비 계층은 워커 프로세스에만 있음 → 웹 프로세스는 재시작하지 않음
+            return jsonify({"status": "ok", "message": "수집 워커가 재시작되었습니다.",
+                            "restart_type": "acquisition_workers"})
         
         # 2. 가비지 컬렉션
         import gc
@@ -1044,18 +1226,10 @@ def force_cleanup():
     강제 정리 - 모든 리소스 해제
     """
     try:
-        global _ACTIVE_BOARD
-        
         # 기존 연결 강제 정리
-        if _ACTIVE_BOARD is not None:
-            try:
-                _ACTIVE_BOARD.stop_stream()
-                _ACTIVE_BOARD.release_session()
-                print("[CLEANUP] 기존 연결 정리 완료")
-            except Exception as e:
-                print(f"[CLEANUP] 기존 연결 정리 중 오류 (무시): {e}")
-            finally:
-                _ACTIVE_BOARD = None
+        n = eeg_acquisition.get_manager().stop_all()
+        print(f"[CLEANUP] 수집 세션 정리 완료: {n}개")
+        _restart_acq_workers("CLEANUP")
         
         # 가비지 컬렉션 강제 실행
         import gc
@@ -1075,6 +1249,42 @@ def force_cleanup():
         print(f"[CLEANUP] 강제 정리 오류: {str(e)}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+# ===== 기동 warm-up =====
+def _warm_engine(kind, device, ver):
+    """기본 엔진 로드 + 합성 신호 1회 추론(필터 설계/oneDNN 커널 등 첫 호출 비용 선지불)"""
+    eng = (_engine2 if kind == "2c" else _engine3)(device, ver, None, None)
+    n = int(130 * 256)
+    X = np.random.default_rng(0).normal(0.0, 20.0, (len(eng.channels), n)).astype(np.float32)
+    eeg_executor.get_executor().run(eng.infer_array, X, 256.0, list(eng.channels), enforce_two_minutes=False)
+
+def _wait_worker_pool():
+    pool = eeg_worker_pool.get_pool()
+    deadline = time.perf_counter() + eeg_worker_pool.WORKER_JOB_TIMEOUT
+    while not all(w["ready"] for w in pool.stats()["workers"]):
+        if time.perf_counter() > deadline:
+            raise TimeoutError("worker pool not ready")
+        time.sleep(0.2)
+
+def _build_warmup():
+    wu = eeg_startup.Warmup(_T_START)
+    wu.mark("import")  # app 모듈 import(Flask 라우트 등록까지)
+    if eeg_worker_pool.enabled():
+        # 엔진은 워커 프로세스가 EEG_WORKER_PRELOAD 로 미리 로드
+        wu.add("worker_pool", _wait_worker_pool)
+        return wu
+    wu.add("import_torch", lambda: __import__("torch"))
+    wu.add("import_mne", lambda: __import__("mne"))
+    wu.add("import_engines", lambda: (_engine_cls("2c"), _engine_cls("3c")))
+    for kind, device, ver, _, _ in eeg_worker_pool.parse_preload(eeg_startup.WARMUP_ENGINES):
+        wu.add(f"engine:{kind}/{device}/{ver or 'default'}", lambda k=kind, d=device, v=ver: _warm_engine(k, d, v))
+    return wu
+
+_WARMUP = _build_warmup()
+# spawn 자식(워커 풀/수집 워커)은 app.py 를 __mp_main__ 으로 다시 import → warm-up 은 부모 프로세스에서만
+# (gunicorn 워커는 fork 라 parent_process() 가 None → 워커마다 정상 실행)
+if multiprocessing.parent_process() is None:
+    _WARMUP.start()
+
 if __name__ == "__main__":
     # 디버그 서버는 단일 스레드라 캐시 race 이슈가 없지만,
     # 운영 시에는 WSGI(예: gunicorn) 사용을 권장드립니다.
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+bench_eeg.py
+- 네트워크/실기기 없이 재현 가능한 EEG 추론 벤치마크
+- 합성 MuseLab CSV, 다채널 .eegr(.set 동등 배열; eeglabio 가 있으면 .set 도) 생성
+- 무작위 가중치 체크포인트를 EEG_WEIGHTS_DIR 에 만들어 CHANNEL_GROUPS 전 장치 × 2/3클 엔진 실행
+- 단계별 지연(eeg_profiling), 처리량(recordings/s), 피크 메모리를 JSON 으로 출력
+- --members / --tta 로 앙상블(가중치 버전 여러 개)·시간 이동 격자 비용 측정
+- --baseline 이전 결과와 비교해 중앙 지연이 허용치 이상 늘면 종료코드 1 (회귀 게이트)
+
+사용 예:
+  python bench_eeg.py --durations 180,600 --repeats 5 --out bench_base.json
+  python bench_eeg.py --devices muse --baseline bench_base.json --max-regress 0.25
+  python bench_eeg.py --devices muse --members 2 --tta 2
+"""
+from __future__ import annotations
+import os, sys, json, time, shutil, platform, argparse, tempfile, tracemalloc
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import torch
+
+import eeg_profiling
+import eeg_recording
+import eeg_result_cache
+import eeg_ensemble
+import eeg_model2class
+import eeg_model3class
+from eeg_model3class import EEGNetV4Compat, CHANNEL_GROUPS
+
+# ========================= 설정 =========================
+BENCH_VER   = "bench"
+MUSE_SFREQ  = 256.0   # Muse 2 / MuseLab
+ARRAY_SFREQ = 500.0   # 임상 .set (OpenNeuro ds004504) 샘플링
+# 실서비스 체크포인트와 같은 크기(_infer_hparams_from_sd 기본값)
+MODEL_HPARAMS = dict(k1=250, k2=32, F1=32, D=2, F2=64)
+
+ENGINES = {
+    "2c": (eeg_model2class.EEGInferenceEngine2Class, 2),
+    "3c": (eeg_model3class.EEGInferenceEngine3Class, 3),
+}
+
+def _member_ver(i: int) -> str:
+    """앙상블 멤버 i 의 가중치 버전(0 번은 BENCH_VER)."""
+    return BENCH_VER if i == 0 else f"{BENCH_VER}{i + 1}"
+
+def _repo_name(kind: str, device: str, ver: str = BENCH_VER) -> str:
+    """엔진이 찾는 HF 레포 이름(EEG_WEIGHTS_DIR 하위 디렉터리 이름)."""
+    base = f"EEGNetV4-{len(CHANNEL_GROUPS[device])}ch-{device}-{ver}"
+    return f"{base}-2Class-extradataset" if kind == "2c" else base
+
+# ========================= 합성 데이터 =========================
+def _synthetic_signal(n_ch: int, n: int, sfreq: float, rng: np.random.Generator) -> np.ndarray:
+    """1/f 배경 + 알파(8–12 Hz) + 약한 60 Hz 전원잡음, µV 단위 (C, n) float32."""
+    freqs = np.fft.rfftfreq(n, d=1.0 / sfreq)
+    shape = 1.0 / np.maximum(freqs, 0.5)
+    spec = (rng.standard_normal((n_ch, freqs.size)) + 1j * rng.standard_normal((n_ch, freqs.size))) * shape
+    x = np.fft.irfft(spec, n=n, axis=1)
+    x *= 15.0 / (x.std(axis=1, keepdims=True) + 1e-12)
+    t = np.arange(n) / sfreq
+    alpha_f = rng.uniform(8.0, 12.0, size=(n_ch, 1))
+    x += rng.uniform(5.0, 15.0, size=(n_ch, 1)) * np.sin(2 * np.pi * alpha_f * t + rng.uniform(0, 2 * np.pi, size=(n_ch, 1)))
+    x += 2.0 * np.sin(2 * np.pi * 60.0 * t)
+    return x.astype(np.float32)
+
+def make_muse_csv(path: str, seconds: float, rng: np.random.Generator) -> str:
+    n = int(seconds * MUSE_SFREQ)
+    X = _synthetic_signal(4, n, MUSE_SFREQ, rng)
+    ts = time.time() + np.arange(n) / MUSE_SFREQ
+    df = pd.DataFrame({"timestamps": ts, **{f"eeg_{i + 1}": X[i] for i in range(4)}})
+    df.to_csv(path, index=False)
+    return path
+
+def make_array_recording(path: str, channels: List[str], seconds: float, sfreq: float,
+                         rng: np.random.Generator) -> str:
+    """
+    다채널 배열 → .eegr(기본) 또는 .set(eeglabio 필요, 볼트 단위).
+    Muse 는 물리 채널명(TP9/AF7/AF8/TP10)으로 저장해 실제 녹화와 같은 경로를 탄다.
+    """
+    X = _synthetic_signal(len(channels), int(seconds * sfreq), sfreq, rng)
+    if path.endswith(".set"):
+        import mne
+        info = mne.create_info(list(channels), sfreq=sfreq, ch_types="eeg")
+        raw = mne.io.RawArray(X.astype(np.float64) * 1e-6, info, verbose="ERROR")
+        mne.export.export_raw(path, raw, overwrite=True, verbose="ERROR")
+    else:
+        eeg_recording.write_recording(path, X, list(channels), sfreq, source="bench")
+    return path
+
+def make_weights(root: str, kind: str, device: str, seed: int, ver: str = BENCH_VER) -> str:
+    """무작위 가중치(BatchNorm 통계 포함) + config.json 을 EEG_WEIGHTS_DIR 레이아웃으로 저장."""
+    d = os.path.join(root, _repo_name(kind, device, ver))
+    os.makedirs(d, exist_ok=True)
+    torch.manual_seed(seed)
+    m = EEGNetV4Compat(n_classes=ENGINES[kind][1], Chans=len(CHANNEL_GROUPS[device]), **MODEL_HPARAMS)
+    for mod in m.modules():
+        if isinstance(mod, torch.nn.BatchNorm2d):
+            mod.running_mean.normal_(0.0, 0.1)
+            mod.running_var.uniform_(0.5, 2.0)
+    torch.save(m.state_dict(), os.path.join(d, "model.pt"))
+    with open(os.path.join(d, "config.json"), "w") as f:
+        json.dump({"kernel_length": MODEL_HPARAMS["k1"], "sep_length": MODEL_HPARAMS["k2"],
+                   "F1": MODEL_HPARAMS["F1"], "D": MODEL_HPARAMS["D"]}, f)
+    return d
+
+# ========================= 측정 =========================
+def _rss_max_mb() -> Optional[float]:
+    try:
+        import resource
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(kb / (1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0), 1)
+    except ImportError:  # Windows
+        try:
+            import psutil
+            mi = psutil.Process().memory_info()
+            return round(getattr(mi, "peak_wset", mi.rss) / (1024.0 * 1024.0), 1)
+        except Exception:
+            return None
+
+def _pct(v: List[float], q: float) -> float:
+    return round(float(np.percentile(np.asarray(v, dtype=np.float64), q)), 3)
+
+def run_case(kind: str, device: str, fmt: str, seconds: float, path: str,
+             repeats: int, warmup: int, trace_memory: bool, members: int = 1, tta: int = 1) -> Dict:
+    cls = ENGINES[kind][0]
+    t0 = time.perf_counter()
+    engine = cls(device_type=device, version=BENCH_VER, torch_device="cpu")
+    if members > 1 or tta > 1:
+        engine = eeg_ensemble.EnsembleEngine(
+            [engine] + [cls(device_type=device, version=_member_ver(i), torch_device="cpu") for i in range(1, members)],
+            tta=tta)
+    init_ms = (time.perf_counter() - t0) * 1000.0
+
+    for _ in range(warmup):
+        engine.infer(path, enforce_two_minutes=False)
+
+    totals: List[float] = []
+    stages: Dict[str, List[float]] = {}
+    sizes: Dict = {}
+    for _ in range(repeats):
+        timer = eeg_profiling.StageTimer()
+        engine.infer(path, enforce_two_minutes=False, timer=timer)
+        timer.stop()
+        totals.append(timer.total_seconds * 1000.0)
+        for k, v in timer.stages.items():
+            stages.setdefault(k, []).append(v * 1000.0)
+        sizes = timer.sizes
+
+    peak_mb = None
+    if trace_memory:  # 지연 측정과 분리(tracemalloc 오버헤드)
+        tracemalloc.start()
+        engine.infer(path, enforce_two_minutes=False)
+        peak_mb = round(tracemalloc.get_traced_memory()[1] / (1024.0 * 1024.0), 1)
+        tracemalloc.stop()
+
+    med_s = float(np.median(totals)) / 1000.0
+    return {
+        "key": f"{kind}/{device}/{fmt}/{int(seconds)}s" + (f"/ens{members}x{tta}" if members > 1 or tta > 1 else ""),
+        "engine": kind,
+        "device": device,
+        "format": fmt,
+        "duration_s": float(seconds),
+        "n_channels": len(CHANNEL_GROUPS[device]),
+        "file_mb": round(os.path.getsize(path) / (1024.0 * 1024.0), 2),
+        "init_ms": round(init_ms, 3),
+        "repeats": repeats,
+        "latency_ms": {"min": round(min(totals), 3), "median": _pct(totals, 50),
+                       "p95": _pct(totals, 95), "mean": round(float(np.mean(totals)), 3)},
+        "stages_ms": {k: _pct(v, 50) for k, v in stages.items()},
+        "throughput_rec_per_s": round(1.0 / med_s, 3) if med_s > 0 else None,
+        "realtime_factor": round(seconds / med_s, 1) if med_s > 0 else None,
+        "sizes": sizes,
+        "tracemalloc_peak_mb": peak_mb,
+    }
+
+# ========================= 회귀 비교 =========================
+def compare(baseline: Dict, current: Dict, max_regress: float) -> Dict:
+    base = {c["key"]: c for c in baseline.get("cases", [])}
+    rows, regressions = [], []
+    for c in current["cases"]:
+        b = base.get(c["key"])
+        if not b:
+            continue
+        ratio = c["latency_ms"]["median"] / max(1e-9, b["latency_ms"]["median"])
+        row = {"key": c["key"], "baseline_ms": b["latency_ms"]["median"],
+               "current_ms": c["latency_ms"]["median"], "ratio": round(ratio, 3)}
+        rows.append(row)
+        if ratio > 1.0 + max_regress:
+            regressions.append(row)
+    return {"max_regress": max_regress, "cases": rows, "regressions": regressions}
+
+# ========================= 실행 =========================
+def _csv_list(s: str) -> List[str]:
+    return [x.strip() for x in s.split(",") if x.strip()]
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Synthetic EEG inference benchmark (offline, random weights)")
+    ap.add_argument("--engines", default="2c,3c", help="2c,3c")
+    ap.add_argument("--devices", default=",".join(CHANNEL_GROUPS.keys()))
+    ap.add_argument("--durations", default="180,600", help="녹화 길이(초), 쉼표 구분")
+    ap.add_argument("--formats", default="csv,eegr", help="csv(Muse 전용), eegr, set(eeglabio 필요)")
+    ap.add_argument("--repeats", type=int, default=3)
+    ap.add_argument("--warmup", type=int, default=1)
+    ap.add_argument("--threads", type=int, default=0, help="torch.set_num_threads (0=기본값)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--members", type=int, default=1, help="앙상블 멤버(가중치 버전) 수, 1=단일 모델")
+    ap.add_argument("--tta", type=int, default=1, help="시간 이동 세그먼트 격자 수, 1=끔")
+    ap.add_argument("--no-memory", action="store_true", help="tracemalloc 피크 측정 생략")
+    ap.add_argument("--workdir", default=None, help="합성 파일/가중치 위치(기본: 임시 디렉터리, 종료 시 삭제)")
+    ap.add_argument("--out", default=None, help="결과 JSON 경로(기본: stdout)")
+    ap.add_argument("--baseline", default=None, help="비교할 이전 결과 JSON")
+    ap.add_argument("--max-regress", type=float, default=0.2, help="허용 중앙 지연 증가율(0.2=20%%)")
+    args = ap.parse_args(argv)
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    engines = [e for e in _csv_list(args.engines) if e in ENGINES]
+    devices = [d for d in _csv_list(args.devices) if d in CHANNEL_GROUPS]
+    durations = [float(x) for x in _csv_list(args.durations)]
+    formats = _csv_list(args.formats)
+    if "set" in formats:
+        try:
+            import eeglabio  # noqa: F401
+        except ImportError:
+            print("[bench] eeglabio 미설치 → .set 케이스 생략", file=sys.stderr)
+            formats = [f for f in formats if f != "set"]
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="eeg_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    weights_root = os.path.join(workdir, "weights")
+    os.environ["EEG_WEIGHTS_DIR"] = weights_root
+    eeg_result_cache.CACHE_ENABLED = False  # 반복 측정이 결과 캐시 hit 로 끝나지 않도록
+    rng = np.random.default_rng(args.seed)
+
+    cases: List[Dict] = []
+    try:
+        for kind in engines:
+            for device in devices:
+                for i in range(max(1, args.members)):
+                    make_weights(weights_root, kind, device, args.seed + i, _member_ver(i))
+        for device in devices:
+            for seconds in durations:
+                for fmt in formats:
+                    if (fmt == "csv") != (device == "muse") and fmt != "eegr":
+                        continue  # csv 는 Muse 전용, .set 은 학습 채널명 기준이라 다채널 장치만
+                    path = os.path.join(workdir, f"{device}_{int(seconds)}s.{fmt}")
+                    if not os.path.exists(path):
+                        if fmt == "csv":
+                            make_muse_csv(path, seconds, rng)
+                        elif device == "muse":
+                            make_array_recording(path, list(eeg_recording.MUSE_CSV_CHANNELS), seconds, MUSE_SFREQ, rng)
+                        else:
+                            make_array_recording(path, CHANNEL_GROUPS[device], seconds, ARRAY_SFREQ, rng)
+                    for kind in engines:
+                        case = run_case(kind, device, fmt, seconds, path,
+                                        args.repeats, args.warmup, not args.no_memory,
+                                        members=max(1, args.members), tta=max(1, args.tta))
+                        print(f"[bench] {case['key']}: median {case['latency_ms']['median']:.1f} ms, "
+                              f"{case['throughput_rec_per_s']} rec/s", file=sys.stderr)
+                        cases.append(case)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report: Dict = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "torch": torch.__version__,
+            "numpy": np.__version__,
+            "torch_threads": torch.get_num_threads(),
+            "batch_size": eeg_model3class.BATCH_SIZE,
+            "model": MODEL_HPARAMS,
+            "seed": args.seed,
+        },
+        "cases": cases,
+        "rss_max_mb": _rss_max_mb(),
+    }
+    rc = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["comparison"] = compare(json.load(f), report, args.max_regress)
+        for r in report["comparison"]["regressions"]:
+            print(f"[bench] REGRESSION {r['key']}: {r['baseline_ms']:.1f} → {r['current_ms']:.1f} ms (x{r['ratio']})",
+                  file=sys.stderr)
+        rc = 1 if report["comparison"]["regressions"] else 0
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return rc
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+"""
+eeg_acq_supervisor.py
+- 수집(BrainFlow) 상주 워커 프로세스 감독자 (EEG_ACQ_PROCESSES > 0 이면 eeg_acquisition 이 사용)
+  · 1회성 worker_eeg.py 실행/Flask 프로세스 내 BoardShim 대체 → BLE/드라이버가 멈춰도 웹 프로세스는 그대로
+- 워커는 spawn 으로 시작해 계속 살아 있음(worker_eeg.serve), 수집 세션이 워커 1개를 임대해 보드 1대를 맡김
+- 명령: 파이프로 (req_id, cmd, args) 전송 → 감독자 스레드 1개가 모든 응답/하트비트 수신, Future 로 전달
+- 데이터: 세션마다 부모가 SharedMemory (rows, EEG_ACQ_CHUNK_SEC × 샘플링 레이트) 블록을 만들고
+  워커가 read 때마다 샘플을 써넣음 → 파이프에는 샘플 수만 오감
+- 상태 감시(감독자 스레드, 1초 주기)
+  · crash   : 프로세스 종료
+  · hang    : 하트비트가 EEG_ACQ_HANG_SEC 동안 없음(프로세스 정지/GIL 점유)
+  · timeout : 명령이 제한 시간 초과(open 은 EEG_ACQ_OPEN_TIMEOUT, 나머지 EEG_ACQ_CMD_TIMEOUT — 예: BLE 응답 없음)
+  → 진행 중 명령은 AcquisitionWorkerLost 로 실패, 워커는 같은 번호로 즉시 재시작(임대는 끊김)
+"""
+from __future__ import annotations
+import os, time, itertools, threading
+import multiprocessing as mp
+from multiprocessing import connection as mp_connection, shared_memory
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import eeg_profiling
+
+# ========================= 설정 =========================
+ACQ_PROCESSES     = int(os.getenv("EEG_ACQ_PROCESSES", "0"))
+ACQ_HEARTBEAT_SEC = float(os.getenv("EEG_ACQ_HEARTBEAT_SEC", "1"))
+ACQ_HANG_SEC      = float(os.getenv("EEG_ACQ_HANG_SEC", "15"))
+ACQ_OPEN_TIMEOUT  = float(os.getenv("EEG_ACQ_OPEN_TIMEOUT", "90"))
+ACQ_CMD_TIMEOUT   = float(os.getenv("EEG_ACQ_CMD_TIMEOUT", "20"))
+ACQ_CHUNK_SEC     = float(os.getenv("EEG_ACQ_CHUNK_SEC", "10"))
+
+RESTARTS = eeg_profiling.REGISTRY.counter(
+    "eeg_acq_worker_restarts_total", "Acquisition worker process restarts by reason", ("reason",))
+COMMANDS = eeg_profiling.REGISTRY.counter(
+    "eeg_acq_worker_commands_total", "Acquisition worker commands by command and outcome", ("cmd", "status"))
+
+
+class AcquisitionWorkerLost(RuntimeError):
+    """명령 도중 수집 워커 종료/멈춤/타임아웃(워커는 재시작됨, 보드 세션은 끊김)."""
+
+class NoIdleWorker(RuntimeError):
+    """모든 수집 워커가 임대 중."""
+
+
+# ========================= 부모(Flask) 측 =========================
+class _AcqWorker:
+    __slots__ = ("wid", "proc", "conn", "ready", "pid", "last_hb", "running", "inflight",
+                 "send_lock", "leased", "lost", "started")
+
+    def __init__(self, wid: int, proc, conn):
+        self.wid, self.proc, self.conn = wid, proc, conn
+        self.ready = False
+        self.pid = proc.pid
+        self.started = self.last_hb = time.time()
+        self.running: Optional[str] = None          # 하트비트가 알려준 실행 중 명령
+        self.inflight: Dict[int, tuple] = {}        # req_id → (cmd, Future, deadline)
+        self.send_lock = threading.Lock()
+        self.leased = False
+        self.lost = False
+
+
+class RemoteBoard:
+    """
+    worker_eeg.BoardHandle 과 같은 인터페이스(open/contact/flush/read/close) — 실제 보드는 임대한 워커 프로세스에 있음
+    close() 는 보드 해제 + 공유 메모리 해제 + 임대 반환
+    """
+    def __init__(self, sup: "AcquisitionSupervisor", worker: _AcqWorker, board_id: int, serial_param: str):
+        self.sup = sup
+        self.worker = worker
+        self.board_id = int(board_id)
+        self.serial_param = str(serial_param)
+        self.info: Optional[Dict] = None
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._capacity = 0
+        self._closed = False
+
+    @property
+    def wid(self) -> int:
+        return self.worker.wid
+
+    def open(self, buffer_seconds: float) -> Dict:
+        info = self.sup.call(self.worker, "open", {"board_id": self.board_id, "serial_param": self.serial_param,
+                                                   "buffer_seconds": float(buffer_seconds)},
+                             timeout=self.sup.open_timeout)
+        if self._shm is None:
+            self._capacity = max(1, int(self.sup.chunk_sec * info["sampling_rate"]))
+            self._shm = shared_memory.SharedMemory(create=True, size=int(info["num_rows"]) * self._capacity * 8)
+        self.info = info
+        return info
+
+    def contact(self):
+        return self.sup.call(self.worker, "contact")
+
+    def flush(self) -> int:
+        return self.sup.call(self.worker, "flush")
+
+    def read(self, max_points: Optional[int] = None) -> np.ndarray:
+        """쌓인 샘플을 공유 메모리 블록 단위로 모두 꺼냄 → (rows, n)"""
+        rows = int(self.info["num_rows"])
+        view = np.ndarray((rows, self._capacity), dtype=np.float64, buffer=self._shm.buf)
+        chunks: List[np.ndarray] = []
+        left = int(max_points) if max_points else None
+        try:
+            while left is None or left > 0:
+                cap = self._capacity if left is None else min(self._capacity, left)
+                n = self.sup.call(self.worker, "read", {"shm": self._shm.name, "rows": rows, "capacity": cap})
+                if n:
+                    chunks.append(view[:, :n].copy())
+                if left is not None:
+                    left -= n
+                if n < cap:
+                    break
+        finally:
+            del view
+        return np.concatenate(chunks, axis=1) if chunks else np.zeros((rows, 0), dtype=np.float64)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if not self.worker.lost:
+                self.sup.call(self.worker, "close")
+        except Exception as e:
+            print(f"[ACQ] worker {self.worker.wid} 보드 해제 실패: {e}")
+        finally:
+            if self._shm is not None:
+                self._shm.close()
+                self._shm.unlink()
+                self._shm = None
+            self.sup.release(self.worker)
+
+
+class AcquisitionSupervisor:
+    """
+    sup = get_supervisor(); board = sup.lease(board_id, "Muse-1234")   # 유휴 워커 없으면 NoIdleWorker
+    board.open(210); board.flush(); ... data = board.read(); board.close()
+    - 감독자 스레드 1개가 응답/하트비트 수신과 사망/멈춤/타임아웃 감시를 모두 담당(eeg_worker_pool 과 같은 구조)
+    """
+    def __init__(self, processes: int = ACQ_PROCESSES, heartbeat_sec: float = ACQ_HEARTBEAT_SEC,
+                 hang_sec: float = ACQ_HANG_SEC, open_timeout: float = ACQ_OPEN_TIMEOUT,
+                 cmd_timeout: float = ACQ_CMD_TIMEOUT, chunk_sec: float = ACQ_CHUNK_SEC):
+        self.processes = max(1, int(processes))
+        self.heartbeat_sec = float(heartbeat_sec)
+        self.hang_sec = max(3 * self.heartbeat_sec, float(hang_sec))
+        self.open_timeout = float(open_timeout)
+        self.cmd_timeout = float(cmd_timeout)
+        self.chunk_sec = max(1.0, float(chunk_sec))
+        self._ctx = mp.get_context("spawn")
+        self._lock = threading.RLock()       # _workers / 임대 / 카운터
+        self._wake_r, self._wake_w = self._ctx.Pipe(duplex=False)
+        self._wake_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._workers: List[_AcqWorker] = []
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._commands = self._failed = self._restarts = 0
+
+    # ----- 수명 -----
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._workers = [self._spawn(i) for i in range(self.processes)]
+            self._thread = threading.Thread(target=self._loop, name="eeg-acq-supervisor", daemon=True)
+            self._thread.start()
+
+    def _spawn(self, wid: int) -> _AcqWorker:
+        import worker_eeg
+        parent_conn, child_conn = self._ctx.Pipe()
+        proc = self._ctx.Process(target=worker_eeg.serve, name=f"eeg-acq-{wid}", daemon=True,
+                                 args=(child_conn, wid, self.heartbeat_sec))
+        proc.start()
+        child_conn.close()
+        return _AcqWorker(wid, proc, parent_conn)
+
+    def _restart(self, w: _AcqWorker, reason: str):
+        # 호출자가 self._lock 보유
+        w.lost = True
+        for req_id, (cmd, fut, _) in list(w.inflight.items()):
+            COMMANDS.inc(cmd=cmd, status=reason)
+            fut.set_exception(AcquisitionWorkerLost(
+                f"acquisition worker {w.wid} {reason} during '{cmd}' (exitcode={w.proc.exitcode})"))
+        self._failed += len(w.inflight)
+        w.inflight.clear()
+        try:
+            w.conn.close()
+        except OSError:
+            pass
+        if w.proc.is_alive():
+            w.proc.terminate()
+            w.proc.join(5.0)
+            if w.proc.is_alive():
+                w.proc.kill()   # SIGSTOP 등으로 멈춘 프로세스는 SIGTERM 을 처리하지 못함
+        w.proc.join(1.0)
+        print(f"[ACQ] worker {w.wid} 재시작 (사유: {reason}, exitcode={w.proc.exitcode})")
+        RESTARTS.inc(reason=reason)
+        self._restarts += 1
+        self._workers[self._workers.index(w)] = self._spawn(w.wid)
+
+    def restart_all(self, reason: str = "manual"):
+        self.start()
+        with self._lock:
+            for w in list(self._workers):
+                self._restart(w, reason)
+
+    def shutdown(self):
+        self._closed = True
+        self._wake()
+        if self._thread is not None:
+            self._thread.join(5.0)
+        with self._lock:
+            for w in self._workers:
+                try:
+                    w.conn.send(None)
+                except OSError:
+                    pass
+            for w in self._workers:
+                w.proc.join(5.0)
+                if w.proc.is_alive():
+                    w.proc.terminate()
+
+    def _wake(self):
+        with self._wake_lock:
+            self._wake_w.send_bytes(b"1")
+
+    # ----- 임대 -----
+    def lease(self, board_id: int, serial_param: str, timeout: float = 0.0) -> RemoteBoard:
+        """준비된 유휴 워커 1개를 임대. 재시작 직후 준비 중이면 timeout 초까지 대기."""
+        self.start()
+        deadline = time.time() + max(0.0, float(timeout))
+        while True:
+            with self._lock:
+                idle = [w for w in self._workers if not w.leased]
+                ready = [w for w in idle if w.ready]
+                if ready:
+                    w = ready[0]
+                    w.leased = True
+                    return RemoteBoard(self, w, board_id, serial_param)
+            if not idle or time.time() >= deadline:
+                raise NoIdleWorker(f"All {self.processes} acquisition workers are busy" if not idle
+                                   else "No acquisition worker is ready")
+            time.sleep(0.1)
+
+    def release(self, w: _AcqWorker):
+        with self._lock:
+            w.leased = False   # 재시작된 워커(lost)는 이미 목록에서 교체됨
+
+    # ----- 명령 -----
+    def call(self, w: _AcqWorker, cmd: str, args: Optional[Dict] = None, timeout: Optional[float] = None):
+        timeout = self.cmd_timeout if timeout is None else float(timeout)
+        fut: Future = Future()
+        with self._lock:
+            if w.lost:
+                raise AcquisitionWorkerLost(f"acquisition worker {w.wid} was restarted")
+            req_id = next(self._ids)
+            w.inflight[req_id] = (cmd, fut, time.time() + timeout)
+            self._commands += 1
+        try:
+            with w.send_lock:
+                w.conn.send((req_id, cmd, args or {}))
+        except (OSError, ValueError):
+            pass  # 워커 사망 → 감시 단계에서 명령 실패 처리 + 재시작
+        # 제한 시간은 감독자 스레드가 강제(워커 재시작) → 여기서는 감독 주기만큼 여유
+        return fut.result(timeout=timeout + self.hang_sec + 5.0)
+
+    # ----- 감독자 -----
+    def _receive(self, w: _AcqWorker) -> bool:
+        """메시지 1개 처리. 파이프가 끊겼으면 False(사망 처리는 감시 단계)"""
+        try:
+            msg = w.conn.recv()
+        except (EOFError, OSError):
+            return False
+        w.last_hb = time.time()
+        if msg[0] == "ready":
+            w.ready, w.pid = True, msg[2]
+            return True
+        if msg[0] == "hb":
+            w.running = msg[2]
+            return True
+        req_id, ok, payload = msg
+        entry = w.inflight.pop(req_id, None)
+        if entry is None:
+            return True
+        cmd, fut, _ = entry
+        COMMANDS.inc(cmd=cmd, status=("ok" if ok else "error"))
+        if ok:
+            fut.set_result(payload)
+        else:
+            self._failed += 1
+            fut.set_exception(RuntimeError(f"{payload[0]}: {payload[1]}"))
+        return True
+
+    def _loop(self):
+        while not self._closed:
+            with self._lock:
+                waitables = [self._wake_r] + [w.conn for w in self._workers] + [w.proc.sentinel for w in self._workers]
+            ready = mp_connection.wait(waitables, timeout=1.0)
+            if self._wake_r in ready:
+                while self._wake_r.poll():
+                    self._wake_r.recv_bytes()
+            if self._closed:
+                break
+            now = time.time()
+            with self._lock:
+                for w in list(self._workers):
+                    if w.conn in ready:
+                        while self._receive(w):
+                            try:
+                                if not w.conn.poll():
+                                    break
+                            except (EOFError, OSError):
+                                break
+                    if not w.proc.is_alive():
+                        self._restart(w, "crash")
+                    elif now - w.last_hb > self.hang_sec:
+                        self._restart(w, "hang")
+                    elif any(deadline < now for _, _, deadline in w.inflight.values()):
+                        self._restart(w, "timeout")
+
+    def stats(self) -> Dict:
+        now = time.time()
+        with self._lock:
+            workers = [{"id": w.wid, "pid": w.pid, "alive": w.proc.is_alive(), "ready": w.ready,
+                        "leased": w.leased, "running": w.running, "inflight": len(w.inflight),
+                        "heartbeat_age": round(now - w.last_hb, 2), "uptime": round(now - w.started, 1)}
+                       for w in self._workers]
+            return {"processes": self.processes, "heartbeat_sec": self.heartbeat_sec, "hang_sec": self.hang_sec,
+                    "open_timeout": self.open_timeout, "cmd_timeout": self.cmd_timeout,
+                    "chunk_sec": self.chunk_sec, "commands": self._commands, "failed": self._failed,
+                    "restarts": self._restarts, "workers": workers}
+
+
+_SUPERVISOR: Optional[AcquisitionSupervisor] = None
+_SUPERVISOR_LOCK = threading.Lock()
+
+def enabled() -> bool:
+    return ACQ_PROCESSES > 0
+
+def get_supervisor() -> AcquisitionSupervisor:
+    global _SUPERVISOR
+    if _SUPERVISOR is None:
+        with _SUPERVISOR_LOCK:
+            if _SUPERVISOR is None:
+                _SUPERVISOR = AcquisitionSupervisor()
+                _SUPERVISOR.start()
+    return _SUPERVISOR
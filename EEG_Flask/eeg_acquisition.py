@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+"""
+eeg_acquisition.py
+- 여러 헤드밴드 동시 수집 관리자: 시리얼 넘버별 BrainFlow 세션 1개 + 보드별 수집 스레드
+  (app 전역 _ACTIVE_BOARD 하나로 프로세스당 1대만 쓰던 구조 대체, 새 수집이 다른 헤드밴드 세션을 끊지 않음)
+- 세션 단계/접촉 품질 이벤트는 eeg_contact.CollectionSession 그대로 사용(/eeg_collection/<id>, SSE)
+- 출력 격리: EEG_ACQ_OUTPUT_DIR/<serial>/<session_id>/ 에 CSV + .eegr 저장
+- 자원 상한: 동시 세션 수(EEG_ACQ_MAX_SESSIONS), 세션당 녹화 길이(EEG_ACQ_MAX_SECONDS),
+  BrainFlow 링버퍼 = (녹화 길이 + 여유) × 샘플링 레이트(기본 45만 샘플 × 보드 수 메모리 방지)
+- 보드: muse2(기본) | muse2_bled | synthetic(BrainFlow 합성 보드, 장비 없이 테스트) — EEG_ACQ_BOARD 또는 요청값
+- stop(serial): 녹화 중이면 그때까지의 데이터 저장 후 분석 없이 stopped, cleanup(): 끝난 세션 목록에서 제거
+- 보드 I/O: worker_eeg.BoardHandle(프로세스 내) 또는 EEG_ACQ_PROCESSES > 0 이면 eeg_acq_supervisor 상주 워커 임대
+  · 녹화 중 EEG_ACQ_PULL_SEC 마다 샘플을 웹 프로세스로 당겨옴 → 워커가 죽어도 그때까지 데이터는 저장(error + result)
+"""
+from __future__ import annotations
+import os, re, time, threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import eeg_contact
+import eeg_recording
+import eeg_acq_supervisor
+import worker_eeg
+
+# ========================= 설정 =========================
+ACQ_MAX_SESSIONS    = int(os.getenv("EEG_ACQ_MAX_SESSIONS", "4"))
+ACQ_MAX_SECONDS     = float(os.getenv("EEG_ACQ_MAX_SECONDS", "600"))
+ACQ_DEFAULT_SECONDS = float(os.getenv("EEG_ACQ_SECONDS", "180"))  # 47 세그먼트를 얻을 수 있는 충분한 시간
+ACQ_BUFFER_MARGIN   = float(os.getenv("EEG_ACQ_BUFFER_MARGIN_SEC", "30"))
+ACQ_OUTPUT_DIR      = os.getenv("EEG_ACQ_OUTPUT_DIR", os.path.join("uploads", "eeg"))
+ACQ_BOARD           = os.getenv("EEG_ACQ_BOARD", "muse2").strip().lower()
+ACQ_RETRIES         = int(os.getenv("EEG_ACQ_RETRIES", "3"))
+ACQ_PULL_SEC        = float(os.getenv("EEG_ACQ_PULL_SEC", "5"))
+
+BOARDS = {"muse2": 38, "muse2_bled": 22, "synthetic": -1}  # BoardIds.MUSE_2_BOARD / MUSE_2_BLED_BOARD / SYNTHETIC_BOARD
+
+
+class AcquisitionError(RuntimeError):
+    """수집 시작 불가(잘못된 요청)"""
+
+class AcquisitionBusy(AcquisitionError):
+    """동시 세션 상한 초과 → 호출 측은 503"""
+
+class AcquisitionConflict(AcquisitionBusy):
+    """같은 시리얼 세션이 이미 진행 중 → 호출 측은 409"""
+
+
+def _safe(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(name)) or "unknown"
+
+def board_id_for(board: Optional[str]) -> int:
+    b = (board or ACQ_BOARD).strip().lower()
+    if b in BOARDS:
+        return BOARDS[b]
+    try:
+        return int(b)
+    except ValueError:
+        raise AcquisitionError(f"Unknown board '{board}'. Choose one of {list(BOARDS)}")
+
+def save_muse_recording(df_final, serial_number, sampling_rate, out_dir: str = ACQ_OUTPUT_DIR,
+                        stamp: Optional[int] = None) -> Tuple[str, str, Tuple[np.ndarray, float]]:
+    """
+    수집 데이터(timestamps, eeg_1..4)를 .eegr 로 저장 → 분석은 memmap 으로 바로 읽음
+    반환: (rec_name, rec_path, (X, sfreq)) — 배열은 워커 풀에 공유 메모리로 직접 전달할 때 사용
+    """
+    ts = df_final['timestamps'].to_numpy(dtype=np.float64)
+    try:
+        sfreq = eeg_recording.sfreq_from_timestamps(ts)
+    except ValueError:
+        sfreq = float(sampling_rate)
+    rec_name = f"eeg_data_{serial_number}_{stamp or int(time.time())}{eeg_recording.RECORDING_EXT}"
+    rec_path = os.path.join(out_dir, rec_name)
+    X = df_final[['eeg_1', 'eeg_2', 'eeg_3', 'eeg_4']].to_numpy(dtype=np.float32).T
+    eeg_recording.write_recording(
+        rec_path, X, list(eeg_recording.MUSE_CSV_CHANNELS), sfreq,
+        device_serial=str(serial_number),
+        t_start=(float(ts[0]) if ts.size else None),
+        t_end=(float(ts[-1]) if ts.size else None),
+        source="brainflow",
+    )
+    return rec_name, rec_path, (X, sfreq)
+
+
+class AcquisitionSession:
+    """
+    헤드밴드 1대 수집: 연결(재시도) → 접촉 게이트 → 녹화 → 저장 → 보드 해제 → (옵션) 분석
+    전용 스레드에서 실행, 진행 상태는 self.session(eeg_contact.CollectionSession) 이벤트로 발행
+    """
+    def __init__(self, serial: str, seconds: float, board_id: int,
+                 analyze: Optional[Callable] = None,
+                 session: Optional[eeg_contact.CollectionSession] = None,
+                 out_root: str = ACQ_OUTPUT_DIR, retries: int = ACQ_RETRIES):
+        self.serial = str(serial)
+        self.seconds = float(seconds)
+        self.board_id = int(board_id)
+        self.analyze = analyze
+        self.session = session or eeg_contact.create_session(self.serial)
+        self.out_dir = os.path.join(out_root, _safe(self.serial), _safe(self.session.id))
+        self.retries = max(1, int(retries))
+        self.started = time.time()
+        self.board = None
+        self.result: Optional[Dict] = None
+        self.exc: Optional[BaseException] = None
+        self._stop = threading.Event()
+        self._board_lock = threading.Lock()
+        self.finished = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"acq-{_safe(self.serial)}", daemon=True)
+
+    # ----- 제어 -----
+    def start(self) -> "AcquisitionSession":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """녹화 중이면 지금까지 데이터로 마감(분석 없음), 접촉 대기 중이면 바로 종료"""
+        self._stop.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self.finished.wait(timeout)
+
+    @property
+    def active(self) -> bool:
+        return not self.finished.is_set()
+
+    def status(self) -> Dict:
+        return {"serial_number": self.serial, "session_id": self.session.id, "state": self.session.state,
+                "board_id": self.board_id, "seconds": self.seconds, "started": self.started,
+                "active": self.active, "stop_requested": self._stop.is_set(), "out_dir": self.out_dir,
+                "worker": getattr(self.board, "wid", None),
+                "error": (str(self.exc) if self.exc is not None else None)}
+
+    # ----- 보드 -----
+    def _serial_param(self) -> str:
+        # Muse 는 "Muse-<serial>" 로 장비 검색, 합성 보드는 시리얼만 달리해 세션 구분
+        return f"Muse-{self.serial}" if self.board_id in (BOARDS["muse2"], BOARDS["muse2_bled"]) else self.serial
+
+    def _new_handle(self):
+        if eeg_acq_supervisor.enabled():
+            try:
+                return eeg_acq_supervisor.get_supervisor().lease(self.board_id, self._serial_param(), timeout=30.0)
+            except eeg_acq_supervisor.NoIdleWorker as e:
+                raise AcquisitionBusy(str(e))
+        return worker_eeg.BoardHandle(self.board_id, self._serial_param())
+
+    def _connect(self) -> Optional[Dict]:
+        """연결 + 스트림 시작(재시도). 반환: 채널 정보, 연결 중 stop 이면 None"""
+        last_error = None
+        for attempt in range(self.retries):
+            if self._stop.is_set():
+                return None
+            if attempt > 0:
+                print(f"[ACQ] {self.serial} {2 * attempt}초 후 재시도...")
+                self._stop.wait(2 * attempt)
+            print(f"[ACQ] {self.serial} 연결 시도 {attempt + 1}/{self.retries}")
+            handle = self._new_handle()
+            try:
+                info = handle.open(self.seconds + ACQ_BUFFER_MARGIN)
+            except Exception as e:
+                last_error = f"장비 연결 실패: {e}"
+                print(f"[ACQ] {self.serial} 연결 실패: {e}")
+                handle.close()
+                continue
+            with self._board_lock:
+                self.board = handle
+            print(f"[ACQ] {self.serial} 연결 성공 (시도 {attempt + 1}/{self.retries})"
+                  + (f", worker {handle.wid}" if hasattr(handle, "wid") else ""))
+            return info
+        raise RuntimeError(f"연결 실패 (최대 재시도 횟수 초과): {last_error}")
+
+    def _release(self):
+        with self._board_lock:
+            board, self.board = self.board, None
+        if board is not None:
+            board.close()
+
+    def _record(self) -> Tuple[np.ndarray, Optional[BaseException]]:
+        """seconds + 1초 동안(stop 시 즉시 마감) ACQ_PULL_SEC 마다 샘플을 당겨옴. 반환: (rows, n), 워커 유실 예외"""
+        chunks: List[np.ndarray] = []
+        lost = None
+        end = time.time() + self.seconds + 1
+        try:
+            while not self._stop.is_set() and time.time() < end:
+                self._stop.wait(min(ACQ_PULL_SEC, max(0.0, end - time.time())))
+                chunks.append(self.board.read())
+            chunks.append(self.board.read())  # 마지막 잔여분
+        except eeg_acq_supervisor.AcquisitionWorkerLost as e:
+            lost = e
+            print(f"[ACQ] {self.serial} 녹화 중 수집 워커 유실: {e}")
+        if not chunks:
+            raise lost
+        return np.concatenate(chunks, axis=1), lost
+
+    # ----- 수집 -----
+    def _run(self):
+        sess = self.session
+        monitor = None
+        try:
+            sess.set_state("connecting", serial_number=self.serial, board_id=self.board_id)
+            info = self._connect()
+            if info is None:  # 연결 중 stop
+                sess.set_state("stopped")
+                return
+            sampling_rate = info["sampling_rate"]
+            eeg_ch = info["eeg_channels"][:4]
+            ts_ch = info["timestamp_channel"]
+            num_points = int(self.seconds * sampling_rate)
+
+            # 전극 접촉 품질: 스트리밍 내내 백그라운드 샘플링(BrainFlow 보드에 API 가 없으면 측정불가로 기록)
+            monitor = eeg_contact.ContactMonitor(sess, self.board.contact).start()
+            sess.set_state("contact_check")
+            if eeg_contact.CONTACT_GATE:
+                contact_check = sess.wait_for_contact(cancel=self._stop)
+            else:
+                contact_check = dict(sess.summary("contact_check"), gate="off")
+            if self._stop.is_set():
+                sess.set_state("stopped", contact=contact_check)
+                return
+
+            # 게이트 이전 데이터 버림 → 녹화 구간만 링버퍼에 남김
+            self.board.flush()
+            sess.set_state("recording", seconds=self.seconds)
+            t_rec = time.time()
+            data, lost = self._record()
+            data = data[:, -num_points:]
+            recorded = round(time.time() - t_rec, 2)
+            monitor.stop()
+            self._release()
+            contact = {"check": contact_check, "recording": sess.summary("recording")}
+
+            import pandas as pd
+            df_final = pd.DataFrame({"timestamps": data[ts_ch],
+                                     "eeg_1": data[eeg_ch[0]], "eeg_2": data[eeg_ch[1]],
+                                     "eeg_3": data[eeg_ch[2]], "eeg_4": data[eeg_ch[3]]})
+            os.makedirs(self.out_dir, exist_ok=True)
+            stamp = int(time.time())
+            filename = f"eeg_data_{_safe(self.serial)}_{stamp}.csv"
+            filepath = os.path.join(self.out_dir, filename)
+            df_final.to_csv(filepath, index=False)
+            rec_name, rec_path, rec_array = save_muse_recording(df_final, _safe(self.serial), sampling_rate,
+                                                                self.out_dir, stamp)
+            print(f"[ACQ] {self.serial} 저장 완료: {filepath} (.eegr: {rec_path}), 샘플 {data.shape[1]}")
+
+            self.result = {
+                'data_file': filename,
+                'recording_file': rec_name,
+                'data_path': filepath,
+                'recording_path': rec_path,
+                'duration': self.seconds,
+                'recorded_seconds': recorded,
+                'data_points': int(data.shape[1]),
+                'contact': contact,
+                'analysis_result': None,
+            }
+            if lost is not None:
+                self.exc = lost
+                sess.set_state("error", error=str(lost), result=self.result)
+                return
+            if self._stop.is_set():
+                sess.set_state("stopped", result=self.result)
+                return
+            if self.analyze is not None:
+                sess.set_state("analyzing")
+                self.result['analysis_result'] = self.analyze(rec_path, self.serial, array=rec_array)
+            sess.set_state("done", result=self.result)
+        except eeg_contact.ContactTimeout as e:
+            self.exc = e
+            sess.set_state("error", error=str(e), contact=e.summary)
+        except Exception as e:
+            self.exc = e
+            print(f"[ACQ] {self.serial} 수집 실패: {e}")
+            sess.set_state("error", error=str(e))
+        finally:
+            if monitor is not None:
+                monitor.stop()
+            self._release()
+            self.finished.set()
+
+
+class AcquisitionManager:
+    """
+    mgr = get_manager()
+    acq = mgr.start("1234", seconds=180, analyze=fn)   # 즉시 반환(보드별 스레드)
+    mgr.status("1234") / mgr.list() / mgr.stop("1234") / mgr.cleanup()
+    """
+    def __init__(self, max_sessions: int = ACQ_MAX_SESSIONS, max_seconds: float = ACQ_MAX_SECONDS,
+                 out_root: str = ACQ_OUTPUT_DIR):
+        if eeg_acq_supervisor.enabled():  # 워커 1개 = 보드 1대
+            max_sessions = min(int(max_sessions), eeg_acq_supervisor.ACQ_PROCESSES)
+        self.max_sessions = max(1, int(max_sessions))
+        self.max_seconds = float(max_seconds)
+        self.out_root = out_root
+        self._sessions: "OrderedDict[str, AcquisitionSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, serial: str, seconds: Optional[float] = None, board: Optional[str] = None,
+              analyze: Optional[Callable] = None, session: Optional[eeg_contact.CollectionSession] = None,
+              replace: bool = False, retries: Optional[int] = None) -> AcquisitionSession:
+        """
+        replace=True 면 같은 시리얼의 진행 중 세션을 멈추고 새로 시작(기존 단일 세션 API 동작)
+        retries: 연결 재시도 횟수(None 이면 EEG_ACQ_RETRIES)
+        """
+        if not serial:
+            raise AcquisitionError("serial_number is required")
+        serial = str(serial)
+        seconds = ACQ_DEFAULT_SECONDS if seconds is None else float(seconds)
+        if not (0 < seconds <= self.max_seconds):
+            raise AcquisitionError(f"seconds must be in (0, {self.max_seconds:g}]")
+        board_id = board_id_for(board)
+        with self._lock:
+            prev = self._sessions.get(serial)
+            if prev is not None and prev.active:
+                if not replace:
+                    raise AcquisitionConflict(f"Acquisition already running for serial {serial}")
+                prev.stop()
+            n_active = sum(1 for k, a in self._sessions.items() if a.active and k != serial)
+            if n_active >= self.max_sessions:
+                raise AcquisitionBusy(f"Too many concurrent acquisitions ({n_active}/{self.max_sessions})")
+            acq = AcquisitionSession(serial, seconds, board_id, analyze=analyze, session=session,
+                                     out_root=self.out_root,
+                                     retries=ACQ_RETRIES if retries is None else retries)
+            self._sessions[serial] = acq
+            self._sessions.move_to_end(serial)
+        if prev is not None and prev.active:
+            prev.wait(timeout=30.0)  # 같은 장비 BLE 세션 해제 대기
+        return acq.start()
+
+    def get(self, serial: str) -> Optional[AcquisitionSession]:
+        with self._lock:
+            return self._sessions.get(str(serial))
+
+    def status(self, serial: str) -> Optional[Dict]:
+        acq = self.get(serial)
+        return None if acq is None else dict(acq.status(), session=acq.session.snapshot())
+
+    def list(self) -> List[Dict]:
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return [a.status() for a in sessions]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            n_active = sum(1 for a in self._sessions.values() if a.active)
+            n = len(self._sessions)
+        return {"active": n_active, "sessions": n, "max_sessions": self.max_sessions,
+                "max_seconds": self.max_seconds, "out_root": self.out_root,
+                "workers": (eeg_acq_supervisor.get_supervisor().stats() if eeg_acq_supervisor.enabled() else None)}
+
+    def stop(self, serial: str, wait: float = 0.0) -> bool:
+        acq = self.get(serial)
+        if acq is None:
+            return False
+        acq.stop()
+        if wait > 0:
+            acq.wait(wait)
+        return True
+
+    def stop_all(self, wait: float = 10.0) -> int:
+        """전체 정리(서버 재시작/강제 정리 API): 모든 세션 stop → 보드 해제 대기"""
+        with self._lock:
+            sessions = [a for a in self._sessions.values() if a.active]
+        for a in sessions:
+            a.stop()
+        deadline = time.time() + wait
+        for a in sessions:
+            a.wait(max(0.0, deadline - time.time()))
+        return len(sessions)
+
+    def cleanup(self, serial: Optional[str] = None) -> int:
+        """끝난 세션을 목록에서 제거(진행 중 세션은 유지). 반환: 제거 수"""
+        with self._lock:
+            keys = [k for k, a in self._sessions.items() if not a.active and (serial is None or k == str(serial))]
+            for k in keys:
+                del self._sessions[k]
+        return len(keys)
+
+
+_MANAGER: Optional[AcquisitionManager] = None
+_MANAGER_LOCK = threading.Lock()
+
+def get_manager() -> AcquisitionManager:
+    global _MANAGER
+    with _MANAGER_LOCK:
+        if _MANAGER is None:
+            _MANAGER = AcquisitionManager()
+        return _MANAGER
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+eeg_artifacts.py
+- 세그먼트 아티팩트 검출(깜빡임/움직임/전극 탈락/전원 잡음): 기존 품질 가중치(std < 중앙값 20%)는 큰 진폭을 못 거름
+- SegmentPipeline 이 만드는 정규화 배치 (b,C,win) 위에서 검출기 전부를 한 번에 계산(추가 신호 패스 없음)
+  · ptp      : 채널별 peak-to-peak > 녹화 중앙값 × EEG_ARTIFACT_PTP_FACTOR
+  · flat     : |차분| < 1e-3·std 인 연속 구간 ≥ EEG_ARTIFACT_FLAT_SEC
+  · variance : 채널별 std 가 녹화 중앙값 × [EEG_ARTIFACT_VAR_LOW, EEG_ARTIFACT_VAR_HIGH] 밖
+  · kurtosis : 초과 첨도 > EEG_ARTIFACT_KURTOSIS (깜빡임 같은 뾰족한 파형)
+  · line     : 50/60 Hz 성분 전력 비율 > 녹화 중앙값 × EEG_ARTIFACT_LINE_FACTOR (그리고 ≥ 1e-4)
+               1–40 Hz 필터 후라 비율 자체는 작음 → 구간성 전원 잡음만 상대값으로 검출
+- 임계값은 채널별 녹화 중앙값 기준(상대값) → 입력 단위(µV/V)와 무관, z 정규화 전/후 결과 동일
+- 한 채널이라도 걸리면 세그먼트 가중치 1e-3 → 품질가중 집계/2분 윈도우 선택/타임라인 quality 에 반영
+- 기본 꺼짐(기존 동작: std 규칙만) — EEG_ARTIFACTS=1 로 켬(결과 캐시 키에 설정 포함)
+"""
+from __future__ import annotations
+import os
+from typing import Dict, Optional
+
+import numpy as np
+
+# ========================= 설정 =========================
+ARTIFACTS_ENABLED = os.getenv("EEG_ARTIFACTS", "0").strip().lower() in ("1", "true", "on", "yes", "y")
+PTP_FACTOR        = float(os.getenv("EEG_ARTIFACT_PTP_FACTOR", "5.0"))
+FLAT_SEC          = float(os.getenv("EEG_ARTIFACT_FLAT_SEC", "0.5"))
+FLAT_EPS          = 1e-3    # z 단위(채널 std 대비) 샘플 간 차분
+VAR_LOW           = float(os.getenv("EEG_ARTIFACT_VAR_LOW", "0.2"))
+VAR_HIGH          = float(os.getenv("EEG_ARTIFACT_VAR_HIGH", "4.0"))
+KURTOSIS_MAX      = float(os.getenv("EEG_ARTIFACT_KURTOSIS", "8.0"))
+LINE_FACTOR       = float(os.getenv("EEG_ARTIFACT_LINE_FACTOR", "20.0"))
+LINE_RATIO_MIN    = 1e-4
+LINE_FREQS        = (50.0, 60.0)
+ARTIFACT_WEIGHT   = 1e-3    # 기존 품질 가중치와 같은 값
+
+DETECTORS = ("ptp", "flat", "variance", "kurtosis", "line")
+
+
+def enabled() -> bool:
+    return ARTIFACTS_ENABLED
+
+def config() -> Optional[Dict]:
+    """결과에 영향을 주는 설정(결과 캐시 키). 꺼져 있으면 None."""
+    if not ARTIFACTS_ENABLED:
+        return None
+    return {"ptp_factor": PTP_FACTOR, "flat_sec": FLAT_SEC, "flat_eps": FLAT_EPS,
+            "var": [VAR_LOW, VAR_HIGH], "kurtosis": KURTOSIS_MAX,
+            "line": [LINE_FACTOR, LINE_RATIO_MIN], "line_freqs": list(LINE_FREQS), "weight": ARTIFACT_WEIGHT}
+
+
+class ArtifactDetector:
+    """
+    det = ArtifactDetector(n_segments, n_channels, win, sfreq)
+    det.update(i, x)        # 배치마다: x (b,C,win) 정규화 세그먼트
+    det.weights()           # (N,) 1.0 | 1e-3
+    det.summary(s, use)     # 검출기별 세그먼트 수
+    """
+    def __init__(self, n_segments: int, n_channels: int, win: int, sfreq: float):
+        N, C = int(n_segments), int(n_channels)
+        self.win = int(win)
+        self.flat_len = max(1, int(round(FLAT_SEC * sfreq)))
+        # 세그먼트×채널 특징(배치마다 채움) → 녹화 전체 중앙값이 필요한 판정은 마지막에
+        self.ptp = np.zeros((N, C), dtype=np.float32)
+        self.std = np.zeros((N, C), dtype=np.float32)
+        self.kurt = np.zeros((N, C), dtype=np.float32)
+        self.line = np.zeros((N, C), dtype=np.float32)
+        self.flat_run = np.zeros((N, C), dtype=np.int32)
+        # 전원 주파수 cos/sin 기저 (win, 2F): 세그먼트 전체 FFT 대신 행렬곱 1번
+        t = np.arange(self.win) / float(sfreq)
+        ang = 2.0 * np.pi * np.asarray(LINE_FREQS)[None, :] * t[:, None]
+        self.basis = np.concatenate([np.cos(ang), np.sin(ang)], axis=1).astype(np.float32)
+        self._flags: Optional[Dict[str, np.ndarray]] = None
+
+    def update(self, start: int, x: np.ndarray):
+        """배치 특징 계산. 입력 x 는 바꾸지 않음(forward 에 그대로 사용)."""
+        b = x.shape[0]
+        sl = slice(start, start + b)
+        self.ptp[sl] = x.max(axis=2) - x.min(axis=2)
+        d = x - x.mean(axis=2, keepdims=True)
+        d2 = d * d
+        m2 = d2.mean(axis=2)
+        m4 = (d2 * d2).mean(axis=2)
+        self.std[sl] = np.sqrt(m2)
+        self.kurt[sl] = m4 / (m2 * m2 + 1e-12) - 3.0
+        proj = d @ self.basis                                    # (b,C,2F)
+        p_line = 2.0 * (proj * proj).sum(axis=2) / float(self.win) ** 2
+        self.line[sl] = p_line / (m2 + 1e-12)
+        # 평탄 구간 최장 길이: 누적합에서 마지막 끊긴 지점 값을 빼는 방식(루프 없음)
+        f = np.abs(np.diff(x, axis=2)) < FLAT_EPS
+        c = np.cumsum(f, axis=2, dtype=np.int32)
+        r = (c - np.maximum.accumulate(np.where(f, 0, c), axis=2)).max(axis=2)
+        self.flat_run[sl] = np.where(r > 0, r + 1, 0)  # 연속 차분 k개 = 샘플 k+1개
+        self._flags = None
+
+    def flags(self) -> Dict[str, np.ndarray]:
+        """검출기별 세그먼트 플래그 (N,) bool"""
+        if self._flags is None:
+            med_ptp = np.median(self.ptp, axis=0) + 1e-8
+            med_std = np.median(self.std, axis=0) + 1e-8
+            med_line = np.median(self.line, axis=0)
+            fl = {
+                "ptp": self.ptp > PTP_FACTOR * med_ptp,
+                "flat": self.flat_run >= self.flat_len,
+                "variance": (self.std < VAR_LOW * med_std) | (self.std > VAR_HIGH * med_std),
+                "kurtosis": self.kurt > KURTOSIS_MAX,
+                "line": self.line > np.maximum(LINE_FACTOR * med_line, LINE_RATIO_MIN),
+            }
+            self._flags = {k: v.any(axis=1) for k, v in fl.items()}
+        return self._flags
+
+    def mask(self) -> np.ndarray:
+        """(N,) True = 아티팩트 세그먼트"""
+        fl = self.flags()
+        out = np.zeros(self.ptp.shape[0], dtype=bool)
+        for k in DETECTORS:
+            out |= fl[k]
+        return out
+
+    def weights(self) -> np.ndarray:
+        return np.where(self.mask(), ARTIFACT_WEIGHT, 1.0).astype(np.float32)
+
+    def summary(self, start: int, count: int) -> Dict:
+        fl = self.flags()
+        m = self.mask()
+        return {"flagged": int(m.sum()), "window_flagged": int(m[start:start+count].sum()),
+                "by_detector": {k: int(fl[k].sum()) for k in DETECTORS}}
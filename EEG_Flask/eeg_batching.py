@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+eeg_batching.py
+- 동시 요청 간 마이크로배칭: 같은 엔진(모델)으로 들어온 세그먼트 텐서를 모아 한 번에 forward
+- 첫 요청 도착 후 최대 EEG_MICROBATCH_WAIT_MS 만 더 기다렸다가 실행 → 단건 지연 증가는 수 ms 이내
+- 모은 세그먼트는 EEG_BATCH_SIZE 청크로 연속 forward(요청마다 남던 자투리 배치가 합쳐짐)
+- 결과 로짓은 요청별 출력 배열에 바로 기록(eval 모드라 샘플 간 독립 → 개별 결과 불변)
+- 엔진은 engine.batcher 가 있으면 _forward() 에서 이를 사용, 없으면 스레드별 ForwardBuffers
+- ForwardBuffers: BATCH_SIZE 크기 입력 버퍼(CUDA 면 pinned host + device)를 재사용,
+  로짓은 호출 측이 미리 할당한 (N,K) float32 배열에 직접 복사 → 배치마다 새 배열/astype/concatenate 없음
+"""
+from __future__ import annotations
+import os, time, queue, threading
+from typing import List, Optional, Sequence
+
+import numpy as np
+import torch
+
+import eeg_profiling
+import eeg_executor
+
+# ========================= 설정 =========================
+MICROBATCH_ENABLED = os.getenv("EEG_MICROBATCH", "1").strip().lower() in ("1", "true", "on", "yes", "y")
+MICROBATCH_WAIT_MS = float(os.getenv("EEG_MICROBATCH_WAIT_MS", "3"))
+MICROBATCH_MAX     = int(os.getenv("EEG_MICROBATCH_MAX", "256"))   # 한 번에 모으는 최대 세그먼트 수
+FORWARD_BATCH      = int(os.getenv("EEG_BATCH_SIZE", "64"))         # 모은 뒤 forward 청크(활성화 메모리 상한)
+
+PASS_SEGMENTS = eeg_profiling.REGISTRY.histogram(
+    "eeg_microbatch_segments", "Segments per coalesced forward pass", ("model",),
+    buckets=(16, 32, 64, 128, 256, 512, 1024))
+PASS_REQUESTS = eeg_profiling.REGISTRY.histogram(
+    "eeg_microbatch_requests", "Requests coalesced into one forward pass", ("model",),
+    buckets=(1, 2, 3, 4, 6, 8, 16))
+
+
+class ForwardBuffers:
+    """
+    bufs = ForwardBuffers(model, "cpu", 64); bufs.forward_into([segs_z], [logits])
+    - 스레드 1개 전용(엔진은 threading.local 로 실행기 스레드마다 하나씩 보유)
+    - 입력 모양(C,T)이 바뀔 때만 재할당
+    """
+    def __init__(self, model: torch.nn.Module, torch_device: str, batch_size: int = FORWARD_BATCH):
+        self.model = model
+        self.torch_device = torch_device
+        self.batch_size = max(1, int(batch_size))
+        self._cuda = str(torch_device).startswith("cuda")
+        self._host_in: Optional[torch.Tensor] = None   # (B,C,T) float32 (CUDA 면 pinned)
+        self._dev_in: Optional[torch.Tensor] = None    # (B,C,T) device (CUDA 전용)
+
+    def _ensure(self, shape) -> None:
+        shape = (self.batch_size,) + tuple(shape)
+        if self._host_in is not None and tuple(self._host_in.shape) == shape:
+            return
+        self._host_in = torch.empty(shape, dtype=torch.float32, pin_memory=self._cuda)
+        self._dev_in = torch.empty(shape, dtype=torch.float32, device=self.torch_device) if self._cuda else None
+
+    def _run(self, xb: torch.Tensor, pend: list) -> None:
+        if self._cuda:
+            b = xb.size(0)
+            self._dev_in[:b].copy_(xb, non_blocking=True)
+            xb = self._dev_in[:b]
+        with torch.no_grad():
+            logits = self.model(xb.unsqueeze(1)).detach()
+        for out, j, r, k in pend:
+            torch.from_numpy(out[j:j+k]).copy_(logits[r:r+k])
+
+    def forward_into(self, xs: Sequence[np.ndarray], outs: Sequence[np.ndarray]) -> None:
+        """여러 (x_i (n_i,C,T), out_i (n_i,K) float32) 를 배치 버퍼에 이어 붙여 forward."""
+        B = self.batch_size
+        # CPU 단건이 한 배치에 들어가면 버퍼 복사 없이 바로 forward(파이프라인 배치가 이미 float32 연속 배열)
+        if (not self._cuda and len(xs) == 1 and xs[0].shape[0] <= B
+                and xs[0].dtype == np.float32 and xs[0].flags.c_contiguous):
+            self._run(torch.from_numpy(xs[0]), [(outs[0], 0, 0, xs[0].shape[0])])
+            return
+        pend, fill = [], 0
+        for x, out in zip(xs, outs):
+            n, j = x.shape[0], 0
+            self._ensure(x.shape[1:])
+            src = torch.from_numpy(x)
+            while j < n:
+                k = min(B - fill, n - j)
+                self._host_in[fill:fill+k].copy_(src[j:j+k])  # dtype 변환은 이 복사에서 한 번만
+                pend.append((out, j, fill, k))
+                fill += k
+                j += k
+                if fill == B:
+                    self._run(self._host_in, pend)
+                    pend, fill = [], 0
+        if fill:
+            self._run(self._host_in[:fill], pend)
+
+
+class _Pending:
+    __slots__ = ("x", "event", "out", "err", "t_enq", "coalesced")
+
+    def __init__(self, x: np.ndarray, out: np.ndarray):
+        self.x = x
+        self.event = threading.Event()
+        self.out = out
+        self.err: Optional[BaseException] = None
+        self.t_enq = time.perf_counter()
+        self.coalesced = 1
+
+
+class MicroBatcher:
+    """
+    batcher = MicroBatcher(engine.model, engine.torch_device, name="2c/muse/53")
+    batcher.forward(segs_z, logits)   # (N, C, T) float32 → logits (N, n_classes) 에 기록
+    - 전용 디스패처 스레드 1개가 모델을 독점 실행(torch 스레드 수는 실행기와 동일)
+    """
+    def __init__(self, model: torch.nn.Module, torch_device: str,
+                 max_batch: int = MICROBATCH_MAX, max_wait_ms: float = MICROBATCH_WAIT_MS,
+                 forward_batch: int = FORWARD_BATCH,
+                 torch_threads: int = eeg_executor.TORCH_THREADS, name: str = "model"):
+        self.model = model
+        self.torch_device = torch_device
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.forward_batch = max(1, int(forward_batch))
+        self.torch_threads = max(1, int(torch_threads))
+        self.name = name
+        self._q: "queue.Queue[_Pending]" = queue.Queue()
+        self._bufs = ForwardBuffers(model, torch_device, self.forward_batch)  # 디스패처 스레드 전용
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name=f"eeg-batch-{self.name}", daemon=True)
+                self._thread.start()
+
+    def forward(self, segs_z: np.ndarray, out: np.ndarray) -> np.ndarray:
+        self._ensure_started()
+        item = _Pending(segs_z, out)
+        self._q.put(item)
+        item.event.wait()
+        if item.err is not None:
+            raise item.err
+        eeg_profiling.note(microbatch_requests=item.coalesced)
+        return item.out
+
+    # ----- 디스패처 -----
+    def _collect(self) -> List[_Pending]:
+        first = self._q.get()
+        items, n = [first], first.x.shape[0]
+        deadline = first.t_enq + self.max_wait
+        while n < self.max_batch:
+            remain = deadline - time.perf_counter()
+            try:
+                it = self._q.get(timeout=remain) if remain > 0 else self._q.get_nowait()
+            except queue.Empty:
+                break
+            items.append(it)
+            n += it.x.shape[0]
+        return items
+
+    def _loop(self):
+        torch.set_num_threads(self.torch_threads)
+        while True:
+            items = self._collect()
+            try:
+                self._bufs.forward_into([it.x for it in items], [it.out for it in items])
+                PASS_SEGMENTS.observe(sum(it.x.shape[0] for it in items), model=self.name)
+                PASS_REQUESTS.observe(len(items), model=self.name)
+            except BaseException as e:
+                for it in items:
+                    it.err = e
+            finally:
+                for it in items:
+                    it.coalesced = len(items)
+                    it.event.set()
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+eeg_contact.py
+- Muse 수집 세션별 전극 접촉 품질 모니터: 스트리밍 중 백그라운드 스레드가 계속 샘플링(요청 스레드 sleep 루프 대체)
+- 세션 상태/접촉 샘플을 구독자(SSE)에게 이벤트로 발행, 최근 상태는 GET 으로 조회
+  · 이벤트: state(connecting/contact_check/recording/analyzing/done/error/stopped, done 에 결과 포함), contact(전극별 값 + good)
+- 녹화 시작 게이트: 모든 전극 ≥ EEG_CONTACT_THRESHOLD 가 EEG_CONTACT_SUSTAIN_SEC 동안 연속 유지될 때 시작
+  · EEG_CONTACT_TIMEOUT_SEC 안에 못 맞추면 ContactTimeout → 3분 녹화 후 47세그먼트 요건 실패로 버려지는 일 방지
+  · 장비가 접촉 품질을 주지 않으면(None/예외) EEG_CONTACT_UNAVAILABLE_SEC 후 게이트 없이 진행(기존 10초 확인과 동일)
+- 세션은 최근 EEG_CONTACT_SESSIONS 개만 메모리에 유지
+"""
+from __future__ import annotations
+import os, json, time, uuid, queue, threading
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional, Sequence
+
+# ========================= 설정 =========================
+CONTACT_GATE            = os.getenv("EEG_CONTACT_GATE", "1").strip().lower() in ("1", "true", "on", "yes", "y")
+CONTACT_THRESHOLD       = float(os.getenv("EEG_CONTACT_THRESHOLD", "50"))
+CONTACT_SUSTAIN_SEC     = float(os.getenv("EEG_CONTACT_SUSTAIN_SEC", "5"))
+CONTACT_TIMEOUT_SEC     = float(os.getenv("EEG_CONTACT_TIMEOUT_SEC", "60"))
+CONTACT_UNAVAILABLE_SEC = float(os.getenv("EEG_CONTACT_UNAVAILABLE_SEC", "10"))
+CONTACT_POLL_SEC        = float(os.getenv("EEG_CONTACT_POLL_SEC", "0.5"))
+CONTACT_SESSIONS        = int(os.getenv("EEG_CONTACT_SESSIONS", "32"))
+_HISTORY = 600   # 세션당 보관할 접촉 샘플 수(0.5초 간격 ≈ 5분)
+
+ELECTRODES = ("TP9", "AF7", "AF8", "TP10")
+FINAL_STATES = ("done", "error", "stopped")
+
+
+class ContactTimeout(RuntimeError):
+    """녹화 시작 전 접촉 품질이 기준을 유지하지 못함"""
+    def __init__(self, message: str, summary: Dict):
+        super().__init__(message)
+        self.summary = summary
+
+
+class CollectionSession:
+    """
+    sess = create_session(serial)
+    sess.set_state("contact_check"); sess.add_sample([80, 75, 90, 60])
+    q = sess.subscribe() → (event, data) 튜플을 받음, sess.unsubscribe(q)
+    """
+    def __init__(self, serial: Optional[str], session_id: Optional[str] = None,
+                 electrodes: Sequence[str] = ELECTRODES):
+        self.id = session_id or uuid.uuid4().hex[:12]
+        self.serial = serial
+        self.electrodes = list(electrodes)
+        self.created = time.time()
+        self.state = "connecting"
+        self.state_since = self.created
+        self.samples: deque = deque(maxlen=_HISTORY)
+        self.good_since: Optional[float] = None   # 연속 양호 시작 시각(불량/측정불가면 None)
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self._cv = threading.Condition()
+        self._subs: List[queue.Queue] = []
+
+    # ----- 발행/구독 -----
+    def subscribe(self) -> queue.Queue:
+        q: queue.Queue = queue.Queue(maxsize=256)
+        with self._cv:
+            self._subs.append(q)
+        return q
+
+    def unsubscribe(self, q: queue.Queue):
+        with self._cv:
+            if q in self._subs:
+                self._subs.remove(q)
+
+    def _publish(self, event: str, data: Dict):
+        # 호출자가 self._cv 보유. 느린 구독자는 오래된 이벤트 버림(수집 스레드를 막지 않음)
+        for q in self._subs:
+            try:
+                q.put_nowait((event, data))
+            except queue.Full:
+                try:
+                    q.get_nowait(); q.put_nowait((event, data))
+                except (queue.Empty, queue.Full):
+                    pass
+        self._cv.notify_all()
+
+    # ----- 상태 -----
+    def set_state(self, state: str, **extra):
+        with self._cv:
+            self.state = state
+            self.state_since = time.time()
+            if "result" in extra:
+                self.result = extra["result"]
+            if "error" in extra:
+                self.error = extra["error"]
+            self._publish("state", dict(extra, state=state, t=self.state_since))
+        print(f"[CONTACT] {self.id} 상태: {state}")
+
+    def add_sample(self, quality: Optional[Sequence[float]]):
+        now = time.time()
+        vals = None if not quality else [float(v) for v in quality]
+        good = None if vals is None else all(v >= CONTACT_THRESHOLD for v in vals)
+        s = {"t": now, "state": self.state, "quality": vals, "good": good}
+        with self._cv:
+            self.samples.append(s)
+            if good:
+                if self.good_since is None:
+                    self.good_since = now
+            else:
+                self.good_since = None
+            sustained = 0.0 if self.good_since is None else now - self.good_since
+            self._publish("contact", dict(s, electrodes=self.electrodes, sustained_sec=round(sustained, 2)))
+
+    # ----- 게이트 -----
+    def wait_for_contact(self, sustain_sec: float = CONTACT_SUSTAIN_SEC, timeout: float = CONTACT_TIMEOUT_SEC,
+                         unavailable_sec: float = CONTACT_UNAVAILABLE_SEC,
+                         cancel: Optional[threading.Event] = None) -> Dict:
+        """
+        연속 양호 sustain_sec 달성 시 반환(요약 dict). 측정값이 한 번도 없으면 unavailable_sec 후 그대로 반환.
+        timeout 초과 시 ContactTimeout. cancel 이 set 되면 gate="cancelled" 로 즉시 반환.
+        """
+        t0 = time.time()
+        with self._cv:
+            while True:
+                now = time.time()
+                if cancel is not None and cancel.is_set():
+                    return dict(self.summary("contact_check"), gate="cancelled")
+                if self.good_since is not None and now - self.good_since >= sustain_sec:
+                    return dict(self.summary("contact_check"), gate="passed")
+                measured = any(s["quality"] is not None for s in self.samples)
+                if not measured and now - t0 >= unavailable_sec:
+                    return dict(self.summary("contact_check"), gate="unavailable")
+                if now - t0 >= timeout:
+                    summary = dict(self.summary("contact_check"), gate="timeout")
+                    raise ContactTimeout(
+                        f"전극 접촉 품질이 {sustain_sec:g}초 동안 기준({CONTACT_THRESHOLD:g})을 유지하지 못했습니다 "
+                        f"({timeout:g}초 초과). 헤드밴드 착용을 조정해주세요.", summary)
+                self._cv.wait(timeout=min(0.5, max(0.05, timeout - (now - t0))))
+
+    # ----- 조회 -----
+    def summary(self, state: Optional[str] = None) -> Dict:
+        """상태별(없으면 전체) 접촉 샘플 요약: 측정 수, 양호 비율, 전극별 최소/평균"""
+        with self._cv:
+            ss = [s for s in self.samples if (state is None or s["state"] == state) and s["quality"] is not None]
+            n_all = sum(1 for s in self.samples if state is None or s["state"] == state)
+        out = {"samples": n_all, "measured": len(ss),
+               "good_ratio": (round(sum(1 for s in ss if s["good"]) / len(ss), 4) if ss else None)}
+        if ss:
+            k = min(len(s["quality"]) for s in ss)
+            out["per_electrode"] = {
+                (self.electrodes[j] if j < len(self.electrodes) else str(j)): {
+                    "min": min(s["quality"][j] for s in ss),
+                    "mean": round(sum(s["quality"][j] for s in ss) / len(ss), 2)}
+                for j in range(k)}
+        return out
+
+    def snapshot(self) -> Dict:
+        with self._cv:
+            last = self.samples[-1] if self.samples else None
+            good_since = self.good_since
+        now = time.time()
+        return {"session_id": self.id, "serial_number": self.serial, "state": self.state,
+                "state_since": self.state_since, "electrodes": self.electrodes, "latest": last,
+                "sustained_sec": (round(now - good_since, 2) if good_since is not None else 0.0),
+                "threshold": CONTACT_THRESHOLD, "sustain_sec": CONTACT_SUSTAIN_SEC,
+                "contact": {st: self.summary(st) for st in ("contact_check", "recording")},
+                "result": self.result, "error": self.error}
+
+
+class ContactMonitor:
+    """
+    mon = ContactMonitor(sess, board_shim.get_electrode_contact_quality).start()
+    ... sess.wait_for_contact() ... 녹화 ...
+    mon.stop()
+    """
+    def __init__(self, session: CollectionSession, read: Callable[[], Optional[Sequence[float]]],
+                 poll_sec: float = CONTACT_POLL_SEC):
+        self.session = session
+        self.read = read
+        self.poll_sec = float(poll_sec)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"contact-{session.id}", daemon=True)
+        self._warned = False
+
+    def start(self) -> "ContactMonitor":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=max(1.0, 2 * self.poll_sec))
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                q = self.read()
+            except Exception as e:
+                if not self._warned:
+                    print(f"[CONTACT] {self.session.id} 전극 접촉 상태 확인 실패: {e}")
+                    self._warned = True
+                q = None
+            self.session.add_sample(q)
+            self._stop.wait(self.poll_sec)
+
+
+# ========================= 세션 레지스트리 =========================
+_SESSIONS: "OrderedDict[str, CollectionSession]" = OrderedDict()
+_SESSIONS_LOCK = threading.Lock()
+
+def create_session(serial: Optional[str], session_id: Optional[str] = None) -> CollectionSession:
+    sess = CollectionSession(serial, session_id)
+    with _SESSIONS_LOCK:
+        _SESSIONS[sess.id] = sess
+        _SESSIONS.move_to_end(sess.id)
+        # 오래된 세션부터 정리(진행 중 세션은 유지)
+        for sid in list(_SESSIONS):
+            if len(_SESSIONS) <= CONTACT_SESSIONS:
+                break
+            if _SESSIONS[sid].state in FINAL_STATES:
+                del _SESSIONS[sid]
+    return sess
+
+def get_session(session_id: str) -> Optional[CollectionSession]:
+    with _SESSIONS_LOCK:
+        return _SESSIONS.get(session_id)
+
+def list_sessions() -> List[Dict]:
+    with _SESSIONS_LOCK:
+        sessions = list(_SESSIONS.values())
+    return [{"session_id": s.id, "serial_number": s.serial, "state": s.state, "created": s.created}
+            for s in sessions]
+
+
+# ========================= SSE =========================
+def format_sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+def stream_events(sess: CollectionSession, keepalive_sec: float = 15.0):
+    """text/event-stream 본문 생성기: 현재 스냅샷 → 이후 이벤트, 세션이 done/error 가 되면 종료"""
+    q = sess.subscribe()   # 스냅샷 전에 구독 → 사이에 발생한 이벤트도 놓치지 않음
+    try:
+        yield format_sse("snapshot", sess.snapshot())
+        if sess.state in FINAL_STATES:
+            return
+        while True:
+            try:
+                event, data = q.get(timeout=keepalive_sec)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_sse(event, data)
+            if event == "state" and data.get("state") in FINAL_STATES:
+                return
+    finally:
+        sess.unsubscribe(q)
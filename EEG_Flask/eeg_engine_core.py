@@ -0,0 +1,818 @@
+# -*- coding: utf-8 -*-
+"""
+eeg_engine_core.py
+- 2/3클 추론 엔진 공용 코어: 모델(EEGNetV4Compat)·가중치 로드·입력 로더·전처리·세그먼트 추론·집계
+- 엔진별 차이는 설정 3가지로 주입
+  · PreprocProfile: 노치(전원 잡음 자동 감지) / 평균 기준 / CSV 타임스탬프 추정 방식
+  · ClassHead     : 클래스 이름, subject 집계(품질가중 확률 평균 | 보정 로짓 평균→softmax), 다수결 동률 처리,
+                    사전확률 상한(3클 1.0 / 2클 없음 — 기존 엔진별 처리 그대로)
+  · Calibration   : 온도 / 클래스 프라이어 / 결정 바이어스(config.json·calibration.json, ENV 우선)
+- 같은 가중치 파일은 엔진 인스턴스 간 모델을 공유(_MODEL_CACHE) → csv_order/comment 만 다른 엔진도 메모리 1벌
+- eeg_model / eeg_model2class / eeg_model3class 는 레포 규칙·기본값만 정하는 호환 래퍼
+- Muse CSV 는 모든 엔진이 csv_order(EEG_CSV_ORDER) 를 따름(기존 3클 엔진은 무시하고 표준 순서로 읽었음)
+"""
+from __future__ import annotations
+import os, re, json, threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple, Optional
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+import mne
+from huggingface_hub import snapshot_download
+
+import eeg_recording
+import eeg_profiling
+import eeg_segments
+import eeg_batching
+import eeg_result_cache
+import eeg_timeline
+import eeg_artifacts
+
+# ========================= 기본 설정 =========================
+HF_OWNER = "ardor924"
+CHANNEL_GROUPS: Dict[str, List[str]] = eeg_recording.CHANNEL_GROUPS
+
+LOW_FREQ, HIGH_FREQ = 1.0, 40.0
+TARGET_SRATE = 250
+SEG_SECONDS, EVAL_HOP_SEC = 5.0, 2.5  # 50% overlap
+WINDOW_NEED_SECONDS = 120
+BATCH_SIZE = int(os.getenv("EEG_BATCH_SIZE", "64"))
+
+# ========================= 모델 정의(Compat) =========================
+class EEGNetV4Compat(nn.Module):
+    """
+    체크포인트 키 네이밍(firstconv/depthwise/separable/classifier)과 호환.
+    k1(첫 conv 커널), k2(separable depthwise 커널), F1/D/F2, pool, dropout을 주입형으로 설정.
+    최종 GAP→Linear(F2→n_classes) 구조로 classifier.in_features=F2 고정.
+    """
+    def __init__(self, n_classes: int, Chans: int,
+                 k1: int, k2: int, F1: int, D: int, F2: int,
+                 pool1: int = 4, pool2: int = 8, dropout: float = 0.3):
+        super().__init__()
+        self.firstconv = nn.Sequential(
+            nn.Conv2d(1, F1, (1, k1), padding=(0, k1 // 2), bias=False),
+            nn.BatchNorm2d(F1)
+        )
+        self.depthwise = nn.Sequential(
+            nn.Conv2d(F1, F1 * D, (Chans, 1), groups=F1, bias=False),
+            nn.BatchNorm2d(F1 * D)
+        )
+        self.separable = nn.Sequential(
+            nn.Conv2d(F1 * D, F1 * D, (1, k2), padding=(0, k2 // 2), groups=F1 * D, bias=False),
+            nn.Conv2d(F1 * D, F2, (1, 1), bias=False),
+            nn.BatchNorm2d(F2)
+        )
+        self.elu = nn.ELU()
+        self.pool1 = nn.AvgPool2d((1, pool1))
+        self.pool2 = nn.AvgPool2d((1, pool2))
+        self.drop = nn.Dropout(dropout)
+        self.gap = nn.AdaptiveAvgPool2d((1, 1))
+        self.classifier = nn.Linear(F2, n_classes)
+
+    def forward(self, x):
+        x = self.firstconv(x)
+        x = self.depthwise(x); x = self.elu(x); x = self.pool1(x); x = self.drop(x)
+        x = self.separable(x); x = self.elu(x); x = self.pool2(x); x = self.drop(x)
+        x = self.gap(x).squeeze(-1).squeeze(-1)
+        x = self.classifier(x)
+        return x
+
+# ========================= 가중치 로드 유틸 =========================
+def _strip_prefix(sd: dict, prefixes=("module.", "model.")) -> dict:
+    out = {}
+    for k, v in sd.items():
+        kk = k
+        for p in prefixes:
+            if kk.startswith(p):
+                kk = kk[len(p):]
+        out[kk] = v
+    return out
+
+def _load_state_dict_generic(weights_path: str, map_location: str):
+    ext = os.path.splitext(weights_path)[-1].lower()
+    if ext == ".safetensors":
+        from safetensors.torch import load_file
+        sd = dict(load_file(weights_path))
+    else:
+        obj = torch.load(weights_path, map_location=map_location)
+        if isinstance(obj, dict):
+            for k in ["state_dict","model_state_dict","weights","params","model","net"]:
+                if k in obj and isinstance(obj[k], dict):
+                    sd = obj[k]; break
+            else:
+                if all(isinstance(v, torch.Tensor) for v in obj.values()):
+                    sd = obj
+                elif isinstance(obj.get("model", None), nn.Module):
+                    sd = obj["model"].state_dict()
+                else:
+                    raise RuntimeError("state_dict를 찾지 못했습니다.")
+        elif isinstance(obj, nn.Module):
+            sd = obj.state_dict()
+        else:
+            raise RuntimeError("지원되지 않는 가중치 포맷")
+    return _strip_prefix(sd)
+
+def _looks_compat(sd: dict) -> bool:
+    return any(k.startswith("firstconv.0.weight") for k in sd.keys())
+
+def _infer_hparams_from_sd(sd: dict, chans: int):
+    F1, D, F2, k1, k2, p1, p2 = 32, 2, 64, 250, 32, 4, 8
+    try:
+        w = sd["firstconv.0.weight"]; F1 = int(w.shape[0]); k1 = int(w.shape[-1])
+        w = sd["depthwise.0.weight"]; D  = int(w.shape[0] // F1)
+        if "separable.0.weight" in sd: k2 = int(sd["separable.0.weight"].shape[-1])
+        if "separable.1.weight" in sd: F2 = int(sd["separable.1.weight"].shape[0])
+        if "classifier.weight" in sd:  F2 = int(sd["classifier.weight"].shape[1])
+    except:  # pragma: no cover
+        pass
+    return F1, D, F2, k1, k2, p1, p2
+
+def _hf_download(repo_id: str, token: Optional[str]):
+    allow = ["*.pt","*.pth","*.bin","*.safetensors","config.json","calibration.json"]
+    # ENV EEG_WEIGHTS_DIR/<레포 이름>/ 이 있으면 HF 대신 사용(오프라인/벤치마크)
+    wdir = os.getenv("EEG_WEIGHTS_DIR", "").strip()
+    local_dir = os.path.join(wdir, repo_id.split("/")[-1]) if wdir else ""
+    if not os.path.isdir(local_dir):
+        local_dir = snapshot_download(repo_id=repo_id, allow_patterns=allow, token=token)
+    weights = []
+    for root, _, files in os.walk(local_dir):
+        for fn in files:
+            if fn.lower().endswith((".pt",".pth",".bin",".safetensors")):
+                weights.append(os.path.join(root, fn))
+    if not weights:
+        raise FileNotFoundError(f"[HF] No weights in {repo_id}")
+    weights.sort()
+    cfg = {}
+    for name in ("config.json","calibration.json"):
+        p = os.path.join(local_dir, name)
+        if os.path.exists(p):
+            try:
+                with open(p, "r") as f:
+                    cfg.update(json.load(f))
+            except Exception:
+                pass
+    return weights[0], cfg
+
+# 가중치 파일(+장치)당 모델 1개를 엔진 인스턴스 간 공유(eval/no_grad 읽기 전용)
+_MODEL_CACHE: Dict[Tuple[str, str], nn.Module] = {}
+_MODEL_LOCK = threading.Lock()
+
+def _load_model(weights_path: str, cfg: Dict, n_classes: int, chans: int,
+                torch_device: str, repo_id: str) -> Tuple[nn.Module, Tuple[str, str]]:
+    key = (os.path.realpath(weights_path), str(torch_device))
+    with _MODEL_LOCK:
+        model = _MODEL_CACHE.get(key)
+        if model is not None:
+            return model, key
+
+        sd = _load_state_dict_generic(weights_path, map_location=torch_device)
+        if not _looks_compat(sd):
+            raise RuntimeError("Unsupported checkpoint (expected 'firstconv/depthwise/separable/...')")
+        if "classifier.weight" in sd:
+            n_out = int(sd["classifier.weight"].shape[0])
+        elif "classifier.bias" in sd:
+            n_out = int(sd["classifier.bias"].shape[0])
+        else:
+            n_out = int(cfg.get("num_classes", 0))
+        if n_out != n_classes:
+            raise RuntimeError(
+                f"This engine requires {n_classes}-class weights, but checkpoint has {n_out} outputs.\n"
+                f"Repo used: {repo_id}"
+            )
+
+        F1, D, F2, k1, k2, p1, p2 = _infer_hparams_from_sd(sd, chans=chans)
+        # config.json 값으로 보정(존재 시)
+        k1 = int(cfg.get("kernel_length", k1))
+        k2 = int(cfg.get("sep_length", k2))
+        F1 = int(cfg.get("F1", F1))
+        D  = int(cfg.get("D", D))
+        dropout = float(cfg.get("dropout_rate", 0.3))
+        pool1 = int(cfg.get("pool1", 4)); pool2 = int(cfg.get("pool2", 8))
+
+        model = EEGNetV4Compat(
+            n_classes=n_classes, Chans=chans,
+            k1=k1, k2=k2, F1=F1, D=D, F2=F2,
+            pool1=pool1, pool2=pool2, dropout=dropout
+        ).to(torch_device)
+        model.load_state_dict(sd, strict=True)
+        model.eval()
+        _MODEL_CACHE[key] = model
+        return model, key
+
+# ========================= 설정 객체 =========================
+@dataclass(frozen=True)
+class PreprocProfile:
+    """원신호 → (C,T) 250 Hz 전처리 방식(필터 1–40 Hz / 리샘플은 공통)."""
+    name: str
+    notch: bool = False              # 50/60 Hz 전원 잡음 자동 감지 후 노치(ENV EEG_MAINS 로 고정 가능)
+    average_reference: bool = False  # 평균 기준 재참조
+    robust_timestamps: bool = False  # CSV sfreq 추정 시 IQR 밖 dt 제외
+
+PROFILE_BASIC = PreprocProfile("basic")
+PROFILE_CLEAN = PreprocProfile("clean", notch=True, average_reference=True, robust_timestamps=True)
+
+
+@dataclass(frozen=True)
+class ClassHead:
+    """분류 헤드: 클래스 이름과 subject 집계/다수결 규칙."""
+    name: str
+    class_names: Tuple[str, ...]
+    aggregate: str = "logit_mean"    # logit_mean: 품질가중 보정 로짓 평균→softmax | prob_mean: 품질가중 확률 평균
+    tie_break: str = "index"         # 다수결 동률: index(앞 클래스) | prob(subject 확률 큰 쪽)
+    prior_max: Optional[float] = None  # 클래스 사전확률 상한(정규화 전 clip), None 이면 하한 1e-6 만
+    label_aliases: Dict[str, str] = field(default_factory=lambda: {"C": "CN", "A": "AD", "F": "FTD"})
+
+HEAD_3CLASS = ClassHead("3class", ("CN", "AD", "FTD"), prior_max=1.0)
+HEAD_2CLASS = ClassHead("2class", ("CN", "AD"), aggregate="prob_mean", tie_break="prob")
+
+
+class Calibration:
+    """z = logits / T + s·log(prior) − bias (클래스 순서는 ClassHead.class_names)."""
+    def __init__(self, n_classes: int, temperature: float = 1.0, prior_strength: float = 0.0,
+                 class_prior: Optional[np.ndarray] = None, decision_bias: Optional[np.ndarray] = None):
+        self.temperature = float(temperature)
+        self.prior_strength = float(prior_strength)
+        self.class_prior = class_prior
+        self.decision_bias = decision_bias if decision_bias is not None else np.zeros(n_classes, dtype=np.float32)
+
+    @classmethod
+    def from_config(cls, cfg: Dict, class_names: Tuple[str, ...],
+                    prior_max: Optional[float] = None) -> "Calibration":
+        K = len(class_names)
+        temperature    = float(os.getenv("EEG_TEMP",           cfg.get("temperature", 1.0)))
+        prior_strength = float(os.getenv("EEG_PRIOR_STRENGTH", cfg.get("prior_strength", 0.0)))
+
+        prior_cfg = cfg.get("class_prior", None)
+        env_prior = os.getenv("EEG_CLASS_PRIOR", None)  # 예: "CN:0.34,AD:0.33,FTD:0.33"
+        if env_prior:
+            try:
+                d = {}
+                for kv in env_prior.split(","):
+                    k, v = kv.split(":"); d[k.strip().upper()] = float(v)
+                prior_cfg = d
+            except Exception:
+                pass
+        class_prior = None
+        if prior_cfg:
+            class_prior = np.array([float(prior_cfg.get(c, 1.0 / K)) for c in class_names], dtype=np.float32)
+            class_prior = np.clip(class_prior, 1e-6, prior_max)
+            class_prior /= class_prior.sum()
+
+        bias_cfg = cfg.get("decision_bias", None)
+        env_bias = os.getenv("EEG_DECISION_BIAS", None)  # 예: "0,0.05,-0.05"
+        if env_bias:
+            try: bias_cfg = [float(x) for x in env_bias.split(",")]
+            except Exception: pass
+        decision_bias = None
+        if isinstance(bias_cfg, (list, tuple)) and len(bias_cfg) >= K:
+            decision_bias = np.array(bias_cfg[:K], dtype=np.float32)
+        return cls(K, temperature, prior_strength, class_prior, decision_bias)
+
+    def apply(self, logits: np.ndarray) -> np.ndarray:
+        z = logits / max(1e-3, self.temperature)
+        if self.class_prior is not None and self.prior_strength > 0:
+            z = z + self.prior_strength * np.log(self.class_prior[None, :])
+        return z - self.decision_bias[None, :]
+
+# ========================= 로더/전처리 =========================
+# CSV 채널 정의: eeg_1..4 = [TP9, AF7, AF8, TP10] (EEG_CSV_ORDER / csv_order 로 변경)
+# 학습 순서: ['T5','T6','F7','F8'] = [TP9, TP10, AF7, AF8]
+_MUSE_CSV_ORDER_DEFAULT = ("TP9","AF7","AF8","TP10")
+_MUSE_TRAIN_ORDER = ("T5","T6","F7","F8")
+_MUSE_MAP_DEFAULT = {"TP9":"T5","TP10":"T6","AF7":"F7","AF8":"F8"}
+
+def _parse_csv_order_env(env_val: Optional[str]) -> Tuple[str,str,str,str]:
+    """EEG_CSV_ORDER 환경변수 파싱: 예) "TP9,AF7,AF8,TP10" (4채널 순열이 아니면 기본 순서)"""
+    if not env_val:
+        return _MUSE_CSV_ORDER_DEFAULT
+    items = [s.strip().upper() for s in env_val.split(",") if s.strip()]
+    if len(items) != 4 or set(items) != set(_MUSE_CSV_ORDER_DEFAULT):
+        return _MUSE_CSV_ORDER_DEFAULT
+    return tuple(items)  # type: ignore
+
+def _robust_median_dt(ts: np.ndarray) -> float:
+    dt = np.diff(ts)
+    dt = dt[dt > 0]
+    if dt.size == 0:
+        raise ValueError("Invalid timestamps: non-increasing or empty.")
+    q1, q3 = np.quantile(dt, [0.25, 0.75])
+    iqr = max(1e-9, q3 - q1)
+    low = q1 - 1.5 * iqr
+    high = q3 + 1.5 * iqr
+    dt_clipped = dt[(dt >= max(1e-4, low)) & (dt <= min(1.0, high))]
+    if dt_clipped.size == 0:
+        dt_clipped = dt
+    return float(np.median(dt_clipped))
+
+def _sfreq_from_ts(ts: np.ndarray, profile: PreprocProfile) -> float:
+    if profile.robust_timestamps:
+        return float(1.0 / max(_robust_median_dt(ts), 1e-6))
+    dt = np.diff(ts)
+    return float(1.0 / np.median(dt[dt > 0]))
+
+def _detect_mains_hz_raw(raw: mne.io.BaseRaw, ratio_thresh: float = 3.0) -> int:
+    try:
+        psd = mne.time_frequency.psd_welch(raw, fmin=45, fmax=65, n_fft=4096,
+                                           n_overlap=1024, verbose="ERROR")
+        if isinstance(psd, tuple):
+            psd_vals, freqs = psd
+        else:
+            psd_vals = psd.get_data(); freqs = psd.freqs
+        med = np.median(psd_vals, axis=0)
+        def band_pow(f0, w=1.5):
+            m = (freqs >= f0 - w) & (freqs <= f0 + w)
+            return np.median(med[m]) if m.any() else 0.0
+        p50 = band_pow(50.0); p60 = band_pow(60.0)
+        base = np.median(med[(freqs >= 46) & (freqs <= 64)])
+        r50 = p50 / (base + 1e-9); r60 = p60 / (base + 1e-9)
+        if r50 >= ratio_thresh and r50 >= r60: return 50
+        if r60 >= ratio_thresh and r60 >  r50: return 60
+    except Exception:
+        pass
+    return 0
+
+def _mains_hz(raw: mne.io.BaseRaw, excerpt_sec: Optional[float] = None) -> int:
+    env = os.getenv("EEG_MAINS", "").strip()
+    if env in ("50","60"):
+        return int(env)
+    if excerpt_sec is not None:  # 지연 로딩 Raw: 앞부분만 읽어 판정
+        raw = raw.copy().crop(0.0, min(float(excerpt_sec), float(raw.times[-1]))).load_data(verbose='ERROR')
+    return _detect_mains_hz_raw(raw, ratio_thresh=3.0)
+
+def _maybe_notch(raw: mne.io.BaseRaw):
+    mains = _mains_hz(raw)
+    if mains in (50, 60):
+        try:
+            raw.notch_filter(freqs=[mains], verbose="ERROR")
+        except Exception:
+            pass
+
+def _average_reference(raw: mne.io.BaseRaw):
+    try:
+        raw.set_eeg_reference('average', projection=False, verbose='ERROR')
+    except Exception:
+        pass
+
+def _prep_array(X_ord: np.ndarray, ch_names: List[str], sfreq: float,
+                profile: PreprocProfile) -> Tuple[np.ndarray, float]:
+    """(C,T) 원신호 → 노치(옵션) → 1–40 Hz → 250 Hz → 평균 기준(옵션)"""
+    eeg_profiling.note(n_channels=int(X_ord.shape[0]), n_samples_in=int(X_ord.shape[1]), sfreq_in=float(sfreq))
+    info = mne.create_info(list(ch_names), sfreq=sfreq, ch_types='eeg')
+    raw = mne.io.RawArray(X_ord, info, verbose='ERROR')
+    if profile.notch:
+        with eeg_profiling.stage("notch"):
+            _maybe_notch(raw)
+    with eeg_profiling.stage("filter"):
+        raw.filter(LOW_FREQ, HIGH_FREQ, fir_design='firwin', verbose='ERROR')
+    if abs(sfreq - TARGET_SRATE) > 1e-3:
+        with eeg_profiling.stage("resample"):
+            raw.resample(TARGET_SRATE, verbose='ERROR')
+    if profile.average_reference:
+        with eeg_profiling.stage("reference"):
+            _average_reference(raw)
+    return raw.get_data(), TARGET_SRATE
+
+def _load_muselab_csv(file_path: str, profile: PreprocProfile,
+                      csv_order: Optional[Tuple[str,str,str,str]] = None) -> Tuple[np.ndarray, float]:
+    with eeg_profiling.stage("read"):
+        df = pd.read_csv(file_path)
+    # 필수 컬럼 점검
+    need_cols = ['eeg_1','eeg_2','eeg_3','eeg_4','timestamps']
+    for c in need_cols:
+        if c not in df.columns:
+            raise ValueError(f"CSV column missing: {c}")
+
+    sub = df[need_cols].dropna()
+    ts = sub["timestamps"].to_numpy(dtype=np.float64)
+    # 타임스탬프 정렬
+    if np.any(np.diff(ts) <= 0):
+        sub = sub.sort_values("timestamps")
+        ts = sub["timestamps"].to_numpy(dtype=np.float64)
+    sfreq_est = _sfreq_from_ts(ts, profile)
+
+    X_raw = sub[['eeg_1','eeg_2','eeg_3','eeg_4']].to_numpy(dtype=np.float32).T  # (4, T)
+
+    # 채널 재배열: 입력 CSV의 물리 채널 순서 → 학습 채널 순서 T5,T6,F7,F8 ← [TP9,TP10,AF7,AF8]
+    order = csv_order or _parse_csv_order_env(os.getenv("EEG_CSV_ORDER"))
+    idx_by_name = {name: i for i, name in enumerate(order)}
+    X_ord = np.stack([
+        X_raw[idx_by_name["TP9"], :],   # T5
+        X_raw[idx_by_name["TP10"], :],  # T6
+        X_raw[idx_by_name["AF7"], :],   # F7
+        X_raw[idx_by_name["AF8"], :],   # F8
+    ], axis=0)
+    return _prep_array(X_ord, list(_MUSE_TRAIN_ORDER), sfreq_est, profile)
+
+def _norm(name: str) -> str:
+    return re.sub(r'[^A-Z0-9]', '', str(name).upper())
+
+def _load_device_csv(file_path: str, channels: List[str], profile: PreprocProfile) -> Tuple[np.ndarray, float]:
+    """Muse 외 장치 CSV: 채널명 컬럼(대소문자/기호 무시, 접미 일치 허용) + timestamps(없으면 EEG_CSV_SFREQ)"""
+    with eeg_profiling.stage("read"):
+        df = pd.read_csv(file_path)
+    if 'timestamps' in df.columns:
+        sub = df.dropna(subset=['timestamps']).copy()
+        ts = sub['timestamps'].to_numpy(dtype=np.float64)
+        if np.any(np.diff(ts) <= 0):
+            sub = sub.sort_values('timestamps')
+            ts = sub['timestamps'].to_numpy(dtype=np.float64)
+        sfreq_est = _sfreq_from_ts(ts, profile)
+    else:
+        sub = df.copy()
+        sfreq_est = float(os.getenv("EEG_CSV_SFREQ", TARGET_SRATE))
+
+    norm2orig = { _norm(c): c for c in sub.columns }
+    X_list, missing = [], []
+    for ch in channels:
+        key = _norm(ch)
+        if key in norm2orig:
+            X_list.append(sub[norm2orig[key]].to_numpy(dtype=np.float32))
+        else:
+            cand = None
+            for k, orig in norm2orig.items():
+                if k.endswith(key):
+                    cand = orig; break
+            if cand is not None:
+                X_list.append(sub[cand].to_numpy(dtype=np.float32))
+            else:
+                missing.append(ch)
+    if missing:
+        raise ValueError(f"CSV missing channels: {missing} / expected={channels}")
+
+    X_ord = np.stack(X_list, axis=0)
+    return _prep_array(X_ord, channels, sfreq_est, profile)
+
+def _load_recording(file_path: str, device_type: str, channels: List[str],
+                    profile: PreprocProfile) -> Tuple[np.ndarray, float]:
+    """
+    .eegr 컨테이너(memmap)에서 필요한 채널만 읽기.
+    Muse 녹화는 물리 채널명(TP9/AF7/AF8/TP10)으로 저장 → 학습 순서로 이름 기준 재배열,
+    .set 변환본은 학습 채널명 그대로 사용.
+    """
+    if device_type == "muse":
+        train2phys = {v: k for k, v in _MUSE_MAP_DEFAULT.items()}
+        phys = [train2phys[ch] for ch in _MUSE_TRAIN_ORDER]  # TP9,TP10,AF7,AF8
+        try:
+            with eeg_profiling.stage("read"):
+                X_ord, sfreq, _ = eeg_recording.read_channels(file_path, phys)
+        except ValueError:
+            with eeg_profiling.stage("read"):
+                X_ord, sfreq, _ = eeg_recording.read_channels(file_path, list(_MUSE_TRAIN_ORDER))
+        return _prep_array(X_ord, list(_MUSE_TRAIN_ORDER), sfreq, profile)
+    with eeg_profiling.stage("read"):
+        X_ord, sfreq, _ = eeg_recording.read_channels(file_path, channels)
+    return _prep_array(X_ord, channels, sfreq, profile)
+
+def _load_set(file_path: str, channels: List[str], profile: PreprocProfile) -> Tuple[np.ndarray, float]:
+    """EEGLAB .set 지연 로딩: 채널 선택/구간 crop 후 필요한 샘플만 읽음(긴 녹화는 블록 스트리밍)"""
+    with eeg_profiling.stage("read"):
+        raw = eeg_recording.open_set_lazy(file_path, channels)
+    eeg_profiling.note(n_channels=len(raw.ch_names), n_samples_in=int(raw.n_times),
+                       sfreq_in=float(raw.info['sfreq']))
+    if eeg_recording.needs_streaming(raw):
+        notch_freqs = None
+        if profile.notch:
+            with eeg_profiling.stage("notch"):
+                mains = _mains_hz(raw, excerpt_sec=60.0)
+            notch_freqs = [mains] if mains in (50, 60) else None
+        data = eeg_recording.stream_filter_resample(raw, LOW_FREQ, HIGH_FREQ, TARGET_SRATE,
+                                                    notch_freqs=notch_freqs)
+        if profile.average_reference:
+            with eeg_profiling.stage("reference"):
+                data = data - data.mean(axis=0, keepdims=True)  # 평균 기준
+        return data, TARGET_SRATE
+    with eeg_profiling.stage("read"):
+        raw.load_data(verbose='ERROR')
+    if profile.notch:
+        with eeg_profiling.stage("notch"):
+            _maybe_notch(raw)
+    with eeg_profiling.stage("filter"):
+        raw.filter(LOW_FREQ, HIGH_FREQ, fir_design='firwin', verbose='ERROR')
+    with eeg_profiling.stage("resample"):
+        raw.resample(TARGET_SRATE, verbose='ERROR')
+    if profile.average_reference:
+        with eeg_profiling.stage("reference"):
+            _average_reference(raw)
+    return raw.get_data(), TARGET_SRATE
+
+def _order_array(X: np.ndarray, ch_names: List[str], device_type: str, channels: List[str]) -> np.ndarray:
+    """메모리 배열(C,T) → 모델 채널 순서. Muse 물리 채널명(TP9/AF7/AF8/TP10)은 학습 채널명으로 치환."""
+    names = [str(c).strip().upper() for c in ch_names]
+    if device_type == "muse":
+        names = [_MUSE_MAP_DEFAULT.get(n, n) for n in names]
+    idx = {n: i for i, n in enumerate(names)}
+    miss = [ch for ch in channels if ch.upper() not in idx]
+    if miss:
+        raise ValueError(f"Channels missing in array: {miss}\nPresent: {list(ch_names)}\nExpected: {channels}")
+    return np.asarray(X)[[idx[ch.upper()] for ch in channels], :]
+
+def _softmax_np(x: np.ndarray) -> np.ndarray:
+    x = x - np.max(x, axis=-1, keepdims=True)
+    e = np.exp(x)
+    return e / (np.sum(e, axis=-1, keepdims=True) + 1e-12)
+
+# ========================= 엔진 코어 =========================
+class EEGEngineCore:
+    """
+    공용 추론 엔진. 호환 래퍼는 head/profile 클래스 속성과 _repo_candidates() 만 정의.
+    device_type: 'muse' | 'hybrid_black' | 'union10' | 'total19'
+    version    : HF 레포 Ver (문자열)
+    comment    : HF 레포 코멘트 (옵션)
+    csv_order  : Muse CSV의 물리 채널 이름 순서 (TP9,AF7,AF8,TP10), 기본값은 환경변수 EEG_CSV_ORDER 또는 표준 순서
+    """
+    head: ClassHead = HEAD_3CLASS
+    profile: PreprocProfile = PROFILE_BASIC
+
+    def __init__(self, device_type: str, version: str,
+                 comment: Optional[str] = None,
+                 torch_device: Optional[str] = None,
+                 hf_token: Optional[str] = None,
+                 csv_order: Optional[Tuple[str,str,str,str]] = None):
+        self.device_type = device_type.lower().strip()
+        if self.device_type not in CHANNEL_GROUPS:
+            raise ValueError(f"Unknown device_type '{self.device_type}'. Choose one of {list(CHANNEL_GROUPS.keys())}")
+
+        self.channels = CHANNEL_GROUPS[self.device_type]
+        self.torch_device = torch_device or ('cuda' if torch.cuda.is_available() else 'cpu')
+        self.version = str(version).strip()
+        self.comment = comment
+        self.hf_token = hf_token or os.getenv("HF_TOKEN", None)
+        self.csv_order = csv_order  # only used for Muse .csv inputs
+
+        # HF 가중치: 후보 레포를 순서대로 시도
+        candidates = self._repo_candidates()
+        last_err = None
+        for rid in candidates:
+            try:
+                weights_path, cfg = _hf_download(rid, token=self.hf_token)
+                self.repo_used = rid
+                break
+            except Exception as e:
+                last_err = e
+        else:
+            raise FileNotFoundError(
+                f"Failed to download {self.head.name} weights. Tried:\n  - " +
+                "\n  - ".join(candidates) +
+                (f"\nOriginal error: {repr(last_err)}" if last_err else "")
+            )
+
+        self.weights_path = weights_path
+        self.model, self.model_key = _load_model(weights_path, cfg, len(self.head.class_names),
+                                                 len(self.channels), self.torch_device, self.repo_used)
+        self.batcher = None  # eeg_batching.MicroBatcher (app 에서 연결, 옵션)
+        self._tls = threading.local()  # 실행기 스레드별 eeg_batching.ForwardBuffers
+        self.calibration = Calibration.from_config(cfg, self.head.class_names, self.head.prior_max)
+
+    def _repo_candidates(self) -> List[str]:
+        base = f"{HF_OWNER}/EEGNetV4-{len(self.channels)}ch-{self.device_type}-{self.version}"
+        return [f"{base}-{self.comment}" if self.comment else base]
+
+    def fingerprint(self) -> Dict:
+        """결과에 영향을 주는 설정 전부(결과 캐시 키). 가중치/캘리브레이션/전처리 ENV 가 바뀌면 값이 달라짐."""
+        cal = self.calibration
+        return {
+            "head": self.head.name, "classes": list(self.head.class_names),
+            "aggregate": self.head.aggregate, "tie_break": self.head.tie_break,
+            "profile": [self.profile.name, self.profile.notch, self.profile.average_reference,
+                        self.profile.robust_timestamps],
+            "repo": self.repo_used, "device": self.device_type,
+            "weights_sha256": eeg_result_cache.file_digest(self.weights_path),
+            "calibration": {
+                "temperature": cal.temperature, "prior_strength": cal.prior_strength,
+                "class_prior": (None if cal.class_prior is None else [float(v) for v in cal.class_prior]),
+                "decision_bias": [float(v) for v in cal.decision_bias],
+            },
+            "csv_order": list(self.csv_order or _parse_csv_order_env(os.getenv("EEG_CSV_ORDER"))),
+            "band": [LOW_FREQ, HIGH_FREQ, TARGET_SRATE],
+            "segments": [SEG_SECONDS, EVAL_HOP_SEC, WINDOW_NEED_SECONDS],
+            "mains": os.getenv("EEG_MAINS", "").strip(),
+            "csv_sfreq": os.getenv("EEG_CSV_SFREQ", ""),
+            "set": [eeg_recording.SET_MAX_SECONDS, eeg_recording.SET_STREAM_SECONDS, eeg_recording.SET_BLOCK_SECONDS],
+            "artifacts": eeg_artifacts.config(),
+        }
+
+    # ----- 내부 보조 -----
+    def _apply_calib(self, logits: np.ndarray) -> np.ndarray:
+        return self.calibration.apply(logits)
+
+    def _segment_probs(self, logits: np.ndarray) -> np.ndarray:
+        """세그먼트 로짓 (N,K) → 보정 확률 (N,K)"""
+        return _softmax_np(self._apply_calib(logits))
+
+    def _choose_best_window(self, probs_all: np.ndarray, need: int,
+                            weights: Optional[np.ndarray] = None) -> Tuple[int, int]:
+        """top-1 확률 합(아티팩트 가중치가 있으면 곱해서)이 가장 큰 연속 need 개 구간(동률이면 앞쪽)"""
+        top1 = probs_all.max(axis=1)
+        if weights is not None:
+            top1 = top1 * weights
+        cs = np.concatenate([[0.0], np.cumsum(top1)])
+        return int(np.argmax(cs[need:] - cs[:-need])), need
+
+    def _majority(self, counts: np.ndarray, subj_prob: np.ndarray) -> int:
+        top = np.flatnonzero(counts == counts.max())
+        if len(top) > 1 and self.head.tie_break == "prob":
+            return int(top[np.argmax(subj_prob[top])])
+        return int(top[0])
+
+    def _forward(self, segs_z: np.ndarray, out: np.ndarray) -> np.ndarray:
+        """(N,C,T) → 로짓을 out (N,K) float32 에 기록. batcher(eeg_batching.MicroBatcher)가 붙어 있으면 요청 간 배칭 사용."""
+        if self.batcher is not None:
+            return self.batcher.forward(segs_z, out)
+        bufs = getattr(self._tls, "buffers", None)
+        if bufs is None:
+            bufs = self._tls.buffers = eeg_batching.ForwardBuffers(self.model, self.torch_device, BATCH_SIZE)
+        bufs.forward_into([segs_z], [out])
+        return out
+
+    def _read_any(self, file_path: str) -> Tuple[np.ndarray, float]:
+        ext = os.path.splitext(file_path)[-1].lower()
+        if ext == ".csv":
+            if self.device_type == "muse":
+                return _load_muselab_csv(file_path, self.profile, csv_order=self.csv_order)
+            return _load_device_csv(file_path, self.channels, self.profile)
+        elif ext == eeg_recording.RECORDING_EXT:
+            return _load_recording(file_path, self.device_type, self.channels, self.profile)
+        elif ext == ".set":
+            return _load_set(file_path, self.channels, self.profile)
+        else:
+            raise ValueError(f"Unsupported file type: {ext}")
+
+    # ----- 공개 API -----
+    @torch.no_grad()
+    def infer(self, file_path: str,
+              subject_id: Optional[str] = None,
+              true_label: Optional[str] = None,
+              enforce_two_minutes: bool = True,
+              timer: Optional[eeg_profiling.StageTimer] = None,
+              timeline=None) -> Dict:
+        """
+        timer   : 단계별 시간/크기 기록(eeg_profiling.StageTimer, 옵션)
+        timeline: 세그먼트별 확률 타임라인 포함 여부/형식(None | True | 'f16' | 'json', eeg_timeline)
+        """
+        with eeg_profiling.activate(timer):
+            return self._infer(file_path, subject_id, true_label, enforce_two_minutes,
+                               eeg_timeline.parse_format(timeline))
+
+    def _infer(self, file_path: str,
+               subject_id: Optional[str],
+               true_label: Optional[str],
+               enforce_two_minutes: bool,
+               timeline: Optional[str] = None,
+               source=None) -> Dict:
+        """source: fingerprint()/_infer_segments() 제공 객체(기본 self, 앙상블은 자기 자신을 넘김)"""
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"EEG file not found: {file_path}")
+        source = source or self
+
+        # 결과 캐시: 같은 파일 내용 + 같은 엔진 설정이면 전처리/추론 생략
+        cache = eeg_result_cache.get_cache()
+        if cache is not None:
+            with eeg_profiling.stage("cache"):
+                key = (eeg_result_cache.file_digest(file_path),
+                       eeg_result_cache.config_digest(source.fingerprint()), bool(enforce_two_minutes))
+                res = cache.get(*key)
+            # 타임라인은 요청 때만 인코딩 → 타임라인 없이 저장된 항목이면 다시 계산해 교체
+            if res is not None and (timeline is None or "timeline" in res):
+                eeg_profiling.note(cache="hit")
+                return self._request_fields(dict(res, cached=True), file_path, subject_id, true_label, timeline)
+            eeg_profiling.note(cache="miss")
+
+        data, srate = self._read_any(file_path)
+        res = source._infer_segments(data, srate, enforce_two_minutes, timeline is not None)
+        if cache is not None:
+            cache.put(*key, engine=self.head.name, result=res)
+            res["cached"] = False
+        return self._request_fields(res, file_path, subject_id, true_label, timeline)
+
+    @torch.no_grad()
+    def infer_array(self, X: np.ndarray, sfreq: float, ch_names: List[str],
+                    subject_id: Optional[str] = None,
+                    true_label: Optional[str] = None,
+                    enforce_two_minutes: bool = True,
+                    timer: Optional[eeg_profiling.StageTimer] = None,
+                    timeline=None) -> Dict:
+        """메모리 배열 (C,T) 원신호 추론(워커 풀 공유메모리 입력 등). 전처리는 파일 입력과 동일."""
+        with eeg_profiling.activate(timer):
+            return self._infer_array(X, sfreq, ch_names, subject_id, true_label, enforce_two_minutes,
+                                     eeg_timeline.parse_format(timeline))
+
+    def _infer_array(self, X: np.ndarray, sfreq: float, ch_names: List[str],
+                     subject_id: Optional[str],
+                     true_label: Optional[str],
+                     enforce_two_minutes: bool,
+                     timeline: Optional[str] = None,
+                     source=None) -> Dict:
+        X_ord = _order_array(X, ch_names, self.device_type, self.channels)
+        data, srate = _prep_array(X_ord, list(self.channels), float(sfreq), self.profile)
+        res = (source or self)._infer_segments(data, srate, enforce_two_minutes, timeline is not None)
+        return self._request_fields(res, None, subject_id, true_label, timeline)
+
+    def _infer_segments(self, data: np.ndarray, srate: float, enforce_two_minutes: bool,
+                        timeline: bool = False) -> Dict:
+        """
+        전처리된 (C,T) 250 Hz 신호 → 입력 파일/요청과 무관한 결과(결과 캐시에 저장되는 부분)
+        timeline: True 면 세그먼트 타임라인(f16)도 인코딩해 res["timeline"] 에 포함
+        """
+        # 세그먼트는 연속 신호 위 view, 정규화/forward 는 BATCH_SIZE 단위(eeg_segments)
+        pipe = self._pipeline(data, srate, enforce_two_minutes)
+        # batched logits (zscore/segment/forward 단계는 파이프라인 안에서 기록)
+        logits_all = pipe.forward_all(self._forward, BATCH_SIZE, len(self.head.class_names))
+        return self._aggregate(logits_all, pipe, timeline=timeline)
+
+    def _pipeline(self, data: np.ndarray, srate: float, enforce_two_minutes: bool) -> eeg_segments.SegmentPipeline:
+        pipe = eeg_segments.SegmentPipeline(data, srate, SEG_SECONDS, EVAL_HOP_SEC)
+        need = int((WINDOW_NEED_SECONDS - SEG_SECONDS) / EVAL_HOP_SEC) + 1  # = 47
+        N = pipe.n_segments
+        if N == 0:
+            raise ValueError("No segments could be formed from the recording.")
+        if enforce_two_minutes and N < need:
+            raise ValueError(f"Too short for 2-minute window: need {need}, got {N}")
+        eeg_profiling.note(n_samples=int(data.shape[1]), n_segments=int(N), batch_size=int(BATCH_SIZE),
+                           n_batches=int(-(-N // BATCH_SIZE)))
+        return pipe
+
+    def _select_window(self, probs_all: np.ndarray, pipe: eeg_segments.SegmentPipeline) -> Tuple[int, int]:
+        """2분 윈도우 (시작 세그먼트, 세그먼트 수). 세그먼트가 모자라면 전체"""
+        need = int((WINDOW_NEED_SECONDS - SEG_SECONDS) / EVAL_HOP_SEC) + 1
+        if pipe.n_segments < need:
+            return 0, pipe.n_segments
+        return self._choose_best_window(probs_all, need, pipe.artifact_weights())
+
+    def _aggregate(self, logits_all: np.ndarray, pipe: eeg_segments.SegmentPipeline,
+                   offset_sec: float = 0.0, timeline: bool = False) -> Dict:
+        """
+        세그먼트 로짓 (N,K) → 캘리브레이션 → 윈도우 선택 → subject 집계. offset_sec: 세그먼트 격자 시작 시각
+        timeline: 녹화 전체 세그먼트 타임라인 인코딩 여부(요청한 경우만 — 앙상블 멤버×격자 집계는 끔)
+        """
+        names = self.head.class_names
+        K = len(names)
+        N = pipe.n_segments
+        with eeg_profiling.stage("window"):
+            z_all = self._apply_calib(logits_all)
+            probs_all = _softmax_np(z_all)
+            s_best, use = self._select_window(probs_all, pipe)
+
+            # 세그먼트 지표
+            block_probs = probs_all[s_best:s_best+use]
+            y_pred = block_probs.argmax(axis=1)
+            cnt = np.bincount(y_pred, minlength=K)
+            counts = {names[i]: int(cnt[i]) for i in range(K)}
+
+            # subject-level: 품질가중 집계
+            w = pipe.quality_weights(s_best, use)
+            if self.head.aggregate == "prob_mean":
+                w = w / (float(w.sum()) + 1e-8)
+                subj_prob = (block_probs * w[:, None]).sum(axis=0)
+            else:
+                wsum = float(w.sum()) + 1e-8
+                subj_logit = (z_all[s_best:s_best+use] * w[:, None]).sum(axis=0) / wsum
+                subj_prob = _softmax_np(subj_logit[None, :])[0]
+            maj_idx = self._majority(cnt, subj_prob)
+
+        res = {
+            "channels_used": self.channels,
+            "n_segments": int(use),
+            "prob_mean": {names[i]: float(subj_prob[i]) for i in range(K)},
+            "segment_counts": counts,
+            "segment_majority_index": maj_idx,
+            "segment_majority_label": names[maj_idx],
+            "window": {"start": int(s_best * EVAL_HOP_SEC + offset_sec), "need": int(WINDOW_NEED_SECONDS)},
+            "repo_used": self.repo_used,
+        }
+        if timeline:
+            # 녹화 전체 세그먼트 타임라인(같은 probs_all 재사용)
+            with eeg_profiling.stage("timeline"):
+                res["timeline"] = eeg_timeline.encode(probs_all, pipe.quality_weights(0, N), offset_sec,
+                                                      EVAL_HOP_SEC, SEG_SECONDS, names, (s_best, use))
+        if pipe.artifacts is not None:
+            res["artifacts"] = pipe.artifacts.summary(s_best, use)
+            eeg_profiling.note(artifact_segments=res["artifacts"]["flagged"])
+        return res
+
+    def _request_fields(self, res: Dict, file_path: Optional[str],
+                        subject_id: Optional[str], true_label: Optional[str],
+                        timeline: Optional[str] = None) -> Dict:
+        """요청별 필드(file_path / subject_id / segment_accuracy / timeline 형식) 채움"""
+        tl = eeg_timeline.render(res.pop("timeline", None), timeline)
+        if tl is not None:
+            res["timeline"] = tl
+
+        # (옵션) 세그 정확도 = 선택 윈도우에서 정답 클래스로 예측된 세그먼트 비율
+        seg_acc = None
+        if true_label:
+            tl = str(true_label).strip().upper()
+            tl = self.head.label_aliases.get(tl, tl)
+            if tl in self.head.class_names:
+                seg_acc = float(res["segment_counts"][tl] / res["n_segments"])
+
+        # subject_id 추정
+        sid = subject_id
+        if not sid:
+            m = re.search(r"(sub-\d+)", file_path or "", flags=re.IGNORECASE)
+            sid = m.group(1) if m else None
+
+        res.update(file_path=file_path, segment_accuracy=seg_acc, subject_id=sid)
+        return res
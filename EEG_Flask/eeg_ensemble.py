@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+eeg_ensemble.py
+- (옵트인) 앙상블/TTA: 같은 장치(CHANNEL_GROUPS)의 여러 가중치 버전 × 시간 이동 세그먼트 격자
+- 전처리는 1회(멤버 공통 프로파일) → 격자마다 정규화 배치를 한 번 만들어 모든 멤버 forward 에 재사용
+  (SegmentPipeline.forward_many, 멤버별 MicroBatcher 가 있으면 그대로 사용)
+- 멤버×격자마다 단일 엔진과 같은 집계(캘리브레이션/2분 윈도우/품질가중) 후 subject 확률을 평균
+  · prob : 산술 평균
+  · logit: log 확률 평균 → softmax(정규화 기하평균 = subject 로짓 평균)
+- 타임라인(요청 시에만 1번 인코딩): 기본 격자에서 멤버별 세그먼트 확률을 같은 방식으로 평균
+- 비용 상한: 멤버 수 × 격자 수 ≤ EEG_ENSEMBLE_MAX_PASSES, 실제 패스 수는 결과/타이머에 기록
+"""
+from __future__ import annotations
+import os
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import torch
+
+import eeg_profiling
+import eeg_timeline
+from eeg_engine_core import EEGEngineCore, BATCH_SIZE, EVAL_HOP_SEC, SEG_SECONDS, _softmax_np
+
+# ========================= 설정 =========================
+ENSEMBLE_MAX_PASSES = int(os.getenv("EEG_ENSEMBLE_MAX_PASSES", "8"))
+ENSEMBLE_AVERAGE    = os.getenv("EEG_ENSEMBLE_AVERAGE", "prob").strip().lower()
+AVERAGE_MODES       = ("prob", "logit")
+
+
+def tta_offsets(n: int, hop_sec: float = EVAL_HOP_SEC) -> List[float]:
+    """격자 n개: 0, hop/n, 2·hop/n, ... (초). n=1 이면 기본 격자만."""
+    n = max(1, int(n))
+    return [k * hop_sec / n for k in range(n)]
+
+
+class EnsembleEngine:
+    """
+    ens = EnsembleEngine([eng_52, eng_53], tta=2, average="logit")
+    ens.infer(path) / ens.infer_array(X, sfreq, ch_names) → 단일 엔진과 같은 결과 형식 + result["ensemble"]
+    - 엔진 상속 없이 멤버를 감쌈: 파일 로드/전처리/결과 캐시/요청 필드는 첫 멤버(members[0]) 코어 경로에 위임
+      (첫 멤버의 장치·전처리·CSV 순서), 앙상블은 fingerprint()/_infer_segments() 만 제공
+    """
+    def __init__(self, members: Sequence[EEGEngineCore], tta: int = 1, average: Optional[str] = None):
+        uniq: Dict[tuple, EEGEngineCore] = {}
+        for m in members:  # 같은 가중치를 두 번 넣어도 패스는 1번
+            uniq.setdefault(m.model_key, m)
+        members = list(uniq.values())
+        if not members:
+            raise ValueError("Ensemble needs at least one member engine")
+        first = members[0]
+        for m in members[1:]:
+            if (m.device_type, m.head, m.profile) != (first.device_type, first.head, first.profile):
+                raise ValueError("Ensemble members must share device, class head and preprocessing profile")
+        average = (average or ENSEMBLE_AVERAGE).strip().lower()
+        if average not in AVERAGE_MODES:
+            raise ValueError(f"Unknown ensemble average '{average}'. Choose one of {list(AVERAGE_MODES)}")
+        offsets = tta_offsets(tta)
+        passes = len(members) * len(offsets)
+        if passes > ENSEMBLE_MAX_PASSES:
+            raise ValueError(f"Ensemble too large: {len(members)} members x {len(offsets)} shifts = {passes} passes "
+                             f"(EEG_ENSEMBLE_MAX_PASSES={ENSEMBLE_MAX_PASSES})")
+
+        self.members = list(members)
+        self.offsets = offsets
+        self.average = average
+
+    # ----- 공개 API (단일 엔진과 같은 시그니처) -----
+    @torch.no_grad()
+    def infer(self, file_path: str,
+              subject_id: Optional[str] = None,
+              true_label: Optional[str] = None,
+              enforce_two_minutes: bool = True,
+              timer: Optional[eeg_profiling.StageTimer] = None,
+              timeline=None) -> Dict:
+        with eeg_profiling.activate(timer):
+            return self.members[0]._infer(file_path, subject_id, true_label, enforce_two_minutes,
+                                          eeg_timeline.parse_format(timeline), source=self)
+
+    @torch.no_grad()
+    def infer_array(self, X: np.ndarray, sfreq: float, ch_names: List[str],
+                    subject_id: Optional[str] = None,
+                    true_label: Optional[str] = None,
+                    enforce_two_minutes: bool = True,
+                    timer: Optional[eeg_profiling.StageTimer] = None,
+                    timeline=None) -> Dict:
+        with eeg_profiling.activate(timer):
+            return self.members[0]._infer_array(X, sfreq, ch_names, subject_id, true_label, enforce_two_minutes,
+                                                eeg_timeline.parse_format(timeline), source=self)
+
+    def fingerprint(self) -> Dict:
+        return {"members": [m.fingerprint() for m in self.members],
+                "tta_offsets": self.offsets, "average": self.average}
+
+    def _combine(self, P: np.ndarray) -> np.ndarray:
+        """멤버 축(0) 평균: prob 산술 / logit 기하(log 평균 → softmax)"""
+        if self.average == "logit":
+            return _softmax_np(np.log(np.clip(P, 1e-12, None)).mean(axis=0))
+        return P.mean(axis=0)
+
+    def _infer_segments(self, data: np.ndarray, srate: float, enforce_two_minutes: bool,
+                        timeline: bool = False) -> Dict:
+        first = self.members[0]
+        names = first.head.class_names
+        K = len(names)
+        runs = []  # (멤버, 격자 시작 초, 멤버 집계 결과)
+        base = None  # 기본 격자 (pipe, 멤버별 로짓) → 타임라인
+        for off in self.offsets:
+            o = int(round(off * srate))
+            # 2분 요건은 기본 격자에서만 확인(이동 격자는 끝 세그먼트 1개가 빠질 수 있음)
+            pipe = first._pipeline(data[:, o:], srate, enforce_two_minutes and o == 0)
+            logits = pipe.forward_many([m._forward for m in self.members], BATCH_SIZE, K)
+            if base is None:
+                base = (pipe, logits)
+            for m, lg in zip(self.members, logits):
+                runs.append((m, off, m._aggregate(lg, pipe, offset_sec=off)))  # 타임라인은 아래에서 1번만
+
+        with eeg_profiling.stage("ensemble"):
+            P = np.array([[r["prob_mean"][c] for c in names] for _, _, r in runs], dtype=np.float64)
+            prob = self._combine(P)
+            cnt = np.array([sum(r["segment_counts"][c] for _, _, r in runs) for c in names])
+            maj_idx = first._majority(cnt, prob)
+        eeg_profiling.note(ensemble_members=len(self.members), ensemble_shifts=len(self.offsets),
+                           ensemble_passes=len(runs))
+
+        res = dict(runs[0][2])  # channels_used / window / repo_used 는 첫 멤버·기본 격자 기준
+        res.update({
+            "n_segments": int(cnt.sum()),  # 멤버×격자 세그먼트 투표 수 합(segment_counts 와 같은 기준)
+            "prob_mean": {names[i]: float(prob[i]) for i in range(K)},
+            "segment_counts": {names[i]: int(cnt[i]) for i in range(K)},
+            "segment_majority_index": maj_idx,
+            "segment_majority_label": names[maj_idx],
+            "ensemble": {
+                "average": self.average,
+                "tta_offsets_sec": self.offsets,
+                "passes": len(runs),
+                "members": [{"repo": m.repo_used, "offset_sec": off, "n_segments": r["n_segments"],
+                             "window": r["window"], "prob_mean": r["prob_mean"],
+                             "segment_majority_label": r["segment_majority_label"]} for m, off, r in runs],
+            },
+        })
+        if timeline:
+            # 기본 격자 멤버별 세그먼트 확률 평균, 2분 윈도우는 첫 멤버·기본 격자 기준
+            with eeg_profiling.stage("timeline"):
+                pipe, logits = base
+                probs = [m._segment_probs(lg) for m, lg in zip(self.members, logits)]
+                res["timeline"] = eeg_timeline.encode(self._combine(np.stack(probs)),
+                                                      pipe.quality_weights(0, pipe.n_segments), 0.0, EVAL_HOP_SEC,
+                                                      SEG_SECONDS, names, first._select_window(probs[0], pipe))
+        return res
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+eeg_executor.py
+- Flask 멀티스레드 요청의 추론을 고정 개수 워커 스레드로 직렬화하는 실행기
+- 워커마다 torch.set_num_threads(EEG_TORCH_THREADS) → 동시 요청이 코어를 과점유하지 않음
+- 대기열(EEG_INFER_QUEUE)이 가득 차면 즉시 ExecutorBusy → API 는 503 + Retry-After 로 응답
+- 워커 × 스레드 분할은 ENV 로 조정: 처리량 위주(워커↑ 스레드↓) / 단건 지연 위주(워커↓ 스레드↑)
+"""
+from __future__ import annotations
+import os, time, queue, threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+import eeg_profiling
+
+# ========================= 설정 =========================
+_CPU = os.cpu_count() or 1
+TORCH_THREADS = int(os.getenv("EEG_TORCH_THREADS", str(max(1, min(4, _CPU // 2)))))
+INFER_WORKERS = int(os.getenv("EEG_INFER_WORKERS", str(max(1, _CPU // max(1, TORCH_THREADS)))))
+INFER_QUEUE   = int(os.getenv("EEG_INFER_QUEUE", str(4 * INFER_WORKERS)))
+
+QUEUE_WAIT = eeg_profiling.REGISTRY.histogram(
+    "eeg_executor_queue_wait_seconds", "Time a job waited for an inference worker")
+JOBS = eeg_profiling.REGISTRY.counter(
+    "eeg_executor_jobs_total", "Inference executor jobs by outcome", ("status",))
+
+
+class ExecutorBusy(RuntimeError):
+    """대기열이 가득 참(backpressure) → 호출 측은 503 으로 응답."""
+
+
+class InferenceExecutor:
+    """
+    ex = InferenceExecutor(); result = ex.run(engine.infer, path, timer=t)
+    - submit(): Future 반환, 대기열 초과 시 ExecutorBusy
+    - 워커 스레드는 첫 submit 때 시작(import 시점 부작용 없음)
+    """
+    def __init__(self, workers: int = INFER_WORKERS, torch_threads: int = TORCH_THREADS,
+                 max_queue: int = INFER_QUEUE, name: str = "eeg-infer"):
+        self.workers = max(1, int(workers))
+        self.torch_threads = max(1, int(torch_threads))
+        self.max_queue = max(1, int(max_queue))
+        self.name = name
+        self._q: "queue.Queue" = queue.Queue(maxsize=self.max_queue)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            # 전역 intra-op 풀도 워커당 스레드 수로 제한(OpenMP 는 스레드별 설정, 네이티브 풀은 전역)
+            import torch  # app 기동 시 torch import 지연(첫 작업 또는 warm-up 때 로드)
+            torch.set_num_threads(self.torch_threads)
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _worker(self):
+        import torch
+        torch.set_num_threads(self.torch_threads)
+        while True:
+            item = self._q.get()
+            if item is None:
+                break
+            fut, fn, args, kwargs, t_enq = item
+            if not fut.set_running_or_notify_cancel():
+                continue
+            QUEUE_WAIT.observe(time.perf_counter() - t_enq)
+            with self._lock:
+                self._active += 1
+            try:
+                fut.set_result(fn(*args, **kwargs))
+                ok = True
+            except BaseException as e:
+                fut.set_exception(e)
+                ok = False
+            with self._lock:
+                self._active -= 1
+                if ok: self._completed += 1
+                else:  self._failed += 1
+            JOBS.inc(status=("ok" if ok else "error"))
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        self._ensure_started()
+        fut: Future = Future()
+        try:
+            self._q.put_nowait((fut, fn, args, kwargs, time.perf_counter()))
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            JOBS.inc(status="rejected")
+            raise ExecutorBusy(f"inference queue full ({self.max_queue} waiting, {self.workers} workers)")
+        return fut
+
+    def run(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs):
+        return self.submit(fn, *args, **kwargs).result(timeout=timeout)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "torch_threads": self.torch_threads,
+                "max_queue": self.max_queue,
+                "queued": self._q.qsize(),
+                "active": self._active,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self):
+        for _ in self._threads:
+            self._q.put(None)
+        for t in self._threads:
+            t.join(timeout=5.0)
+        self._threads = []
+
+
+_DEFAULT: Optional[InferenceExecutor] = None
+_DEFAULT_LOCK = threading.Lock()
+
+def get_executor() -> InferenceExecutor:
+    """프로세스 공용 실행기(ENV 설정 사용)."""
+    global _DEFAULT
+    if _DEFAULT is None:
+        with _DEFAULT_LOCK:
+            if _DEFAULT is None:
+                _DEFAULT = InferenceExecutor()
+    return _DEFAULT
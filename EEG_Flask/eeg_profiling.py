@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+eeg_profiling.py
+- 추론 단계별 타이밍(StageTimer): read / filter / resample / segment / zscore / forward / window ...
+- 엔진/로더는 stage("이름") 컨텍스트만 호출 → 활성 타이머가 없으면 no-op
+- Prometheus 텍스트 포맷 카운터/게이지/히스토그램 레지스트리(REGISTRY) → Flask /metrics
+- 요청 단위 trace 캡처(cProfile .prof / torch.profiler chrome trace .json)
+"""
+from __future__ import annotations
+import os, time, threading, contextvars
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Tuple, Optional, Iterator
+
+# ========================= 단계 타이머 =========================
+class StageTimer:
+    """
+    같은 이름의 단계는 누적(블록 스트리밍/배치 forward 등), 호출 횟수도 함께 기록.
+    sizes 에는 입력/세그먼트 크기 등 단계 비용을 해석하는 데 필요한 값만 담는다.
+    """
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.t_end: Optional[float] = None
+        self.stages: Dict[str, float] = {}   # 초 단위, 첫 호출 순서 유지
+        self.calls: Dict[str, int] = {}
+        self.sizes: Dict[str, object] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - t)
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def add(self, name: str, seconds: float):
+        """컨텍스트 밖에서 잰 구간(예: 실행기 대기열 대기) 기록."""
+        self.stages[name] = self.stages.get(name, 0.0) + float(seconds)
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def merge(self, stages: Dict[str, float], calls: Dict[str, int], sizes: Dict[str, object]):
+        """다른 프로세스(워커 풀)에서 잰 단계 결과를 합침."""
+        for name, sec in stages.items():
+            self.stages[name] = self.stages.get(name, 0.0) + float(sec)
+            self.calls[name] = self.calls.get(name, 0) + int(calls.get(name, 1))
+        self.sizes.update(sizes)
+
+    def note(self, **kv):
+        self.sizes.update(kv)
+
+    def stop(self):
+        if self.t_end is None:
+            self.t_end = time.perf_counter()
+
+    @property
+    def total_seconds(self) -> float:
+        return (self.t_end or time.perf_counter()) - self.t0
+
+    def as_dict(self) -> Dict:
+        return {
+            "total_ms": round(self.total_seconds * 1000.0, 3),
+            "stages_ms": {k: round(v * 1000.0, 3) for k, v in self.stages.items()},
+            "calls": dict(self.calls),
+            "sizes": dict(self.sizes),
+        }
+
+
+_CURRENT: contextvars.ContextVar = contextvars.ContextVar("eeg_stage_timer", default=None)
+
+@contextmanager
+def activate(timer: Optional[StageTimer]) -> Iterator[Optional[StageTimer]]:
+    """현재 스레드/컨텍스트의 활성 타이머 지정(None 이면 기존 값 유지)."""
+    if timer is None:
+        yield _CURRENT.get()
+        return
+    tok = _CURRENT.set(timer)
+    try:
+        yield timer
+    finally:
+        _CURRENT.reset(tok)
+
+def current() -> Optional[StageTimer]:
+    return _CURRENT.get()
+
+def stage(name: str):
+    t = _CURRENT.get()
+    return t.stage(name) if t is not None else nullcontext()
+
+def note(**kv):
+    t = _CURRENT.get()
+    if t is not None:
+        t.note(**kv)
+
+# ========================= Prometheus 레지스트리 =========================
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _fmt_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _fmt_num(v: float) -> str:
+    v = float(v)
+    if v == float("inf"):
+        return "+Inf"
+    return str(int(v)) if v.is_integer() and abs(v) < 1e15 else repr(v)
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labels: Tuple[str, ...] = ()):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + float(amount)
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                out.append(f"{self.name}{_fmt_labels(self.labels, key)} {_fmt_num(v)}")
+        return out
+
+
+class Gauge:
+    def __init__(self, name: str, doc: str, labels: Tuple[str, ...] = ()):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                out.append(f"{self.name}{_fmt_labels(self.labels, key)} {_fmt_num(v)}")
+        return out
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        v = float(value)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, b in enumerate(self.buckets):
+                if v <= b:
+                    s[i] += 1
+            s[-2] += v
+            s[-1] += 1
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, s in sorted(self._series.items()):
+                for i, b in enumerate(self.buckets + (float("inf"),)):
+                    le = 'le="' + _fmt_num(b) + '"'
+                    cnt = s[i] if i < len(self.buckets) else s[-1]
+                    out.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, le)} {_fmt_num(cnt)}")
+                out.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {_fmt_num(s[-2])}")
+                out.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {_fmt_num(s[-1])}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, *args, **kw):
+        with self._lock:
+            m = self._metrics.get(name)
+            if m is None:
+                m = self._metrics[name] = cls(name, *args, **kw)
+            return m
+
+    def counter(self, name: str, doc: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._get(Counter, name, doc, labels)
+
+    def gauge(self, name: str, doc: str, labels: Tuple[str, ...] = ()) -> Gauge:
+        return self._get(Gauge, name, doc, labels)
+
+    def histogram(self, name: str, doc: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, doc, labels, buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+INFER_REQUESTS = REGISTRY.counter("eeg_infer_requests_total", "Inference requests by endpoint and status", ("endpoint", "status"))
+INFER_SECONDS  = REGISTRY.histogram("eeg_infer_seconds", "End-to-end inference latency", ("endpoint",))
+STAGE_SECONDS  = REGISTRY.histogram("eeg_infer_stage_seconds", "Per-stage inference latency", ("engine", "stage"))
+SEGMENTS_TOTAL = REGISTRY.counter("eeg_infer_segments_total", "Segments passed through the model", ("engine",))
+SAMPLES_TOTAL  = REGISTRY.counter("eeg_infer_input_samples_total", "Input samples read (per channel)", ("engine",))
+
+def observe_timer(timer: StageTimer, engine: str, endpoint: str, status: str = "ok"):
+    """요청 종료 시 타이머 내용을 레지스트리에 반영."""
+    timer.stop()
+    INFER_REQUESTS.inc(endpoint=endpoint, status=status)
+    INFER_SECONDS.observe(timer.total_seconds, endpoint=endpoint)
+    for name, sec in timer.stages.items():
+        STAGE_SECONDS.observe(sec, engine=engine, stage=name)
+    if "n_segments" in timer.sizes:
+        SEGMENTS_TOTAL.inc(float(timer.sizes["n_segments"]), engine=engine)
+    if "n_samples_in" in timer.sizes:
+        SAMPLES_TOTAL.inc(float(timer.sizes["n_samples_in"]), engine=engine)
+
+# ========================= trace 캡처 =========================
+PROFILE_DIR = os.getenv("EEG_PROFILE_DIR", os.path.join("uploads", "profiles"))
+PROFILE_MODES = ("cprofile", "torch")
+
+def capture_mode(requested: Optional[str]) -> Optional[str]:
+    """요청값 우선, 없으면 ENV EEG_PROFILE_CAPTURE. 알 수 없는 값은 캡처 안 함."""
+    mode = (requested or os.getenv("EEG_PROFILE_CAPTURE", "")).strip().lower()
+    return mode if mode in PROFILE_MODES else None
+
+@contextmanager
+def capture(mode: Optional[str], tag: str = "infer", out_dir: Optional[str] = None) -> Iterator[Dict]:
+    """
+    with capture("cprofile") as info: ...  → info["trace_file"] 에 저장 경로
+    - cprofile: pstats 덤프(.prof) → snakeviz / python -m pstats 로 확인
+    - torch   : torch.profiler chrome trace(.json) → chrome://tracing / perfetto
+    """
+    info: Dict = {"mode": mode, "trace_file": None}
+    if not mode:
+        yield info
+        return
+    out_dir = out_dir or PROFILE_DIR
+    os.makedirs(out_dir, exist_ok=True)
+    stem = os.path.join(out_dir, f"{tag}_{time.strftime('%Y%m%d_%H%M%S')}_{threading.get_ident() % 100000}")
+
+    if mode == "cprofile":
+        import cProfile
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            yield info
+        finally:
+            prof.disable()
+            path = stem + ".prof"
+            prof.dump_stats(path)
+            info["trace_file"] = path
+        return
+
+    import torch
+    from torch.profiler import profile, ProfilerActivity
+    acts = [ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        acts.append(ProfilerActivity.CUDA)
+    prof = profile(activities=acts, record_shapes=True)
+    try:
+        with prof:
+            yield info
+    finally:
+        path = stem + ".json"
+        prof.export_chrome_trace(path)
+        info["trace_file"] = path
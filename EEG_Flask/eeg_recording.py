@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+"""
+eeg_recording.py
+- 네이티브 녹화 컨테이너(.eegr): JSON 헤더 + 청크 단위로 append 되는 float32 배열
+- 엔진은 np.memmap 으로 바로 열어 텍스트 파싱 비용 없이 사용
+- 기존 MuseLab CSV / EEGLAB .set → .eegr 변환기 포함
+- EEGLAB .set 지연 로딩: 채널 선택 → 필요한 구간만 load, 긴 녹화는 블록 단위 필터/리샘플 스트리밍
+- 사용법:
+    python eeg_recording.py convert input.csv [-o out.eegr] [--csv-order TP9,AF7,AF8,TP10]
+    python eeg_recording.py info recording.eegr
+
+파일 레이아웃
+  [0:8)      MAGIC  b"EEGREC1\\0"
+  [8:12)     uint32 LE  JSON 헤더 길이
+  [12:4096)  UTF-8 JSON 헤더(공백 패딩)
+  [4096: )   float32 LE 청크 배열, shape (n_chunks, n_channels, chunk_samples)
+             - 청크 내부는 채널 우선이라 채널 부분집합만 읽을 때 해당 채널 페이지만 접근
+             - 마지막 청크는 0 패딩, 실제 길이는 헤더 n_samples
+"""
+from __future__ import annotations
+import os, sys, json, time, struct, argparse
+from typing import Dict, List, Tuple, Optional
+
+import numpy as np
+
+import eeg_profiling
+
+RECORDING_EXT = ".eegr"
+MAGIC         = b"EEGREC1\0"
+HEADER_BYTES  = 4096
+FORMAT_VER    = 1
+DTYPE         = np.dtype("<f4")
+CHUNK_SAMPLES = 4096
+
+MUSE_CSV_CHANNELS = ("TP9", "AF7", "AF8", "TP10")  # eeg_1..eeg_4 기본 물리 순서
+
+# 장치별 모델 입력 채널(엔진/app 공용, torch/mne 없이 참조 가능)
+CHANNEL_GROUPS: Dict[str, List[str]] = {
+    'muse': ['T5','T6','F7','F8'],
+    'hybrid_black': ['Fz','C3','Cz','C4','Pz','T5','T6','O1'],
+    'union10': ['T5','T6','F7','F8','Fz','C3','Cz','C4','Pz','O1'],
+    'total19': ['Fp1','Fp2','F7','F3','Fz','F4','F8','T3','C3','Cz','C4','T4','T5','P3','Pz','P4','T6','O1','O2'],
+}
+
+# .set 지연 로딩
+SET_STREAM_SECONDS = float(os.getenv("EEG_SET_STREAM_SECONDS", "1800"))  # 이보다 긴 녹화는 블록 스트리밍
+SET_BLOCK_SECONDS  = float(os.getenv("EEG_SET_BLOCK_SECONDS", "300"))
+SET_PAD_SECONDS    = 10.0   # 블록 경계 필터 과도응답 제거용 여유(1 Hz 하이패스 FIR 길이 3.3 s 보다 충분히 큼)
+_SET_MAX_ENV       = os.getenv("EEG_SET_MAX_SECONDS", "").strip()
+SET_MAX_SECONDS: Optional[float] = float(_SET_MAX_ENV) if _SET_MAX_ENV else None  # 앞에서부터 N초만 사용(옵션)
+
+
+def is_recording(file_path: str) -> bool:
+    return os.path.splitext(file_path)[-1].lower() == RECORDING_EXT
+
+
+def _pack_header(header: Dict) -> bytes:
+    body = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    if 12 + len(body) > HEADER_BYTES:
+        raise ValueError(f"Recording header too large ({len(body)} bytes)")
+    return MAGIC + struct.pack("<I", len(body)) + body.ljust(HEADER_BYTES - 12, b" ")
+
+
+def read_header(file_path: str) -> Dict:
+    with open(file_path, "rb") as f:
+        head = f.read(HEADER_BYTES)
+    if len(head) < 12 or head[:8] != MAGIC:
+        raise ValueError(f"Not an {RECORDING_EXT} recording: {file_path}")
+    (n,) = struct.unpack("<I", head[8:12])
+    return json.loads(head[12:12 + n].decode("utf-8"))
+
+
+# ========================= 쓰기 =========================
+class RecordingWriter:
+    """
+    청크 단위 append 가능한 .eegr 작성기.
+    - append(block): block shape (n_samples, n_channels), channels_first=True 이면 (n_channels, n_samples)
+    - chunk_samples 만큼 모이면 (C, chunk) 블록으로 기록, close() 시 마지막 청크 0 패딩
+    - flush() 는 완성된 청크까지 헤더(n_samples)를 갱신 → 수집 중 프로세스가 죽어도 그 지점까지 유효
+    """
+    def __init__(self, file_path: str, channels: List[str], sfreq: float,
+                 device_serial: Optional[str] = None,
+                 t_start: Optional[float] = None,
+                 source: Optional[str] = None,
+                 chunk_samples: int = CHUNK_SAMPLES,
+                 extra: Optional[Dict] = None):
+        self.file_path = file_path
+        self.chunk_samples = int(chunk_samples)
+        self.header: Dict = {
+            "format": "eegr",
+            "version": FORMAT_VER,
+            "dtype": DTYPE.str,
+            "layout": "chunked_channel_major",
+            "chunk_samples": self.chunk_samples,
+            "channels": [str(c) for c in channels],
+            "sfreq": float(sfreq),
+            "n_samples": 0,
+            "device_serial": device_serial,
+            "t_start": (float(t_start) if t_start is not None else None),
+            "t_end": None,
+            "created_at": time.time(),
+            "source": source,
+        }
+        if extra:
+            self.header.update(extra)
+        self._buf = np.zeros((len(self.header["channels"]), self.chunk_samples), dtype=DTYPE)
+        self._fill = 0
+        self._written = 0
+        d = os.path.dirname(file_path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._f = open(file_path, "wb")
+        self._f.write(_pack_header(self.header))
+
+    @property
+    def n_channels(self) -> int:
+        return len(self.header["channels"])
+
+    def _emit_chunk(self, n_valid: int):
+        if n_valid < self.chunk_samples:
+            self._buf[:, n_valid:] = 0.0
+        self._f.write(self._buf.tobytes())
+        self._written += n_valid
+        self._fill = 0
+
+    def append(self, block: np.ndarray, channels_first: bool = False, t_end: Optional[float] = None):
+        arr = np.asarray(block)
+        if not channels_first:
+            arr = arr.T
+        if arr.ndim != 2 or arr.shape[0] != self.n_channels:
+            raise ValueError(f"Block shape {arr.shape} does not match {self.n_channels} channels")
+        i, T = 0, arr.shape[1]
+        while i < T:
+            take = min(self.chunk_samples - self._fill, T - i)
+            self._buf[:, self._fill:self._fill + take] = arr[:, i:i + take]
+            self._fill += take
+            i += take
+            if self._fill == self.chunk_samples:
+                self._emit_chunk(self.chunk_samples)
+        if t_end is not None:
+            self.header["t_end"] = float(t_end)
+
+    def flush(self):
+        # 완성된 청크까지만 헤더에 반영(수집 중 주기적으로 호출 가능)
+        self.header["n_samples"] = int(self._written)
+        pos = self._f.tell()
+        self._f.seek(0)
+        self._f.write(_pack_header(self.header))
+        self._f.seek(pos)
+        self._f.flush()
+
+    def close(self):
+        if self._f.closed:
+            return
+        if self._fill:
+            self._emit_chunk(self._fill)
+        self.flush()
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_recording(file_path: str, data: np.ndarray, channels: List[str], sfreq: float,
+                    channels_first: bool = True, **meta) -> str:
+    """배열 한 번에 저장. meta: device_serial / t_start / t_end / source / chunk_samples / extra"""
+    t_end = meta.pop("t_end", None)
+    with RecordingWriter(file_path, channels, sfreq, **meta) as w:
+        w.append(data, channels_first=channels_first, t_end=t_end)
+    return file_path
+
+
+# ========================= 읽기 =========================
+def open_recording(file_path: str) -> Tuple[np.ndarray, Dict]:
+    """
+    memmap 으로 열기 → (chunks (n_chunks, C, chunk_samples) 읽기전용, header)
+    데이터는 복사되지 않으며, 실제 접근한 채널/구간의 페이지만 읽힌다.
+    """
+    header = read_header(file_path)
+    n_ch = len(header["channels"])
+    n = int(header["n_samples"])
+    cs = int(header["chunk_samples"])
+    n_chunks = -(-n // cs)
+    if n_chunks == 0:
+        return np.empty((0, n_ch, cs), dtype=DTYPE), header
+    mm = np.memmap(file_path, dtype=np.dtype(header.get("dtype", DTYPE.str)),
+                   mode="r", offset=HEADER_BYTES, shape=(n_chunks, n_ch, cs))
+    return mm, header
+
+
+def _norm_name(s) -> str:
+    return "".join(ch for ch in str(s).upper() if ch.isalnum())
+
+
+def read_channels(file_path: str, channels: Optional[List[str]] = None,
+                  start: int = 0, stop: Optional[int] = None) -> Tuple[np.ndarray, float, Dict]:
+    """
+    요청 채널 / 샘플 구간만 (C,T) float32 로 추출(채널 None 이면 전체).
+    이름 비교는 대소문자/기호 무시, 정확히 같은 이름이 없으면 접미사 일치(예: 'EEG Fp1' → Fp1)
+    — 장비 CSV 로더(eeg_engine_core._load_device_csv)와 같은 규칙이라 CSV 를 변환한 .eegr 도 똑같이 읽힘
+    """
+    chunks, header = open_recording(file_path)
+    names = header["channels"]
+    if channels is None:
+        idx = list(range(len(names)))
+    else:
+        idx_by_name = {_norm_name(c): i for i, c in enumerate(names)}
+        idx, missing = [], []
+        for c in channels:
+            key = _norm_name(c)
+            i = idx_by_name.get(key)
+            if i is None:
+                i = next((j for k, j in idx_by_name.items() if k.endswith(key)), None)
+            if i is None:
+                missing.append(c)
+            else:
+                idx.append(i)
+        if missing:
+            raise ValueError(f"Recording missing channels: {missing} / present={names}")
+
+    n = int(header["n_samples"])
+    cs = int(header["chunk_samples"])
+    stop = n if stop is None else max(0, min(int(stop), n))
+    start = max(0, min(int(start), stop))
+    out = np.empty((len(idx), stop - start), dtype=np.float32)
+    c0, c1 = start // cs, -(-stop // cs)
+    if c1 > c0:
+        sel = chunks[c0:c1][:, idx, :]                        # (k, C_sel, cs) — 선택 채널만 페이지 접근
+        flat = sel.transpose(1, 0, 2).reshape(len(idx), -1)   # (C_sel, k*cs)
+        off = start - c0 * cs
+        out[:] = flat[:, off:off + (stop - start)]
+    return out, float(header["sfreq"]), header
+
+
+# ========================= .set 지연 로딩 =========================
+def open_set_lazy(file_path: str, channels: List[str], max_seconds: Optional[float] = SET_MAX_SECONDS):
+    """
+    EEGLAB .set 을 preload 없이 열고 채널 선택(순서 = channels) / 구간 crop 까지만 수행.
+    실제 샘플은 이후 load_data() 또는 stream_filter_resample() 에서 필요한 만큼만 읽힌다.
+    """
+    import mne
+    raw = mne.io.read_raw_eeglab(file_path, preload=False, verbose='ERROR')
+    miss = [ch for ch in channels if ch not in raw.ch_names]
+    if miss:
+        raise ValueError(f"Channels missing in file: {miss}\nPresent: {raw.ch_names}\nExpected: {channels}")
+    raw.pick_channels(channels, ordered=True)
+    if max_seconds is not None and raw.times[-1] > max_seconds:
+        raw.crop(tmin=0.0, tmax=float(max_seconds), include_tmax=False)
+    return raw
+
+
+def needs_streaming(raw) -> bool:
+    return (raw.n_times / float(raw.info['sfreq'])) > SET_STREAM_SECONDS
+
+
+def stream_filter_resample(raw, l_freq: float, h_freq: float, sfreq_out: float,
+                           notch_freqs: Optional[List[float]] = None,
+                           block_seconds: float = SET_BLOCK_SECONDS,
+                           pad_seconds: float = SET_PAD_SECONDS) -> np.ndarray:
+    """
+    preload 되지 않은 Raw 를 블록 단위로 읽어 (노치) → 대역통과 → 리샘플 후 이어붙임.
+    블록마다 양쪽 pad 를 함께 읽고 잘라내므로 경계 과도응답이 결과에 남지 않으며,
+    피크 메모리는 녹화 길이가 아니라 (블록 + 2*pad) × 채널 수에 비례한다.
+    반환: (C, T_out) float64
+    """
+    import mne
+    sf = float(raw.info['sfreq'])
+    n = int(raw.n_times)
+    ratio = float(sfreq_out) / sf
+    blk = max(1, int(round(block_seconds * sf)))
+    pad = int(round(pad_seconds * sf))
+    out = np.empty((len(raw.ch_names), int(round(n * ratio))), dtype=np.float64)
+
+    for start in range(0, n, blk):
+        stop = min(n, start + blk)
+        ps, pe = max(0, start - pad), min(n, stop + pad)
+        with eeg_profiling.stage("read"):
+            x = raw.get_data(start=ps, stop=pe)
+        if notch_freqs:
+            with eeg_profiling.stage("notch"):
+                x = mne.filter.notch_filter(x, sf, notch_freqs, verbose='ERROR')
+        with eeg_profiling.stage("filter"):
+            x = mne.filter.filter_data(x, sf, l_freq, h_freq, fir_design='firwin', verbose='ERROR')
+        if abs(sf - sfreq_out) > 1e-3:
+            with eeg_profiling.stage("resample"):
+                x = mne.filter.resample(x, up=float(sfreq_out), down=sf, npad='auto', verbose='ERROR')
+        o0, o1 = int(round(start * ratio)), min(out.shape[1], int(round(stop * ratio)))
+        off = int(round((start - ps) * ratio))
+        seg = x[:, off:off + (o1 - o0)]
+        out[:, o0:o0 + seg.shape[1]] = seg
+        if seg.shape[1] < (o1 - o0):  # 반올림으로 1샘플 모자랄 때
+            out[:, o0 + seg.shape[1]:o1] = seg[:, -1:]
+    return out
+
+
+# ========================= 변환기 =========================
+def sfreq_from_timestamps(ts: np.ndarray) -> float:
+    dt = np.diff(ts)
+    dt = dt[dt > 0]
+    if dt.size == 0:
+        raise ValueError("Invalid timestamps: non-increasing or empty.")
+    q1, q3 = np.quantile(dt, [0.25, 0.75])
+    iqr = max(1e-9, q3 - q1)
+    keep = dt[(dt >= max(1e-4, q1 - 1.5 * iqr)) & (dt <= min(1.0, q3 + 1.5 * iqr))]
+    return float(1.0 / max(float(np.median(keep if keep.size else dt)), 1e-6))
+
+
+def convert_csv(src: str, dst: Optional[str] = None,
+                csv_order: Optional[Tuple[str, str, str, str]] = None,
+                device_serial: Optional[str] = None) -> str:
+    """
+    MuseLab CSV(eeg_1..4 + timestamps) → 물리 채널명(TP9/AF7/AF8/TP10)으로 저장
+    그 외 장비 CSV → timestamps 를 제외한 숫자 컬럼 전체 저장(sfreq 는 timestamps 또는 EEG_CSV_SFREQ)
+    """
+    import pandas as pd
+    df = pd.read_csv(src)
+    dst = dst or os.path.splitext(src)[0] + RECORDING_EXT
+    muse_cols = ['eeg_1', 'eeg_2', 'eeg_3', 'eeg_4']
+    if all(c in df.columns for c in muse_cols + ['timestamps']):
+        sub = df[muse_cols + ['timestamps']].dropna()
+        channels = list(csv_order or MUSE_CSV_CHANNELS)
+    else:
+        sub = df.dropna(subset=['timestamps']) if 'timestamps' in df.columns else df
+        muse_cols = [c for c in sub.columns if c != 'timestamps' and np.issubdtype(sub[c].dtype, np.number)]
+        channels = list(muse_cols)
+
+    if 'timestamps' in sub.columns:
+        ts = sub['timestamps'].to_numpy(dtype=np.float64)
+        if np.any(np.diff(ts) <= 0):
+            sub = sub.sort_values('timestamps')
+            ts = sub['timestamps'].to_numpy(dtype=np.float64)
+        sfreq = sfreq_from_timestamps(ts)
+        t_start, t_end = float(ts[0]), float(ts[-1])
+    else:
+        sfreq = float(os.getenv("EEG_CSV_SFREQ", 250))
+        t_start = t_end = None
+
+    X = sub[muse_cols].to_numpy(dtype=np.float32)  # (T,C)
+    return write_recording(dst, X, channels, sfreq, channels_first=False,
+                           device_serial=device_serial, t_start=t_start, t_end=t_end,
+                           source=os.path.basename(src))
+
+
+def convert_set(src: str, dst: Optional[str] = None) -> str:
+    """EEGLAB .set → 전체 채널 그대로(단위 V) 저장"""
+    import mne
+    raw = mne.io.read_raw_eeglab(src, preload=False, verbose='ERROR')
+    dst = dst or os.path.splitext(src)[0] + RECORDING_EXT
+    sfreq = float(raw.info['sfreq'])
+    block = int(sfreq * 60)
+    with RecordingWriter(dst, list(raw.ch_names), sfreq, source=os.path.basename(src)) as w:
+        for start in range(0, raw.n_times, block):
+            stop = min(raw.n_times, start + block)
+            w.append(raw.get_data(start=start, stop=stop), channels_first=True)
+    return dst
+
+
+def convert_any(src: str, dst: Optional[str] = None, **kw) -> str:
+    ext = os.path.splitext(src)[-1].lower()
+    if ext == ".csv":
+        return convert_csv(src, dst, **kw)
+    if ext == ".set":
+        return convert_set(src, dst)
+    if ext == RECORDING_EXT:
+        return src
+    raise ValueError(f"Unsupported file type: {ext}")
+
+
+def _main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="EEG .eegr recording tools")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_conv = sub.add_parser("convert", help="CSV/.set → .eegr")
+    p_conv.add_argument("src", nargs="+")
+    p_conv.add_argument("-o", "--out", default=None, help="출력 경로(입력 1개일 때만)")
+    p_conv.add_argument("--csv-order", default=None, help="예: TP9,AF7,AF8,TP10")
+    p_info = sub.add_parser("info", help="헤더 출력")
+    p_info.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "info":
+        print(json.dumps(read_header(args.path), ensure_ascii=False, indent=2))
+        return 0
+
+    csv_order = None
+    if args.csv_order:
+        csv_order = tuple(s.strip().upper() for s in args.csv_order.split(",") if s.strip())
+    for src in args.src:
+        dst = args.out if (args.out and len(args.src) == 1) else None
+        kw = {"csv_order": csv_order} if src.lower().endswith(".csv") else {}
+        print(f"[EEGR] {src} -> {convert_any(src, dst, **kw)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+eeg_result_cache.py
+- /infer* 결과 영구 캐시(sqlite): 같은 녹화 재요청(페이지 새로고침/리포트 재생성) 시 전처리·추론 생략
+- 키 = (파일 내용 sha256, 엔진 설정 해시, enforce_two_minutes)
+  · 엔진 설정 해시: 레포/가중치 파일 해시/캘리브레이션 값/전처리 프로파일/결과에 영향 주는 ENV
+    → 가중치 교체나 EEG_TEMP 등 변경 시 키가 달라져 자동 무효화
+- 요청별 필드(file_path/subject_id/segment_accuracy)는 저장하지 않고 엔진이 매 요청 다시 채움
+- 세그먼트 타임라인은 요청한 경우에만 인코딩·저장 → 타임라인 요청인데 저장 항목에 없으면 엔진이 다시 계산해 교체
+- 여러 프로세스(워커 풀)가 같은 DB 파일을 공유(WAL), 항목 수 상한 초과 시 오래 안 쓴 항목부터 삭제
+- EEG_RESULT_CACHE=0 으로 끔
+"""
+from __future__ import annotations
+import os, json, time, sqlite3, hashlib, threading
+from typing import Dict, Optional, Tuple
+
+import eeg_profiling
+
+# ========================= 설정 =========================
+CACHE_ENABLED     = os.getenv("EEG_RESULT_CACHE", "1").strip().lower() in ("1", "true", "on", "yes", "y")
+CACHE_PATH        = os.getenv("EEG_RESULT_CACHE_PATH", os.path.join("uploads", "result_cache.sqlite3"))
+CACHE_MAX_ENTRIES = int(os.getenv("EEG_RESULT_CACHE_MAX", "5000"))
+SCHEMA_VERSION    = 2   # 결과 dict 구조가 바뀌면 올림 → 기존 항목 전부 무효 (2: timeline 포함 가능)
+_HASH_CHUNK       = 1 << 20
+
+LOOKUPS = eeg_profiling.REGISTRY.counter(
+    "eeg_result_cache_lookups_total", "Result cache lookups by engine and outcome (hit/miss)", ("engine", "outcome"))
+
+# ========================= 해시 =========================
+_DIGESTS: Dict[Tuple[str, int, int], str] = {}
+_DIGEST_LOCK = threading.Lock()
+
+def _sha256_file(path: str, h) -> None:
+    with open(path, "rb") as f:
+        while True:
+            buf = f.read(_HASH_CHUNK)
+            if not buf:
+                break
+            h.update(buf)
+
+def file_digest(path: str) -> str:
+    """
+    파일 내용 sha256(hex). (경로, 크기, mtime) 이 같으면 메모리에 기억한 값 재사용.
+    EEGLAB .set 은 같은 이름의 .fdt(실제 샘플)가 있으면 함께 해시.
+    """
+    paths = [path]
+    stem, ext = os.path.splitext(path)
+    if ext.lower() == ".set":
+        for fdt in (stem + ".fdt", stem + ".FDT"):
+            if os.path.exists(fdt):
+                paths.append(fdt); break
+    stats = [os.stat(p) for p in paths]
+    key = (os.path.realpath(path), sum(st.st_size for st in stats), max(st.st_mtime_ns for st in stats))
+    with _DIGEST_LOCK:
+        d = _DIGESTS.get(key)
+    if d is not None:
+        return d
+    h = hashlib.sha256()
+    for p in paths:
+        _sha256_file(p, h)
+    d = h.hexdigest()
+    with _DIGEST_LOCK:
+        _DIGESTS[key] = d
+    return d
+
+def config_digest(fingerprint: Dict) -> str:
+    body = json.dumps({"schema": SCHEMA_VERSION, **fingerprint}, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+# ========================= 저장소 =========================
+class ResultCache:
+    """
+    cache = ResultCache(path)
+    hit = cache.get(file_hash, config_hash, enforce)   # dict | None
+    cache.put(file_hash, config_hash, enforce, engine="3c", result=res)
+    """
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = int(max_entries)
+        self._tls = threading.local()
+        d = os.path.dirname(os.path.abspath(path))
+        os.makedirs(d, exist_ok=True)
+        with self._conn() as c:
+            c.execute("""CREATE TABLE IF NOT EXISTS results (
+                             file_hash   TEXT NOT NULL,
+                             config_hash TEXT NOT NULL,
+                             enforce     INTEGER NOT NULL,
+                             engine      TEXT,
+                             result      TEXT NOT NULL,
+                             created_at  REAL NOT NULL,
+                             last_used   REAL NOT NULL,
+                             hits        INTEGER NOT NULL DEFAULT 0,
+                             PRIMARY KEY (file_hash, config_hash, enforce))""")
+            c.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results(last_used)")
+            # 조회 통계(hit/miss/store/evict): 모든 프로세스 합산, 재시작 후에도 유지
+            c.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # 스레드별 연결(sqlite3 연결은 스레드 간 공유 불가), WAL 로 다른 프로세스와 동시 읽기
+        c = getattr(self._tls, "conn", None)
+        if c is None:
+            c = self._tls.conn = sqlite3.connect(self.path, timeout=10.0)
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("PRAGMA synchronous=NORMAL")
+        return c
+
+    @staticmethod
+    def _count(c: sqlite3.Connection, name: str, n: int = 1):
+        c.execute("INSERT INTO counters(name, value) VALUES (?, ?) "
+                  "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value", (name, int(n)))
+
+    def get(self, file_hash: str, config_hash: str, enforce: bool) -> Optional[Dict]:
+        c = self._conn()
+        key = (file_hash, config_hash, int(bool(enforce)))
+        row = c.execute("SELECT result FROM results WHERE file_hash=? AND config_hash=? AND enforce=?", key).fetchone()
+        with c:
+            if row is None:
+                self._count(c, "misses")
+            else:
+                self._count(c, "hits")
+                c.execute("UPDATE results SET hits=hits+1, last_used=? WHERE file_hash=? AND config_hash=? AND enforce=?",
+                          (time.time(),) + key)
+        return None if row is None else json.loads(row[0])
+
+    def put(self, file_hash: str, config_hash: str, enforce: bool, engine: str, result: Dict):
+        now = time.time()
+        c = self._conn()
+        with c:
+            c.execute("INSERT OR REPLACE INTO results(file_hash, config_hash, enforce, engine, result, created_at, last_used, hits) "
+                      "VALUES (?,?,?,?,?,?,?,0)",
+                      (file_hash, config_hash, int(bool(enforce)), engine, json.dumps(result), now, now))
+            self._count(c, "stores")
+            if self.max_entries > 0:
+                n = c.execute("DELETE FROM results WHERE rowid IN "
+                              "(SELECT rowid FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                              (self.max_entries,)).rowcount
+                if n > 0:
+                    self._count(c, "evictions", n)
+
+    def clear(self) -> int:
+        """결과 전부 삭제(통계 카운터는 유지). 반환: 삭제한 항목 수"""
+        c = self._conn()
+        with c:
+            n = c.execute("DELETE FROM results").rowcount
+        return int(n)
+
+    def stats(self) -> Dict:
+        c = self._conn()
+        entries = int(c.execute("SELECT COUNT(*) FROM results").fetchone()[0])
+        by_engine = {e: {"entries": int(n), "hits": int(h)} for e, n, h in
+                     c.execute("SELECT engine, COUNT(*), COALESCE(SUM(hits), 0) FROM results GROUP BY engine")}
+        cnt = {k: 0 for k in ("hits", "misses", "stores", "evictions")}
+        cnt.update({k: int(v) for k, v in c.execute("SELECT name, value FROM counters")})
+        looked = cnt["hits"] + cnt["misses"]
+        return dict(cnt, path=self.path, max_entries=self.max_entries, entries=entries, by_engine=by_engine,
+                    hit_ratio=(round(cnt["hits"] / looked, 4) if looked else None))
+
+
+_CACHE: Optional[ResultCache] = None
+_CACHE_LOCK = threading.Lock()
+
+def enabled() -> bool:
+    return CACHE_ENABLED
+
+def get_cache() -> Optional[ResultCache]:
+    """EEG_RESULT_CACHE=0 이면 None."""
+    global _CACHE
+    if not CACHE_ENABLED:
+        return None
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = ResultCache()
+        return _CACHE
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+eeg_segments.py
+- 50% 겹침 세그먼트를 전부 만들지 않는 추론 파이프라인(2/3클 엔진 공용)
+- 세그먼트는 연속 신호 (C,T) 위의 strided view(sliding_window_view) → 복사 없음
+- per-record z-score 통계는 연속 신호에서 계산: 샘플별 세그먼트 포함 횟수(coverage)로 가중
+  → 겹친 세그먼트 전체에서 구한 평균/표준편차와 같은 값(결과 불변)
+- 정규화된 float32 배치는 batch_size 개씩만 만들고 forward 후 버림 → 피크 메모리는 배치 크기에 비례
+- 품질 가중치용 세그먼트 표준편차(원신호 기준)도 배치 생성 시 함께 계산
+- 아티팩트 검출(eeg_artifacts)도 같은 정규화 배치에서 계산 → 품질 가중치/윈도우 선택에 반영
+"""
+from __future__ import annotations
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import eeg_profiling
+import eeg_artifacts
+
+
+class SegmentPipeline:
+    """
+    pipe = SegmentPipeline(data, sfreq, SEG_SECONDS, EVAL_HOP_SEC)
+    logits = pipe.forward_all(engine._forward, BATCH_SIZE, n_classes)   # (N,K)
+    w = pipe.quality_weights(s_best, use)
+    """
+    def __init__(self, data: np.ndarray, sfreq: float, win_sec: float, hop_sec: float):
+        self.data = np.asarray(data)
+        C, T = self.data.shape
+        self.win = int(round(win_sec * sfreq))
+        self.hop = int(round(hop_sec * sfreq))
+        self.n_channels = C
+        self.n_segments = 0 if T < self.win else (T - self.win) // self.hop + 1
+        self.mean: Optional[np.ndarray] = None   # (C,1)
+        self.std: Optional[np.ndarray] = None    # (C,1)
+        self.seg_std = np.zeros(self.n_segments, dtype=np.float32)  # 원신호 세그먼트별 std
+        self.artifacts = (eeg_artifacts.ArtifactDetector(self.n_segments, C, self.win, sfreq)
+                          if eeg_artifacts.enabled() and self.n_segments > 0 else None)
+
+    # ----- 세그먼트 view -----
+    def windows(self) -> np.ndarray:
+        """(N, C, win) strided view(읽기 전용, 복사 없음)."""
+        v = sliding_window_view(self.data, self.win, axis=1)[:, ::self.hop][:, :self.n_segments]
+        return v.transpose(1, 0, 2)
+
+    def coverage(self) -> np.ndarray:
+        """샘플별로 그 샘플을 포함하는 세그먼트 수 (T,)."""
+        T = self.data.shape[1]
+        d = np.zeros(T + 1, dtype=np.float64)
+        starts = np.arange(self.n_segments) * self.hop
+        np.add.at(d, starts, 1.0)
+        np.add.at(d, starts + self.win, -1.0)
+        return np.cumsum(d[:-1])
+
+    def compute_stats(self) -> Tuple[np.ndarray, np.ndarray]:
+        """채널별 평균/표준편차(겹침 세그먼트 기준과 동일한 coverage 가중)."""
+        cov = self.coverage()
+        total = float(cov.sum())
+        mean = (self.data @ cov) / total
+        var = np.empty(self.n_channels, dtype=np.float64)
+        for c in range(self.n_channels):  # 채널 단위 임시 배열만 사용
+            dc = self.data[c] - mean[c]
+            var[c] = (dc * dc) @ cov / total
+        self.mean = mean[:, None]
+        self.std = np.sqrt(var)[:, None] + 1e-7
+        return self.mean, self.std
+
+    # ----- 배치 생성 -----
+    def batches(self, batch_size: int) -> Iterator[Tuple[int, np.ndarray]]:
+        """(시작 인덱스, 정규화된 float32 (b,C,win)) 를 순서대로 생성."""
+        if self.mean is None:
+            self.compute_stats()
+        mean32 = self.mean.astype(np.float32)
+        inv32 = (1.0 / self.std).astype(np.float32)
+        view = self.windows()
+        buf = np.empty((min(batch_size, self.n_segments), self.n_channels, self.win), dtype=np.float32)
+        for i in range(0, self.n_segments, batch_size):
+            raw = view[i:i+batch_size]
+            b = raw.shape[0]
+            out = buf[:b]
+            out[...] = raw                          # float32 캐스팅 복사(배치 1개 분량)
+            self.seg_std[i:i+b] = out.std(axis=(1, 2))
+            out -= mean32
+            out *= inv32
+            yield i, out
+
+    def forward_all(self, forward: Callable[[np.ndarray, np.ndarray], object],
+                    batch_size: int, n_classes: int) -> np.ndarray:
+        """배치 단위로 정규화 → forward(x, out), 로짓은 미리 할당한 (N,K) float32 에 직접 기록."""
+        return self.forward_many([forward], batch_size, n_classes)[0]
+
+    def forward_many(self, forwards: Sequence[Callable[[np.ndarray, np.ndarray], object]],
+                     batch_size: int, n_classes: int) -> List[np.ndarray]:
+        """정규화 배치 1개를 여러 모델(앙상블 멤버)에 차례로 통과 → 모델별 (N,K) 로짓. 세그먼트/정규화 비용은 1회."""
+        logits = [np.empty((self.n_segments, int(n_classes)), dtype=np.float32) for _ in forwards]
+        with eeg_profiling.stage("zscore"):
+            self.compute_stats()
+        it = self.batches(batch_size)
+        while True:
+            with eeg_profiling.stage("segment"):
+                nxt = next(it, None)
+            if nxt is None:
+                break
+            i, x = nxt
+            if self.artifacts is not None:
+                with eeg_profiling.stage("artifacts"):
+                    self.artifacts.update(i, x)
+            with eeg_profiling.stage("forward"):
+                for forward, out in zip(forwards, logits):
+                    forward(x, out[i:i+x.shape[0]])
+        eeg_profiling.note(batch_bytes=int(min(batch_size, self.n_segments) * self.n_channels * self.win * 4))
+        return logits
+
+    def artifact_weights(self) -> Optional[np.ndarray]:
+        """녹화 전체 세그먼트 아티팩트 가중치 (N,) 1.0 | 1e-3 (검출 꺼짐이면 None)"""
+        return None if self.artifacts is None else self.artifacts.weights()
+
+    def quality_weights(self, start: int, count: int) -> np.ndarray:
+        """선택 구간 세그먼트 중 std 가 중앙값의 20% 미만(평탄/접촉 불량)이거나 아티팩트면 1e-3."""
+        std = self.seg_std[start:start+count]
+        med = np.median(std) + 1e-8
+        w = np.where(std < 0.2 * med, 1e-3, 1.0).astype(np.float32)
+        aw = self.artifact_weights()
+        if aw is not None:
+            w = np.minimum(w, aw[start:start+count])
+        return w
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+eeg_startup.py
+- 앱 기동 직후 무거운 import(torch/mne/엔진)와 기본 엔진 로드를 백그라운드 스레드에서 수행(warm-up)
+- EEG_WARMUP: background(기본, 서버 즉시 기동) | eager(warm-up 끝난 뒤 서비스) | off(첫 요청 때 로드)
+- 상태: liveness(프로세스 응답)와 readiness(warm-up 완료)를 분리해 /health, /ready 에 노출
+- 실패 단계는 백그라운드에서 지수 백오프로 재시도(EEG_WARMUP_RETRY_SEC ~ EEG_WARMUP_RETRY_MAX_SEC, 0=재시도 안 함)
+  · 일시 오류(HF Hub 다운로드 등)로 readiness 가 영구히 꺼지지 않도록 — 모두 성공하면 ready, 실패 단계/다음 재시도는 /health 에
+- 기동 시간 측정: app import, 단계별 warm-up, 기동~ready 누적 → eeg_startup_seconds 게이지
+"""
+from __future__ import annotations
+import os, time, threading, traceback
+from typing import Callable, Dict, List, Optional, Tuple
+
+import eeg_profiling
+
+# ========================= 설정 =========================
+WARMUP_MODE    = os.getenv("EEG_WARMUP", "background").strip().lower()
+WARMUP_ENGINES = os.getenv("EEG_WARMUP_ENGINES", "2c:muse:53,3c:muse")  # kind:device[:ver], 쉼표 구분
+WARMUP_MODES   = ("background", "eager", "off")
+RETRY_SEC      = float(os.getenv("EEG_WARMUP_RETRY_SEC", "5"))      # 첫 재시도 대기(0 = 재시도 안 함)
+RETRY_MAX_SEC  = float(os.getenv("EEG_WARMUP_RETRY_MAX_SEC", "300"))
+
+STARTUP_SECONDS = eeg_profiling.REGISTRY.gauge(
+    "eeg_startup_seconds", "Cold-start time by phase (import, warm-up steps, until ready)", ("phase",))
+READY = eeg_profiling.REGISTRY.gauge("eeg_ready", "1 when warm-up finished without errors")
+
+
+class Warmup:
+    """
+    wu = Warmup(t0); wu.add("import_torch", lambda: __import__("torch")); wu.start()
+    - 단계는 등록 순서대로 1회 실행, 실패해도 다음 단계 진행(상태에 오류 기록)
+    - 실패 단계는 백그라운드 스레드에서 백오프 재시도 → 모두 성공하면 state=done (eager 도 첫 실행만 동기)
+    - t0: 기동 기준 시각(time.perf_counter, app.py 최상단에서 기록)
+    """
+    def __init__(self, t0: Optional[float] = None, mode: str = WARMUP_MODE):
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self.mode = mode if mode in WARMUP_MODES else "background"
+        self._steps: List[Tuple[str, Callable[[], object]]] = []
+        self._status: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._state = "pending"        # pending | running | done | failed | retrying | skipped
+        self._current: Optional[str] = None
+        self._ready_at: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+        self._retry_thread: Optional[threading.Thread] = None
+        self._retry: Dict = {"attempt": 0, "next_at": None}
+        self._done = threading.Event()
+        self._stop = threading.Event()
+
+    def mark(self, phase: str, seconds: Optional[float] = None):
+        """기동 구간 기록(seconds 생략 시 t0 부터 지금까지)."""
+        sec = (time.perf_counter() - self.t0) if seconds is None else float(seconds)
+        STARTUP_SECONDS.set(sec, phase=phase)
+        with self._lock:
+            self._status.setdefault("_phases", {})[phase] = round(sec, 3)
+
+    def add(self, name: str, fn: Callable[[], object]):
+        self._steps.append((name, fn))
+        self._status[name] = {"status": "pending"}
+
+    # ----- 실행 -----
+    def _run_steps(self, steps: List[Tuple[str, Callable[[], object]]]) -> List[Tuple[str, Callable[[], object]]]:
+        """단계 실행 → 실패한 단계 목록"""
+        failed = []
+        for name, fn in steps:
+            with self._lock:
+                attempts = self._status[name].get("attempts", 0) + 1
+                self._current = name
+                self._status[name] = {"status": "running", "attempts": attempts}
+            t = time.perf_counter()
+            try:
+                fn()
+                st = {"status": "ok"}
+            except Exception as e:
+                failed.append((name, fn))
+                print(f"[WARMUP] {name} 실패({attempts}회): {e!r}")
+                traceback.print_exc()
+                st = {"status": "error", "error": repr(e)}
+            sec = time.perf_counter() - t
+            st.update(seconds=round(sec, 3), attempts=attempts)
+            STARTUP_SECONDS.set(sec, phase=name)
+            with self._lock:
+                self._status[name] = st
+            print(f"[WARMUP] {name}: {st['status']} ({sec:.2f}s)")
+        with self._lock:
+            self._current = None
+        return failed
+
+    def _settle(self, failed: List) -> None:
+        with self._lock:
+            self._state = "failed" if failed else "done"
+            if not failed:
+                self._ready_at = time.perf_counter()
+                self._retry["next_at"] = None
+        if not failed:
+            self.mark("ready")
+        READY.set(0.0 if failed else 1.0)
+
+    def run(self):
+        with self._lock:
+            self._state = "running"
+        failed = self._run_steps(self._steps)
+        self._settle(failed)
+        self._done.set()
+        if failed and RETRY_SEC > 0:
+            self._retry_thread = threading.Thread(target=self._retry_loop, args=(failed,),
+                                                  name="eeg-warmup-retry", daemon=True)
+            self._retry_thread.start()
+
+    def _retry_loop(self, failed: List):
+        """실패 단계만 지수 백오프(RETRY_SEC → RETRY_MAX_SEC)로 재시도, 모두 성공하면 종료"""
+        delay = RETRY_SEC
+        while failed:
+            with self._lock:
+                self._retry["next_at"] = time.perf_counter() + delay
+            print(f"[WARMUP] 실패 단계 {[n for n, _ in failed]} → {delay:.0f}s 후 재시도")
+            if self._stop.wait(delay):
+                return
+            with self._lock:
+                self._retry["attempt"] += 1
+                self._state = "retrying"
+            failed = self._run_steps(failed)
+            self._settle(failed)
+            delay = min(delay * 2, RETRY_MAX_SEC)
+
+    def stop(self):
+        """재시도 중단(테스트/종료용)"""
+        self._stop.set()
+
+    def start(self):
+        """mode 에 따라 백그라운드 시작 / 동기 실행 / 생략."""
+        if self.mode == "off":
+            with self._lock:
+                self._state = "skipped"
+            READY.set(1.0)
+            self._done.set()
+            return
+        if self.mode == "eager":
+            self.run()
+            return
+        self._thread = threading.Thread(target=self.run, name="eeg-warmup", daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    # ----- 상태 -----
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return self._state in ("done", "skipped")
+
+    def status(self) -> Dict:
+        with self._lock:
+            steps = {n: dict(self._status[n]) for n, _ in self._steps}
+            done = sum(1 for st in steps.values() if st["status"] in ("ok", "error"))
+            next_at = self._retry["next_at"]
+            return {
+                "mode": self.mode,
+                "state": self._state,
+                "ready": self._state in ("done", "skipped"),
+                "current": self._current,
+                "progress": {"done": done, "total": len(self._steps)},
+                "steps": steps,
+                "failed_steps": [n for n, st in steps.items() if st["status"] == "error"],
+                "retry": {"attempt": self._retry["attempt"],
+                          "next_in_seconds": (None if next_at is None
+                                              else round(max(0.0, next_at - time.perf_counter()), 1))},
+                "startup_seconds": dict(self._status.get("_phases", {})),
+                "uptime_seconds": round(time.perf_counter() - self.t0, 3),
+            }
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+eeg_timeline.py
+- 녹화 전체 세그먼트별 확률 타임라인(옵션 출력): 추론 때 이미 계산한 probs_all 을 그대로 인코딩(추가 패스 없음)
+- 기본 인코딩 f16: float16 little-endian → base64 (확률 N×K 행 우선, 품질 가중치 N)
+  · 30분 Muse 녹화(N≈720, K=3) ≈ 8 KB, JSON 숫자 목록(≈27 KB)의 약 1/3
+- 세그먼트 i 의 시작 시각(초) = start_sec + i * hop_sec, 길이 seg_sec (녹화 시작 기준)
+- json 인코딩: 같은 내용을 숫자 목록(+시각 t)으로 — 디버깅/간단한 클라이언트용
+"""
+from __future__ import annotations
+import base64
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+FORMATS = ("f16", "json")
+
+
+def parse_format(v) -> Optional[str]:
+    """요청값 → None(끔) | 'f16' | 'json'. true/1/on 은 f16."""
+    if v is None or v is False:
+        return None
+    s = str(v).strip().lower()
+    if s in ("", "0", "false", "off", "no", "n"):
+        return None
+    if s in ("1", "true", "on", "yes", "y"):
+        return "f16"
+    if s not in FORMATS:
+        raise ValueError(f"Unknown timeline format '{v}'. Choose one of {list(FORMATS)}")
+    return s
+
+def _b64(a: np.ndarray) -> str:
+    return base64.b64encode(np.ascontiguousarray(a, dtype="<f2").tobytes()).decode("ascii")
+
+def _unb64(s: str, shape: Tuple[int, ...]) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(s), dtype="<f2").astype(np.float32).reshape(shape)
+
+def encode(probs: np.ndarray, quality: np.ndarray, start_sec: float, hop_sec: float, seg_sec: float,
+           class_names: Sequence[str], window: Tuple[int, int]) -> Dict:
+    """probs (N,K), quality (N,) → f16 타임라인 dict. window: 선택된 2분 구간 (시작 인덱스, 세그먼트 수)"""
+    N, K = probs.shape
+    return {
+        "encoding": "f16",
+        "classes": list(class_names),
+        "n": int(N),
+        "start_sec": float(start_sec),
+        "hop_sec": float(hop_sec),
+        "seg_sec": float(seg_sec),
+        "window": {"start_index": int(window[0]), "count": int(window[1])},
+        "probs": _b64(probs),
+        "quality": _b64(quality),
+    }
+
+def decode(tl: Dict) -> Tuple[np.ndarray, np.ndarray]:
+    """f16 타임라인 → (probs (N,K) float32, quality (N,) float32)"""
+    n, k = int(tl["n"]), len(tl["classes"])
+    return _unb64(tl["probs"], (n, k)), _unb64(tl["quality"], (n,))
+
+def to_json(tl: Dict) -> Dict:
+    probs, quality = decode(tl)
+    out = {k: v for k, v in tl.items() if k not in ("probs", "quality")}
+    out.update(encoding="json",
+               t=[round(tl["start_sec"] + i * tl["hop_sec"], 3) for i in range(int(tl["n"]))],
+               probs=np.round(probs.astype(np.float64), 4).tolist(),
+               quality=np.round(quality.astype(np.float64), 4).tolist())
+    return out
+
+def render(tl: Optional[Dict], fmt: Optional[str]) -> Optional[Dict]:
+    """저장된 f16 타임라인 → 요청 형식(None 이면 응답에서 제외)"""
+    if tl is None or fmt is None:
+        return None
+    return to_json(tl) if fmt == "json" else tl
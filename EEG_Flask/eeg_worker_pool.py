@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+"""
+eeg_worker_pool.py
+- 추론 전용 장기 실행 워커 프로세스 풀 (EEG_WORKER_PROCESSES > 0 이면 app.py 가 사용)
+- MNE 전처리/Torch 추론을 Flask 프로세스 밖에서 실행 → GIL 경합/크래시가 웹 서버로 번지지 않음
+- 워커는 spawn 으로 시작해 EEG_WORKER_PRELOAD 엔진을 미리 로드, 이후 (kind, device, ver, comment, csv_order) 별 캐시
+- 입력: 파일 경로, 또는 배열(SharedMemory 로 전달 → 파이프로 큰 배열을 피클하지 않음)
+  · 공유 메모리 블록은 작업이 끝나거나 취소될 때 해제(호출 측 timeout 으로 먼저 돌아가도 워커 읽기와 겹치지 않음)
+- 호출 측 timeout 시 대기열의 작업은 취소(실행 안 함)
+- 워커가 죽거나 작업이 EEG_WORKER_JOB_TIMEOUT 을 넘기면 진행 중 작업은 실패 처리하고 워커를 자동 재시작
+- 대기열(EEG_WORKER_QUEUE) 초과 시 eeg_executor.ExecutorBusy → API 는 503
+"""
+from __future__ import annotations
+import os, time, signal, itertools, threading, collections
+import multiprocessing as mp
+from multiprocessing import connection as mp_connection, shared_memory
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import eeg_profiling
+import eeg_executor
+
+# ========================= 설정 =========================
+WORKER_PROCESSES   = int(os.getenv("EEG_WORKER_PROCESSES", "0"))
+WORKER_PRELOAD     = os.getenv("EEG_WORKER_PRELOAD", "2c:muse:53,3c:muse")  # kind:device[:ver], 쉼표 구분
+WORKER_JOB_TIMEOUT = float(os.getenv("EEG_WORKER_JOB_TIMEOUT", "600"))
+WORKER_QUEUE       = int(os.getenv("EEG_WORKER_QUEUE", str(4 * max(1, WORKER_PROCESSES))))
+
+QUEUE_WAIT = eeg_profiling.REGISTRY.histogram(
+    "eeg_worker_queue_wait_seconds", "Time a job waited for a worker process")
+JOBS = eeg_profiling.REGISTRY.counter(
+    "eeg_worker_jobs_total", "Worker pool jobs by outcome", ("status",))
+RESTARTS = eeg_profiling.REGISTRY.counter(
+    "eeg_worker_restarts_total", "Worker process restarts by reason", ("reason",))
+
+EngineKey = Tuple[str, Optional[str], Optional[str], Optional[str], Optional[tuple]]
+
+
+class WorkerCrashed(RuntimeError):
+    """작업 도중 워커 프로세스 종료/타임아웃."""
+
+
+# 워커에서 난 예외 중 API 응답 코드가 달라지는 것만 같은 타입으로 복원
+_REMOTE_ERRORS = {
+    "FileNotFoundError": FileNotFoundError,
+    "ValueError": ValueError,
+    "AssertionError": AssertionError,
+}
+
+def _remote_error(name: str, msg: str) -> BaseException:
+    cls = _REMOTE_ERRORS.get(name)
+    return cls(msg) if cls else RuntimeError(f"{name}: {msg}")
+
+def parse_preload(spec: str) -> List[EngineKey]:
+    out: List[EngineKey] = []
+    for item in (spec or "").split(","):
+        parts = [p.strip() for p in item.split(":")]
+        if not parts[0]:
+            continue
+        device = parts[1] if len(parts) > 1 and parts[1] else "muse"
+        ver = parts[2] if len(parts) > 2 and parts[2] else None
+        out.append((parts[0], device, ver, None, None))
+    return out
+
+def engine_key(job: Dict) -> EngineKey:
+    csv_order = job.get("csv_order")
+    return (job["kind"], job.get("device"), job.get("ver"), job.get("comment"),
+            tuple(csv_order) if csv_order else None)
+
+# ========================= 워커 프로세스 =========================
+def _build_engine(key: EngineKey):
+    kind, device, ver, comment, csv_order = key
+    if kind == "2c":
+        from eeg_model2class import EEGInferenceEngine2Class as Engine
+    else:
+        from eeg_model3class import EEGInferenceEngine3Class as Engine
+    return Engine(device_type=device, version=ver, comment=comment, csv_order=csv_order)
+
+def _read_shared_array(spec: Dict) -> np.ndarray:
+    shm = shared_memory.SharedMemory(name=spec["shm"])
+    try:
+        view = np.ndarray(tuple(spec["shape"]), dtype=np.dtype(spec["dtype"]), buffer=shm.buf)
+        X = view.astype(np.float64)  # MNE 는 float64 로 처리 → 변환 겸 복사 1회 후 즉시 분리
+        del view
+    finally:
+        shm.close()
+    return X
+
+def _get_engine(engines: Dict, key: EngineKey, timer: eeg_profiling.StageTimer):
+    eng = engines.get(key)
+    if eng is None:
+        with timer.stage("engine_init"):
+            eng = engines[key] = _build_engine(key)
+    return eng
+
+def _run_job(engines: Dict, job: Dict, worker_id: int) -> Dict:
+    timer = eeg_profiling.StageTimer()
+    eng = _get_engine(engines, engine_key(job), timer)
+    ens = job.get("ensemble")
+    if ens:
+        import eeg_ensemble
+        members = [eng] + [_get_engine(engines, engine_key(dict(job, ver=v)), timer) for v in ens["vers"]]
+        eng = eeg_ensemble.EnsembleEngine(members, tta=ens["tta"], average=ens["average"])
+    kw = dict(subject_id=job.get("subject_id"), true_label=job.get("true_label"),
+              enforce_two_minutes=job.get("enforce_two_minutes", True), timer=timer,
+              timeline=job.get("timeline"))
+    with eeg_profiling.capture(job.get("profile_capture"), tag=f"infer{job['kind']}_w{worker_id}") as trace:
+        if "array" in job:
+            a = job["array"]
+            with timer.stage("shm_read"):
+                X = _read_shared_array(a)
+            result = eng.infer_array(X, a["sfreq"], a["ch_names"], **kw)
+            result["file_path"] = job.get("file_path")
+        else:
+            result = eng.infer(job["file_path"], **kw)
+    timer.stop()
+    return {"result": result, "stages": timer.stages, "calls": timer.calls, "sizes": timer.sizes,
+            "trace_file": trace["trace_file"], "worker": worker_id}
+
+def _worker_main(conn, worker_id: int, preload: List[EngineKey], torch_threads: int):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C 는 부모가 처리
+    import torch
+    torch.set_num_threads(max(1, int(torch_threads)))
+    engines: Dict = {}
+    for key in preload:
+        try:
+            engines[key] = _build_engine(key)
+        except Exception as e:
+            print(f"[WORKER {worker_id}] 엔진 preload 실패 {key}: {e!r}")
+    conn.send(("ready", worker_id, os.getpid()))
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            break
+        if msg is None:
+            break
+        job_id, job = msg
+        try:
+            conn.send((job_id, True, _run_job(engines, job, worker_id)))
+        except Exception as e:
+            conn.send((job_id, False, (type(e).__name__, str(e))))
+
+# ========================= 부모(Flask) 측 =========================
+def _release_shm(shm: shared_memory.SharedMemory):
+    try:
+        shm.close()
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+class _Worker:
+    __slots__ = ("wid", "proc", "conn", "ready", "job", "t_start")
+
+    def __init__(self, wid: int, proc, conn):
+        self.wid, self.proc, self.conn = wid, proc, conn
+        self.ready = False
+        self.job: Optional[Tuple[Dict, Future, float]] = None
+        self.t_start = 0.0
+
+
+class WorkerPool:
+    """
+    pool = get_pool(); out = pool.run(job, timer=t)   # out["result"] = 엔진 infer 결과
+    - job: {"kind": "2c"|"3c", "device", "ver", "comment", "csv_order", "file_path", "subject_id",
+            "true_label", "enforce_two_minutes", "profile_capture"}
+    - 디스패처 스레드 1개가 유휴 워커에 작업 배정, 결과 수신, 사망/타임아웃 감시를 모두 담당
+    """
+    def __init__(self, processes: int = WORKER_PROCESSES, preload: Optional[List[EngineKey]] = None,
+                 torch_threads: int = eeg_executor.TORCH_THREADS, max_queue: int = WORKER_QUEUE,
+                 job_timeout: float = WORKER_JOB_TIMEOUT):
+        self.processes = max(1, int(processes))
+        self.preload = preload if preload is not None else parse_preload(WORKER_PRELOAD)
+        self.torch_threads = max(1, int(torch_threads))
+        self.max_queue = max(1, int(max_queue))
+        self.job_timeout = float(job_timeout)
+        self._ctx = mp.get_context("spawn")
+        self._pending: "collections.deque" = collections.deque()
+        self._lock = threading.Lock()        # _pending / 카운터
+        self._wlock = threading.RLock()      # _workers (디스패처 vs restart_all)
+        self._wake_r, self._wake_w = self._ctx.Pipe(duplex=False)
+        self._wake_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._workers: List[_Worker] = []
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._completed = self._failed = self._rejected = self._restarts = 0
+
+    # ----- 수명 -----
+    def start(self):
+        with self._wlock:
+            if self._thread is not None:
+                return
+            self._workers = [self._spawn(i) for i in range(self.processes)]
+            self._thread = threading.Thread(target=self._loop, name="eeg-worker-pool", daemon=True)
+            self._thread.start()
+
+    def _spawn(self, wid: int) -> _Worker:
+        parent_conn, child_conn = self._ctx.Pipe()
+        proc = self._ctx.Process(target=_worker_main, name=f"eeg-worker-{wid}", daemon=True,
+                                 args=(child_conn, wid, self.preload, self.torch_threads))
+        proc.start()
+        child_conn.close()
+        return _Worker(wid, proc, parent_conn)
+
+    def _restart(self, w: _Worker, reason: str):
+        if w.job is not None:
+            _, fut, _ = w.job
+            fut.set_exception(WorkerCrashed(f"EEG worker {w.wid} {reason} (exitcode={w.proc.exitcode})"))
+            with self._lock:
+                self._failed += 1
+            JOBS.inc(status=reason)
+            w.job = None
+        try:
+            w.conn.close()
+        except OSError:
+            pass
+        if w.proc.is_alive():
+            w.proc.terminate()
+            w.proc.join(5.0)
+            if w.proc.is_alive():
+                w.proc.kill()
+        w.proc.join(1.0)
+        print(f"[WORKER] worker {w.wid} 재시작 (사유: {reason}, exitcode={w.proc.exitcode})")
+        RESTARTS.inc(reason=reason)
+        with self._lock:
+            self._restarts += 1
+        new = self._spawn(w.wid)
+        self._workers[self._workers.index(w)] = new
+
+    def restart_all(self, reason: str = "manual"):
+        with self._wlock:
+            for w in list(self._workers):
+                self._restart(w, reason)
+
+    def shutdown(self):
+        self._closed = True
+        self._wake()
+        if self._thread is not None:
+            self._thread.join(5.0)  # 디스패처 먼저 정지 → 종료 중인 워커를 재시작하지 않음
+        with self._wlock:
+            for w in self._workers:
+                try:
+                    w.conn.send(None)
+                except OSError:
+                    pass
+            for w in self._workers:
+                w.proc.join(5.0)
+                if w.proc.is_alive():
+                    w.proc.terminate()
+
+    # ----- 제출 -----
+    def _wake(self):
+        with self._wake_lock:
+            self._wake_w.send_bytes(b"1")
+
+    def submit(self, job: Dict) -> Future:
+        self.start()
+        fut: Future = Future()
+        with self._lock:
+            if len(self._pending) >= self.max_queue:
+                self._rejected += 1
+                JOBS.inc(status="rejected")
+                raise eeg_executor.ExecutorBusy(f"worker pool queue full ({self.max_queue} waiting, {self.processes} workers)")
+            self._pending.append((job, fut, time.perf_counter()))
+        self._wake()
+        return fut
+
+    def run(self, job: Dict, timer: Optional[eeg_profiling.StageTimer] = None,
+            timeout: Optional[float] = None) -> Dict:
+        return self._wait(self.submit(job), timer, timeout)
+
+    def run_array(self, job: Dict, X: np.ndarray, sfreq: float, ch_names: List[str],
+                  timer: Optional[eeg_profiling.StageTimer] = None,
+                  timeout: Optional[float] = None) -> Dict:
+        """
+        (C,T) 배열을 SharedMemory 에 한 번 복사해 워커로 전달(파이프 피클 없음).
+        블록 해제(unlink)는 작업 Future 완료/취소 시점 → 타임아웃으로 먼저 돌아가도 워커가 읽는 중인 블록을 지우지 않음
+        """
+        X = np.ascontiguousarray(X)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, X.nbytes))
+        try:
+            np.ndarray(X.shape, dtype=X.dtype, buffer=shm.buf)[...] = X
+            spec = {"shm": shm.name, "shape": list(X.shape), "dtype": X.dtype.str,
+                    "sfreq": float(sfreq), "ch_names": list(ch_names)}
+            fut = self.submit(dict(job, array=spec))
+        except BaseException:
+            _release_shm(shm)
+            raise
+        fut.add_done_callback(lambda _f: _release_shm(shm))
+        return self._wait(fut, timer, timeout)
+
+    def _wait(self, fut: Future, timer: Optional[eeg_profiling.StageTimer],
+              timeout: Optional[float]) -> Dict:
+        try:
+            out = fut.result(timeout=timeout)
+        except TimeoutError:
+            # 대기 중이면 대기열에서 빼고 취소(워커가 나중에 실행하지 않음),
+            # 이미 실행 중이면 워커 완료/EEG_WORKER_JOB_TIMEOUT 재시작 때 Future 가 끝남
+            self._cancel(fut)
+            raise
+        if timer is not None:
+            timer.merge(out["stages"], out["calls"], out["sizes"])
+            timer.note(worker=out["worker"])
+        return out
+
+    def _cancel(self, fut: Future) -> bool:
+        with self._lock:
+            for item in self._pending:
+                if item[1] is fut:
+                    self._pending.remove(item)
+                    break
+        if not fut.cancel():
+            return False
+        JOBS.inc(status="cancelled")
+        return True
+
+    # ----- 디스패처 -----
+    def _dispatch(self):
+        for w in self._workers:
+            if w.job is not None or not w.ready:
+                continue
+            while True:
+                with self._lock:
+                    if not self._pending:
+                        return
+                    job, fut, t_enq = self._pending.popleft()
+                if fut.set_running_or_notify_cancel():
+                    break
+            QUEUE_WAIT.observe(time.perf_counter() - t_enq)
+            w.job, w.t_start = (job, fut, t_enq), time.perf_counter()
+            try:
+                w.conn.send((next(self._ids), job))
+            except OSError:
+                pass  # 워커 사망 → 감시 단계에서 작업 실패 처리 + 재시작
+
+    def _receive(self, w: _Worker):
+        try:
+            msg = w.conn.recv()
+        except (EOFError, OSError):
+            return
+        if msg[0] == "ready":
+            w.ready = True
+            return
+        _, ok, payload = msg
+        if w.job is None:
+            return
+        _, fut, _ = w.job
+        w.job = None
+        if ok:
+            fut.set_result(payload)
+        else:
+            fut.set_exception(_remote_error(*payload))
+        with self._lock:
+            if ok: self._completed += 1
+            else:  self._failed += 1
+        JOBS.inc(status=("ok" if ok else "error"))
+
+    def _loop(self):
+        while not self._closed:
+            with self._wlock:
+                self._dispatch()
+                waitables = [self._wake_r] + [w.conn for w in self._workers] + [w.proc.sentinel for w in self._workers]
+            ready = mp_connection.wait(waitables, timeout=1.0)
+            if self._wake_r in ready:
+                while self._wake_r.poll():
+                    self._wake_r.recv_bytes()
+            with self._wlock:
+                for w in list(self._workers):
+                    if w.conn in ready:
+                        self._receive(w)
+                    if not w.proc.is_alive():
+                        self._restart(w, "crash")
+                    elif w.job is not None and time.perf_counter() - w.t_start > self.job_timeout:
+                        self._restart(w, "timeout")
+
+    def stats(self) -> Dict:
+        with self._wlock:
+            workers = [{"id": w.wid, "pid": w.proc.pid, "alive": w.proc.is_alive(),
+                        "ready": w.ready, "busy": w.job is not None} for w in self._workers]
+        with self._lock:
+            return {
+                "processes": self.processes,
+                "torch_threads": self.torch_threads,
+                "max_queue": self.max_queue,
+                "queued": len(self._pending),
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "restarts": self._restarts,
+                "workers": workers,
+            }
+
+
+_POOL: Optional[WorkerPool] = None
+_POOL_LOCK = threading.Lock()
+
+def enabled() -> bool:
+    return WORKER_PROCESSES > 0
+
+def get_pool() -> WorkerPool:
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = WorkerPool()
+                _POOL.start()
+    return _POOL
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+eeg_acquisition 동시 수집 테스트 (pytest test_acquisition.py)
+- BrainFlow 합성 보드(250 Hz) 두 대를 동시에 3초 수집 → 두 세션 모두 done, 각 750 샘플
+- 접촉 게이트는 끔(합성 보드는 접촉 품질 API 없음), 출력은 tmp_path 아래 시리얼/세션별 폴더
+"""
+import os
+
+import pytest
+
+pytest.importorskip("brainflow.board_shim")
+pytest.importorskip("pandas")
+
+import eeg_acquisition
+import eeg_contact
+
+SECONDS = 3
+SFREQ = 250  # BoardShim.get_sampling_rate(SYNTHETIC_BOARD)
+
+
+@pytest.fixture
+def manager(monkeypatch, tmp_path):
+    monkeypatch.setattr(eeg_contact, "CONTACT_GATE", False)
+    monkeypatch.setattr(eeg_acquisition, "ACQ_PULL_SEC", 1.0)
+    mgr = eeg_acquisition.AcquisitionManager(max_sessions=2, out_root=str(tmp_path))
+    yield mgr
+    mgr.stop_all(wait=10.0)
+
+
+def test_two_synthetic_sessions_concurrently(manager, tmp_path):
+    analyzed = []
+    analyze = lambda path, serial, array=None: analyzed.append(serial) or {"serial": serial}
+
+    a = manager.start("synth-a", seconds=SECONDS, board="synthetic", analyze=analyze)
+    b = manager.start("synth-b", seconds=SECONDS, board="synthetic", analyze=analyze)
+    assert manager.stats()["active"] == 2  # 두 번째 수집이 첫 번째 세션을 끊지 않음
+
+    for acq in (a, b):
+        assert acq.wait(timeout=60.0)
+        assert acq.exc is None, acq.exc
+        assert acq.session.state == "done"
+        assert acq.result["data_points"] == SECONDS * SFREQ
+        assert acq.result["analysis_result"] == {"serial": acq.serial}
+        # 출력 격리: <out_root>/<serial>/<session_id>/
+        assert os.path.dirname(acq.result["data_path"]) == str(tmp_path / acq.serial / acq.session.id)
+        assert os.path.exists(acq.result["recording_path"])
+    assert sorted(analyzed) == ["synth-a", "synth-b"]
+    assert manager.cleanup() == 2
+
+
+def test_retries_passed_through(manager):
+    acq = manager.start("synth-r", seconds=SECONDS, board="synthetic", retries=5)
+    assert acq.retries == 5
+    manager.stop("synth-r", wait=30.0)
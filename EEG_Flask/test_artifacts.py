@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+eeg_artifacts 검출기 단위 테스트 (pytest test_artifacts.py)
+- 깨끗한 합성 녹화(가우시안 잡음)에 세그먼트 하나만 아티팩트를 넣고
+  · 해당 검출기가 그 세그먼트를 잡는지
+  · 나머지 깨끗한 세그먼트는 어떤 검출기에도 걸리지 않는지 확인
+"""
+import importlib
+
+import numpy as np
+import pytest
+
+import eeg_artifacts
+from eeg_artifacts import ArtifactDetector
+
+N_SEG, N_CH, SFREQ = 40, 4, 256.0
+WIN = int(SFREQ * 2)
+BAD = 17
+
+
+def _clean(seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((N_SEG, N_CH, WIN)).astype(np.float32)
+
+def _detect(x, batch=8):
+    det = ArtifactDetector(N_SEG, N_CH, WIN, SFREQ)
+    for i in range(0, N_SEG, batch):
+        det.update(i, x[i:i + batch])
+    return det
+
+def _assert_only_bad(det, detector):
+    fl = det.flags()
+    assert fl[detector][BAD], f"{detector} 가 아티팩트 세그먼트를 못 잡음"
+    clean = np.ones(N_SEG, dtype=bool)
+    clean[BAD] = False
+    assert not det.mask()[clean].any(), "깨끗한 세그먼트가 아티팩트로 표시됨"
+    w = det.weights()
+    assert w[BAD] == pytest.approx(eeg_artifacts.ARTIFACT_WEIGHT)
+    assert np.all(w[clean] == 1.0)
+
+
+# ----------------------------- 깨끗한 녹화 -----------------------------
+def test_clean_recording_not_flagged():
+    det = _detect(_clean())
+    assert not det.mask().any()
+    assert det.summary(0, N_SEG)["flagged"] == 0
+
+
+# ----------------------------- 검출기별 -----------------------------
+def test_ptp_flags_large_excursion():
+    x = _clean()
+    # 중앙값 ptp(≈7σ) 의 PTP_FACTOR 배를 넘는 완만한 움직임 파형(첨도는 낮음)
+    t = np.arange(WIN) / SFREQ
+    amp = eeg_artifacts.PTP_FACTOR * 8.0
+    x[BAD, 1] += (amp * np.sin(2 * np.pi * 1.0 * t)).astype(np.float32)
+    det = _detect(x)
+    _assert_only_bad(det, "ptp")
+    assert not det.flags()["kurtosis"][BAD]
+
+def test_kurtosis_flags_blink_spike():
+    x = _clean()
+    # 짧고 뾰족한 깜빡임 파형(가우시안 펄스) → 초과 첨도 > KURTOSIS_MAX
+    n = np.arange(WIN)
+    pulse = 12.0 * np.exp(-0.5 * ((n - WIN // 2) / 3.0) ** 2)
+    x[BAD, 0] += pulse.astype(np.float32)
+    det = _detect(x)
+    assert det.kurt[BAD, 0] > eeg_artifacts.KURTOSIS_MAX
+    _assert_only_bad(det, "kurtosis")
+
+@pytest.mark.parametrize("freq", eeg_artifacts.LINE_FREQS)
+def test_line_flags_mains_noise(freq):
+    x = _clean()
+    # 구간성 전원 잡음: 녹화 중앙값 대비 LINE_FACTOR 배 이상
+    t = np.arange(WIN) / SFREQ
+    x[BAD, 2] += (3.0 * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+    det = _detect(x)
+    med = np.median(det.line[:, 2])
+    assert det.line[BAD, 2] > eeg_artifacts.LINE_FACTOR * med
+    _assert_only_bad(det, "line")
+
+
+# ----------------------------- 설정 -----------------------------
+def test_disabled_by_default(monkeypatch):
+    monkeypatch.delenv("EEG_ARTIFACTS", raising=False)
+    mod = importlib.reload(eeg_artifacts)
+    try:
+        assert not mod.enabled()
+        assert mod.config() is None
+    finally:
+        monkeypatch.undo()
+        importlib.reload(eeg_artifacts)
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+eeg_recording 채널 선택 테스트 (pytest test_recording.py)
+- 장비 CSV 의 접두사 붙은 컬럼명('EEG Fz')을 그대로 저장한 .eegr 도 학습 채널명(Fz)으로 읽히는지
+  (eeg_engine_core._load_device_csv 의 접미사 일치 규칙과 동일)
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import eeg_recording
+
+NAMES = ["EEG Fz", "EEG C3", "EEG Cz", "EEG C4"]
+
+
+@pytest.fixture
+def device_csv(tmp_path):
+    rng = np.random.default_rng(0)
+    n, sfreq = 1000, 250.0
+    df = pd.DataFrame(rng.standard_normal((n, len(NAMES))).astype(np.float32), columns=NAMES)
+    df["timestamps"] = np.arange(n) / sfreq
+    path = tmp_path / "device.csv"
+    df.to_csv(path, index=False)
+    return path, df
+
+
+def test_converted_device_csv_reads_by_suffix(device_csv):
+    path, df = device_csv
+    rec = eeg_recording.convert_csv(str(path))
+    assert eeg_recording.read_header(rec)["channels"] == NAMES
+    X, sfreq, _ = eeg_recording.read_channels(rec, ["Cz", "Fz"])
+    assert X.shape == (2, len(df)) and sfreq == pytest.approx(250.0)
+    np.testing.assert_allclose(X, df[["EEG Cz", "EEG Fz"]].to_numpy(dtype=np.float32).T, rtol=1e-6)
+
+def test_exact_name_preferred_and_missing_reported(tmp_path):
+    X = np.arange(3 * 10, dtype=np.float32).reshape(3, 10)
+    rec = eeg_recording.write_recording(str(tmp_path / "r.eegr"), X, ["EEG Cz", "Cz", "O1"], 250.0)
+    got, _, _ = eeg_recording.read_channels(rec, ["cz"])
+    np.testing.assert_array_equal(got[0], X[1])
+    with pytest.raises(ValueError, match="missing channels"):
+        eeg_recording.read_channels(rec, ["Pz"])
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+eeg_startup warm-up 재시도 테스트 (pytest test_startup.py)
+- 한 번 실패한 단계가 백오프 재시도로 성공하면 readiness 가 켜지는지
+- 재시도 끔(EEG_WARMUP_RETRY_SEC=0)이면 failed 로 남고 실패 단계가 상태에 보이는지
+"""
+import time
+
+import eeg_startup
+
+
+def _flaky(fails):
+    calls = {"n": 0}
+    def step():
+        calls["n"] += 1
+        if calls["n"] <= fails:
+            raise OSError("hub unavailable")
+    return step, calls
+
+def _until(pred, timeout=5.0):
+    end = time.time() + timeout
+    while time.time() < end:
+        if pred():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_failed_step_retried_until_ready(monkeypatch):
+    monkeypatch.setattr(eeg_startup, "RETRY_SEC", 0.05)
+    monkeypatch.setattr(eeg_startup, "RETRY_MAX_SEC", 0.1)
+    step, calls = _flaky(2)
+    wu = eeg_startup.Warmup(mode="eager")
+    wu.add("ok", lambda: None)
+    wu.add("engine", step)
+    try:
+        wu.start()
+        st = wu.status()
+        assert not wu.ready and st["state"] == "failed"
+        assert st["failed_steps"] == ["engine"] and st["retry"]["next_in_seconds"] is not None
+        assert _until(lambda: wu.ready)
+        st = wu.status()
+        assert st["state"] == "done" and st["failed_steps"] == []
+        assert st["steps"]["engine"]["attempts"] == 3 and st["steps"]["ok"]["attempts"] == 1
+        assert st["retry"] == {"attempt": 2, "next_in_seconds": None}
+        assert calls["n"] == 3
+    finally:
+        wu.stop()
+
+def test_no_retry_when_disabled(monkeypatch):
+    monkeypatch.setattr(eeg_startup, "RETRY_SEC", 0.0)
+    step, calls = _flaky(1)
+    wu = eeg_startup.Warmup(mode="eager")
+    wu.add("engine", step)
+    wu.start()
+    time.sleep(0.1)
+    st = wu.status()
+    assert st["state"] == "failed" and not st["ready"]
+    assert st["failed_steps"] == ["engine"] and "hub unavailable" in st["steps"]["engine"]["error"]
+    assert calls["n"] == 1
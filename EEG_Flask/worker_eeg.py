@@ -2,14 +2,80 @@
 """
 worker_eeg.py
 - BrainFlow 의존 로직을 메인 Flask 프로세스와 격리하여 실행
-- 사용법: python worker_eeg.py --serial 0000 --duration 190
+- 사용법: python worker_eeg.py --serial 0000 --duration 190   (1회성 수집 → CSV/.eegr 저장 후 종료)
+- 상주 모드: eeg_acq_supervisor 가 serve() 를 spawn 프로세스로 띄워 계속 재사용
+  · 파이프 명령: open / contact / flush / read / close / ping → (req_id, ok, payload) 응답
+  · read 는 부모가 만든 SharedMemory (rows, capacity) float64 블록에 샘플을 쓰고 개수만 응답(파이프 피클 없음)
+  · 하트비트 스레드가 EEG_ACQ_HEARTBEAT_SEC 마다 ("hb", wid, 현재 명령, 시작 시각) 전송 → 부모가 멈춤 감지
+- BoardHandle: 보드 1대 연결/스트림/읽기/해제 — 상주 워커와 eeg_acquisition 프로세스 내 모드가 공용
 """
 
 import os
 import sys
 import time
+import signal
 import argparse
+import threading
 import traceback
+from typing import Dict, List, Optional
+
+
+class BoardHandle:
+    """
+    h = BoardHandle(38, "Muse-1234"); info = h.open(buffer_seconds=210)
+    h.contact() / h.flush() / h.read(max_points) → (rows, n) 오래된 샘플부터 꺼냄 / h.close()
+    """
+    def __init__(self, board_id: int, serial_param: str):
+        self.board_id = int(board_id)
+        self.serial_param = str(serial_param)
+        self.board = None
+
+    def open(self, buffer_seconds: float) -> Dict:
+        """prepare_session + start_stream(링버퍼 = buffer_seconds × 샘플링 레이트). 반환: 채널 정보"""
+        from brainflow.board_shim import BoardShim, BrainFlowInputParams
+        params = BrainFlowInputParams()
+        params.serial_number = self.serial_param
+        sr = BoardShim.get_sampling_rate(self.board_id)
+        board = BoardShim(self.board_id, params)
+        board.prepare_session()
+        try:
+            board.start_stream(max(1, int(buffer_seconds * sr)))
+        except Exception:
+            try:
+                board.release_session()
+            except Exception:
+                pass
+            raise
+        self.board = board
+        return {"sampling_rate": int(sr),
+                "eeg_channels": [int(c) for c in BoardShim.get_eeg_channels(self.board_id)],
+                "timestamp_channel": int(BoardShim.get_timestamp_channel(self.board_id)),
+                "num_rows": int(BoardShim.get_num_rows(self.board_id))}
+
+    def contact(self) -> Optional[List[float]]:
+        # BrainFlow 버전/보드에 따라 접촉 품질 API 가 없음 → None(측정불가)
+        fn = getattr(self.board, "get_electrode_contact_quality", None)
+        if fn is None:
+            return None
+        q = fn()
+        return None if q is None else [float(v) for v in q]
+
+    def flush(self) -> int:
+        """링버퍼 비움(게이트 이전 데이터 버림). 반환: 버린 샘플 수"""
+        return int(self.board.get_board_data().shape[1])
+
+    def read(self, max_points: Optional[int] = None):
+        return self.board.get_board_data(int(max_points)) if max_points else self.board.get_board_data()
+
+    def close(self):
+        board, self.board = self.board, None
+        if board is None:
+            return
+        for fn in (board.stop_stream, board.release_session):
+            try:
+                fn()
+            except Exception:
+                pass
 
 def run_worker(serial: str, duration: int) -> int:
     try:
@@ -49,6 +115,17 @@ def run_worker(serial: str, duration: int) -> int:
         filepath = os.path.join(base, 'uploads', 'eeg', filename)
         df_final.to_csv(filepath, index=False)
 
+        # 네이티브 녹화 컨테이너(.eegr)도 함께 저장 → 분석 시 파싱 없이 memmap 로드
+        import numpy as np
+        import eeg_recording
+        ts = df_final['timestamps'].to_numpy(dtype=np.float64)
+        rec_path = os.path.splitext(filepath)[0] + eeg_recording.RECORDING_EXT
+        eeg_recording.write_recording(
+            rec_path, df_final[['eeg_1', 'eeg_2', 'eeg_3', 'eeg_4']].to_numpy(dtype=np.float32).T,
+            list(eeg_recording.MUSE_CSV_CHANNELS), eeg_recording.sfreq_from_timestamps(ts),
+            device_serial=serial, t_start=float(ts[0]), t_end=float(ts[-1]), source="worker_eeg",
+        )
+
         # 종료
         try:
             board.stop_stream()
@@ -56,6 +133,7 @@ def run_worker(serial: str, duration: int) -> int:
             board.release_session()
 
         print(f"[WORKER] saved: {filepath}")
+        print(f"[WORKER] saved: {rec_path}")
         return 0
 
     except Exception as e:
@@ -64,6 +142,98 @@ def run_worker(serial: str, duration: int) -> int:
         return 1
 
 
+# ========================= 상주 워커 =========================
+def _read_into(handle: BoardHandle, shms: Dict, args: Dict) -> int:
+    """args = {"shm", "rows", "capacity"}: 최대 capacity 샘플을 공유 메모리에 쓰고 개수 반환"""
+    import numpy as np
+    from multiprocessing import shared_memory
+    shm = shms.get(args["shm"])
+    if shm is None:
+        for old in shms.values():  # 세션당 블록 1개 → 이전 세션 블록은 닫음
+            old.close()
+        shms.clear()
+        shm = shms[args["shm"]] = shared_memory.SharedMemory(name=args["shm"])
+    data = handle.read(args["capacity"])
+    n = int(data.shape[1])
+    if n:
+        view = np.ndarray((int(args["rows"]), int(args["capacity"])), dtype=np.float64, buffer=shm.buf)
+        view[:data.shape[0], :n] = data
+        del view
+    return n
+
+def serve(conn, worker_id: int, heartbeat_sec: float = 1.0):
+    """eeg_acq_supervisor 가 spawn 으로 실행. 보드는 한 번에 1대(세션 단위로 부모가 임대)."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C 는 부모가 처리
+    try:
+        from brainflow.board_shim import BoardShim
+        BoardShim.disable_board_logger()
+    except Exception as e:
+        print(f"[WORKER {worker_id}] BrainFlow 로드 실패: {e!r}")
+    send_lock = threading.Lock()
+    current = {"cmd": None, "since": None}
+    closed = threading.Event()
+
+    def send(msg):
+        with send_lock:
+            conn.send(msg)
+
+    def heartbeat():
+        while not closed.wait(heartbeat_sec):
+            try:
+                send(("hb", worker_id, current["cmd"], current["since"]))
+            except (OSError, ValueError):
+                return
+
+    handle: Optional[BoardHandle] = None
+    shms: Dict = {}
+    send(("ready", worker_id, os.getpid()))
+    threading.Thread(target=heartbeat, name="acq-heartbeat", daemon=True).start()
+    try:
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                break
+            if msg is None:
+                break
+            req_id, cmd, args = msg
+            current["since"], current["cmd"] = time.time(), cmd
+            try:
+                if cmd == "open":
+                    if handle is not None:
+                        handle.close()
+                    handle = BoardHandle(args["board_id"], args["serial_param"])
+                    out = handle.open(args["buffer_seconds"])
+                elif cmd == "close":
+                    if handle is not None:
+                        handle.close()
+                    handle = None
+                    out = None
+                elif cmd == "ping":
+                    out = os.getpid()
+                elif handle is None:
+                    raise RuntimeError(f"no open board for '{cmd}'")
+                elif cmd == "contact":
+                    out = handle.contact()
+                elif cmd == "flush":
+                    out = handle.flush()
+                elif cmd == "read":
+                    out = _read_into(handle, shms, args)
+                else:
+                    raise ValueError(f"unknown command '{cmd}'")
+                send((req_id, True, out))
+            except Exception as e:
+                send((req_id, False, (type(e).__name__, str(e))))
+            finally:
+                current["cmd"] = current["since"] = None
+    finally:
+        closed.set()
+        if handle is not None:
+            handle.close()
+        for shm in shms.values():
+            shm.close()
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--serial', required=True)